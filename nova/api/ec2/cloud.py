@@ -23,6 +23,7 @@ datastore.
 """
 
 import base64
+import collections
 import time
 
 from oslo.config import cfg
@@ -1062,13 +1063,18 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_uuid, root_device_name,
-                             result):
-        """Format InstanceBlockDeviceMappingResponseItemType."""
+                             result, bdms=None, volumes=None):
+        """Format InstanceBlockDeviceMappingResponseItemType.
+
+        bdms and volumes (a dict of volume id to volume) may be passed in
+        when they have been prefetched for several instances.
+        """
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in block_device.legacy_mapping(
-            db.block_device_mapping_get_all_by_instance(context,
-                                                        instance_uuid)):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_uuid)
+        for bdm in block_device.legacy_mapping(bdms):
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1078,7 +1084,11 @@ class CloudController(object):
                 assert not bdm['virtual_name']
                 root_device_type = 'ebs'
 
-            vol = self.volume_api.get(context, volume_id)
+            vol = None
+            if volumes is not None:
+                vol = volumes.get(str(volume_id))
+            if vol is None:
+                vol = self.volume_api.get(context, volume_id)
             LOG.debug(_("vol = %s\n"), vol)
             # TODO(yamahata): volume attach time
             ebs = {'volumeId': ec2utils.id_to_ec2_vol_id(volume_id),
@@ -1112,6 +1122,19 @@ class CloudController(object):
         result['groupSet'] = utils.convert_to_list_dict(
             security_group_names, 'groupId')
 
+    def _get_volumes(self, context, volume_ids):
+        """Return a dict of volume id to volume for the given volume ids.
+
+        Several volumes are fetched with a single listing; any volume not
+        in the listing (e.g. one owned by another project) is fetched by
+        _format_instance_bdm() on its own.
+        """
+        if len(volume_ids) < 2:
+            return {}
+        return dict((str(vol['id']), vol)
+                    for vol in self.volume_api.get_all(context)
+                    if str(vol['id']) in volume_ids)
+
     def _format_instances(self, context, instance_id=None, use_v6=False,
             instances_cache=None, **search_opts):
         # TODO(termie): this method is poorly named as its name does not imply
@@ -1143,22 +1166,51 @@ class CloudController(object):
                 search_opts['deleted'] = False
                 instances = self.compute_api.get_all(context,
                                                      search_opts=search_opts,
-                                                     sort_dir='asc')
+                                                     sort_dir='asc',
+                                                     use_slave=True)
             except exception.NotFound:
                 instances = []
 
+        if not context.is_admin:
+            instances = [instance for instance in instances
+                         if not pipelib.is_vpn_image(instance['image_ref'])]
+
+        # NOTE: look up EC2 ids, block device mappings, volumes and
+        #       availability zones for all instances at once rather than
+        #       once per instance.
+        glance_ids = []
+        for instance in instances:
+            glance_ids.extend([instance['image_ref'], instance['kernel_id'],
+                               instance['ramdisk_id']])
+        image_ids = ec2utils.glance_ids_to_ids(context, glance_ids)
+        instance_ids = ec2utils.get_int_ids_from_instance_uuids(
+            context, [instance['uuid'] for instance in instances])
+
+        bdms = collections.defaultdict(list)
+        for bdm in db.block_device_mapping_get_all_by_instance_uuids(
+                context, [instance['uuid'] for instance in instances]):
+            bdms[bdm['instance_uuid']].append(bdm)
+        volumes = self._get_volumes(context, set(
+            str(bdm['volume_id']) for instance_bdms in bdms.values()
+            for bdm in instance_bdms
+            if bdm['volume_id'] is not None and not bdm['no_device']))
+
+        zones = ec2utils.get_availability_zones_by_hosts(
+            set(instance['host'] for instance in instances))
+
         for instance in instances:
-            if not context.is_admin:
-                if pipelib.is_vpn_image(instance['image_ref']):
-                    continue
             i = {}
             instance_uuid = instance['uuid']
-            ec2_id = ec2utils.id_to_ec2_inst_id(instance_uuid)
+            ec2_id = ec2utils.id_to_ec2_id(instance_ids[instance_uuid])
             i['instanceId'] = ec2_id
             image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['imageId'] = ec2utils.image_ec2_id(image_ids[image_uuid])
+            if instance['kernel_id']:
+                i['kernelId'] = ec2utils.image_ec2_id(
+                    image_ids[instance['kernel_id']], 'aki')
+            if instance['ramdisk_id']:
+                i['ramdiskId'] = ec2utils.image_ec2_id(
+                    image_ids[instance['ramdisk_id']], 'ari')
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1196,10 +1248,10 @@ class CloudController(object):
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance['uuid'],
-                                      i['rootDeviceName'], i)
-            host = instance['host']
-            zone = ec2utils.get_availability_zone_by_host(host)
-            i['placement'] = {'availabilityZone': zone}
+                                      i['rootDeviceName'], i,
+                                      bdms=bdms[instance['uuid']],
+                                      volumes=volumes)
+            i['placement'] = {'availabilityZone': zones[instance['host']]}
             if instance['reservation_id'] not in reservations:
                 r = {}
                 r['reservationId'] = instance['reservation_id']
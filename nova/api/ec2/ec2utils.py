@@ -16,44 +16,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import functools
 import re
 
+from nova.api.ec2 import id_mapping
 from nova import availability_zones
 from nova import context
-from nova import db
 from nova import exception
 from nova.network import model as network_model
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
 
 LOG = logging.getLogger(__name__)
-# NOTE(vish): cache mapping for one week
-_CACHE_TIME = 7 * 24 * 60 * 60
-_CACHE = None
-
-
-def memoize(func):
-    @functools.wraps(func)
-    def memoizer(context, reqid):
-        global _CACHE
-        if not _CACHE:
-            _CACHE = memorycache.get_client()
-        key = "%s:%s" % (func.__name__, reqid)
-        key = str(key)
-        value = _CACHE.get(key)
-        if value is None:
-            value = func(context, reqid)
-            _CACHE.set(key, value, time=_CACHE_TIME)
-        return value
-    return memoizer
 
 
 def reset_cache():
-    global _CACHE
-    _CACHE = None
+    id_mapping.reset_cache()
 
 
 def image_type(image_type):
@@ -98,21 +76,16 @@ def resource_type_from_id(context, resource_id):
     return known_types.get(type_marker)
 
 
-@memoize
 def id_to_glance_id(context, image_id):
     """Convert an internal (db) id to a glance id."""
-    return db.s3_image_get(context, image_id)['uuid']
+    return id_mapping.get_mapping('image').get_uuid(context, image_id)
 
 
-@memoize
 def glance_id_to_id(context, glance_id):
     """Convert a glance id to an internal (db) id."""
     if glance_id is None:
         return
-    try:
-        return db.s3_image_get_by_uuid(context, glance_id)['id']
-    except exception.NotFound:
-        return db.s3_image_create(context, glance_id)['id']
+    return id_mapping.get_mapping('image').get_id(context, glance_id)
 
 
 def ec2_id_to_glance_id(context, ec2_id):
@@ -120,6 +93,19 @@ def ec2_id_to_glance_id(context, ec2_id):
     return id_to_glance_id(context, image_id)
 
 
+def glance_ids_to_ids(context, glance_ids):
+    """Convert glance ids to internal (db) ids in bulk.
+
+    Returns a dict of glance id to internal id.  Missing mappings are
+    created in the order the glance ids are given.  None ids are skipped as
+    in glance_id_to_id(), while the empty image_ref of volume-backed
+    instances gets a mapping like any other id.
+    """
+    glance_ids = [glance_id for glance_id in glance_ids
+                  if glance_id is not None]
+    return id_mapping.get_mapping('image').get_ids(context, glance_ids)
+
+
 def glance_id_to_ec2_id(context, glance_id, image_type='ami'):
     image_id = glance_id_to_id(context, glance_id)
     return image_ec2_id(image_id, image_type=image_type)
@@ -168,6 +154,11 @@ def get_availability_zone_by_host(host, conductor_api=None):
         context.get_admin_context(), host, conductor_api)
 
 
+def get_availability_zones_by_hosts(hosts):
+    return availability_zones.get_hosts_availability_zones(
+        context.get_admin_context(), hosts)
+
+
 def id_to_ec2_id(instance_id, template='i-%08x'):
     """Convert an instance ID (int) to an ec2 ID (i-[base 16 number])."""
     return template % int(instance_id)
@@ -191,9 +182,8 @@ def ec2_inst_id_to_uuid(context, ec2_id):
     return get_instance_uuid_from_int_id(context, int_id)
 
 
-@memoize
 def get_instance_uuid_from_int_id(context, int_id):
-    return db.get_instance_uuid_by_ec2_id(context, int_id)
+    return id_mapping.get_mapping('instance').get_uuid(context, int_id)
 
 
 def id_to_ec2_snap_id(snapshot_id):
@@ -268,29 +258,26 @@ def is_ec2_timestamp_expired(request, expires=None):
         return True
 
 
-@memoize
 def get_int_id_from_instance_uuid(context, instance_uuid):
     if instance_uuid is None:
         return
-    try:
-        return db.get_ec2_instance_id_by_uuid(context, instance_uuid)
-    except exception.NotFound:
-        return db.ec2_instance_create(context, instance_uuid)['id']
+    return id_mapping.get_mapping('instance').get_id(context, instance_uuid)
+
+
+def get_int_ids_from_instance_uuids(context, instance_uuids):
+    """Return a dict of instance uuid to internal (db) id."""
+    return id_mapping.get_mapping('instance').get_ids(context,
+                                                      instance_uuids)
 
 
-@memoize
 def get_int_id_from_volume_uuid(context, volume_uuid):
     if volume_uuid is None:
         return
-    try:
-        return db.get_ec2_volume_id_by_uuid(context, volume_uuid)
-    except exception.NotFound:
-        return db.ec2_volume_create(context, volume_uuid)['id']
+    return id_mapping.get_mapping('volume').get_id(context, volume_uuid)
 
 
-@memoize
 def get_volume_uuid_from_int_id(context, int_id):
-    return db.get_volume_uuid_by_ec2_id(context, int_id)
+    return id_mapping.get_mapping('volume').get_uuid(context, int_id)
 
 
 def ec2_snap_id_to_uuid(ec2_id):
@@ -302,19 +289,14 @@ def ec2_snap_id_to_uuid(ec2_id):
     return get_snapshot_uuid_from_int_id(ctxt, int_id)
 
 
-@memoize
 def get_int_id_from_snapshot_uuid(context, snapshot_uuid):
     if snapshot_uuid is None:
         return
-    try:
-        return db.get_ec2_snapshot_id_by_uuid(context, snapshot_uuid)
-    except exception.NotFound:
-        return db.ec2_snapshot_create(context, snapshot_uuid)['id']
+    return id_mapping.get_mapping('snapshot').get_id(context, snapshot_uuid)
 
 
-@memoize
 def get_snapshot_uuid_from_int_id(context, int_id):
-    return db.get_snapshot_uuid_by_ec2_id(context, int_id)
+    return id_mapping.get_mapping('snapshot').get_uuid(context, int_id)
 
 
 _c2u = re.compile('(((?<=[a-z])[A-Z])|([A-Z](?![A-Z]|$)))')
@@ -0,0 +1,181 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Mapping between uuids and the integer ids used to build EC2 ids.
+
+Mappings are stored in the s3_images, instance_id_mappings,
+volume_id_mappings and snapshot_id_mappings tables.  Once created a mapping
+never changes, so lookups are kept in a bounded in-process LRU cache that
+is shared between requests.
+"""
+
+import collections
+
+from oslo.config import cfg
+
+from nova import db
+from nova import exception
+
+id_mapping_opts = [
+    cfg.IntOpt('ec2_id_cache_size',
+               default=10000,
+               help='Number of EC2 id mappings of each kind to keep cached '
+                    'in memory'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(id_mapping_opts)
+
+KINDS = ('image', 'instance', 'volume', 'snapshot')
+
+_NOT_FOUND = {
+    'image': lambda id: exception.ImageNotFound(image_id=id),
+    'instance': lambda id: exception.InstanceNotFound(instance_id=id),
+    'volume': lambda id: exception.VolumeNotFound(volume_id=id),
+    'snapshot': lambda id: exception.SnapshotNotFound(snapshot_id=id),
+}
+
+
+class LRUCache(object):
+    """A dict-like cache which keeps at most size items, dropping the
+    least recently used ones first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = value
+        return value
+
+    def set(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+
+class IdMapping(object):
+    """Cached uuid <-> ec2 id mapping of one kind."""
+
+    def __init__(self, kind, cache_size):
+        self.kind = kind
+        self._ids = LRUCache(cache_size)
+        self._uuids = LRUCache(cache_size)
+
+    def _remember(self, uuid, id):
+        self._ids.set(uuid, id)
+        self._uuids.set(id, uuid)
+
+    def get_ids(self, context, uuids, create=True):
+        """Return a dict of uuid to ec2 id for the given uuids.
+
+        Mappings missing from the database are created, in the order the
+        uuids are given, unless create is False.
+        """
+        result = {}
+        missing = []
+        for uuid in uuids:
+            id = self._ids.get(uuid)
+            if id is not None:
+                result[uuid] = id
+            elif uuid not in missing:
+                missing.append(uuid)
+        if not missing:
+            return result
+
+        found = db.ec2_id_mappings_get_by_uuids(context, self.kind, missing)
+        if create:
+            to_create = [uuid for uuid in missing if uuid not in found]
+            if to_create:
+                found.update(db.ec2_id_mappings_create(context, self.kind,
+                                                       to_create))
+        for uuid, id in found.iteritems():
+            self._remember(uuid, id)
+        result.update(found)
+        return result
+
+    def get_uuids(self, context, ids):
+        """Return a dict of ec2 id to uuid for the given ec2 ids.
+
+        Ids without a mapping are left out.
+        """
+        result = {}
+        missing = []
+        for id in ids:
+            uuid = self._uuids.get(id)
+            if uuid is not None:
+                result[id] = uuid
+            elif id not in missing:
+                missing.append(id)
+        if not missing:
+            return result
+
+        found = db.ec2_id_mappings_get_by_ids(context, self.kind, missing)
+        for id, uuid in found.iteritems():
+            self._remember(uuid, id)
+        result.update(found)
+        return result
+
+    def get_id(self, context, uuid):
+        """Return the ec2 id for a uuid, creating the mapping if needed."""
+        return self.get_ids(context, [uuid])[uuid]
+
+    def get_uuid(self, context, id):
+        """Return the uuid for an ec2 id or raise the kind's NotFound.
+
+        The id may also be given as a string, as S3ImageService.show()
+        does.
+        """
+        try:
+            int_id = int(id)
+            return self.get_uuids(context, [int_id])[int_id]
+        except (KeyError, ValueError):
+            raise _NOT_FOUND[self.kind](id)
+
+
+_MAPPINGS = {}
+
+
+def get_mapping(kind):
+    """Return the process wide IdMapping for a kind of resource."""
+    mapping = _MAPPINGS.get(kind)
+    if mapping is None:
+        if kind not in KINDS:
+            raise ValueError(_('Unknown EC2 id mapping kind %s') % kind)
+        mapping = IdMapping(kind, CONF.ec2_id_cache_size)
+        _MAPPINGS[kind] = mapping
+    return mapping
+
+
+def reset_cache():
+    _MAPPINGS.clear()
@@ -29,8 +29,7 @@ class ExtendedVolumesController(wsgi.Controller):
         super(ExtendedVolumesController, self).__init__(*args, **kwargs)
         self.compute_api = compute.API()
 
-    def _extend_server(self, context, server, instance):
-        bdms = self.compute_api.get_instance_bdms(context, instance)
+    def _extend_server(self, server, bdms):
         volume_ids = [bdm['volume_id'] for bdm in bdms if bdm['volume_id']]
         key = "%s:volumes_attached" % Extended_volumes.alias
         server[key] = [{'id': volume_id} for volume_id in volume_ids]
@@ -45,7 +44,8 @@ class ExtendedVolumesController(wsgi.Controller):
             db_instance = req.get_db_instance(server['id'])
             # server['id'] is guaranteed to be in the cache due to
             # the core API adding it in its 'show' method.
-            self._extend_server(context, server, db_instance)
+            bdms = self.compute_api.get_instance_bdms(context, db_instance)
+            self._extend_server(server, bdms)
 
     @wsgi.extends
     def detail(self, req, resp_obj):
@@ -54,11 +54,12 @@ class ExtendedVolumesController(wsgi.Controller):
             # Attach our slave template to the response object
             resp_obj.attach(xml=ExtendedVolumesServersTemplate())
             servers = list(resp_obj.obj['servers'])
+            bdms_by_uuid = req.get_batched_items('bdms',
+                    [server['id'] for server in servers],
+                    lambda uuids: self.compute_api.get_instances_bdms(
+                        context, uuids))
             for server in servers:
-                db_instance = req.get_db_instance(server['id'])
-                # server['id'] is guaranteed to be in the cache due to
-                # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
+                self._extend_server(server, bdms_by_uuid[server['id']])
 
 
 class Extended_volumes(extensions.ExtensionDescriptor):
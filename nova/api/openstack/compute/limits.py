@@ -27,12 +27,14 @@ To find good rate-limit values, check how long requests are taking (see logs)
 in your environment to assess your capabilities and multiply out to get
 figures.
 
-NOTE: As the rate-limiting here is done in memory, this only works per
-process (each process will have its own rate limiting counter).
+NOTE: As the rate-limiting done by `Limiter` is in memory, it only works per
+process (each process will have its own rate limiting counter).  Use
+`SharedLimiter` to share counters between processes through memcached.
 """
 
 import collections
 import copy
+import hashlib
 import httplib
 import math
 import re
@@ -46,6 +48,7 @@ from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
+from nova.openstack.common import memorycache
 from nova import quota
 from nova import utils
 from nova import wsgi as base_wsgi
@@ -173,6 +176,14 @@ class Limit(object):
         if self.verb != verb or not re.match(self.regex, url):
             return
 
+        return self.consume()
+
+    def consume(self):
+        """
+        Record a request matching this limit.
+
+        @return: Delay in seconds until the request would be allowed, or None
+        """
         now = self._get_time()
 
         if self.last_request is None:
@@ -309,6 +320,7 @@ class Limiter(object):
         """
         self.limits = copy.deepcopy(limits)
         self.levels = collections.defaultdict(lambda: copy.deepcopy(limits))
+        self._dispatch = {}
 
         # Pick up any per-user limit information
         for key, value in kwargs.items():
@@ -322,6 +334,31 @@ class Limiter(object):
         """
         return [limit.display() for limit in self.levels[username]]
 
+    def _get_dispatch(self, username):
+        """
+        Return the limits of a user grouped by verb, along with their
+        compiled regular expressions, so a request is only matched
+        against the limits for its verb.
+        """
+        user_limits = self.levels[username]
+        cached = self._dispatch.get(username)
+        if cached is not None and cached[0] is user_limits:
+            return cached[1]
+
+        dispatch = collections.defaultdict(list)
+        for limit in user_limits:
+            dispatch[limit.verb].append((re.compile(limit.regex), limit))
+        self._dispatch[username] = (user_limits, dispatch)
+        return dispatch
+
+    def _consume(self, username, limit):
+        """
+        Record a request against a matching limit.
+
+        @return: Delay in seconds until the request would be allowed, or None
+        """
+        return limit.consume()
+
     def check_for_delay(self, verb, url, username=None):
         """
         Check the given verb/user/user triplet for limit.
@@ -330,8 +367,10 @@ class Limiter(object):
         """
         delays = []
 
-        for limit in self.levels[username]:
-            delay = limit(verb, url)
+        for regex, limit in self._get_dispatch(username).get(verb, ()):
+            if not regex.match(url):
+                continue
+            delay = self._consume(username, limit)
             if delay:
                 delays.append((delay, limit.error_message))
 
@@ -402,6 +441,91 @@ class Limiter(object):
         return result
 
 
+class SharedLimiter(Limiter):
+    """
+    Rate-limit checking class which shares counters between API processes
+    through memcached.
+
+    Each limit allows `value` requests per `unit` window.  Requests are
+    counted locally and only pushed to memcached every `sync_interval`
+    seconds, or sooner when a limit is about to be reached, so most
+    requests do not need a round trip to memcached.  Limits may therefore
+    be overshot by up to the number of requests each process accepts
+    between syncs.
+    """
+
+    def __init__(self, limits, memcached_servers=None, sync_interval=1,
+                 **kwargs):
+        """
+        Initialize the new `SharedLimiter`.
+
+        @param limits: List of `Limit` objects
+        @param memcached_servers: Comma separated list of memcached servers,
+                                  defaults to the memcached_servers option
+        @param sync_interval: Seconds between pushes of local counters
+        """
+        super(SharedLimiter, self).__init__(limits, **kwargs)
+        if memcached_servers:
+            memcached_servers = [server.strip() for server
+                                 in memcached_servers.split(',')]
+        self._cache = memorycache.get_client(memcached_servers)
+        self.sync_interval = float(sync_interval)
+        self._counters = {}
+
+    def _get_counter(self, username, limit, window):
+        key = hashlib.md5(repr((username, limit.verb, limit.regex,
+                                limit.value, limit.unit))).hexdigest()
+        counter = self._counters.get(key)
+        if counter is None or counter['window'] != window:
+            counter = {'key': 'limits-%s-%d' % (key, window),
+                       'window': window,
+                       'count': 0,
+                       'pending': 0,
+                       'synced_at': None}
+            self._counters[key] = counter
+        return counter
+
+    def _sync(self, counter, limit, now):
+        """Push pending requests to memcached and fetch the shared count."""
+        key = counter['key']
+        pending = counter['pending']
+        if pending:
+            count = self._cache.incr(key, pending)
+            if count is None:
+                if self._cache.add(key, str(pending), time=limit.unit):
+                    count = pending
+                else:
+                    # Lost the race to create the counter
+                    count = self._cache.incr(key, pending)
+        else:
+            count = self._cache.get(key)
+        counter['count'] = int(count or 0)
+        counter['pending'] = 0
+        counter['synced_at'] = now
+
+    def _consume(self, username, limit):
+        now = limit._get_time()
+        window = int(now // limit.unit)
+        counter = self._get_counter(username, limit, window)
+
+        used = counter['count'] + counter['pending']
+        if (counter['synced_at'] is None or
+                (used >= limit.value and counter['pending']) or
+                now - counter['synced_at'] >= self.sync_interval):
+            self._sync(counter, limit, now)
+            used = counter['count']
+
+        limit.last_request = now
+        if used >= limit.value:
+            limit.remaining = 0
+            limit.next_request = (window + 1) * limit.unit
+            return limit.next_request - now
+
+        counter['pending'] += 1
+        limit.remaining = limit.value - used - 1
+        limit.next_request = now
+
+
 class WsgiLimiter(object):
     """
     Rate-limit checking from a WSGI application. Uses an in-memory `Limiter`.
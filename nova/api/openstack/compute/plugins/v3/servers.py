@@ -601,7 +601,8 @@ class ServersController(wsgi.Controller):
                                                      search_opts=search_opts,
                                                      limit=limit,
                                                      marker=marker,
-                                                     want_objects=True)
+                                                     want_objects=True,
+                                                     use_slave=True)
         except exception.MarkerNotFound as e:
             msg = _('marker [%s] not found') % marker
             raise exc.HTTPBadRequest(explanation=msg)
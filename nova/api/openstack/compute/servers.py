@@ -540,7 +540,8 @@ class Controller(wsgi.Controller):
                                                      search_opts=search_opts,
                                                      limit=limit,
                                                      marker=marker,
-                                                     want_objects=True)
+                                                     want_objects=True,
+                                                     use_slave=True)
         except exception.MarkerNotFound:
             msg = _('marker [%s] not found') % marker
             raise exc.HTTPBadRequest(explanation=msg)
@@ -75,7 +75,7 @@ class Request(webob.Request):
 
     def __init__(self, *args, **kwargs):
         super(Request, self).__init__(*args, **kwargs)
-        self._extension_data = {'db_items': {}}
+        self._extension_data = {'db_items': {}, 'batched': {}}
 
     def cache_db_items(self, key, items, item_key='id'):
         """
@@ -132,6 +132,26 @@ class Request(webob.Request):
     def get_db_flavor(self, flavorid):
         return self.get_db_item('flavors', flavorid)
 
+    def get_batched_items(self, key, item_keys, loader):
+        """
+        Allow API extensions to look up data for many items (typically
+        all servers in a listing) with one call instead of one call
+        per item.
+
+        `loader` is called once with the list of item keys that haven't
+        been loaded under `key` yet within this request, and must return
+        a dict keyed by them.  Item keys missing from that dict map to
+        None.  Extensions asking for the same `key` share the results.
+        """
+        batched = self._extension_data['batched'].setdefault(key, {})
+        missing = [item_key for item_key in set(item_keys)
+                   if item_key not in batched]
+        if missing:
+            loaded = loader(missing)
+            for item_key in missing:
+                batched[item_key] = loaded.get(item_key)
+        return dict((item_key, batched[item_key]) for item_key in item_keys)
+
     def best_match_content_type(self):
         """Determine the requested response content-type."""
         if 'nova.best_content_type' not in self.environ:
@@ -15,15 +15,11 @@
 
 """Availability zone helper functions."""
 
+import time
+
 from oslo.config import cfg
 
 from nova import db
-from nova.openstack.common import memorycache
-
-# NOTE(vish): azs don't change that often, so cache them for an hour to
-#             avoid hitting the db multiple times on every request.
-AZ_CACHE_SECONDS = 60 * 60
-MC = None
 
 availability_zone_opts = [
     cfg.StrOpt('internal_service_availability_zone',
@@ -32,101 +28,135 @@ availability_zone_opts = [
     cfg.StrOpt('default_availability_zone',
                default='nova',
                help='default compute node availability_zone'),
+    cfg.IntOpt('availability_zone_check_interval',
+               default=1,
+               help='Seconds during which the availability zones of hosts '
+                    'are used without checking whether aggregates changed'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(availability_zone_opts)
 
+# NOTE: (aggregates version, time of the last version check,
+#       {host: set of availability zones}) for this process.  The
+#       aggregate_* DB APIs bump the version on every change, so the index
+#       is rebuilt at the first check after it went stale.
+_HOST_AZS = None
 
-def _get_cache():
-    global MC
 
-    if MC is None:
-        MC = memorycache.get_client()
+def _reset_cache():
+    """Reset the cache, mainly for testing purposes."""
 
-    return MC
+    global _HOST_AZS
 
+    _HOST_AZS = None
 
-def _reset_cache():
-    """Reset the cache, mainly for testing purposes."""
 
-    global MC
+def _get_host_azs(context):
+    """Return the host to availability zones index, rebuilding it with a
+    single aggregate query if aggregates changed since it was built.
 
-    MC = None
+    The aggregates version is checked at most once every
+    availability_zone_check_interval seconds.
+    """
+    global _HOST_AZS
 
+    now = time.time()
+    if (_HOST_AZS is not None and
+            now - _HOST_AZS[1] < CONF.availability_zone_check_interval):
+        return _HOST_AZS[2]
 
-def _make_cache_key(host):
-    return "azcache-%s" % host
+    context = context.elevated()
+    version = db.aggregate_version_get(context)
+    if _HOST_AZS is None or _HOST_AZS[0] != version:
+        metadata = db.aggregate_host_get_by_metadata_key(context,
+                key='availability_zone')
+    else:
+        metadata = _HOST_AZS[2]
+    _HOST_AZS = (version, now, metadata)
+    return metadata
 
 
 def set_availability_zones(context, services):
     # Makes sure services isn't a sqlalchemy object
     services = [dict(service.iteritems()) for service in services]
-    metadata = db.aggregate_host_get_by_metadata_key(context,
-            key='availability_zone')
+    host_azs = _get_host_azs(context)
     for service in services:
         az = CONF.internal_service_availability_zone
         if service['topic'] == "compute":
-            if metadata.get(service['host']):
-                az = u','.join(list(metadata[service['host']]))
+            if host_azs.get(service['host']):
+                az = u','.join(list(host_azs[service['host']]))
             else:
                 az = CONF.default_availability_zone
-                # update the cache
-                cache = _get_cache()
-                cache_key = _make_cache_key(service['host'])
-                cache.delete(cache_key)
-                cache.set(cache_key, az, AZ_CACHE_SECONDS)
         service['availability_zone'] = az
     return services
 
 
+def get_host_availability_zones(context, host):
+    """Return the set of availability zones a host is in."""
+    host_azs = _get_host_azs(context)
+    return host_azs.get(host) or set([CONF.default_availability_zone])
+
+
 def get_host_availability_zone(context, host, conductor_api=None):
     if conductor_api:
+        # NOTE: services without DB access can't check the aggregates
+        #       version, so they keep asking conductor.
         metadata = conductor_api.aggregate_metadata_get_by_host(
             context, host, key='availability_zone')
-    else:
-        metadata = db.aggregate_metadata_get_by_host(
-            context, host, key='availability_zone')
-    if 'availability_zone' in metadata:
-        az = list(metadata['availability_zone'])[0]
-    else:
-        az = CONF.default_availability_zone
-    return az
+        if 'availability_zone' in metadata:
+            return list(metadata['availability_zone'])[0]
+        return CONF.default_availability_zone
+    return list(get_host_availability_zones(context, host))[0]
+
+
+def get_hosts_availability_zones(context, hosts):
+    """Return a dict of host to availability zone for the given hosts."""
+    host_azs = _get_host_azs(context)
+    azs = {}
+    for host in hosts:
+        if host_azs.get(host):
+            azs[host] = list(host_azs[host])[0]
+        else:
+            azs[host] = CONF.default_availability_zone
+    return azs
 
 
 def get_availability_zones(context):
     """Return available and unavailable zones."""
-    enabled_services = db.service_get_all(context, False)
-    disabled_services = db.service_get_all(context, True)
-    enabled_services = set_availability_zones(context, enabled_services)
-    disabled_services = set_availability_zones(context, disabled_services)
+    services = set_availability_zones(context, db.service_get_all(context))
 
     available_zones = []
-    for zone in [service['availability_zone'] for service
-                 in enabled_services]:
-        if zone not in available_zones:
+    available_set = set()
+    for service in services:
+        zone = service['availability_zone']
+        if not service['disabled'] and zone not in available_set:
+            available_set.add(zone)
             available_zones.append(zone)
 
     not_available_zones = []
-    zones = [service['availability_zone'] for service in disabled_services
-            if service['availability_zone'] not in available_zones]
-    for zone in zones:
-        if zone not in not_available_zones:
+    not_available_set = set(available_set)
+    for service in services:
+        zone = service['availability_zone']
+        if service['disabled'] and zone not in not_available_set:
+            not_available_set.add(zone)
             not_available_zones.append(zone)
     return (available_zones, not_available_zones)
 
 
+def get_instance_host(instance):
+    """Return the host whose availability zone an instance is in.
+
+    An instance which never had a host is looked up as host 'None', that is
+    in the default availability zone, while an empty host gives ''.
+    """
+    return str(instance.get('host'))
+
+
 def get_instance_availability_zone(context, instance):
     """Return availability zone of specified instance."""
-    host = str(instance.get('host'))
+    host = get_instance_host(instance)
     if not host:
         return None
 
-    cache_key = _make_cache_key(host)
-    cache = _get_cache()
-    az = cache.get(cache_key)
-    if not az:
-        elevated = context.elevated()
-        az = get_host_availability_zone(elevated, host)
-        cache.set(cache_key, az, AZ_CACHE_SECONDS)
-    return az
+    return get_host_availability_zone(context.elevated(), host)
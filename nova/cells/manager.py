@@ -102,10 +102,12 @@ class CellsManager(manager.Manager):
     @periodic_task.periodic_task
     def _update_our_parents(self, ctxt):
         """Update our parent cells with our capabilities and capacity
-        if we're at the bottom of the tree.
+        if we're at the bottom of the tree.  Capacities are only sent
+        when they changed.
         """
         self.msg_runner.tell_parents_our_capabilities(ctxt)
-        self.msg_runner.tell_parents_our_capacities(ctxt)
+        self.msg_runner.tell_parents_our_capacities(ctxt,
+                                                    only_if_changed=True)
 
     @periodic_task.periodic_task
     def _heal_instances(self, ctxt):
@@ -714,7 +714,8 @@ class _TargetedMessageMethods(_BaseMessageMethods):
         self.state_manager.update_cell_capacities(cell_name,
                 capacities)
         # Go ahead and update our parents now that a child updated us
-        self.msg_runner.tell_parents_our_capacities(message.ctxt)
+        self.msg_runner.tell_parents_our_capacities(message.ctxt,
+                                                    only_if_changed=True)
 
     def announce_capabilities(self, message):
         """A parent cell has told us to send our capabilities, so let's
@@ -1107,6 +1108,7 @@ class MessageRunner(object):
         for msg_type, cls in _CELL_MESSAGE_TYPE_TO_METHODS_CLS.iteritems():
             self.methods_by_type[msg_type] = cls(self)
         self.serializer = objects_base.NovaObjectSerializer()
+        self._last_capacities_sent = None
 
     def _process_message_locally(self, message):
         """Message processing will call this when its determined that
@@ -1233,13 +1235,23 @@ class MessageRunner(object):
                     method_kwargs, 'up', cell, fanout=True)
             message.process()
 
-    def tell_parents_our_capacities(self, ctxt):
-        """Send our capacities to parent cells."""
+    def tell_parents_our_capacities(self, ctxt, only_if_changed=False):
+        """Send our capacities to parent cells.
+
+        If only_if_changed is True, nothing is sent when neither our
+        capacities nor our parent cells changed since the last time they
+        were sent.
+        """
         parent_cells = self.state_manager.get_parent_cells()
         if not parent_cells:
             return
         my_cell_info = self.state_manager.get_my_state()
         capacities = self.state_manager.get_our_capacities()
+        sent = (sorted(cell.name for cell in parent_cells), capacities)
+        if only_if_changed and sent == self._last_capacities_sent:
+            LOG.debug(_("Capacities unchanged, not updating parents"))
+            return
+        self._last_capacities_sent = sent
         LOG.debug(_("Updating parents with our capacities: %(capacities)s"),
                   {'capacities': capacities})
         method_kwargs = {'cell_name': my_cell_info.name,
@@ -16,6 +16,7 @@
 """
 CellState Manager
 """
+import bisect
 import copy
 import datetime
 import functools
@@ -114,6 +115,115 @@ class CellState(object):
         return "Cell '%s' (%s)" % (self.name, me)
 
 
+class CellCapacity(object):
+    """Running free capacity totals for the compute nodes in a cell.
+
+    The last seen free/total RAM and disk of every host is kept so that
+    a refresh only has to adjust the totals for the hosts whose values
+    changed.  Unit counts are kept per distinct flavor size and the sizes
+    are sorted, so a host only contributes to the sizes that fit into its
+    free space.
+    """
+    def __init__(self):
+        self.hosts = {}
+        self.reserve_level = None
+        self.ram_counts = {}
+        self.disk_counts = {}
+        self.ram_sizes = []
+        self.disk_sizes = []
+        self.ram_units = {}
+        self.disk_units = {}
+        self.total_ram_mb_free = 0
+        self.total_disk_mb_free = 0
+
+    def _reset(self, ram_counts, disk_counts, reserve_level):
+        """Forget all hosts and start over with new flavor sizes."""
+        self.hosts = {}
+        self.reserve_level = reserve_level
+        self.ram_counts = ram_counts
+        self.disk_counts = disk_counts
+        # Flavors of size 0 never fit any units, so they're only
+        # reported, never counted.
+        self.ram_sizes = sorted(size for size in ram_counts if size)
+        self.disk_sizes = sorted(size for size in disk_counts if size)
+        self.ram_units = dict((size, 0) for size in self.ram_sizes)
+        self.disk_units = dict((size, 0) for size in self.disk_sizes)
+        self.total_ram_mb_free = 0
+        self.total_disk_mb_free = 0
+
+    def _adjust_units(self, sizes, units, total, free, sign):
+        free = max(0, free - total * self.reserve_level)
+        for size in sizes[:bisect.bisect_right(sizes, free)]:
+            units[size] += sign * int(free / size)
+
+    def _adjust(self, values, sign):
+        """Add (sign=1) or remove (sign=-1) a host's values."""
+        self.total_ram_mb_free += sign * values['free_ram_mb']
+        self.total_disk_mb_free += sign * values['free_disk_mb']
+        self._adjust_units(self.ram_sizes, self.ram_units,
+                values['total_ram_mb'], values['free_ram_mb'], sign)
+        self._adjust_units(self.disk_sizes, self.disk_units,
+                values['total_disk_mb'], values['free_disk_mb'], sign)
+
+    def refresh(self, compute_hosts, instance_types, reserve_level):
+        """Bring the totals up to date.
+
+        :param compute_hosts: dict of host name to a dict with
+                              'free_ram_mb', 'free_disk_mb',
+                              'total_ram_mb' and 'total_disk_mb'
+        :param instance_types: list of instance types
+        :param reserve_level: fraction of every host to hold in reserve
+
+        Returns True if the capacities changed.
+        """
+        ram_counts = {}
+        disk_counts = {}
+        for instance_type in instance_types:
+            memory_mb = instance_type['memory_mb']
+            disk_mb = (instance_type['root_gb'] +
+                    instance_type['ephemeral_gb']) * 1024
+            ram_counts[memory_mb] = ram_counts.get(memory_mb, 0) + 1
+            disk_counts[disk_mb] = disk_counts.get(disk_mb, 0) + 1
+
+        changed = False
+        if (ram_counts != self.ram_counts or
+                disk_counts != self.disk_counts or
+                reserve_level != self.reserve_level):
+            self._reset(ram_counts, disk_counts, reserve_level)
+            changed = True
+
+        for host in set(self.hosts) - set(compute_hosts):
+            self._adjust(self.hosts.pop(host), -1)
+            changed = True
+
+        for host, values in compute_hosts.iteritems():
+            old_values = self.hosts.get(host)
+            if old_values == values:
+                continue
+            if old_values is not None:
+                self._adjust(old_values, -1)
+            self._adjust(values, 1)
+            self.hosts[host] = values
+            changed = True
+        return changed
+
+    def get_capacities(self):
+        """Return the capacities in the format used by CellState."""
+        if not self.hosts:
+            return {}
+
+        def _units_by_mb(counts, units):
+            return dict((str(size), count * units.get(size, 0))
+                        for size, count in counts.iteritems())
+
+        return {'ram_free': {'total_mb': self.total_ram_mb_free,
+                             'units_by_mb': _units_by_mb(self.ram_counts,
+                                                         self.ram_units)},
+                'disk_free': {'total_mb': self.total_disk_mb_free,
+                              'units_by_mb': _units_by_mb(self.disk_counts,
+                                                          self.disk_units)}}
+
+
 def sync_before(f):
     """Use as a decorator to wrap methods that use cell information to
     make sure they sync the latest information from the DB periodically.
@@ -165,6 +275,7 @@ class CellStateManager(base.Base):
         self.parent_cells = {}
         self.child_cells = {}
         self.last_cell_db_check = datetime.datetime.min
+        self.capacity = CellCapacity()
 
         self._cell_data_sync(force=True)
 
@@ -241,6 +352,10 @@ class CellStateManager(base.Base):
 
         NOTE(comstud): Perhaps we should only report a single number
         available per instance_type.
+
+        The totals are kept in self.capacity and only adjusted for the
+        compute nodes that changed since the last update.  CellState
+        capacities are only replaced when something actually changed.
         """
 
         if not ctxt:
@@ -249,63 +364,23 @@ class CellStateManager(base.Base):
         reserve_level = CONF.cells.reserve_percent / 100.0
         compute_hosts = {}
 
-        def _get_compute_hosts():
-            compute_nodes = self.db.compute_node_get_all(ctxt)
-            for compute in compute_nodes:
-                service = compute['service']
-                if not service or service['disabled']:
-                    continue
-                host = service['host']
-                compute_hosts[host] = {
-                        'free_ram_mb': compute['free_ram_mb'],
-                        'free_disk_mb': compute['free_disk_gb'] * 1024,
-                        'total_ram_mb': compute['memory_mb'],
-                        'total_disk_mb': compute['local_gb'] * 1024}
-
-        _get_compute_hosts()
-        if not compute_hosts:
-            self.my_cell_state.update_capacities({})
-            return
-
-        ram_mb_free_units = {}
-        disk_mb_free_units = {}
-        total_ram_mb_free = 0
-        total_disk_mb_free = 0
-
-        def _free_units(total, free, per_inst):
-            if per_inst:
-                min_free = total * reserve_level
-                free = max(0, free - min_free)
-                return int(free / per_inst)
-            else:
-                return 0
-
-        def _update_from_values(values, instance_type):
-            memory_mb = instance_type['memory_mb']
-            disk_mb = (instance_type['root_gb'] +
-                    instance_type['ephemeral_gb']) * 1024
-            ram_mb_free_units.setdefault(str(memory_mb), 0)
-            disk_mb_free_units.setdefault(str(disk_mb), 0)
-            ram_free_units = _free_units(compute_values['total_ram_mb'],
-                    compute_values['free_ram_mb'], memory_mb)
-            disk_free_units = _free_units(compute_values['total_disk_mb'],
-                    compute_values['free_disk_mb'], disk_mb)
-            ram_mb_free_units[str(memory_mb)] += ram_free_units
-            disk_mb_free_units[str(disk_mb)] += disk_free_units
+        compute_nodes = self.db.compute_node_get_all(ctxt)
+        for compute in compute_nodes:
+            service = compute['service']
+            if not service or service['disabled']:
+                continue
+            host = service['host']
+            compute_hosts[host] = {
+                    'free_ram_mb': compute['free_ram_mb'],
+                    'free_disk_mb': compute['free_disk_gb'] * 1024,
+                    'total_ram_mb': compute['memory_mb'],
+                    'total_disk_mb': compute['local_gb'] * 1024}
 
         instance_types = self.db.flavor_get_all(ctxt)
-
-        for compute_values in compute_hosts.values():
-            total_ram_mb_free += compute_values['free_ram_mb']
-            total_disk_mb_free += compute_values['free_disk_mb']
-            for instance_type in instance_types:
-                _update_from_values(compute_values, instance_type)
-
-        capacities = {'ram_free': {'total_mb': total_ram_mb_free,
-                                   'units_by_mb': ram_mb_free_units},
-                      'disk_free': {'total_mb': total_disk_mb_free,
-                                    'units_by_mb': disk_mb_free_units}}
-        self.my_cell_state.update_capacities(capacities)
+        if self.capacity.refresh(compute_hosts, instance_types,
+                                 reserve_level):
+            self.my_cell_state.update_capacities(
+                    self.capacity.get_capacities())
 
     @sync_before
     def get_cell_info_for_neighbors(self):
@@ -150,18 +150,17 @@ class CloudPipe(object):
             group_ref = db.security_group_create(context, group)
         except exception.SecurityGroupExists:
             return group_name
-        rule = {'parent_group_id': group_ref['id'],
-                'cidr': '0.0.0.0/0',
-                'protocol': 'udp',
-                'from_port': 1194,
-                'to_port': 1194}
-        db.security_group_rule_create(context, rule)
-        rule = {'parent_group_id': group_ref['id'],
-                'cidr': '0.0.0.0/0',
-                'protocol': 'icmp',
-                'from_port': -1,
-                'to_port': -1}
-        db.security_group_rule_create(context, rule)
+        rules = [{'parent_group_id': group_ref['id'],
+                  'cidr': '0.0.0.0/0',
+                  'protocol': 'udp',
+                  'from_port': 1194,
+                  'to_port': 1194},
+                 {'parent_group_id': group_ref['id'],
+                  'cidr': '0.0.0.0/0',
+                  'protocol': 'icmp',
+                  'from_port': -1,
+                  'to_port': -1}]
+        db.security_group_rule_bulk_create(context, rules)
         # NOTE(vish): No need to trigger the group since the instance
         #             has not been run yet.
         return group_name
@@ -30,6 +30,8 @@ import socket
 import stat
 from wsgiref import simple_server
 
+from oslo.config import cfg
+
 from nova import config
 from nova import context as nova_context
 from nova.openstack.common import excutils
@@ -38,11 +40,42 @@ from nova.openstack.common import processutils
 from nova import utils
 from nova.virt.baremetal import baremetal_states
 from nova.virt.baremetal import db
-
+from nova.virt.baremetal import deploy_events
+
+
+opts = [
+    cfg.IntOpt('deploy_workers',
+               default=4,
+               help='Number of deployments to run at the same time'),
+    cfg.IntOpt('deploy_workers_per_portal',
+               default=2,
+               help='Maximum number of deployments to run at the same time '
+                    'through the same iSCSI portal'),
+    cfg.IntOpt('deploy_write_streams',
+               default=4,
+               help='Number of dd processes writing an image to a node '
+                    'at the same time'),
+    ]
+
+baremetal_group = cfg.OptGroup(name='baremetal',
+                               title='Baremetal Options')
+
+CONF = cfg.CONF
+CONF.register_group(baremetal_group)
+CONF.register_opts(opts, baremetal_group)
 
 QUEUE = Queue.Queue()
 LOG = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+# Largest number of 1MB blocks written by a single dd command
+WRITE_CHUNK_MB = 64
+# Deploy progress is saved to the node every time it grows by this much
+PROGRESS_STEP = 10
+
+_PORTALS = {}
+_PORTALS_LOCK = threading.Lock()
+
 
 # All functions are called from deploy() directly or indirectly.
 # They are split for stub-out.
@@ -103,17 +136,111 @@ def is_block_device(dev):
     return stat.S_ISBLK(s.st_mode)
 
 
-def dd(src, dst):
-    """Execute dd from src to dst."""
+def dd(src, dst, *args):
+    """Execute dd from src to dst, with extra operands if given."""
     utils.execute('dd',
                   'if=%s' % src,
                   'of=%s' % dst,
                   'bs=1M',
                   'oflag=direct',
+                  *args,
+                  run_as_root=True,
+                  check_exit_code=[0])
+
+
+def zero_out(dev, first_block, count):
+    """Zero 1MB blocks of a device without sending the zeros."""
+    utils.execute('blkdiscard', '-z',
+                  '-o', first_block * MB,
+                  '-l', count * MB,
+                  dev,
                   run_as_root=True,
                   check_exit_code=[0])
 
 
+def image_extents(image_path):
+    """Split an image into runs of 1MB blocks holding data or only zeros.
+
+    Returns a list of (is_data, first_block, block_count) tuples.
+    """
+    extents = []
+    zero = '\0' * MB
+    block = 0
+    with open(image_path, 'rb') as f:
+        while True:
+            data = f.read(MB)
+            if not data:
+                break
+            is_data = data != zero[:len(data)]
+            if extents and extents[-1][0] == is_data:
+                extents[-1][2] += 1
+            else:
+                extents.append([is_data, block, 1])
+            block += 1
+    return [tuple(extent) for extent in extents]
+
+
+def write_image(image_path, dev, progress=None):
+    """Write an image to a device with parallel dd streams.
+
+    The image is split in chunks of at most WRITE_CHUNK_MB, which
+    CONF.baremetal.deploy_write_streams threads write out of order.  Chunks
+    holding only zeros are zeroed with blkdiscard, so the target zeroes
+    them without the zeros going over the wire, unless the device does not
+    support it in which case they are written with dd too.
+
+    :param progress: called with the percentage of the image written
+    """
+    chunks = Queue.Queue()
+    total = 0
+    for is_data, first, count in image_extents(image_path):
+        for start in xrange(first, first + count, WRITE_CHUNK_MB):
+            chunks.put((is_data, start,
+                        min(WRITE_CHUNK_MB, first + count - start)))
+        total += count
+    state = {'written': 0, 'zero_out': True, 'errors': []}
+
+    def zero_out_chunk(start, count):
+        if not state['zero_out']:
+            return False
+        try:
+            zero_out(dev, start, count)
+        except processutils.ProcessExecutionError:
+            LOG.warn(_("Could not zero out blocks of %s, writing zeros "
+                       "instead"), dev)
+            state['zero_out'] = False
+            return False
+        return True
+
+    def write_chunks():
+        while not state['errors']:
+            try:
+                is_data, start, count = chunks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                if is_data or not zero_out_chunk(start, count):
+                    dd(image_path, dev,
+                       'skip=%d' % start, 'seek=%d' % start,
+                       'count=%d' % count, 'conv=notrunc')
+            except Exception:
+                state['errors'].append(sys.exc_info())
+                return
+            state['written'] += count
+            if progress is not None:
+                progress(state['written'] * 100 / total)
+
+    streams = [threading.Thread(target=write_chunks)
+               for i in xrange(max(1, CONF.baremetal.deploy_write_streams))]
+    for stream in streams:
+        stream.start()
+    for stream in streams:
+        stream.join()
+    if state['errors']:
+        exc_info = state['errors'][0]
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+
 def mkswap(dev, label='swap1'):
     """Execute mkswap on a device."""
     utils.execute('mkswap',
@@ -171,7 +298,7 @@ def get_image_mb(image_path):
     return image_mb
 
 
-def work_on_disk(dev, root_mb, swap_mb, image_path):
+def work_on_disk(dev, root_mb, swap_mb, image_path, progress=None):
     """Creates partitions and write an image to the root partition."""
     root_part = "%s-part1" % dev
     swap_part = "%s-part2" % dev
@@ -186,7 +313,7 @@ def work_on_disk(dev, root_mb, swap_mb, image_path):
     if not is_block_device(swap_part):
         LOG.warn(_("swap device '%s' not found"), swap_part)
         return
-    dd(image_path, root_part)
+    write_image(image_path, root_part, progress)
     mkswap(swap_part)
 
     try:
@@ -198,8 +325,11 @@ def work_on_disk(dev, root_mb, swap_mb, image_path):
 
 
 def deploy(address, port, iqn, lun, image_path, pxe_config_path,
-           root_mb, swap_mb):
-    """All-in-one function to deploy a node."""
+           root_mb, swap_mb, progress=None):
+    """All-in-one function to deploy a node.
+
+    :param progress: called with the percentage of the image written
+    """
     dev = get_dev(address, port, iqn, lun)
     image_mb = get_image_mb(image_path)
     if image_mb > root_mb:
@@ -207,7 +337,8 @@ def deploy(address, port, iqn, lun, image_path, pxe_config_path,
     discovery(address, port)
     login_iscsi(address, port, iqn)
     try:
-        root_uuid = work_on_disk(dev, root_mb, swap_mb, image_path)
+        root_uuid = work_on_disk(dev, root_mb, swap_mb, image_path,
+                                 progress)
     except processutils.ProcessExecutionError as err:
         with excutils.save_and_reraise_exception():
             # Log output if there was a error
@@ -222,8 +353,45 @@ def deploy(address, port, iqn, lun, image_path, pxe_config_path,
     notify(address, 10000)
 
 
+def portal_semaphore(address, port):
+    """Return the semaphore bounding the deployments through a portal."""
+    with _PORTALS_LOCK:
+        semaphore = _PORTALS.get((address, port))
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(
+                    CONF.baremetal.deploy_workers_per_portal)
+            _PORTALS[(address, port)] = semaphore
+        return semaphore
+
+
+def progress_reporter(context, node_id):
+    """Return a callback saving the deploy progress of a node."""
+    saved = {'percent': 0}
+
+    def report(percent):
+        if percent - saved['percent'] >= PROGRESS_STEP:
+            saved['percent'] = percent
+            db.bm_node_update(context, node_id, {'deploy_progress': percent})
+    return report
+
+
+def set_deploy_state(context, node_id, values):
+    """Save the deploy state of a node and announce it to the computes."""
+    db.bm_node_update(context, node_id, values)
+    try:
+        deploy_events.DeployEventAPI().deploy_state_changed(
+                context, node_id, values['task_state'])
+    except Exception:
+        # The computes poll the database for the lost notifications
+        LOG.exception(_('failed to announce the deploy state of node %s'),
+                      node_id)
+
+
 class Worker(threading.Thread):
-    """Thread that handles requests in queue."""
+    """Thread that handles requests in queue.
+
+    BareMetalDeploy runs CONF.baremetal.deploy_workers of them.
+    """
 
     def __init__(self):
         super(Worker, self).__init__()
@@ -244,26 +412,38 @@ class Worker(threading.Thread):
                 LOG.info(_('start deployment for node %(node_id)s, '
                            'params %(params)s') % locals())
                 context = nova_context.get_admin_context()
+                portal = portal_semaphore(params.get('address'),
+                                          params.get('port'))
                 try:
-                    db.bm_node_update(context, node_id,
-                          {'task_state': baremetal_states.DEPLOYING})
-                    deploy(**params)
+                    with portal:
+                        set_deploy_state(context, node_id,
+                              {'task_state': baremetal_states.DEPLOYING,
+                               'deploy_progress': 0})
+                        deploy(progress=progress_reporter(context, node_id),
+                               **params)
                 except Exception:
                     LOG.exception(_('deployment to node %s failed'), node_id)
-                    db.bm_node_update(context, node_id,
+                    set_deploy_state(context, node_id,
                           {'task_state': baremetal_states.DEPLOYFAIL})
                 else:
                     LOG.info(_('deployment to node %s done'), node_id)
-                    db.bm_node_update(context, node_id,
-                          {'task_state': baremetal_states.DEPLOYDONE})
+                    set_deploy_state(context, node_id,
+                          {'task_state': baremetal_states.DEPLOYDONE,
+                           'deploy_progress': 100})
 
 
 class BareMetalDeploy(object):
     """WSGI server for bare-metal deployment."""
 
     def __init__(self):
-        self.worker = Worker()
-        self.worker.start()
+        self.workers = [self._start_worker()
+                        for i in xrange(CONF.baremetal.deploy_workers)]
+
+    @staticmethod
+    def _start_worker():
+        worker = Worker()
+        worker.start()
+        return worker
 
     def __call__(self, environ, start_response):
         method = environ['REQUEST_METHOD']
@@ -312,10 +492,10 @@ class BareMetalDeploy(object):
                   'root_mb': int(d['root_mb']),
                   'swap_mb': int(d['swap_mb']),
                  }
-        # Restart worker, if needed
-        if not self.worker.isAlive():
-            self.worker = Worker()
-            self.worker.start()
+        # Restart workers, if needed
+        for i, worker in enumerate(self.workers):
+            if not worker.isAlive():
+                self.workers[i] = self._start_worker()
         LOG.info(_("request is queued: node %(node_id)s, params %(params)s"),
                   {'node_id': node_id, 'params': params})
         QUEUE.put((node_id, params))
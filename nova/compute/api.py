@@ -851,6 +851,7 @@ class API(base.Base):
         """tell vm driver to create ephemeral/swap device at boot time by
         updating BlockDeviceMapping
         """
+        values_list = []
         for bdm in block_device.mappings_prepend_dev(mappings):
             LOG.debug(_("bdm %s"), bdm, instance_uuid=instance_uuid)
 
@@ -865,13 +866,13 @@ class API(base.Base):
             if size == 0:
                 continue
 
-            values = {
+            values_list.append({
                 'instance_uuid': instance_uuid,
                 'device_name': bdm['device'],
                 'virtual_name': virtual_name,
-                'volume_size': size}
-            self.db.block_device_mapping_update_or_create(elevated_context,
-                                                          values)
+                'volume_size': size})
+        self.db.block_device_mapping_bulk_update_or_create(elevated_context,
+                                                           values_list)
 
     def _update_block_device_mapping(self, elevated_context,
                                      instance_type, instance_uuid,
@@ -881,6 +882,7 @@ class API(base.Base):
         """
         LOG.debug(_("block_device_mapping %s"), block_device_mapping,
                   instance_uuid=instance_uuid)
+        values_list = []
         for bdm in block_device_mapping:
             assert 'device_name' in bdm
 
@@ -907,8 +909,9 @@ class API(base.Base):
                           'snapshot_id', 'volume_id', 'volume_size'):
                     values[k] = None
 
-            self.db.block_device_mapping_update_or_create(elevated_context,
-                                                          values)
+            values_list.append(values)
+        self.db.block_device_mapping_bulk_update_or_create(elevated_context,
+                                                           values_list)
 
     def _validate_bdm(self, context, instance):
         for bdm in block_device.legacy_mapping(
@@ -1470,7 +1473,8 @@ class API(base.Base):
     def get_active_by_window(self, context, begin, end=None, project_id=None):
         """Get instances that were continuously active over a window."""
         return self.db.instance_get_active_by_window_joined(context, begin,
-                                                     end, project_id)
+                                                     end, project_id,
+                                                     use_slave=True)
 
     #NOTE(bcwaldon): this doesn't really belong in this class
     def get_instance_type(self, context, instance_type_id):
@@ -1501,7 +1505,8 @@ class API(base.Base):
         return instance
 
     def get_all(self, context, search_opts=None, sort_key='created_at',
-                sort_dir='desc', limit=None, marker=None, want_objects=False):
+                sort_dir='desc', limit=None, marker=None, want_objects=False,
+                use_slave=False):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retrieve
@@ -1513,6 +1518,10 @@ class API(base.Base):
         The results will be returned sorted in the order specified by the
         'sort_dir' parameter using the key specified in the 'sort_key'
         parameter.
+
+        With use_slave, the instances are read from the read-only replica
+        when one is configured, for listings which can live with
+        replication lag.
         """
 
         #TODO(bcwaldon): determine the best argument for target here
@@ -1580,7 +1589,8 @@ class API(base.Base):
         inst_models = self._get_instances_by_filters(context, filters,
                                                      sort_key, sort_dir,
                                                      limit=limit,
-                                                     marker=marker)
+                                                     marker=marker,
+                                                     use_slave=use_slave)
         if want_objects:
             return inst_models
 
@@ -1594,7 +1604,8 @@ class API(base.Base):
     def _get_instances_by_filters(self, context, filters,
                                   sort_key, sort_dir,
                                   limit=None,
-                                  marker=None):
+                                  marker=None,
+                                  use_slave=False):
         if 'ip6' in filters or 'ip' in filters:
             res = self.network_api.get_instance_uuids_by_ip_filter(context,
                                                                    filters)
@@ -1607,7 +1618,8 @@ class API(base.Base):
                   'security_groups']
         return instance_obj.InstanceList.get_by_filters(
             context, filters=filters, sort_key=sort_key, sort_dir=sort_dir,
-            limit=limit, marker=marker, expected_attrs=fields)
+            limit=limit, marker=marker, expected_attrs=fields,
+            use_slave=use_slave)
 
     @wrap_check_policy
     @check_instance_state(vm_state=[vm_states.ACTIVE, vm_states.PAUSED])
@@ -2705,6 +2717,21 @@ class API(base.Base):
             return block_device.legacy_mapping(bdms)
         return bdms
 
+    def get_instances_bdms(self, context, instance_uuids, legacy=True):
+        """Get all bdm tables for the specified instances with a single
+        query.  Returns a dict keyed by instance uuid.
+        """
+        bdms_by_uuid = dict((instance_uuid, [])
+                            for instance_uuid in instance_uuids)
+        bdms = self.db.block_device_mapping_get_all_by_instance_uuids(
+                context, instance_uuids)
+        for bdm in bdms:
+            bdms_by_uuid[bdm['instance_uuid']].append(bdm)
+        if legacy:
+            for instance_uuid, bdms in bdms_by_uuid.items():
+                bdms_by_uuid[instance_uuid] = block_device.legacy_mapping(bdms)
+        return bdms_by_uuid
+
     def is_volume_backed_instance(self, context, instance, bdms):
         if not instance['image_ref']:
             return True
@@ -3384,7 +3411,7 @@ class SecurityGroupAPI(base.Base, security_group_base.SecurityGroupBase):
         msg = _("Authorize security group ingress %s")
         LOG.audit(msg, name, context=context)
 
-        rules = [self.db.security_group_rule_create(context, v) for v in vals]
+        rules = self.db.security_group_rule_bulk_create(context, vals)
 
         self.trigger_rules_refresh(context, id=id)
         return rules
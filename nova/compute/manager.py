@@ -578,6 +578,10 @@ class ComputeManager(manager.SchedulerDependentManager):
         self._notify_about_instance_usage(context, instance, "delete.end",
                 system_metadata=system_meta)
 
+        self._delete_console_tokens(context, instance)
+
+    def _delete_console_tokens(self, context, instance):
+        """Invalidate the console tokens of a deleted or moved instance."""
         if CONF.vnc_enabled or CONF.spice.enabled:
             if CONF.cells.enable:
                 self.cells_rpcapi.consoleauth_delete_tokens(context,
@@ -1799,6 +1803,9 @@ class ComputeManager(manager.SchedulerDependentManager):
                     LOG.info(_("disk not on shared storagerebuilding from:"
                                " '%s'") % str(image_ref))
 
+                # The consoles of the instance were on the failed host
+                self._delete_console_tokens(context, instance)
+
                 instance = self._instance_update(
                         context, instance['uuid'], host=self.host)
 
@@ -2498,13 +2505,16 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         connector = self.driver.get_volume_connector(instance)
 
+        values_list = []
         for bdm in bdms:
             cinfo = self.volume_api.initialize_connection(
                     context, bdm['volume_id'], connector)
+            values_list.append({'instance_uuid': instance['uuid'],
+                                'device_name': bdm['device_name'],
+                                'connection_info': jsonutils.dumps(cinfo)})
 
-            self.conductor_api.block_device_mapping_update(
-                context, bdm['id'],
-                {'connection_info': jsonutils.dumps(cinfo)})
+        self.conductor_api.block_device_mapping_bulk_update_or_create(
+            context, values_list)
 
         return bdms
 
@@ -2561,6 +2571,7 @@ class ComputeManager(manager.SchedulerDependentManager):
             self.driver.finish_revert_migration(instance,
                                        self._legacy_nw_info(network_info),
                                        block_device_info, power_on)
+            self._delete_console_tokens(context, instance)
 
             # Just roll back the record. There's no need to resize down since
             # the 'old' VM already has the preferred attributes
@@ -2846,6 +2857,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                                      self._legacy_nw_info(network_info),
                                      image, resize_instance,
                                      block_device_info, power_on)
+        self._delete_console_tokens(context, instance)
 
         migration = self.conductor_api.migration_update(context,
                 migration, 'finished')
@@ -3139,6 +3151,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         instance.task_state = None
         instance.save(expected_task_state=[task_states.SHELVING,
                                            task_states.SHELVING_OFFLOADING])
+        self._delete_console_tokens(context, instance)
         self._notify_about_instance_usage(context, instance,
                 'shelve_offload.end')
 
@@ -3804,6 +3817,9 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.network_api.setup_networks_on_host(ctxt, instance_ref,
                                                 self.host, teardown=True)
 
+        # The consoles of the instance are now on the destination host
+        self._delete_console_tokens(ctxt, instance_ref)
+
         LOG.info(_('Migrating instance to %s finished successfully.'),
                  dest, instance=instance_ref)
         LOG.info(_("You may see the error \"libvirt: QEMU error: "
@@ -4315,8 +4331,13 @@ class ComputeManager(manager.SchedulerDependentManager):
         loop, one database record at a time, checking if the hypervisor has the
         same power state as is in the database.
         """
-        db_instances = instance_obj.InstanceList.get_by_host(context,
-                                                             self.host)
+        # NOTE: Only the columns needed to decide whether to sync an
+        # instance are loaded up front. The projected instances are only
+        # used for that read-only comparison, _sync_instance_power_state
+        # works on a fully loaded instance since it may send it over RPC
+        db_instances = instance_obj.InstanceList.get_by_host(
+            context, self.host, fields=['host', 'node', 'power_state',
+                                        'task_state', 'vm_state'])
 
         num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
@@ -4352,8 +4373,10 @@ class ComputeManager(manager.SchedulerDependentManager):
         """
 
         # We re-query the DB to get the latest instance info to minimize
-        # (not eliminate) race condition.
-        db_instance.refresh()
+        # (not eliminate) race condition. The full instance is loaded, not
+        # just the fields the caller had, since it may be sent over RPC.
+        db_instance = instance_obj.Instance.get_by_uuid(context,
+                                                        db_instance.uuid)
         db_power_state = db_instance.power_state
         vm_state = db_instance.vm_state
 
@@ -198,6 +198,11 @@ class LocalAPI(object):
         return self._manager.block_device_mapping_update_or_create(context,
                                                                    values)
 
+    def block_device_mapping_bulk_update_or_create(self, context,
+                                                   values_list):
+        return self._manager.block_device_mapping_bulk_update_or_create(
+            context, values_list)
+
     def block_device_mapping_get_all_by_instance(self, context, instance,
                                                  legacy=True):
         return self._manager.block_device_mapping_get_all_by_instance(
@@ -73,7 +73,7 @@ class ConductorManager(manager.Manager):
     namespace.  See the ComputeTaskManager class for details.
     """
 
-    RPC_API_VERSION = '1.54'
+    RPC_API_VERSION = '1.55'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -281,6 +281,14 @@ class ConductorManager(manager.Manager):
         self.cells_rpcapi.bdm_update_or_create_at_top(context, bdm,
                                                       create=create)
 
+    def block_device_mapping_bulk_update_or_create(self, context,
+                                                   values_list):
+        bdms = self.db.block_device_mapping_bulk_update_or_create(context,
+                                                                  values_list)
+        for bdm in bdms:
+            self.cells_rpcapi.bdm_update_or_create_at_top(context, bdm,
+                                                          create=None)
+
     def block_device_mapping_get_all_by_instance(self, context, instance,
                                                  legacy=True):
         bdms = self.db.block_device_mapping_get_all_by_instance(
@@ -106,6 +106,7 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     1.52 - Pass instance objects for compute_confirm_resize
     1.53 - Added compute_reboot
     1.54 - Added 'update_cells' argument to bw_usage_update
+    1.55 - Added block_device_mapping_bulk_update_or_create
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -266,6 +267,12 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             values=values, create=create)
         return self.call(context, msg, version='1.12')
 
+    def block_device_mapping_bulk_update_or_create(self, context,
+                                                   values_list):
+        msg = self.make_msg('block_device_mapping_bulk_update_or_create',
+                            values_list=values_list)
+        return self.call(context, msg, version='1.55')
+
     def block_device_mapping_get_all_by_instance(self, context, instance,
                                                  legacy=True):
         instance_p = jsonutils.to_primitive(instance)
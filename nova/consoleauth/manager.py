@@ -59,30 +59,40 @@ class ConsoleAuthManager(manager.Manager):
         self.cells_rpcapi = cells_rpcapi.CellsAPI()
 
     def _get_tokens_for_instance(self, instance_uuid):
-        tokens_str = self.mc.get(instance_uuid.encode('UTF-8'))
-        if not tokens_str:
-            tokens = []
-        else:
-            tokens = jsonutils.loads(tokens_str)
+        """Return a dict of the tokens of an instance to their expiry."""
+        tokens = self.mc.get(instance_uuid.encode('UTF-8'))
+        if not tokens:
+            return {}
+        if isinstance(tokens, basestring):
+            # NOTE: tokens used to be stored as a JSON encoded list
+            expires_at = time.time() + CONF.console_token_ttl
+            tokens = dict((token, expires_at)
+                          for token in jsonutils.loads(tokens))
         return tokens
 
     def authorize_console(self, context, token, console_type, host, port,
                           internal_access_path, instance_uuid=None):
 
+        now = time.time()
         token_dict = {'token': token,
                       'instance_uuid': instance_uuid,
                       'console_type': console_type,
                       'host': host,
                       'port': port,
                       'internal_access_path': internal_access_path,
-                      'last_activity_at': time.time()}
+                      'last_activity_at': now}
         data = jsonutils.dumps(token_dict)
         self.mc.set(token.encode('UTF-8'), data, CONF.console_token_ttl)
         if instance_uuid is not None:
             tokens = self._get_tokens_for_instance(instance_uuid)
-            tokens.append(token)
-            self.mc.set(instance_uuid.encode('UTF-8'),
-                        jsonutils.dumps(tokens))
+            # Forget the tokens which expired since the last authorization
+            # so that the set of an instance does not grow without bound.
+            tokens = dict((t, expires_at)
+                          for t, expires_at in tokens.iteritems()
+                          if expires_at > now)
+            tokens[token] = now + CONF.console_token_ttl
+            self.mc.set(instance_uuid.encode('UTF-8'), tokens,
+                        CONF.console_token_ttl)
 
         LOG.audit(_("Received Token: %(token)s, %(token_dict)s)"), locals())
 
@@ -111,9 +121,32 @@ class ConsoleAuthManager(manager.Manager):
         LOG.audit(_("Checking Token: %(token)s, %(token_valid)s)"), locals())
         if token_valid:
             token = jsonutils.loads(token_str)
+            if token.get('validated'):
+                return token
             if self._validate_token(context, token):
+                self._cache_validation(token)
                 return token
 
+    def _cache_validation(self, token):
+        """Remember that a token was validated for the rest of its life.
+
+        Later checks of the token skip the round trip to the compute host.
+        The validation goes away with the token when the tokens of the
+        instance are deleted, which happens when it is deleted or moved.
+        """
+        ttl = int(token['last_activity_at'] + CONF.console_token_ttl -
+                  time.time())
+        if ttl <= 0:
+            return
+        # NOTE: do not bring back a token which was deleted while it was
+        # being validated.
+        tokens = self._get_tokens_for_instance(token['instance_uuid'])
+        if token['token'] not in tokens:
+            return
+        token['validated'] = True
+        self.mc.set(token['token'].encode('UTF-8'), jsonutils.dumps(token),
+                    ttl)
+
     def delete_tokens_for_instance(self, context, instance_uuid):
         tokens = self._get_tokens_for_instance(instance_uuid)
         for token in tokens:
@@ -95,6 +95,9 @@ class RequestContext(object):
         self.user_name = user_name
         self.project_name = project_name
         self.is_admin = is_admin
+        # Memoized policy check results for this request, see
+        # nova.policy.enforce().
+        self.policy_results = {}
         if self.is_admin is None:
             self.is_admin = policy.check_is_admin(self)
         if overwrite or not hasattr(local.store, 'context'):
@@ -144,6 +147,7 @@ class RequestContext(object):
         """Return a version of this context with admin flag set."""
         context = copy.copy(self)
         context.is_admin = True
+        context.policy_results = {}
 
         if 'admin' not in context.roles:
             context.roles.append('admin')
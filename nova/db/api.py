@@ -177,9 +177,9 @@ def compute_node_get(context, compute_id):
     return IMPL.compute_node_get(context, compute_id)
 
 
-def compute_node_get_all(context):
+def compute_node_get_all(context, use_slave=False):
     """Get all computeNodes."""
-    return IMPL.compute_node_get_all(context)
+    return IMPL.compute_node_get_all(context, use_slave=use_slave)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -448,6 +448,17 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
                                         instance_uuid, host)
 
 
+def fixed_ip_associate_pool_many(context, network_id, instance_uuids,
+                                 host=None):
+    """Find free ips in network and associate them with the instances.
+
+    Returns the addresses in the order of instance_uuids, fewer of them if
+    the network runs out of free ips.
+    """
+    return IMPL.fixed_ip_associate_pool_many(context, network_id,
+                                             instance_uuids, host)
+
+
 def fixed_ip_create(context, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_create(context, values)
@@ -616,28 +627,42 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None):
-    """Get all instances that match all filters."""
+                                columns_to_join=None, columns=None,
+                                use_slave=False):
+    """Get all instances that match all filters.
+
+    If columns is given, only those columns (plus id and uuid) are loaded.
+    With use_slave, they are read from the read-only replica if any.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
-                                            columns_to_join=columns_to_join)
+                                            columns_to_join=columns_to_join,
+                                            columns=columns,
+                                            use_slave=use_slave)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False):
     """Get instances and joins active during a certain time window.
 
     Specifying a project_id will filter for a certain project.
     Specifying a host will filter for instances on a given compute host.
     """
     return IMPL.instance_get_active_by_window_joined(context, begin, end,
-                                              project_id, host)
+                                              project_id, host,
+                                              use_slave=use_slave)
+
 
+def instance_get_all_by_host(context, host, columns_to_join=None,
+                             columns=None):
+    """Get all instances belonging to a host.
 
-def instance_get_all_by_host(context, host, columns_to_join=None):
-    """Get all instances belonging to a host."""
-    return IMPL.instance_get_all_by_host(context, host, columns_to_join)
+    If columns is given, only those columns (plus id and uuid) are loaded.
+    """
+    return IMPL.instance_get_all_by_host(context, host, columns_to_join,
+                                         columns=columns)
 
 
 def instance_get_all_by_host_and_node(context, host, node):
@@ -1124,12 +1149,26 @@ def block_device_mapping_update_or_create(context, values, legacy=True):
     return IMPL.block_device_mapping_update_or_create(context, values, legacy)
 
 
+def block_device_mapping_bulk_update_or_create(context, values_list,
+                                               legacy=True):
+    """Update or create many entries of block device mapping at once."""
+    return IMPL.block_device_mapping_bulk_update_or_create(context,
+                                                           values_list,
+                                                           legacy)
+
+
 def block_device_mapping_get_all_by_instance(context, instance_uuid):
     """Get all block device mapping belonging to an instance."""
     return IMPL.block_device_mapping_get_all_by_instance(context,
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    """Get all block device mapping belonging to a list of instances."""
+    return IMPL.block_device_mapping_get_all_by_instance_uuids(
+            context, instance_uuids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1222,6 +1261,11 @@ def security_group_rule_create(context, values):
     return IMPL.security_group_rule_create(context, values)
 
 
+def security_group_rule_bulk_create(context, values_list):
+    """Create many security group rules at once."""
+    return IMPL.security_group_rule_bulk_create(context, values_list)
+
+
 def security_group_rule_get_by_security_group(context, security_group_id):
     """Get all rules for a given security group."""
     return IMPL.security_group_rule_get_by_security_group(context,
@@ -1558,9 +1602,10 @@ def bw_usage_get(context, uuid, start_period, mac):
     return IMPL.bw_usage_get(context, uuid, start_period, mac)
 
 
-def bw_usage_get_by_uuids(context, uuids, start_period):
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
     """Return bw usages for instance(s) in a given audit period."""
-    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period)
+    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period,
+                                      use_slave=use_slave)
 
 
 def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
@@ -1623,6 +1668,36 @@ def s3_image_create(context, image_uuid):
 ####################
 
 
+def ec2_id_mappings_get_by_uuids(context, kind, uuids):
+    """Get the ec2 ids mapped to the given uuids.
+
+    :param kind: 'image', 'instance', 'volume' or 'snapshot'
+    :returns: dict of uuid to ec2 id, only for uuids that have a mapping
+    """
+    return IMPL.ec2_id_mappings_get_by_uuids(context, kind, uuids)
+
+
+def ec2_id_mappings_get_by_ids(context, kind, ids):
+    """Get the uuids mapped to the given ec2 ids.
+
+    :param kind: 'image', 'instance', 'volume' or 'snapshot'
+    :returns: dict of ec2 id to uuid, only for ids that have a mapping
+    """
+    return IMPL.ec2_id_mappings_get_by_ids(context, kind, ids)
+
+
+def ec2_id_mappings_create(context, kind, uuids):
+    """Create ec2 id mappings for the given uuids, in order.
+
+    :param kind: 'image', 'instance', 'volume' or 'snapshot'
+    :returns: dict of uuid to the created ec2 id
+    """
+    return IMPL.ec2_id_mappings_create(context, kind, uuids)
+
+
+####################
+
+
 def aggregate_create(context, values, metadata=None):
     """Create a new aggregate with metadata."""
     return IMPL.aggregate_create(context, values, metadata)
@@ -1658,6 +1733,15 @@ def aggregate_host_get_by_metadata_key(context, key):
     return IMPL.aggregate_host_get_by_metadata_key(context, key)
 
 
+def aggregate_version_get(context):
+    """Get the aggregates version.
+
+    The version is bumped whenever aggregate hosts or metadata change, so
+    it can be used to tell when data derived from aggregates is stale.
+    """
+    return IMPL.aggregate_version_get(context)
+
+
 def aggregate_update(context, aggregate_id, values):
     """Update the attributes of an aggregates.
 
@@ -23,6 +23,7 @@ import collections
 import copy
 import datetime
 import functools
+import random
 import sys
 import time
 import uuid
@@ -41,6 +42,7 @@ from sqlalchemy.orm import joinedload_all
 from sqlalchemy.orm import noload
 from sqlalchemy.schema import Table
 from sqlalchemy.sql.expression import asc
+from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql.expression import select
 from sqlalchemy.sql import func
@@ -86,6 +88,8 @@ _DEFAULT_QUOTA_NAME = 'default'
 
 def get_backend():
     """The backend is this module itself."""
+    if CONF.sql_query_stats:
+        return db_session.QueryStatsBackend(sys.modules[__name__])
     return sys.modules[__name__]
 
 
@@ -172,6 +176,9 @@ def model_query(context, model, *args, **kwargs):
 
     :param context: context to query under
     :param session: if present, the session to use
+    :param use_slave: if present and true, query the read-only replica
+            rather than the main database, when one is configured.  Only
+            for reads which can live with replication lag.
     :param read_deleted: if present, overrides context's read_deleted field.
     :param project_only: if present and context is user-type, then restrict
             query to match the context's project_id. If set to 'allow_none',
@@ -181,7 +188,8 @@ def model_query(context, model, *args, **kwargs):
             parameter that is a subclass of NovaBase and corresponds to the
             model parameter.
     """
-    session = kwargs.get('session') or get_session()
+    session = kwargs.get('session') or get_session(
+        slave_session=kwargs.get('use_slave', False))
     read_deleted = kwargs.get('read_deleted') or context.read_deleted
     project_only = kwargs.get('project_only', False)
 
@@ -279,6 +287,49 @@ def convert_datetimes(values, *datetime_keys):
             values[key] = timeutils.parse_strtime(values[key])
     return values
 
+
+def _bulk_insert(session, model, rows):
+    """Insert rows of a model with one executemany per set of columns.
+
+    Rows giving different columns are inserted separately rather than padded
+    with NULLs, so that the column defaults still apply.
+    """
+    by_columns = collections.defaultdict(list)
+    for row in rows:
+        by_columns[tuple(sorted(row))].append(row)
+    with session.begin(subtransactions=True):
+        for same_columns in by_columns.values():
+            session.execute(model.__table__.insert(), same_columns)
+
+
+def _metadata_bulk_update(session, model, instance_uuid, metadata, query):
+    """Set metadata items with one executemany for the keys whose value
+    changed and another for the new keys.
+
+    :param query: query on the current metadata rows of the instance
+    """
+    if not metadata:
+        return
+
+    rows = query.filter(model.key.in_(metadata.keys())).\
+        with_entities(model.id, model.key, model.value).\
+        all()
+
+    table = model.__table__
+    changed = [{'row_id': row_id, 'new_value': metadata[key]}
+               for row_id, key, value in rows if value != metadata[key]]
+    if changed:
+        session.execute(table.update().
+                        where(table.c.id == bindparam('row_id')).
+                        values(value=bindparam('new_value')),
+                        changed)
+
+    existing_keys = set(key for row_id, key, value in rows)
+    _bulk_insert(session, model,
+                 [{'key': key, 'value': value, 'instance_uuid': instance_uuid}
+                  for key, value in metadata.iteritems()
+                  if key not in existing_keys])
+
 ###################
 
 
@@ -472,8 +523,8 @@ def _compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
-def compute_node_get_all(context):
-    return model_query(context, models.ComputeNode).\
+def compute_node_get_all(context, use_slave=False):
+    return model_query(context, models.ComputeNode, use_slave=use_slave).\
             options(joinedload('service')).\
             options(joinedload('stats')).\
             all()
@@ -1017,39 +1068,107 @@ def fixed_ip_associate(context, address, instance_uuid, network_id=None,
     return fixed_ip_ref['address']
 
 
+def _fixed_ip_pool_candidates(context, network_id, count, session):
+    """Return up to count free (id, address) pairs of a network.
+
+    The rows are read from a random point of the network's ids onwards,
+    wrapping around, so that concurrent allocations look at different rows
+    instead of all racing for the first free one.
+    """
+    network_or_none = or_(models.FixedIp.network_id == network_id,
+                          models.FixedIp.network_id == None)
+    low, high = model_query(context, func.min(models.FixedIp.id),
+                            func.max(models.FixedIp.id),
+                            base_model=models.FixedIp, session=session,
+                            read_deleted="no").\
+                        filter(network_or_none).\
+                        first()
+    if low is None:
+        return []
+
+    query = model_query(context, models.FixedIp.id, models.FixedIp.address,
+                        base_model=models.FixedIp, session=session,
+                        read_deleted="no").\
+                    filter(network_or_none).\
+                    filter_by(reserved=False).\
+                    filter_by(instance_uuid=None).\
+                    filter_by(host=None).\
+                    order_by(asc(models.FixedIp.id))
+    start = random.randint(low, high)
+    candidates = query.filter(models.FixedIp.id >= start).\
+                       limit(count).\
+                       all()
+    if len(candidates) < count:
+        candidates += query.filter(models.FixedIp.id < start).\
+                            limit(count - len(candidates)).\
+                            all()
+    return candidates
+
+
+def _fixed_ip_associate_pool(context, network_id, instance_uuids, host):
+    """Associate a free fixed ip of a network with each instance.
+
+    No row is locked: every candidate is claimed with an UPDATE which only
+    matches while the row is still free, and a candidate claimed by
+    someone else in the meantime is simply skipped.  Returns the addresses
+    in the order of instance_uuids, fewer of them if the network runs out.
+    """
+    network_or_none = or_(models.FixedIp.network_id == network_id,
+                          models.FixedIp.network_id == None)
+    session = get_session()
+    addresses = []
+    pending = list(instance_uuids)
+    while pending:
+        # NOTE: a few more candidates than needed, as some of them may be
+        # claimed concurrently
+        candidates = _fixed_ip_pool_candidates(context, network_id,
+                                               len(pending) + 5, session)
+        if not candidates:
+            break
+        for fixed_ip_id, address in candidates:
+            values = {'network_id': network_id}
+            if pending[0]:
+                values['instance_uuid'] = pending[0]
+            if host:
+                values['host'] = host
+            claimed = model_query(context, models.FixedIp, session=session,
+                                  read_deleted="no").\
+                              filter_by(id=fixed_ip_id).\
+                              filter(network_or_none).\
+                              filter_by(reserved=False).\
+                              filter_by(instance_uuid=None).\
+                              filter_by(host=None).\
+                              update(values, synchronize_session=False)
+            if claimed:
+                addresses.append(address)
+                pending.pop(0)
+                if not pending:
+                    break
+    return addresses
+
+
 @require_admin_context
 def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
                             host=None):
     if instance_uuid and not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(uuid=instance_uuid)
 
-    session = get_session()
-    with session.begin():
-        network_or_none = or_(models.FixedIp.network_id == network_id,
-                              models.FixedIp.network_id == None)
-        fixed_ip_ref = model_query(context, models.FixedIp, session=session,
-                                   read_deleted="no").\
-                               filter(network_or_none).\
-                               filter_by(reserved=False).\
-                               filter_by(instance_uuid=None).\
-                               filter_by(host=None).\
-                               with_lockmode('update').\
-                               first()
-        # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
-        #             then this has concurrency issues
-        if not fixed_ip_ref:
-            raise exception.NoMoreFixedIps()
+    addresses = _fixed_ip_associate_pool(context, network_id,
+                                         [instance_uuid], host)
+    if not addresses:
+        raise exception.NoMoreFixedIps()
+    return addresses[0]
 
-        if fixed_ip_ref['network_id'] is None:
-            fixed_ip_ref['network'] = network_id
 
-        if instance_uuid:
-            fixed_ip_ref['instance_uuid'] = instance_uuid
+@require_admin_context
+def fixed_ip_associate_pool_many(context, network_id, instance_uuids,
+                                 host=None):
+    for instance_uuid in instance_uuids:
+        if not uuidutils.is_uuid_like(instance_uuid):
+            raise exception.InvalidUUID(uuid=instance_uuid)
 
-        if host:
-            fixed_ip_ref['host'] = host
-        session.add(fixed_ip_ref)
-    return fixed_ip_ref['address']
+    return _fixed_ip_associate_pool(context, network_id, instance_uuids,
+                                    host)
 
 
 @require_context
@@ -1065,19 +1184,25 @@ def fixed_ip_create(context, values):
 
 @require_context
 def fixed_ip_bulk_create(context, ips):
-    session = get_session()
-    with session.begin():
-        for ip in ips:
-            model = models.FixedIp()
-            model.update(ip)
-            try:
-                # NOTE (vsergeyev): To get existing address we have to do each
-                #                   time session.flush().
-                #                   See related note at line 697.
-                session.add(model)
-                session.flush()
-            except db_exc.DBDuplicateEntry:
-                raise exception.FixedIpExists(address=ip['address'])
+    if not ips:
+        return
+    try:
+        _bulk_insert(get_session(), models.FixedIp, ips)
+    except db_exc.DBDuplicateEntry:
+        # NOTE: the error does not tell which row was a duplicate, look for
+        # it once everything was rolled back
+        addresses = [ip['address'] for ip in ips]
+        duplicates = [address for address, count in
+                      collections.Counter(addresses).iteritems()
+                      if count > 1]
+        existing = model_query(context, models.FixedIp.address,
+                               base_model=models.FixedIp,
+                               read_deleted='yes').\
+                        filter(models.FixedIp.address.in_(addresses)).\
+                        first()
+        if existing:
+            duplicates.append(existing[0])
+        raise exception.FixedIpExists(address=(duplicates or addresses)[0])
 
 
 @require_context
@@ -1596,7 +1721,8 @@ def _build_instance_get(context, session=None, columns_to_join=None):
     return query
 
 
-def _instances_fill_metadata(context, instances, manual_joins=None):
+def _instances_fill_metadata(context, instances, manual_joins=None,
+                             use_slave=False):
     """Selectively fill instances with manually-joined metadata. Note that
     instance will be converted to a dict.
 
@@ -1605,6 +1731,7 @@ def _instances_fill_metadata(context, instances, manual_joins=None):
     :param manual_joins: list of tables to manually join (can be any
                          combination of 'metadata' and 'system_metadata' or
                          None to take the default of both)
+    :param use_slave: whether to read the metadata from the replica
     """
     uuids = [inst['uuid'] for inst in instances]
 
@@ -1613,12 +1740,14 @@ def _instances_fill_metadata(context, instances, manual_joins=None):
 
     meta = collections.defaultdict(list)
     if 'metadata' in manual_joins:
-        for row in _instance_metadata_get_multi(context, uuids):
+        for row in _instance_metadata_get_multi(context, uuids,
+                                                use_slave=use_slave):
             meta[row['instance_uuid']].append(row)
 
     sys_meta = collections.defaultdict(list)
     if 'system_metadata' in manual_joins:
-        for row in _instance_system_metadata_get_multi(context, uuids):
+        for row in _instance_system_metadata_get_multi(context, uuids,
+                                                       use_slave=use_slave):
             sys_meta[row['instance_uuid']].append(row)
 
     filled_instances = []
@@ -1631,6 +1760,21 @@ def _instances_fill_metadata(context, instances, manual_joins=None):
     return filled_instances
 
 
+def _instance_columns(columns):
+    """Return the Instance model attributes to select for a projection.
+
+    id and uuid are always selected, as they identify the rows and are
+    needed to join the metadata.
+    """
+    columns = set(columns) | set(['id', 'uuid'])
+    return [getattr(models.Instance, column) for column in sorted(columns)]
+
+
+def _instance_rows_to_dicts(rows):
+    """Convert the rows of a projection query to dicts."""
+    return [dict(zip(row.keys(), row)) for row in rows]
+
+
 def _manual_join_columns(columns_to_join):
     manual_joins = []
     for column in ('metadata', 'system_metadata'):
@@ -1663,7 +1807,7 @@ def instance_get_all(context, columns_to_join=None):
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 limit=None, marker=None, columns_to_join=None,
-                                session=None):
+                                columns=None, session=None, use_slave=False):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise.
@@ -1696,20 +1840,34 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
         'soft_deleted' - modify behavior of 'deleted' to either
                          include or exclude instances whose
                          vm_state is SOFT_DELETED.
+
+    If columns is given, only those columns (plus id and uuid) are
+    selected and the instances are returned as plain dicts.  Of
+    columns_to_join only 'metadata' and 'system_metadata' are then honored,
+    and neither is joined by default.
+
+    With use_slave, the instances are read from the read-only replica when
+    one is configured.
     """
 
     sort_fn = {'desc': desc, 'asc': asc}
 
     if not session:
-        session = get_session()
+        session = get_session(slave_session=use_slave)
 
-    if columns_to_join is None:
-        columns_to_join = ['info_cache', 'security_groups']
-        manual_joins = ['metadata', 'system_metadata']
+    if columns is not None:
+        manual_joins, columns_to_join = _manual_join_columns(
+            list(columns_to_join or []))
+        columns_to_join = []
+        query_prefix = session.query(*_instance_columns(columns))
     else:
-        manual_joins, columns_to_join = _manual_join_columns(columns_to_join)
-
-    query_prefix = session.query(models.Instance)
+        if columns_to_join is None:
+            columns_to_join = ['info_cache', 'security_groups']
+            manual_joins = ['metadata', 'system_metadata']
+        else:
+            manual_joins, columns_to_join = _manual_join_columns(
+                columns_to_join)
+        query_prefix = session.query(models.Instance)
     for column in columns_to_join:
         query_prefix = query_prefix.options(joinedload(column))
 
@@ -1781,7 +1939,11 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                            marker=marker,
                            sort_dir=sort_dir)
 
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    instances = query_prefix.all()
+    if columns is not None:
+        instances = _instance_rows_to_dicts(instances)
+    return _instances_fill_metadata(context, instances, manual_joins,
+                                    use_slave=use_slave)
 
 
 def tag_filter(query, model, tag_model, tag_model_col, filters):
@@ -1892,9 +2054,10 @@ def regex_filter(query, model, filters):
 
 @require_context
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False):
     """Return instances and joins that were active during window."""
-    session = get_session()
+    session = get_session(slave_session=use_slave)
     query = session.query(models.Instance)
 
     query = query.options(joinedload('info_cache')).\
@@ -1908,7 +2071,8 @@ def instance_get_active_by_window_joined(context, begin, end=None,
     if host:
         query = query.filter_by(host=host)
 
-    return _instances_fill_metadata(context, query.all())
+    return _instances_fill_metadata(context, query.all(),
+                                    use_slave=use_slave)
 
 
 @require_admin_context
@@ -1923,7 +2087,18 @@ def _instance_get_all_query(context, project_only=False, joins=None):
 
 
 @require_admin_context
-def instance_get_all_by_host(context, host, columns_to_join=None):
+def instance_get_all_by_host(context, host, columns_to_join=None,
+                             columns=None):
+    if columns is not None:
+        manual_joins, _joins = _manual_join_columns(
+            list(columns_to_join or []))
+        rows = model_query(context, *_instance_columns(columns),
+                           base_model=models.Instance).\
+                        filter(models.Instance.host == host).\
+                        all()
+        return _instances_fill_metadata(context,
+                                        _instance_rows_to_dicts(rows),
+                                        manual_joins=manual_joins)
     return _instances_fill_metadata(context,
         _instance_get_all_query(context).filter_by(host=host).all(),
                                 manual_joins=columns_to_join)
@@ -3175,6 +3350,27 @@ def block_device_mapping_update(context, bdm_id, values, legacy=True):
     return query.first()
 
 
+def _block_device_mapping_delete_other_blanks(context, values, session):
+    # NOTE(yamahata): same virtual device name can be specified multiple
+    #                 times. So delete the existing ones.
+    # TODO(ndipanov): Just changed to use new format for now -
+    #                 should be moved out of db layer or removed completely
+    if values.get('source_type') == 'blank':
+        is_swap = values.get('guest_format') == 'swap'
+        query = (_block_device_mapping_get_query(context, session=session).
+            filter_by(instance_uuid=values['instance_uuid']).
+            filter_by(source_type='blank').
+            filter(models.BlockDeviceMapping.device_name !=
+                   values['device_name']))
+        if is_swap:
+            query.filter_by(guest_format='swap').soft_delete()
+        else:
+            (query.filter(or_(
+                models.BlockDeviceMapping.guest_format == None,
+                models.BlockDeviceMapping.guest_format != 'swap')).
+             soft_delete())
+
+
 def block_device_mapping_update_or_create(context, values, legacy=True):
     _scrub_empty_str_values(values, ['volume_size'])
     session = get_session()
@@ -3193,27 +3389,78 @@ def block_device_mapping_update_or_create(context, values, legacy=True):
             values = _from_legacy_values(values, legacy, allow_updates=True)
             result.update(values)
 
-        # NOTE(yamahata): same virtual device name can be specified multiple
-        #                 times. So delete the existing ones.
-        # TODO(ndipanov): Just changed to use new format for now -
-        #                 should be moved out of db layer or removed completely
-        if values.get('source_type') == 'blank':
-            is_swap = values.get('guest_format') == 'swap'
-            query = (_block_device_mapping_get_query(context, session=session).
-                filter_by(instance_uuid=values['instance_uuid']).
-                filter_by(source_type='blank').
-                filter(models.BlockDeviceMapping.device_name !=
-                       values['device_name']))
-            if is_swap:
-                query.filter_by(guest_format='swap').soft_delete()
-            else:
-                (query.filter(or_(
-                    models.BlockDeviceMapping.guest_format == None,
-                    models.BlockDeviceMapping.guest_format != 'swap')).
-                 soft_delete())
+        _block_device_mapping_delete_other_blanks(context, values, session)
         return result
 
 
+@require_context
+def block_device_mapping_bulk_update_or_create(context, values_list,
+                                               legacy=True):
+    """Update or create many block device mappings in one transaction.
+
+    Mappings are matched on instance_uuid and device_name as with
+    block_device_mapping_update_or_create(), but the existing ones are
+    fetched with a single query and the new ones inserted with a single
+    executemany.  Returns the resulting mappings.
+    """
+    if not values_list:
+        return []
+
+    instance_uuids = set(values['instance_uuid'] for values in values_list)
+    session = get_session()
+    with session.begin():
+        existing = {}
+        for bdm_ref in _block_device_mapping_get_query(context,
+                                                       session=session).\
+                filter(models.BlockDeviceMapping.instance_uuid.in_(
+                    instance_uuids)).\
+                all():
+            existing[(bdm_ref['instance_uuid'],
+                      bdm_ref['device_name'])] = bdm_ref
+
+        new_rows = collections.OrderedDict()
+        all_values = []
+        for values in values_list:
+            values = dict(values)
+            _scrub_empty_str_values(values, ['volume_size'])
+            key = (values['instance_uuid'], values['device_name'])
+            if key in existing:
+                values = _from_legacy_values(values, legacy,
+                                             allow_updates=True)
+                existing[key].update(values)
+            elif key in new_rows:
+                values = _from_legacy_values(values, legacy,
+                                             allow_updates=True)
+                new_rows[key].update(values)
+            else:
+                values = dict(_from_legacy_values(values, legacy))
+                new_rows[key] = values
+            all_values.append(values)
+        session.flush()
+
+        _bulk_insert(session, models.BlockDeviceMapping, new_rows.values())
+
+        # NOTE: one after the other, each blank device would delete the
+        # others, so only the last blank swap and the last other blank
+        # device of an instance are left
+        last_blanks = collections.OrderedDict()
+        for values in all_values:
+            if values.get('source_type') == 'blank':
+                is_swap = values.get('guest_format') == 'swap'
+                last_blanks[(values['instance_uuid'], is_swap)] = values
+        for values in last_blanks.values():
+            _block_device_mapping_delete_other_blanks(context, values,
+                                                      session)
+
+        keys = set(existing) | set(new_rows)
+        bdm_refs = _block_device_mapping_get_query(context, session=session).\
+                filter(models.BlockDeviceMapping.instance_uuid.in_(
+                    instance_uuids)).\
+                all()
+        return [bdm_ref for bdm_ref in bdm_refs
+                if (bdm_ref['instance_uuid'], bdm_ref['device_name']) in keys]
+
+
 @require_context
 def block_device_mapping_get_all_by_instance(context, instance_uuid):
     return _block_device_mapping_get_query(context).\
@@ -3221,6 +3468,16 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                     instance_uuids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     _block_device_mapping_get_query(context).\
@@ -3518,6 +3775,25 @@ def security_group_rule_create(context, values):
     return _security_group_rule_create(context, values)
 
 
+@require_context
+def security_group_rule_bulk_create(context, values_list):
+    """Create many security group rules in one transaction.
+
+    The rules are flushed together; their ids are needed by the callers, so
+    they cannot be inserted with a single executemany.
+    """
+    rule_refs = []
+    for values in values_list:
+        rule_ref = models.SecurityGroupIngressRule()
+        rule_ref.update(values)
+        rule_refs.append(rule_ref)
+
+    session = get_session()
+    with session.begin():
+        session.add_all(rule_refs)
+    return rule_refs
+
+
 @require_context
 def security_group_rule_destroy(context, security_group_rule_id):
     count = (_security_group_rule_get_query(context).
@@ -4170,9 +4446,10 @@ def cell_get_all(context):
 ########################
 # User-provided metadata
 
-def _instance_metadata_get_multi(context, instance_uuids, session=None):
+def _instance_metadata_get_multi(context, instance_uuids, session=None,
+                                 use_slave=False):
     return model_query(context, models.InstanceMetadata,
-                       session=session).\
+                       session=session, use_slave=use_slave).\
                     filter(
             models.InstanceMetadata.instance_uuid.in_(instance_uuids))
 
@@ -4278,22 +4555,10 @@ def instance_metadata_update(context, instance_uuid, metadata, delete,
                 filter(~models.InstanceMetadata.key.in_(all_keys)).\
                 soft_delete(synchronize_session=synchronize_session)
 
-        already_existing_keys = []
-        meta_refs = _instance_metadata_get_query(context, instance_uuid,
-                                                 session=session).\
-            filter(models.InstanceMetadata.key.in_(all_keys)).\
-            all()
-
-        for meta_ref in meta_refs:
-            already_existing_keys.append(meta_ref.key)
-            meta_ref.update({"value": metadata[meta_ref.key]})
-
-        new_keys = set(all_keys) - set(already_existing_keys)
-        for key in new_keys:
-            meta_ref = models.InstanceMetadata()
-            meta_ref.update({"key": key, "value": metadata[key],
-                             "instance_uuid": instance_uuid})
-            session.add(meta_ref)
+        _metadata_bulk_update(
+            session, models.InstanceMetadata, instance_uuid, metadata,
+            _instance_metadata_get_query(context, instance_uuid,
+                                         session=session))
 
         return metadata
 
@@ -4302,9 +4567,10 @@ def instance_metadata_update(context, instance_uuid, metadata, delete,
 # System-owned metadata
 
 
-def _instance_system_metadata_get_multi(context, instance_uuids, session=None):
+def _instance_system_metadata_get_multi(context, instance_uuids, session=None,
+                                        use_slave=False):
     return model_query(context, models.InstanceSystemMetadata,
-                       session=session).\
+                       session=session, use_slave=use_slave).\
                     filter(
             models.InstanceSystemMetadata.instance_uuid.in_(instance_uuids))
 
@@ -4342,22 +4608,10 @@ def instance_system_metadata_update(context, instance_uuid, metadata, delete,
                 filter(~models.InstanceSystemMetadata.key.in_(all_keys)).\
                 soft_delete(synchronize_session=synchronize_session)
 
-        already_existing_keys = []
-        meta_refs = _instance_system_metadata_get_query(context, instance_uuid,
-                                                        session=session).\
-            filter(models.InstanceSystemMetadata.key.in_(all_keys)).\
-            all()
-
-        for meta_ref in meta_refs:
-            already_existing_keys.append(meta_ref.key)
-            meta_ref.update({"value": metadata[meta_ref.key]})
-
-        new_keys = set(all_keys) - set(already_existing_keys)
-        for key in new_keys:
-            meta_ref = models.InstanceSystemMetadata()
-            meta_ref.update({"key": key, "value": metadata[key],
-                             "instance_uuid": instance_uuid})
-            session.add(meta_ref)
+        _metadata_bulk_update(
+            session, models.InstanceSystemMetadata, instance_uuid, metadata,
+            _instance_system_metadata_get_query(context, instance_uuid,
+                                                session=session))
 
         return metadata
 
@@ -4428,8 +4682,9 @@ def bw_usage_get(context, uuid, start_period, mac):
 
 
 @require_context
-def bw_usage_get_by_uuids(context, uuids, start_period):
-    return model_query(context, models.BandwidthUsage, read_deleted="yes").\
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
+    return model_query(context, models.BandwidthUsage, read_deleted="yes",
+                       use_slave=use_slave).\
                    filter(models.BandwidthUsage.uuid.in_(uuids)).\
                    filter_by(start_period=start_period).\
                    all()
@@ -4644,6 +4899,65 @@ def s3_image_create(context, image_uuid):
 ####################
 
 
+_EC2_ID_MAPPING_MODELS = {
+    'image': models.S3Image,
+    'instance': models.InstanceIdMapping,
+    'volume': models.VolumeIdMapping,
+    'snapshot': models.SnapshotIdMapping,
+}
+
+
+def _ec2_id_mapping_model(context, kind):
+    """Return the model of a kind of mapping, checking the context as the
+    per-kind APIs do: the s3_image_* ones never did.
+    """
+    if kind != 'image':
+        nova.context.require_context(context)
+    return _EC2_ID_MAPPING_MODELS[kind]
+
+
+def ec2_id_mappings_get_by_uuids(context, kind, uuids):
+    model = _ec2_id_mapping_model(context, kind)
+    if not uuids:
+        return {}
+    result = model_query(context, model.id, model.uuid,
+                         base_model=model, read_deleted='yes').\
+                     filter(model.uuid.in_(uuids)).\
+                     all()
+    return dict((mapping_uuid, mapping_id)
+                for mapping_id, mapping_uuid in result)
+
+
+def ec2_id_mappings_get_by_ids(context, kind, ids):
+    model = _ec2_id_mapping_model(context, kind)
+    if not ids:
+        return {}
+    result = model_query(context, model.id, model.uuid,
+                         base_model=model, read_deleted='yes').\
+                     filter(model.id.in_(ids)).\
+                     all()
+    return dict(result)
+
+
+def ec2_id_mappings_create(context, kind, uuids):
+    model = _ec2_id_mapping_model(context, kind)
+    result = {}
+    session = get_session()
+    with session.begin():
+        for mapping_uuid in uuids:
+            mapping_ref = model()
+            mapping_ref.uuid = mapping_uuid
+            session.add(mapping_ref)
+            # NOTE: flush each row so ids are assigned in the order the
+            #       uuids were given.
+            session.flush()
+            result[mapping_uuid] = mapping_ref.id
+    return result
+
+
+####################
+
+
 def _aggregate_get_query(context, model_class, id_field=None, id=None,
                          session=None, read_deleted=None):
     columns_to_join = {models.Aggregate: ['_hosts', '_metadata']}
@@ -4660,6 +4974,30 @@ def _aggregate_get_query(context, model_class, id_field=None, id=None,
     return query
 
 
+def _aggregate_version_bump(context, session):
+    """Bump the aggregates version, which tells the per-process host to
+    availability zone indexes that they need to be rebuilt.
+    """
+    count = model_query(context, models.AggregateVersion, session=session,
+                        read_deleted="no").\
+                update({'version': models.AggregateVersion.version + 1},
+                       synchronize_session=False)
+    if not count:
+        version_ref = models.AggregateVersion()
+        version_ref.update({'version': 1})
+        session.add(version_ref)
+
+
+@require_admin_context
+def aggregate_version_get(context):
+    result = model_query(context, models.AggregateVersion.version,
+                         base_model=models.AggregateVersion,
+                         read_deleted="no").first()
+    if not result:
+        return 0
+    return result[0]
+
+
 @require_admin_context
 def aggregate_create(context, values, metadata=None):
     session = get_session()
@@ -4796,6 +5134,7 @@ def aggregate_delete(context, aggregate_id):
                     models.AggregateMetadata, session=session).\
                     filter_by(aggregate_id=aggregate_id).\
                     soft_delete()
+        _aggregate_version_bump(context, session)
 
 
 @require_admin_context
@@ -4826,15 +5165,19 @@ def aggregate_metadata_get(context, aggregate_id):
 @require_admin_context
 @require_aggregate_exists
 def aggregate_metadata_delete(context, aggregate_id, key):
-    count = _aggregate_get_query(context,
-                                 models.AggregateMetadata,
-                                 models.AggregateMetadata.aggregate_id,
-                                 aggregate_id).\
-                                 filter_by(key=key).\
-                                 soft_delete()
-    if count == 0:
-        raise exception.AggregateMetadataNotFound(aggregate_id=aggregate_id,
-                                                  metadata_key=key)
+    session = get_session()
+    with session.begin():
+        count = _aggregate_get_query(context,
+                                     models.AggregateMetadata,
+                                     models.AggregateMetadata.aggregate_id,
+                                     aggregate_id,
+                                     session=session).\
+                                     filter_by(key=key).\
+                                     soft_delete()
+        if count == 0:
+            raise exception.AggregateMetadataNotFound(
+                    aggregate_id=aggregate_id, metadata_key=key)
+        _aggregate_version_bump(context, session)
 
 
 @require_admin_context
@@ -4870,6 +5213,7 @@ def aggregate_metadata_add(context, aggregate_id, metadata, set_delete=False):
                              "aggregate_id": aggregate_id})
             session.add(meta_ref)
 
+        _aggregate_version_bump(context, session)
         return metadata
 
 
@@ -4886,24 +5230,31 @@ def aggregate_host_get_all(context, aggregate_id):
 @require_admin_context
 @require_aggregate_exists
 def aggregate_host_delete(context, aggregate_id, host):
-    count = _aggregate_get_query(context,
-                                 models.AggregateHost,
-                                 models.AggregateHost.aggregate_id,
-                                 aggregate_id).\
-            filter_by(host=host).\
-            soft_delete()
-    if count == 0:
-        raise exception.AggregateHostNotFound(aggregate_id=aggregate_id,
-                                              host=host)
+    session = get_session()
+    with session.begin():
+        count = _aggregate_get_query(context,
+                                     models.AggregateHost,
+                                     models.AggregateHost.aggregate_id,
+                                     aggregate_id,
+                                     session=session).\
+                filter_by(host=host).\
+                soft_delete()
+        if count == 0:
+            raise exception.AggregateHostNotFound(aggregate_id=aggregate_id,
+                                                  host=host)
+        _aggregate_version_bump(context, session)
 
 
 @require_admin_context
 @require_aggregate_exists
 def aggregate_host_add(context, aggregate_id, host):
+    session = get_session()
     host_ref = models.AggregateHost()
     host_ref.update({"host": host, "aggregate_id": aggregate_id})
     try:
-        host_ref.save()
+        with session.begin():
+            host_ref.save(session=session)
+            _aggregate_version_bump(context, session)
     except db_exc.DBDuplicateEntry:
         raise exception.AggregateHostExists(host=host,
                                             aggregate_id=aggregate_id)
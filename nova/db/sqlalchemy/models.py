@@ -940,6 +940,13 @@ class AggregateMetadata(BASE, NovaBase):
     aggregate_id = Column(Integer, ForeignKey('aggregates.id'), nullable=False)
 
 
+class AggregateVersion(BASE, NovaBase):
+    """Counter bumped whenever aggregate hosts or metadata change."""
+    __tablename__ = 'aggregate_versions'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
 class Aggregate(BASE, NovaBase):
     """Represents a cluster of hosts that exists in this zone."""
     __tablename__ = 'aggregates'
@@ -20,13 +20,15 @@
 
 import base64
 import binascii
+import collections
+import itertools
 import os
-import shutil
 import tarfile
-import tempfile
+import time
 
 import boto.s3.connection
 import eventlet
+from eventlet.green import subprocess
 from lxml import etree
 from oslo.config import cfg
 
@@ -35,8 +37,6 @@ import nova.cert.rpcapi
 from nova import exception
 from nova.image import glance
 from nova.openstack.common import log as logging
-from nova.openstack.common import processutils
-from nova import utils
 
 
 LOG = logging.getLogger(__name__)
@@ -44,7 +44,8 @@ LOG = logging.getLogger(__name__)
 s3_opts = [
     cfg.StrOpt('image_decryption_dir',
                default='/tmp',
-               help='parent dir for tempdir used for image decryption'),
+               help='parent dir for tempdir used for image decryption '
+                    '(unused, images are no longer staged on disk)'),
     cfg.StrOpt('s3_host',
                default='$my_ip',
                help='hostname or ip for openstack to use when accessing '
@@ -65,12 +66,111 @@ s3_opts = [
                default=False,
                help='whether to affix the tenant id to the access key '
                     'when downloading from s3'),
+    cfg.IntOpt('s3_part_concurrency',
+               default=4,
+               help='number of parts of a bundled image fetched from s3 '
+                    'in parallel while registering it'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(s3_opts)
 CONF.import_opt('my_ip', 'nova.netconf')
 
+# Size of the chunks the decrypted image is read in
+CHUNK_SIZE = 64 * 1024
+
+
+class _MeteredFile(object):
+    """File-like object counting the bytes read through it."""
+
+    def __init__(self, fileobj, progress, stage):
+        self._fileobj = fileobj
+        self._progress = progress
+        self._stage = stage
+
+    def read(self, size=CHUNK_SIZE):
+        data = self._fileobj.read(size)
+        self._progress[self._stage] += len(data)
+        return data
+
+
+class _DecryptingReader(object):
+    """File-like object decrypting an image with openssl as it is read.
+
+    The encrypted parts are fed to openssl by a greenthread, so fetching
+    and decrypting the image overlap with whatever consumes the decrypted
+    data.  Past the parts fetched ahead, only the pipes buffer data.
+    """
+
+    def __init__(self, parts, key, iv):
+        self.download_error = None
+        self._closed = False
+        self._failed_stage = None
+        self._process = subprocess.Popen(['openssl', 'enc', '-d',
+                                          '-aes-128-cbc', '-K', key,
+                                          '-iv', iv],
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE,
+                                         close_fds=True)
+        self._writer = eventlet.spawn(self._write, parts)
+
+    def _write(self, parts):
+        stdin = self._process.stdin
+        try:
+            parts = iter(parts)
+            while True:
+                try:
+                    part = next(parts)
+                except StopIteration:
+                    break
+                except Exception as exc:
+                    self.download_error = exc
+                    break
+                try:
+                    stdin.write(part)
+                except IOError:
+                    # openssl exited, which close() reports
+                    break
+        finally:
+            stdin.close()
+
+    def read(self, size=CHUNK_SIZE):
+        return self._process.stdout.read(size)
+
+    def close(self, kill=False):
+        """Finish the decryption and return the stage which failed first.
+
+        Returns 'download' or 'decrypt' if fetching or decrypting the image
+        failed, or None if both succeeded.  A wrong key only shows in the
+        exit status of openssl, so the rest of the image is decrypted and
+        thrown away before what read the decrypted data is blamed.  With
+        kill, openssl is killed instead and nothing is blamed.
+        """
+        if not self._closed:
+            self._closed = True
+            self._failed_stage = self._finish(kill)
+        return self._failed_stage
+
+    def _finish(self, kill):
+        if kill:
+            self._writer.kill()
+            self._process.kill()
+            self._process.wait()
+            return None
+
+        # Let the writer feed the rest of the parts and openssl exit
+        while self._process.stdout.read(CHUNK_SIZE):
+            pass
+        self._writer.wait()
+        stderr = self._process.stderr.read()
+        if self.download_error is not None:
+            return 'download'
+        if self._process.wait() != 0:
+            LOG.error(_('Failed to decrypt image: %s'), stderr)
+            return 'decrypt'
+        return None
+
 
 class S3ImageService(object):
     """Wraps an existing image service to support s3 based register."""
@@ -188,13 +288,6 @@ class S3ImageService(object):
                                                port=CONF.s3_port,
                                                host=CONF.s3_host)
 
-    @staticmethod
-    def _download_file(bucket, filename, local_dir):
-        key = bucket.get_key(filename)
-        local_filename = os.path.join(local_dir, os.path.basename(filename))
-        key.get_contents_to_filename(local_filename)
-        return local_filename
-
     def _s3_parse_manifest(self, context, metadata, manifest):
         manifest = etree.fromstring(manifest)
         image_format = 'ami'
@@ -279,9 +372,13 @@ class S3ImageService(object):
         return manifest, image, image_uuid
 
     def _s3_create(self, context, metadata):
-        """Gets a manifest from s3 and makes an image."""
-        image_path = tempfile.mkdtemp(dir=CONF.image_decryption_dir)
+        """Gets a manifest from s3 and makes an image.
 
+        The image parts are fetched in parallel and streamed in order
+        through openssl and the tar extraction to the image service, so
+        registering an image neither stages it on disk nor holds more than
+        s3_part_concurrency parts in memory.
+        """
         image_location = metadata['properties']['image_location'].lstrip('/')
         bucket_name = image_location.split('/')[0]
         manifest_path = image_location[len(bucket_name) + 1:]
@@ -296,88 +393,83 @@ class S3ImageService(object):
         def delayed_create():
             """This handles the fetching and decrypting of the part files."""
             context.update_store()
-            log_vars = {'image_location': image_location,
-                        'image_path': image_path}
+            log_vars = {'image_location': image_location}
 
             def _update_image_state(context, image_uuid, image_state):
                 metadata = {'properties': {'image_state': image_state}}
                 self.service.update(context, image_uuid, metadata,
                                     purge_props=False)
 
-            def _update_image_data(context, image_uuid, image_data):
-                metadata = {}
+            def _update_image_data(context, image_uuid, image_data, size):
+                metadata = {'size': size}
                 self.service.update(context, image_uuid, metadata, image_data,
                                     purge_props=False)
 
+            progress = collections.defaultdict(int)
+            start = time.time()
+            stage = 'download'
+            decrypted = None
             try:
                 _update_image_state(context, image_uuid, 'downloading')
 
                 try:
-                    parts = []
-                    elements = manifest.find('image').getiterator('filename')
-                    for fn_element in elements:
-                        part = self._download_file(bucket,
-                                                   fn_element.text,
-                                                   image_path)
-                        parts.append(part)
-
-                    # NOTE(vish): this may be suboptimal, should we use cat?
-                    enc_filename = os.path.join(image_path, 'image.encrypted')
-                    with open(enc_filename, 'w') as combined:
-                        for filename in parts:
-                            with open(filename) as part:
-                                shutil.copyfileobj(part, combined)
-
-                except Exception:
-                    LOG.exception(_("Failed to download %(image_location)s "
-                                    "to %(image_path)s"), log_vars)
-                    _update_image_state(context, image_uuid, 'failed_download')
-                    return
-
-                _update_image_state(context, image_uuid, 'decrypting')
+                    filenames = [fn_element.text for fn_element in
+                                 manifest.find('image').getiterator(
+                                     'filename')]
+                    parts = self._fetch_parts(bucket, filenames, progress)
 
-                try:
+                    stage = 'decrypt'
+                    _update_image_state(context, image_uuid, 'decrypting')
                     hex_key = manifest.find('image/ec2_encrypted_key').text
                     encrypted_key = binascii.a2b_hex(hex_key)
                     hex_iv = manifest.find('image/ec2_encrypted_iv').text
                     encrypted_iv = binascii.a2b_hex(hex_iv)
-
-                    dec_filename = os.path.join(image_path, 'image.tar.gz')
-                    self._decrypt_image(context, enc_filename, encrypted_key,
-                                        encrypted_iv, dec_filename)
+                    decrypted = self._decrypt_image(context, parts,
+                                                    encrypted_key,
+                                                    encrypted_iv)
+
+                    stage = 'untar'
+                    _update_image_state(context, image_uuid, 'untarring')
+                    image_file, size = self._untarzip_image(
+                        _MeteredFile(decrypted, progress, 'decrypted'))
+
+                    stage = 'upload'
+                    _update_image_state(context, image_uuid, 'uploading')
+                    _update_image_data(context, image_uuid,
+                                       _MeteredFile(image_file, progress,
+                                                    'uploaded'),
+                                       size)
+                    if decrypted.close() is not None:
+                        raise exception.NovaException(
+                            _('Image data was truncated'))
+                except exception.ImageNotFound:
+                    if decrypted is not None:
+                        decrypted.close(kill=True)
+                    raise
                 except Exception:
-                    LOG.exception(_("Failed to decrypt %(image_location)s "
-                                    "to %(image_path)s"), log_vars)
-                    _update_image_state(context, image_uuid, 'failed_decrypt')
+                    # NOTE: A failure makes every later stage fail as well,
+                    # so blame the earliest stage which failed
+                    if decrypted is not None:
+                        stage = decrypted.close() or stage
+                    LOG.exception(_("Failed to %(stage)s %(image_location)s"),
+                                  dict(log_vars, stage=stage))
+                    _update_image_state(context, image_uuid,
+                                        'failed_%s' % stage)
                     return
 
-                _update_image_state(context, image_uuid, 'untarring')
-
-                try:
-                    unz_filename = self._untarzip_image(image_path,
-                                                        dec_filename)
-                except Exception:
-                    LOG.exception(_("Failed to untar %(image_location)s "
-                                    "to %(image_path)s"), log_vars)
-                    _update_image_state(context, image_uuid, 'failed_untar')
-                    return
-
-                _update_image_state(context, image_uuid, 'uploading')
-                try:
-                    with open(unz_filename) as image_file:
-                        _update_image_data(context, image_uuid, image_file)
-                except Exception:
-                    LOG.exception(_("Failed to upload %(image_location)s "
-                                    "to %(image_path)s"), log_vars)
-                    _update_image_state(context, image_uuid, 'failed_upload')
-                    return
+                LOG.debug(_("Registered %(image_location)s in %(seconds).1f "
+                            "seconds: %(downloaded)d bytes downloaded, "
+                            "%(decrypted)d decrypted and %(uploaded)d "
+                            "uploaded"),
+                          dict(log_vars, seconds=time.time() - start,
+                               downloaded=progress['downloaded'],
+                               decrypted=progress['decrypted'],
+                               uploaded=progress['uploaded']))
 
                 metadata = {'status': 'active',
                             'properties': {'image_state': 'available'}}
                 self.service.update(context, image_uuid, metadata,
                         purge_props=False)
-
-                shutil.rmtree(image_path)
             except exception.ImageNotFound:
                 LOG.info(_("Image %s was deleted underneath us"), image_uuid)
                 return
@@ -386,8 +478,36 @@ class S3ImageService(object):
 
         return image
 
-    def _decrypt_image(self, context, encrypted_filename, encrypted_key,
-                       encrypted_iv, decrypted_filename):
+    @staticmethod
+    def _fetch_part(bucket, filename):
+        return bucket.get_key(filename).get_contents_as_string()
+
+    def _fetch_parts(self, bucket, filenames, progress):
+        """Yield the content of the parts in order, fetched in parallel.
+
+        At most s3_part_concurrency parts are fetched ahead of the one
+        being consumed.
+        """
+        pool = eventlet.GreenPool(CONF.s3_part_concurrency)
+        filenames = iter(filenames)
+        pending = collections.deque(
+            pool.spawn(self._fetch_part, bucket, filename)
+            for filename in itertools.islice(filenames,
+                                             CONF.s3_part_concurrency))
+        try:
+            while pending:
+                part = pending.popleft().wait()
+                for filename in itertools.islice(filenames, 1):
+                    pending.append(pool.spawn(self._fetch_part, bucket,
+                                              filename))
+                progress['downloaded'] += len(part)
+                yield part
+        finally:
+            for thread in pending:
+                thread.kill()
+
+    def _decrypt_image(self, context, parts, encrypted_key, encrypted_iv):
+        """Return a file-like object decrypting the parts as it is read."""
         elevated = context.elevated()
         try:
             key = self.cert_rpcapi.decrypt_text(elevated,
@@ -404,34 +524,21 @@ class S3ImageService(object):
             raise exception.NovaException(_('Failed to decrypt initialization '
                                     'vector: %s') % exc)
 
-        try:
-            utils.execute('openssl', 'enc',
-                          '-d', '-aes-128-cbc',
-                          '-in', '%s' % (encrypted_filename,),
-                          '-K', '%s' % (key,),
-                          '-iv', '%s' % (iv,),
-                          '-out', '%s' % (decrypted_filename,))
-        except processutils.ProcessExecutionError as exc:
-            raise exception.NovaException(_('Failed to decrypt image file '
-                                    '%(image_file)s: %(err)s') %
-                                    {'image_file': encrypted_filename,
-                                     'err': exc.stdout})
+        return _DecryptingReader(parts, key, iv)
 
     @staticmethod
-    def _test_for_malicious_tarball(path, filename):
-        """Raises exception if extracting tarball would escape extract path."""
-        tar_file = tarfile.open(filename, 'r|gz')
-        for n in tar_file.getnames():
-            if not os.path.abspath(os.path.join(path, n)).startswith(path):
-                tar_file.close()
-                raise exception.NovaException(_('Unsafe filenames in image'))
-        tar_file.close()
+    def _untarzip_image(fileobj):
+        """Return the image file streamed out of a tar.gz, and its size.
 
-    @staticmethod
-    def _untarzip_image(path, filename):
-        S3ImageService._test_for_malicious_tarball(path, filename)
-        tar_file = tarfile.open(filename, 'r|gz')
-        tar_file.extractall(path)
-        image_file = tar_file.getnames()[0]
-        tar_file.close()
-        return os.path.join(path, image_file)
+        The image is the first regular file of the tarball.  Nothing is
+        extracted to disk, but unsafe names are still refused.
+        """
+        tar_file = tarfile.open(fileobj=fileobj, mode='r|gz')
+        for member in tar_file:
+            name = os.path.normpath(member.name)
+            if (os.path.isabs(name) or name == os.pardir or
+                    name.startswith(os.pardir + os.sep)):
+                raise exception.NovaException(_('Unsafe filenames in image'))
+            if member.isfile():
+                return tar_file.extractfile(member), member.size
+        raise exception.NovaException(_('No image file in tarball'))
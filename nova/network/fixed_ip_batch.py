@@ -0,0 +1,91 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Batching of the fixed ip allocations of a network.
+
+A multi-instance boot reaches nova-network as one allocate_for_instance
+call per instance, all at about the same time.  While the addresses of
+some instances are being associated in the database, the allocations
+arriving for the same network are queued, and the request which ran that
+call then associates the addresses of the whole queue with a single
+fixed_ip_associate_pool_many call.  A lone allocation goes straight to
+fixed_ip_associate_pool, so nothing is delayed waiting for a batch to
+fill up.
+
+Requests only queue up while a database call lets other greenthreads run,
+that is with dbapi_use_tpool or a pure Python database driver.
+"""
+
+import sys
+
+from eventlet import event
+
+from nova import exception
+
+
+class FixedIpBatcher(object):
+    """Associates pool addresses, batching concurrent requests per network.
+
+    The database calls of a batch are made with the context of the request
+    which runs them, so all the requests are expected to use an admin
+    context.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._running = set()
+
+    def associate(self, db, context, network_id, instance_uuid):
+        """Return a free address of the network, now used by the instance.
+
+        :raises: NoMoreFixedIps if the network has no free address left
+        """
+        waiter = event.Event()
+        self._pending.setdefault(network_id, []).append((instance_uuid,
+                                                         waiter))
+        if network_id not in self._running:
+            self._running.add(network_id)
+            try:
+                while network_id in self._pending:
+                    self._associate(db, context, network_id,
+                                    self._pending.pop(network_id))
+            finally:
+                self._running.discard(network_id)
+        return waiter.wait()
+
+    def _associate(self, db, context, network_id, batch):
+        instance_uuids = [instance_uuid for instance_uuid, _waiter in batch]
+        try:
+            if len(batch) == 1:
+                addresses = [db.fixed_ip_associate_pool(context, network_id,
+                                                        instance_uuids[0])]
+            else:
+                addresses = db.fixed_ip_associate_pool_many(context,
+                                                            network_id,
+                                                            instance_uuids)
+        except Exception:
+            exc_info = sys.exc_info()
+            for _instance_uuid, waiter in batch:
+                waiter.send_exception(*exc_info)
+            return
+
+        for i, (_instance_uuid, waiter) in enumerate(batch):
+            if i < len(addresses):
+                waiter.send(addresses[i])
+            else:
+                waiter.send_exception(exception.NoMoreFixedIps())
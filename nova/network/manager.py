@@ -59,6 +59,7 @@ from nova import ipv6
 from nova import manager
 from nova.network import api as network_api
 from nova.network import driver
+from nova.network import fixed_ip_batch
 from nova.network import floating_ips
 from nova.network import model as network_model
 from nova.network import rpcapi as network_rpcapi
@@ -300,6 +301,7 @@ class NetworkManager(manager.Manager):
             openstack_driver.get_openstack_security_group_driver())
 
         self.servicegroup_api = servicegroup.API()
+        self.fixed_ip_batcher = fixed_ip_batch.FixedIpBatcher()
 
         # NOTE(tr3buchet: unless manager subclassing NetworkManager has
         #                 already imported ipam, import nova ipam here
@@ -838,8 +840,9 @@ class NetworkManager(manager.Manager):
                                                          instance_id,
                                                          network['id'])
                 else:
-                    address = self.db.fixed_ip_associate_pool(
-                        context.elevated(), network['id'], instance_id)
+                    address = self.fixed_ip_batcher.associate(
+                        self.db, context.elevated(), network['id'],
+                        instance_id)
                 self._do_trigger_security_group_members_refresh_for_instance(
                     instance_id)
                 get_vif = self.db.virtual_interface_get_by_instance_and_network
@@ -1708,7 +1711,7 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
                                                      instance_id,
                                                      network['id'])
             else:
-                address = self.db.fixed_ip_associate_pool(context,
+                address = self.fixed_ip_batcher.associate(self.db, context,
                                                           network['id'],
                                                           instance_id)
             self._do_trigger_security_group_members_refresh_for_instance(
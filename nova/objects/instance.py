@@ -35,6 +35,9 @@ INSTANCE_IMPLIED_FIELDS = ['info_cache', 'security_groups']
 INSTANCE_OPTIONAL_NON_COLUMNS = ['fault']
 # These are all fields that most query calls load by default
 INSTANCE_DEFAULT_FIELDS = INSTANCE_OPTIONAL_FIELDS + INSTANCE_IMPLIED_FIELDS
+# These are fields that are always loaded when a list is projected on a
+# subset of the columns, as needed to lazy-load the rest
+INSTANCE_PROJECTION_FIELDS = ['id', 'uuid']
 
 
 class Instance(base.NovaObject):
@@ -176,15 +179,23 @@ class Instance(base.NovaObject):
         return base.NovaObject.obj_from_primitive(val)
 
     @staticmethod
-    def _from_db_object(context, instance, db_inst, expected_attrs=None):
+    def _from_db_object(context, instance, db_inst, expected_attrs=None,
+                        fields=None):
         """Method to help with migration to objects.
 
         Converts a database entity to a formal object.
+
+        :param fields: if not None, the columns the entity was projected on;
+                       the other columns are left unset
         """
         if expected_attrs is None:
             expected_attrs = []
+        if fields is None:
+            fields = instance.fields
+        else:
+            fields = set(fields) | set(INSTANCE_PROJECTION_FIELDS)
         # Most of the field names match right now, so be quick
-        for field in instance.fields:
+        for field in fields:
             if field in INSTANCE_OPTIONAL_FIELDS + INSTANCE_IMPLIED_FIELDS:
                 continue
             elif field == 'deleted':
@@ -204,11 +215,11 @@ class Instance(base.NovaObject):
         # NOTE(danms): info_cache and security_groups are almost always joined
         # in the DB layer right now, so check to see if they're filled instead
         # of looking at expected_attrs
-        if db_inst['info_cache']:
+        if db_inst.get('info_cache'):
             instance['info_cache'] = instance_info_cache.InstanceInfoCache()
             instance_info_cache.InstanceInfoCache._from_db_object(
                     context, instance['info_cache'], db_inst['info_cache'])
-        if db_inst['security_groups']:
+        if db_inst.get('security_groups'):
             instance['security_groups'] = security_group.SecurityGroupList()
             security_group._make_secgroup_list(context,
                                                instance['security_groups'],
@@ -314,6 +325,21 @@ class Instance(base.NovaObject):
         self.obj_reset_changes()
 
     def obj_load_attr(self, attrname):
+        instance_list = getattr(self, '_instance_list', None)
+        if instance_list is not None:
+            # NOTE: Load the attribute for the whole list this instance was
+            # projected in, rather than one query per instance
+            instance_list._load_attr(attrname)
+            if hasattr(self, base.get_attrname(attrname)):
+                return
+
+        if attrname in _column_fields():
+            instance = self.__class__.get_by_uuid(self._context,
+                                                  uuid=self.uuid)
+            self[attrname] = instance[attrname]
+            self.obj_reset_changes([attrname])
+            return
+
         extra = []
         if attrname == 'system_metadata':
             extra.append('system_metadata')
@@ -336,12 +362,30 @@ class Instance(base.NovaObject):
         self[attrname] = instance[attrname]
 
 
-def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
+def _column_fields():
+    """Return the fields which map to plain instance columns."""
+    return [field for field in Instance.fields
+            if field not in INSTANCE_DEFAULT_FIELDS]
+
+
+def _link_projected(inst_list, instances):
+    """Make the projected instances lazy-load through inst_list."""
+    columns = _column_fields()
+    for inst in instances:
+        if not all(hasattr(inst, base.get_attrname(field))
+                   for field in columns):
+            inst._instance_list = inst_list
+
+
+def _make_instance_list(context, inst_list, db_inst_list, expected_attrs,
+                        fields=None):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
     if get_fault:
         # Build an instance_uuid:latest-fault mapping
-        expected_attrs.remove('fault')
+        # NOTE: Leave the caller's list alone, it may be one of the module
+        # level field lists
+        expected_attrs = [attr for attr in expected_attrs if attr != 'fault']
         instance_uuids = [inst['uuid'] for inst in db_inst_list]
         faults = instance_fault.InstanceFaultList.get_by_instance_uuids(
             context, instance_uuids)
@@ -352,14 +396,23 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
     inst_list.objects = []
     for db_inst in db_inst_list:
         inst_obj = Instance._from_db_object(context, Instance(), db_inst,
-                                            expected_attrs=expected_attrs)
+                                            expected_attrs=expected_attrs,
+                                            fields=fields)
         if get_fault:
             inst_obj.fault = inst_faults.get(inst_obj.uuid, None)
         inst_list.objects.append(inst_obj)
+    if fields is not None:
+        _link_projected(inst_list, inst_list.objects)
     inst_list.obj_reset_changes()
     return inst_list
 
 
+def projected_cols(fields):
+    """Return the columns to select for a projection on fields."""
+    columns = set(fields) - set(INSTANCE_DEFAULT_FIELDS)
+    return sorted(columns | set(INSTANCE_PROJECTION_FIELDS))
+
+
 def expected_cols(expected_attrs):
     """Return expected_attrs that are columns needing joining."""
     if expected_attrs:
@@ -369,22 +422,47 @@ def expected_cols(expected_attrs):
 
 
 class InstanceList(base.ObjectListBase, base.NovaObject):
+    """A list of instances.
+
+    The get_by_filters() and get_by_host() queries can be projected on a
+    subset of the instance columns by passing fields.  The other columns,
+    as well as any attribute not given in expected_attrs, are then
+    lazy-loaded for all the instances of the list at once, the first time
+    one of them is accessed.  Lazy-loaded columns are not reported as
+    changed, so save() only writes what the caller actually modified.
+    """
+
+    # Version 1.0: Initial version
+    # Version 1.1: Added fields to get_by_filters() and get_by_host()
+    # Version 1.2: Added use_slave to get_by_filters()
+    VERSION = '1.2'
+
     @base.remotable_classmethod
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
-                       marker=None, expected_attrs=None):
+                       marker=None, expected_attrs=None, fields=None,
+                       use_slave=False):
+        kwargs = {}
+        if fields is not None:
+            kwargs['columns'] = projected_cols(fields)
+        if use_slave:
+            kwargs['use_slave'] = True
         db_inst_list = db.instance_get_all_by_filters(
             context, filters, sort_key, sort_dir, limit=limit, marker=marker,
-            columns_to_join=expected_cols(expected_attrs))
+            columns_to_join=expected_cols(expected_attrs), **kwargs)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, fields=fields)
 
     @base.remotable_classmethod
-    def get_by_host(cls, context, host, expected_attrs=None):
+    def get_by_host(cls, context, host, expected_attrs=None, fields=None):
+        kwargs = {}
+        if fields is not None:
+            kwargs['columns'] = projected_cols(fields)
         db_inst_list = db.instance_get_all_by_host(
-            context, host, columns_to_join=expected_cols(expected_attrs))
+            context, host, columns_to_join=expected_cols(expected_attrs),
+            **kwargs)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, fields=fields)
 
     @base.remotable_classmethod
     def get_by_host_and_node(cls, context, host, node, expected_attrs=None):
@@ -432,3 +510,59 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
             instance.obj_reset_changes(['fault'])
 
         return faults_by_uuid.keys()
+
+    def _attr_objects_from_primitive(self, value):
+        objects = super(InstanceList, self)._attr_objects_from_primitive(
+            value)
+        _link_projected(self, objects)
+        return objects
+
+    def _load_attr(self, attrname):
+        """Lazy-load an attribute for all the projected instances.
+
+        Columns left out of the projection are all loaded together, so
+        accessing any of them costs a single query for the whole list.
+        """
+        missing = [inst for inst in self.objects
+                   if getattr(inst, '_instance_list', None) is self and
+                   not hasattr(inst, base.get_attrname(attrname))]
+        if not missing:
+            return
+
+        if attrname == 'fault':
+            self.fill_faults()
+            return
+
+        filters = {'uuid': [inst.uuid for inst in missing]}
+        if attrname in INSTANCE_DEFAULT_FIELDS:
+            attrs = [attrname]
+            fields = None
+            if attrname in INSTANCE_OPTIONAL_FIELDS:
+                fields = []
+            loaded = InstanceList.get_by_filters(self._context, filters,
+                                                 expected_attrs=[attrname],
+                                                 fields=fields)
+        else:
+            attrs = [field for field in _column_fields()
+                     if not all(hasattr(inst, base.get_attrname(field))
+                                for inst in missing)]
+            loaded = InstanceList.get_by_filters(self._context, filters,
+                                                 fields=attrs)
+
+        loaded = dict((inst.uuid, inst) for inst in loaded)
+        for inst in missing:
+            source = loaded.get(inst.uuid)
+            if source is None:
+                continue
+            for attr in attrs:
+                name = base.get_attrname(attr)
+                if hasattr(inst, name):
+                    continue
+                if attr in INSTANCE_DEFAULT_FIELDS:
+                    # NOTE: metadata and the nested objects stay marked as
+                    # changed like with Instance.obj_load_attr(), as
+                    # callers rely on save() writing back in-place changes
+                    inst[attr] = getattr(source, name, None)
+                elif hasattr(source, name):
+                    inst[attr] = source[attr]
+                    inst.obj_reset_changes([attr])
@@ -32,20 +32,36 @@ S3 client with this module::
     c.put("mybucket", "mykey", "a value")
     print c.get("mybucket", "mykey").body
 
+Objects are streamed to and from disk in chunks, so their size is not bound
+by the memory of the server.  GET supports single byte ranges, and large
+objects can be uploaded in parts with the multipart upload API.  The keys
+of each bucket are kept in a sorted sqlite index, so that listing a page of
+keys does not need to walk the whole bucket.
+
 """
 
-import bisect
+import base64
+import contextlib
 import datetime
 import hashlib
+import json
 import os
 import os.path
+import re
+import shutil
+import sqlite3
+import tempfile
 import urllib
+import uuid
 
 from oslo.config import cfg
 import routes
 import webob
 
+from nova.api.openstack import xmlutil
+from nova import exception
 from nova.openstack.common import fileutils
+from nova.openstack.common import strutils
 from nova import paths
 from nova import utils
 from nova import wsgi
@@ -66,6 +82,14 @@ s3_opts = [
 CONF = cfg.CONF
 CONF.register_opts(s3_opts)
 
+# Size of the chunks objects are read and written in
+CHUNK_SIZE = 64 * 1024
+
+# Directory under the root directory holding the bucket indexes, the
+# multipart uploads in progress and the objects being written.  Bucket
+# names cannot start with a dot, so it never clashes with a bucket.
+INTERNAL_DIRECTORY = '.objectstore'
+
 
 def get_wsgi_server():
     return wsgi.Server("S3 Objectstore",
@@ -96,9 +120,141 @@ class S3Application(wsgi.Router):
         self.directory = os.path.abspath(root_directory)
         fileutils.ensure_tree(self.directory)
         self.bucket_depth = bucket_depth
+        internal = os.path.join(self.directory, INTERNAL_DIRECTORY)
+        self.index_directory = os.path.join(internal, 'index')
+        self.uploads_directory = os.path.join(internal, 'uploads')
+        self.tmp_directory = os.path.join(internal, 'tmp')
+        for directory in (self.index_directory, self.uploads_directory,
+                          self.tmp_directory):
+            fileutils.ensure_tree(directory)
         super(S3Application, self).__init__(mapper)
 
 
+class BucketIndex(object):
+    """Sorted index of the objects of a bucket, kept in a sqlite database.
+
+    Listing the keys after a marker or with a prefix is then a lookup in
+    the index, which costs as much as the page returned instead of as much
+    as the whole bucket.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self, path=None):
+        return contextlib.closing(sqlite3.connect(path or self.path))
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def create(self, objects=()):
+        """Create the index, filled with (name, size, mtime) tuples.
+
+        The index is written aside and renamed in place, so a concurrent
+        request never sees it half filled.
+        """
+        tmp_path = '%s.%s' % (self.path, uuid.uuid4().hex)
+        try:
+            with self._connect(tmp_path) as conn:
+                with conn:
+                    conn.execute('CREATE TABLE objects ('
+                                 'name TEXT PRIMARY KEY, size INTEGER, '
+                                 'mtime REAL, etag TEXT)')
+                    conn.executemany('INSERT OR REPLACE INTO objects '
+                                     '(name, size, mtime) VALUES (?, ?, ?)',
+                                     ((_key(name), size, mtime)
+                                      for name, size, mtime in objects))
+            os.rename(tmp_path, self.path)
+        finally:
+            fileutils.delete_if_exists(tmp_path)
+
+    def destroy(self):
+        fileutils.delete_if_exists(self.path)
+
+    def add(self, name, size, mtime, etag):
+        with self._connect() as conn:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO objects '
+                             '(name, size, mtime, etag) VALUES (?, ?, ?, ?)',
+                             (_key(name), size, mtime, etag))
+
+    def remove(self, name):
+        with self._connect() as conn:
+            with conn:
+                conn.execute('DELETE FROM objects WHERE name = ?',
+                             (_key(name),))
+
+    def get_etag(self, name):
+        with self._connect() as conn:
+            row = conn.execute('SELECT etag FROM objects WHERE name = ?',
+                               (_key(name),)).fetchone()
+        return row[0] if row else None
+
+    def list(self, prefix, marker, limit):
+        """Return up to limit (name, size, mtime) tuples, sorted by name.
+
+        Only names after marker and starting with prefix are returned.
+        """
+        prefix = _key(prefix)
+        objects = []
+        with self._connect() as conn:
+            rows = conn.execute('SELECT name, size, mtime FROM objects '
+                                'WHERE name > ? AND name >= ? '
+                                'ORDER BY name LIMIT ?',
+                                (_key(marker), prefix, limit))
+            for row in rows:
+                if not row[0].startswith(prefix):
+                    break
+                objects.append(row)
+        return objects
+
+
+def _key(name):
+    return strutils.safe_decode(name, 'utf-8')
+
+
+def _parse_range(header, size):
+    """Return the first and last byte asked for by a Range header.
+
+    Only a single byte range is supported.  None is returned if there is no
+    header or it cannot be parsed, in which case the whole object is sent,
+    and ValueError is raised if the range cannot be satisfied.
+    """
+    match = re.match(r'^bytes=(\d*)-(\d*)$', header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix range, giving the number of bytes to send from the end
+        first = size - int(last)
+        if first == size:
+            raise ValueError(header)
+        first, last = max(first, 0), size - 1
+    else:
+        first = int(first)
+        if last:
+            if int(last) < first:
+                return None
+            last = min(int(last), size - 1)
+        else:
+            last = size - 1
+    if first >= size:
+        raise ValueError(header)
+    return first, last
+
+
+def _file_iter(path, first, length):
+    """Yield length bytes of a file from first, in CHUNK_SIZE chunks."""
+    with open(path, 'rb') as object_file:
+        object_file.seek(first)
+        while length > 0:
+            chunk = object_file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
 class BaseRequestHandler(object):
     """Base class emulating Tornado's web framework pattern in WSGI.
 
@@ -162,6 +318,13 @@ class BaseRequestHandler(object):
             }})
         self.set_status(404)
 
+    def set_error(self, status_code, code, message):
+        self.render_xml({"Error": {
+            "Code": code,
+            "Message": message,
+            }})
+        self.set_status(status_code)
+
     def finish(self, body=''):
         self.response.body = utils.utf8(body)
 
@@ -186,6 +349,8 @@ class BaseRequestHandler(object):
 
         if isinstance(value, basestring):
             parts.append(utils.xhtml_escape(value))
+        elif isinstance(value, bool):
+            parts.append('true' if value else 'false')
         elif isinstance(value, int) or isinstance(value, long):
             parts.append(str(value))
         elif isinstance(value, datetime.datetime):
@@ -201,6 +366,70 @@ class BaseRequestHandler(object):
         else:
             raise Exception("Unknown S3 value type %r", value)
 
+    def _bucket_path(self, bucket):
+        """Return the directory of a bucket, or None if the name is bad."""
+        path = os.path.abspath(os.path.join(self.application.directory,
+                                            bucket))
+        if (bucket.startswith('.') or
+                not path.startswith(self.application.directory)):
+            return None
+        return path
+
+    def _bucket_index(self, bucket):
+        """Return the index of an existing bucket.
+
+        Buckets created before the indexes were introduced are walked once
+        to build their index.
+        """
+        index = BucketIndex(os.path.join(self.application.index_directory,
+                                         bucket))
+        if not index.exists():
+            index.create(self._walk_bucket(bucket))
+        return index
+
+    def _walk_bucket(self, bucket):
+        path = self._bucket_path(bucket)
+        skip = len(path) + 1
+        for i in range(self.application.bucket_depth):
+            skip += 2 * (i + 1) + 1
+        for root, dirs, files in os.walk(path):
+            for file_name in files:
+                object_path = os.path.join(root, file_name)
+                info = os.stat(object_path)
+                yield object_path[skip:], info.st_size, info.st_mtime
+
+    def _write_file(self, path, chunks, check=None):
+        """Write chunks to path, returning the MD5 of the data.
+
+        The data is written to a temporary file which is renamed in place
+        once complete, so readers never see a partial object.  If given,
+        check is called with the MD5 before renaming and may raise to
+        discard the data.
+        """
+        md5 = hashlib.md5()
+        fd, tmp_path = tempfile.mkstemp(dir=self.application.tmp_directory)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in chunks:
+                    md5.update(chunk)
+                    tmp_file.write(chunk)
+            if check is not None:
+                check(md5)
+            fileutils.ensure_tree(os.path.dirname(path))
+            os.rename(tmp_path, path)
+        finally:
+            fileutils.delete_if_exists(tmp_path)
+        return md5
+
+    def _body_chunks(self):
+        """Yield the request body in CHUNK_SIZE chunks."""
+        body_file = self.request.body_file
+        while True:
+            chunk = body_file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
     def _object_path(self, bucket, object_name):
         if self.application.bucket_depth < 1:
             return os.path.abspath(os.path.join(
@@ -218,6 +447,8 @@ class RootHandler(BaseRequestHandler):
         names = os.listdir(self.application.directory)
         buckets = []
         for name in names:
+            if name.startswith('.'):
+                continue
             path = os.path.join(self.application.directory, name)
             info = os.stat(path)
             buckets.append({
@@ -235,45 +466,22 @@ class BucketHandler(BaseRequestHandler):
         prefix = self.get_argument("prefix", u"")
         marker = self.get_argument("marker", u"")
         max_keys = int(self.get_argument("max-keys", 50000))
-        path = os.path.abspath(os.path.join(self.application.directory,
-                                            bucket_name))
+        path = self._bucket_path(bucket_name)
         terse = int(self.get_argument("terse", 0))
-        if (not path.startswith(self.application.directory) or
-                not os.path.isdir(path)):
+        if path is None or not os.path.isdir(path):
             self.set_404()
             return
-        object_names = []
-        for root, dirs, files in os.walk(path):
-            for file_name in files:
-                object_names.append(os.path.join(root, file_name))
-        skip = len(path) + 1
-        for i in range(self.application.bucket_depth):
-            skip += 2 * (i + 1) + 1
-        object_names = [n[skip:] for n in object_names]
-        object_names.sort()
+        objects = self._bucket_index(bucket_name).list(prefix, marker,
+                                                       max_keys + 1)
+        truncated = len(objects) > max_keys
         contents = []
-
-        start_pos = 0
-        if marker:
-            start_pos = bisect.bisect_right(object_names, marker, start_pos)
-        if prefix:
-            start_pos = bisect.bisect_left(object_names, prefix, start_pos)
-
-        truncated = False
-        for object_name in object_names[start_pos:]:
-            if not object_name.startswith(prefix):
-                break
-            if len(contents) >= max_keys:
-                truncated = True
-                break
-            object_path = self._object_path(bucket_name, object_name)
+        for object_name, size, mtime in objects[:max_keys]:
             c = {"Key": object_name}
             if not terse:
-                info = os.stat(object_path)
                 c.update({
                     "LastModified": datetime.datetime.utcfromtimestamp(
-                        info.st_mtime),
-                    "Size": info.st_size,
+                        mtime),
+                    "Size": size,
                 })
             contents.append(c)
             marker = object_name
@@ -287,35 +495,56 @@ class BucketHandler(BaseRequestHandler):
         }})
 
     def put(self, bucket_name):
-        path = os.path.abspath(os.path.join(
-            self.application.directory, bucket_name))
-        if (not path.startswith(self.application.directory) or
-                os.path.exists(path)):
+        path = self._bucket_path(bucket_name)
+        if path is None or os.path.exists(path):
             self.set_status(403)
             return
         fileutils.ensure_tree(path)
+        BucketIndex(os.path.join(self.application.index_directory,
+                                 bucket_name)).create()
         self.finish()
 
     def delete(self, bucket_name):
-        path = os.path.abspath(os.path.join(
-            self.application.directory, bucket_name))
-        if (not path.startswith(self.application.directory) or
-                not os.path.isdir(path)):
+        path = self._bucket_path(bucket_name)
+        if path is None or not os.path.isdir(path):
             self.set_404()
             return
         if len(os.listdir(path)) > 0:
             self.set_status(403)
             return
         os.rmdir(path)
+        BucketIndex(os.path.join(self.application.index_directory,
+                                 bucket_name)).destroy()
         self.set_status(204)
         self.finish()
 
 
+class _BadDigest(Exception):
+    pass
+
+
+class _InvalidPart(Exception):
+    pass
+
+
+def _child_text(node, name):
+    """Return the text of the first name child of a DOM node, or None."""
+    for child in node.getElementsByTagName(name):
+        return ''.join(text.data for text in child.childNodes
+                       if text.nodeType == text.TEXT_NODE).strip()
+    return None
+
+
 class ObjectHandler(BaseRequestHandler):
     def get(self, bucket, object_name):
         object_name = urllib.unquote(object_name)
+        upload_id = self.get_argument('uploadId', None)
+        if upload_id is not None:
+            self._list_parts(bucket, object_name, upload_id)
+            return
         path = self._object_path(bucket, object_name)
-        if (not path.startswith(self.application.directory) or
+        if (self._bucket_path(bucket) is None or
+                not path.startswith(self.application.directory) or
                 not os.path.isfile(path)):
             self.set_404()
             return
@@ -323,40 +552,260 @@ class ObjectHandler(BaseRequestHandler):
         self.set_header("Content-Type", "application/unknown")
         self.set_header("Last-Modified", datetime.datetime.utcfromtimestamp(
             info.st_mtime))
-        object_file = open(path, "r")
+        self.set_header("Accept-Ranges", "bytes")
+        etag = self._bucket_index(bucket).get_etag(object_name)
+        if etag:
+            self.set_header('ETag', '"%s"' % etag)
+
+        size = info.st_size
         try:
-            self.finish(object_file.read())
-        finally:
-            object_file.close()
+            byte_range = _parse_range(self.request.headers.get('Range'),
+                                      size)
+        except ValueError:
+            self.set_header('Content-Range', 'bytes */%d' % size)
+            self.set_error(416, 'InvalidRange',
+                           'The requested range is not satisfiable')
+            return
+        first, last = 0, size - 1
+        if byte_range is not None:
+            first, last = byte_range
+            self.set_status(206)
+            self.set_header('Content-Range',
+                            'bytes %d-%d/%d' % (first, last, size))
+        self.response.app_iter = _file_iter(path, first, last - first + 1)
+        self.response.content_length = last - first + 1
 
     def put(self, bucket, object_name):
         object_name = urllib.unquote(object_name)
-        bucket_dir = os.path.abspath(os.path.join(
-            self.application.directory, bucket))
-        if (not bucket_dir.startswith(self.application.directory) or
-                not os.path.isdir(bucket_dir)):
+        bucket_dir = self._bucket_path(bucket)
+        if bucket_dir is None or not os.path.isdir(bucket_dir):
             self.set_404()
             return
+        upload_id = self.get_argument('uploadId', None)
+        if upload_id is not None:
+            self._put_part(bucket, object_name, upload_id)
+            return
         path = self._object_path(bucket, object_name)
         if not path.startswith(bucket_dir) or os.path.isdir(path):
             self.set_status(403)
             return
-        directory = os.path.dirname(path)
-        fileutils.ensure_tree(directory)
-        object_file = open(path, "w")
-        object_file.write(self.request.body)
-        object_file.close()
-        self.set_header('ETag',
-                        '"%s"' % hashlib.md5(self.request.body).hexdigest())
+        md5 = self._write_body(path)
+        if md5 is None:
+            return
+        self._index_object(bucket, object_name, path, md5.hexdigest())
+        self.set_header('ETag', '"%s"' % md5.hexdigest())
         self.finish()
 
+    def post(self, bucket, object_name):
+        object_name = urllib.unquote(object_name)
+        bucket_dir = self._bucket_path(bucket)
+        if bucket_dir is None or not os.path.isdir(bucket_dir):
+            self.set_404()
+            return
+        path = self._object_path(bucket, object_name)
+        if not path.startswith(bucket_dir) or os.path.isdir(path):
+            self.set_status(403)
+            return
+        if 'uploads' in self.request.params:
+            self._initiate_upload(bucket, object_name)
+        elif 'uploadId' in self.request.params:
+            self._complete_upload(bucket, object_name, path,
+                                  self.get_argument('uploadId', None))
+        else:
+            self.set_error(400, 'InvalidRequest',
+                           'Only multipart uploads can be posted')
+
     def delete(self, bucket, object_name):
         object_name = urllib.unquote(object_name)
+        upload_id = self.get_argument('uploadId', None)
+        if upload_id is not None:
+            self._abort_upload(bucket, object_name, upload_id)
+            return
         path = self._object_path(bucket, object_name)
-        if (not path.startswith(self.application.directory) or
+        if (self._bucket_path(bucket) is None or
+                not path.startswith(self.application.directory) or
                 not os.path.isfile(path)):
             self.set_404()
             return
         os.unlink(path)
+        self._bucket_index(bucket).remove(object_name)
+        self.set_status(204)
+        self.finish()
+
+    def _write_body(self, path):
+        """Stream the request body to path, checking its Content-MD5.
+
+        Returns the MD5 of the body, or None after rendering an error if
+        it does not match the Content-MD5 header.
+        """
+        content_md5 = self.request.headers.get('Content-MD5')
+
+        def check(md5):
+            if (content_md5 is not None and
+                    base64.b64encode(md5.digest()) != content_md5.strip()):
+                raise _BadDigest()
+
+        try:
+            return self._write_file(path, self._body_chunks(), check)
+        except _BadDigest:
+            self.set_error(400, 'BadDigest',
+                           'The Content-MD5 you specified did not match '
+                           'what was received')
+            return None
+
+    def _index_object(self, bucket, object_name, path, etag):
+        info = os.stat(path)
+        self._bucket_index(bucket).add(object_name, info.st_size,
+                                       info.st_mtime, etag)
+
+    def _upload_path(self, bucket, object_name, upload_id):
+        """Return the directory of a multipart upload of an object.
+
+        None is returned after rendering an error if there is no such
+        upload in progress for the object.
+        """
+        path = None
+        if re.match(r'^[0-9a-f]{32}$', upload_id or ''):
+            path = os.path.join(self.application.uploads_directory,
+                                upload_id)
+            try:
+                with open(os.path.join(path, 'upload.json')) as f:
+                    upload = json.load(f)
+            except (IOError, ValueError):
+                upload = None
+            if upload != {'bucket': _key(bucket), 'key': _key(object_name)}:
+                path = None
+        if path is None:
+            self.set_error(404, 'NoSuchUpload',
+                           'The specified upload does not exist')
+        return path
+
+    def _initiate_upload(self, bucket, object_name):
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.application.uploads_directory, upload_id)
+        fileutils.ensure_tree(path)
+        with open(os.path.join(path, 'upload.json'), 'w') as f:
+            json.dump({'bucket': _key(bucket), 'key': _key(object_name)}, f)
+        self.render_xml({"InitiateMultipartUploadResult": {
+            "Bucket": bucket,
+            "Key": object_name,
+            "UploadId": upload_id,
+        }})
+
+    def _put_part(self, bucket, object_name, upload_id):
+        path = self._upload_path(bucket, object_name, upload_id)
+        if path is None:
+            return
+        try:
+            part_number = int(self.get_argument('partNumber', ''))
+        except ValueError:
+            part_number = 0
+        if not 1 <= part_number <= 10000:
+            self.set_error(400, 'InvalidArgument',
+                           'Part number must be an integer between 1 and '
+                           '10000')
+            return
+        part_path = os.path.join(path, '%05d' % part_number)
+        md5 = self._write_body(part_path)
+        if md5 is None:
+            return
+        with open(part_path + '.etag', 'w') as f:
+            f.write(md5.hexdigest())
+        self.set_header('ETag', '"%s"' % md5.hexdigest())
+        self.finish()
+
+    def _list_parts(self, bucket, object_name, upload_id):
+        path = self._upload_path(bucket, object_name, upload_id)
+        if path is None:
+            return
+        parts = []
+        for name in sorted(os.listdir(path)):
+            if not re.match(r'^\d{5}$', name):
+                continue
+            part_path = os.path.join(path, name)
+            try:
+                with open(part_path + '.etag') as f:
+                    etag = f.read()
+            except IOError:
+                # The part is still being written
+                continue
+            info = os.stat(part_path)
+            parts.append({
+                "PartNumber": int(name),
+                "ETag": '"%s"' % etag,
+                "Size": info.st_size,
+                "LastModified": datetime.datetime.utcfromtimestamp(
+                    info.st_mtime),
+            })
+        self.render_xml({"ListPartsResult": {
+            "Bucket": bucket,
+            "Key": object_name,
+            "UploadId": upload_id,
+            "IsTruncated": False,
+            "Part": parts,
+        }})
+
+    def _complete_upload(self, bucket, object_name, path, upload_id):
+        upload = self._upload_path(bucket, object_name, upload_id)
+        if upload is None:
+            return
+        try:
+            doc = xmlutil.safe_minidom_parse_string(self.request.body)
+            parts = [(int(_child_text(node, 'PartNumber')),
+                      _child_text(node, 'ETag').strip('"'))
+                     for node in doc.getElementsByTagName('Part')]
+        except (exception.MalformedRequestBody, AttributeError,
+                TypeError, ValueError):
+            parts = None
+        if not parts:
+            self.set_error(400, 'MalformedXML',
+                           'The XML you provided was not well-formed')
+            return
+        numbers = [number for number, etag in parts]
+        if numbers != sorted(set(numbers)):
+            self.set_error(400, 'InvalidPartOrder',
+                           'The list of parts was not in ascending order')
+            return
+
+        digests = []
+
+        def read_parts():
+            for number, etag in parts:
+                part_path = os.path.join(upload, '%05d' % number)
+                if not os.path.isfile(part_path):
+                    raise _InvalidPart()
+                part_md5 = hashlib.md5()
+                for chunk in _file_iter(part_path, 0,
+                                        os.path.getsize(part_path)):
+                    part_md5.update(chunk)
+                    yield chunk
+                if part_md5.hexdigest() != etag:
+                    raise _InvalidPart()
+                digests.append(part_md5.digest())
+
+        try:
+            self._write_file(path, read_parts())
+        except _InvalidPart:
+            self.set_error(400, 'InvalidPart',
+                           'One or more of the specified parts could not '
+                           'be found or did not match its ETag')
+            return
+        shutil.rmtree(upload, ignore_errors=True)
+
+        etag = '%s-%d' % (hashlib.md5(''.join(digests)).hexdigest(),
+                          len(digests))
+        self._index_object(bucket, object_name, path, etag)
+        self.render_xml({"CompleteMultipartUploadResult": {
+            "Location": self.request.path_url,
+            "Bucket": bucket,
+            "Key": object_name,
+            "ETag": '"%s"' % etag,
+        }})
+
+    def _abort_upload(self, bucket, object_name, upload_id):
+        path = self._upload_path(bucket, object_name, upload_id)
+        if path is None:
+            return
+        shutil.rmtree(path, ignore_errors=True)
         self.set_status(204)
         self.finish()
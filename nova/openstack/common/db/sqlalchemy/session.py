@@ -240,6 +240,8 @@ Efficient use of soft deletes:
         # This will produce count(bar_refs) db requests.
 """
 
+import contextlib
+import functools
 import os.path
 import re
 import time
@@ -256,6 +258,7 @@ from sqlalchemy.sql.expression import literal_column
 from nova.openstack.common.db import exception
 from nova.openstack.common import log as logging
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import local
 from nova.openstack.common import timeutils
 
 
@@ -267,6 +270,12 @@ sql_opts = [
                help='The SQLAlchemy connection string used to connect to the '
                     'database',
                secret=True),
+    cfg.StrOpt('sql_slave_connection',
+               default='',
+               help='The SQLAlchemy connection string used to connect to a '
+                    'read-only replica of the database, queried by the read '
+                    'paths tolerating replication lag',
+               secret=True),
     cfg.StrOpt('sqlite_db',
                default='nova.sqlite',
                help='the filename to use with sqlite'),
@@ -294,6 +303,9 @@ sql_opts = [
     cfg.IntOpt('sql_max_overflow',
                default=None,
                help='If set, use this value for max_overflow with sqlalchemy'),
+    cfg.IntOpt('sql_pool_timeout',
+               default=None,
+               help='If set, use this value for pool_timeout with sqlalchemy'),
     cfg.IntOpt('sql_connection_debug',
                default=0,
                help='Verbosity of SQL debugging information. 0=None, '
@@ -301,6 +313,10 @@ sql_opts = [
     cfg.BoolOpt('sql_connection_trace',
                 default=False,
                 help='Add python stack traces to SQL as comment strings'),
+    cfg.BoolOpt('sql_query_stats',
+                default=False,
+                help='Count the queries run by each DB API function and '
+                     'how long they take'),
 ]
 
 CONF = cfg.CONF
@@ -309,6 +325,8 @@ LOG = logging.getLogger(__name__)
 
 _ENGINE = None
 _MAKER = None
+_SLAVE_ENGINE = None
+_SLAVE_MAKER = None
 
 
 def set_defaults(sql_connection, sqlite_db):
@@ -319,7 +337,7 @@ def set_defaults(sql_connection, sqlite_db):
 
 
 def cleanup():
-    global _ENGINE, _MAKER
+    global _ENGINE, _MAKER, _SLAVE_ENGINE, _SLAVE_MAKER
 
     if _MAKER:
         _MAKER.close_all()
@@ -327,6 +345,12 @@ def cleanup():
     if _ENGINE:
         _ENGINE.dispose()
         _ENGINE = None
+    if _SLAVE_MAKER:
+        _SLAVE_MAKER.close_all()
+        _SLAVE_MAKER = None
+    if _SLAVE_ENGINE:
+        _SLAVE_ENGINE.dispose()
+        _SLAVE_ENGINE = None
 
 
 class SqliteForeignKeysListener(PoolListener):
@@ -342,15 +366,28 @@ class SqliteForeignKeysListener(PoolListener):
 
 
 def get_session(autocommit=True, expire_on_commit=False,
-                sqlite_fk=False):
-    """Return a SQLAlchemy session."""
-    global _MAKER
+                sqlite_fk=False, slave_session=False):
+    """Return a SQLAlchemy session.
+
+    :param slave_session: whether the session should query the replica set
+                          by sql_slave_connection, if any, rather than the
+                          main database
+    """
+    global _MAKER, _SLAVE_MAKER
 
-    if _MAKER is None:
-        engine = get_engine(sqlite_fk=sqlite_fk)
-        _MAKER = get_maker(engine, autocommit, expire_on_commit)
+    if slave_session and not CONF.sql_slave_connection:
+        slave_session = False
 
-    session = _MAKER()
+    maker = _SLAVE_MAKER if slave_session else _MAKER
+    if maker is None:
+        engine = get_engine(sqlite_fk=sqlite_fk, slave_engine=slave_session)
+        maker = get_maker(engine, autocommit, expire_on_commit)
+        if slave_session:
+            _SLAVE_MAKER = maker
+        else:
+            _MAKER = maker
+
+    session = maker()
     return session
 
 
@@ -465,9 +502,19 @@ def _wrap_db_error(f):
     return _wrap
 
 
-def get_engine(sqlite_fk=False):
-    """Return a SQLAlchemy engine."""
-    global _ENGINE
+def get_engine(sqlite_fk=False, slave_engine=False):
+    """Return a SQLAlchemy engine.
+
+    :param slave_engine: whether to return the engine of the replica set by
+                         sql_slave_connection, if any, rather than the
+                         engine of the main database
+    """
+    global _ENGINE, _SLAVE_ENGINE
+    if slave_engine and CONF.sql_slave_connection:
+        if _SLAVE_ENGINE is None:
+            _SLAVE_ENGINE = create_engine(CONF.sql_slave_connection,
+                                          sqlite_fk=sqlite_fk)
+        return _SLAVE_ENGINE
     if _ENGINE is None:
         _ENGINE = create_engine(CONF.sql_connection,
                                 sqlite_fk=sqlite_fk)
@@ -516,6 +563,78 @@ def _ping_listener(dbapi_conn, connection_rec, connection_proxy):
             raise
 
 
+# Queries run by each DB API function, see sql_query_stats
+_QUERY_STATS = {}
+
+
+@contextlib.contextmanager
+def _api_call(name):
+    """Attribute the queries run in this context to the DB API function.
+
+    Only the outermost call is counted when DB API functions call each other.
+    """
+    if getattr(local.strong_store, 'db_api_call', None) is not None:
+        yield
+        return
+    stats = _QUERY_STATS.setdefault(name, {'calls': 0,
+                                           'queries': 0,
+                                           'time': 0.0})
+    stats['calls'] += 1
+    local.strong_store.db_api_call = name
+    try:
+        yield
+    finally:
+        local.strong_store.db_api_call = None
+
+
+class QueryStatsBackend(object):
+    """DB API backend recording the queries run by each of its functions."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, key):
+        attr = getattr(self._backend, key)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            with _api_call(key):
+                return attr(*args, **kwargs)
+        return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info['query_start'] = time.time()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    name = getattr(local.strong_store, 'db_api_call', None)
+    start = conn.info.pop('query_start', None)
+    if name is None or start is None:
+        return
+    stats = _QUERY_STATS[name]
+    stats['queries'] += 1
+    stats['time'] += time.time() - start
+
+
+def get_query_stats():
+    """Return the queries run by each DB API function so far.
+
+    Only recorded when the sql_query_stats option is set.  The result maps
+    function names to {'calls': ..., 'queries': ..., 'time': seconds}; many
+    more queries than calls hint at queries run in a loop.
+    """
+    return dict((name, dict(stats)) for name, stats in _QUERY_STATS.items())
+
+
+def reset_query_stats():
+    _QUERY_STATS.clear()
+
+
 def _is_db_connection_error(args):
     """Return True if error in connecting to db."""
     # NOTE(adam_g): This is currently MySQL specific and needs to be extended
@@ -548,18 +667,26 @@ def create_engine(sql_connection, sqlite_fk=False):
             engine_args["listeners"] = [SqliteForeignKeysListener()]
         engine_args["poolclass"] = NullPool
 
-        if CONF.sql_connection == "sqlite://":
+        if sql_connection == "sqlite://":
             engine_args["poolclass"] = StaticPool
             engine_args["connect_args"] = {'check_same_thread': False}
     else:
         engine_args['pool_size'] = CONF.sql_max_pool_size
         if CONF.sql_max_overflow is not None:
             engine_args['max_overflow'] = CONF.sql_max_overflow
+        if CONF.sql_pool_timeout is not None:
+            engine_args['pool_timeout'] = CONF.sql_pool_timeout
 
     engine = sqlalchemy.create_engine(sql_connection, **engine_args)
 
     sqlalchemy.event.listen(engine, 'checkin', _greenthread_yield)
 
+    if CONF.sql_query_stats:
+        sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                                _before_cursor_execute)
+        sqlalchemy.event.listen(engine, 'after_cursor_execute',
+                                _after_cursor_execute)
+
     if 'mysql' in connection_dict.drivername:
         sqlalchemy.event.listen(engine, 'checkout', _ping_listener)
     elif 'sqlite' in connection_dict.drivername:
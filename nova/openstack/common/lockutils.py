@@ -15,7 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-
+import bisect
+import contextlib
 import errno
 import functools
 import os
@@ -23,6 +24,7 @@ import shutil
 import tempfile
 import time
 import weakref
+import zlib
 
 from eventlet import semaphore
 from oslo.config import cfg
@@ -41,7 +43,13 @@ util_opts = [
                 help='Whether to disable inter-process locks'),
     cfg.StrOpt('lock_path',
                help=('Directory to use for lock files. Default to a '
-                     'temp directory'))
+                     'temp directory')),
+    cfg.BoolOpt('lock_stats', default=False,
+                help='Whether to record how long each lock is waited for '
+                     'and held'),
+    cfg.IntOpt('lock_stripes', default=32,
+               help='Default number of locks striped locks are spread '
+                    'over'),
 ]
 
 
@@ -69,14 +77,21 @@ class _InterProcessLock(object):
     safe to close the file descriptor while another green thread holds the
     lock. Just opening and closing the lock file can break synchronisation,
     so lock files must be accessed only using this abstraction.
+
+    A shared lock can be held by several processes at once, but not while
+    another one holds the lock exclusively.  The lock belongs to the
+    process, so the readers of one process must share a single one, see
+    _SharedFileLock.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, shared=False):
         self.lockfile = None
         self.fname = name
+        self.shared = shared
 
     def __enter__(self):
-        self.lockfile = open(self.fname, 'w')
+        # NOTE: opened for reading too, shared locks need it
+        self.lockfile = open(self.fname, 'a+')
 
         while True:
             try:
@@ -110,6 +125,7 @@ class _InterProcessLock(object):
 
 
 class _WindowsLock(_InterProcessLock):
+    # NOTE: msvcrt has no shared locks, they are taken exclusively
     def trylock(self):
         msvcrt.locking(self.lockfile.fileno(), msvcrt.LK_NBLCK, 1)
 
@@ -119,7 +135,8 @@ class _WindowsLock(_InterProcessLock):
 
 class _PosixLock(_InterProcessLock):
     def trylock(self):
-        fcntl.lockf(self.lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        fcntl.lockf(self.lockfile, mode | fcntl.LOCK_NB)
 
     def unlock(self):
         fcntl.lockf(self.lockfile, fcntl.LOCK_UN)
@@ -132,10 +149,264 @@ else:
     import fcntl
     InterProcessLock = _PosixLock
 
+
+class _SharedFileLock(object):
+    """Shared file lock held on behalf of all the readers of a process.
+
+    Closing any descriptor of the lock file drops the locks the process
+    holds on it, so the readers use one InterProcessLock, taken by the
+    first of them and released by the last.
+    """
+
+    def __init__(self, name):
+        self._lock = InterProcessLock(name, shared=True)
+        self._semaphore = semaphore.Semaphore()
+        self._holders = 0
+
+    def __enter__(self):
+        with self._semaphore:
+            if not self._holders:
+                self._lock.__enter__()
+            self._holders += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._semaphore:
+            self._holders -= 1
+            if not self._holders:
+                self._lock.__exit__(exc_type, exc_val, exc_tb)
+
+
+class ReaderWriterLock(object):
+    """Lock held either by any number of readers or by a single writer.
+
+    A waiting writer stops new readers from getting the lock, so a steady
+    flow of readers cannot starve writers.
+    """
+
+    def __init__(self):
+        self._turnstile = semaphore.Semaphore()
+        self._room_empty = semaphore.Semaphore()
+        self._readers_lock = semaphore.Semaphore()
+        self._readers = 0
+
+    def acquire_read(self):
+        with self._turnstile:
+            pass
+        with self._readers_lock:
+            self._readers += 1
+            if self._readers == 1:
+                self._room_empty.acquire()
+
+    def release_read(self):
+        with self._readers_lock:
+            self._readers -= 1
+            if not self._readers:
+                self._room_empty.release()
+
+    def acquire_write(self):
+        self._turnstile.acquire()
+        self._room_empty.acquire()
+
+    def release_write(self):
+        self._room_empty.release()
+        self._turnstile.release()
+
+    @contextlib.contextmanager
+    def read_lock(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write_lock(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+# Upper bounds in seconds of the histogram buckets, the last bucket counts
+# everything above the last bound
+STATS_BUCKETS = (0.001, 0.01, 0.1, 1, 10, 60)
+
+# Locks named after instances and images come and go, stats of names past
+# this many are added up under STATS_OVERFLOW_NAME
+MAX_STATS_NAMES = 1000
+STATS_OVERFLOW_NAME = '*'
+
+
+class _Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(STATS_BUCKETS) + 1)
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(STATS_BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def to_dict(self):
+        return {'count': sum(self.counts),
+                'total': self.total,
+                'buckets': zip(STATS_BUCKETS + (None,), self.counts)}
+
+
+_stats = {}
+
+
+def _record_stats(name, wait_time, hold_time):
+    if name not in _stats and len(_stats) >= MAX_STATS_NAMES:
+        name = STATS_OVERFLOW_NAME
+    if name not in _stats:
+        _stats[name] = (_Histogram(), _Histogram())
+    wait, hold = _stats[name]
+    wait.add(wait_time)
+    hold.add(hold_time)
+
+
+def get_lock_stats():
+    """Return the wait and hold time histograms of the locks taken so far.
+
+    Only recorded when the lock_stats option is set.  The result maps lock
+    names to {'wait': histogram, 'hold': histogram}, a histogram being
+    {'count': ..., 'total': seconds, 'buckets': [(upper_bound, count), ...]}
+    with None as the upper bound of the last bucket.
+    """
+    return dict((name, {'wait': wait.to_dict(), 'hold': hold.to_dict()})
+                for name, (wait, hold) in _stats.items())
+
+
+def reset_lock_stats():
+    _stats.clear()
+
+
+def striped(name, key, stripes=None):
+    """Return the name of the lock guarding key among stripes locks.
+
+    Spreading keys such as image names over a fixed number of locks bounds
+    the number of locks and lock files while unrelated keys rarely contend.
+    The same key gets the same lock in every process.
+    """
+    if stripes is None:
+        stripes = CONF.lock_stripes
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    stripe = (zlib.crc32(str(key)) & 0xffffffff) % stripes
+    return '%s-stripe-%d' % (name, stripe)
+
+
 _semaphores = weakref.WeakValueDictionary()
+_shared_file_locks = weakref.WeakValueDictionary()
+
+
+def _get_lock(name):
+    # NOTE(soren): If we ever go natively threaded, this will be racy.
+    #              See http://stackoverflow.com/questions/5390569/dyn
+    #              amically-allocating-and-destroying-mutexes
+    sem = _semaphores.get(name, ReaderWriterLock())
+    if name not in _semaphores:
+        # this check is not racy - we're already holding ref locally
+        # so GC won't remove the item and there was no IO switch
+        # (only valid in greenthreads)
+        _semaphores[name] = sem
+    return sem
+
+
+def _get_shared_file_lock(path):
+    file_lock = _shared_file_locks.get(path, _SharedFileLock(path))
+    if path not in _shared_file_locks:
+        # NOTE: not racy for the same reasons as _get_lock()
+        _shared_file_locks[path] = file_lock
+    return file_lock
+
+
+@contextlib.contextmanager
+def lock(name, lock_file_prefix=None, external=False, lock_path=None,
+         shared=False):
+    """Context based lock
 
+    This function yields once the lock named name is held; see
+    synchronized() for the meaning of the arguments.
+    """
+    start = time.time()
+    sem = _get_lock(name)
+    if shared:
+        sem.acquire_read()
+    else:
+        sem.acquire_write()
+    acquired = None
+    try:
+        LOG.debug(_('Got semaphore "%(lock)s"'), {'lock': name})
+
+        # NOTE(mikal): I know this looks odd
+        if not hasattr(local.strong_store, 'locks_held'):
+            local.strong_store.locks_held = []
+        local.strong_store.locks_held.append(name)
 
-def synchronized(name, lock_file_prefix, external=False, lock_path=None):
+        try:
+            if external and not CONF.disable_process_locking:
+                LOG.debug(_('Attempting to grab file lock "%(lock)s"'),
+                          {'lock': name})
+                cleanup_dir = False
+
+                # We need a copy of lock_path because it is non-local
+                local_lock_path = lock_path
+                if not local_lock_path:
+                    local_lock_path = CONF.lock_path
+
+                if not local_lock_path:
+                    cleanup_dir = True
+                    local_lock_path = tempfile.mkdtemp()
+
+                if not os.path.exists(local_lock_path):
+                    fileutils.ensure_tree(local_lock_path)
+
+                # NOTE(mikal): the lock name cannot contain directory
+                # separators
+                safe_name = name.replace(os.sep, '_')
+                lock_file_name = '%s%s' % (lock_file_prefix or '', safe_name)
+                lock_file_path = os.path.join(local_lock_path,
+                                              lock_file_name)
+
+                if shared:
+                    file_lock = _get_shared_file_lock(lock_file_path)
+                else:
+                    file_lock = InterProcessLock(lock_file_path)
+                try:
+                    with file_lock:
+                        LOG.debug(_('Got file lock "%(lock)s" at %(path)s'),
+                                  {'lock': name, 'path': lock_file_path})
+                        acquired = time.time()
+                        yield
+                finally:
+                    LOG.debug(_('Released file lock "%(lock)s" at %(path)s'),
+                              {'lock': name, 'path': lock_file_path})
+                    # NOTE(vish): This removes the tempdir if we needed
+                    #             to create one. This is used to
+                    #             cleanup the locks left behind by unit
+                    #             tests.
+                    if cleanup_dir:
+                        shutil.rmtree(local_lock_path)
+            else:
+                acquired = time.time()
+                yield
+
+        finally:
+            local.strong_store.locks_held.remove(name)
+    finally:
+        if shared:
+            sem.release_read()
+        else:
+            sem.release_write()
+        if CONF.lock_stats and acquired is not None:
+            _record_stats(name, acquired - start, time.time() - acquired)
+
+
+def synchronized(name, lock_file_prefix, external=False, lock_path=None,
+                 shared=False):
     """Synchronization decorator.
 
     Decorating a method like so::
@@ -158,6 +429,15 @@ def synchronized(name, lock_file_prefix, external=False, lock_path=None):
 
     This way only one of either foo or bar can be executing at a time.
 
+    Methods which only read what the lock protects can share it::
+
+        @synchronized('mylock', shared=True)
+        def baz(self, *args):
+           ...
+
+    Any number of threads can execute baz at the same time, but not while
+    foo or bar is executing.
+
     :param lock_file_prefix: The lock_file_prefix argument is used to provide
     lock files on disk with a meaningful prefix. The prefix should end with a
     hyphen ('-') if specified.
@@ -170,86 +450,19 @@ def synchronized(name, lock_file_prefix, external=False, lock_path=None):
     :param lock_path: The lock_path keyword argument is used to specify a
     special location for external lock files to live. If nothing is set, then
     CONF.lock_path is used as a default.
+
+    :param shared: The shared keyword argument denotes whether the lock is
+    taken as a reader, along with other readers, rather than exclusively.
     """
 
     def wrap(f):
         @functools.wraps(f)
         def inner(*args, **kwargs):
-            # NOTE(soren): If we ever go natively threaded, this will be racy.
-            #              See http://stackoverflow.com/questions/5390569/dyn
-            #              amically-allocating-and-destroying-mutexes
-            sem = _semaphores.get(name, semaphore.Semaphore())
-            if name not in _semaphores:
-                # this check is not racy - we're already holding ref locally
-                # so GC won't remove the item and there was no IO switch
-                # (only valid in greenthreads)
-                _semaphores[name] = sem
-
-            with sem:
-                LOG.debug(_('Got semaphore "%(lock)s" for method '
+            with lock(name, lock_file_prefix, external, lock_path, shared):
+                LOG.debug(_('Got lock "%(lock)s" for method '
                             '"%(method)s"...'), {'lock': name,
                                                  'method': f.__name__})
-
-                # NOTE(mikal): I know this looks odd
-                if not hasattr(local.strong_store, 'locks_held'):
-                    local.strong_store.locks_held = []
-                local.strong_store.locks_held.append(name)
-
-                try:
-                    if external and not CONF.disable_process_locking:
-                        LOG.debug(_('Attempting to grab file lock "%(lock)s" '
-                                    'for method "%(method)s"...'),
-                                  {'lock': name, 'method': f.__name__})
-                        cleanup_dir = False
-
-                        # We need a copy of lock_path because it is non-local
-                        local_lock_path = lock_path
-                        if not local_lock_path:
-                            local_lock_path = CONF.lock_path
-
-                        if not local_lock_path:
-                            cleanup_dir = True
-                            local_lock_path = tempfile.mkdtemp()
-
-                        if not os.path.exists(local_lock_path):
-                            fileutils.ensure_tree(local_lock_path)
-
-                        # NOTE(mikal): the lock name cannot contain directory
-                        # separators
-                        safe_name = name.replace(os.sep, '_')
-                        lock_file_name = '%s%s' % (lock_file_prefix, safe_name)
-                        lock_file_path = os.path.join(local_lock_path,
-                                                      lock_file_name)
-
-                        try:
-                            lock = InterProcessLock(lock_file_path)
-                            with lock:
-                                LOG.debug(_('Got file lock "%(lock)s" at '
-                                            '%(path)s for method '
-                                            '"%(method)s"...'),
-                                          {'lock': name,
-                                           'path': lock_file_path,
-                                           'method': f.__name__})
-                                retval = f(*args, **kwargs)
-                        finally:
-                            LOG.debug(_('Released file lock "%(lock)s" at '
-                                        '%(path)s for method "%(method)s"...'),
-                                      {'lock': name,
-                                       'path': lock_file_path,
-                                       'method': f.__name__})
-                            # NOTE(vish): This removes the tempdir if we needed
-                            #             to create one. This is used to
-                            #             cleanup the locks left behind by unit
-                            #             tests.
-                            if cleanup_dir:
-                                shutil.rmtree(local_lock_path)
-                    else:
-                        retval = f(*args, **kwargs)
-
-                finally:
-                    local.strong_store.locks_held.remove(name)
-
-            return retval
+                return f(*args, **kwargs)
         return inner
     return wrap
 
@@ -0,0 +1,111 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Client of nova-rootwrap-daemon."""
+
+import json
+import socket
+import threading
+
+from eventlet.green import subprocess
+
+from nova.openstack.common.rootwrap import daemon
+
+
+class DaemonUnavailable(Exception):
+    """The daemon could not be started or reached; nothing was run."""
+    pass
+
+
+class DaemonError(Exception):
+    """The connection to the daemon broke while commands were running."""
+    pass
+
+
+class Client(object):
+    """Runs commands through a daemon started on first use.
+
+    Every request uses its own connection, so concurrent callers have their
+    commands run concurrently.  The daemon is started again if it exits.
+    """
+
+    def __init__(self, daemon_cmd):
+        """:param daemon_cmd: command starting the daemon, usually through
+                              sudo
+        """
+        self._daemon_cmd = daemon_cmd
+        self._process = None
+        self._socket_path = None
+        self._lock = threading.Lock()
+
+    def _get_socket_path(self):
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start_daemon()
+            return self._socket_path
+
+    def _start_daemon(self):
+        try:
+            process = subprocess.Popen(self._daemon_cmd,
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       close_fds=True)
+        except OSError as exc:
+            raise DaemonUnavailable(str(exc))
+        socket_path = process.stdout.readline().strip()
+        if not socket_path:
+            process.wait()
+            raise DaemonUnavailable("%s exited with %s" %
+                                    (' '.join(self._daemon_cmd),
+                                     process.returncode))
+        # NOTE: stdin stays open for as long as the daemon should live
+        self._process = process
+        self._socket_path = socket_path
+
+    def execute(self, commands):
+        """Run commands as root, concurrently.
+
+        :param commands: list of (args, stdin) tuples, stdin being None
+                         when nothing is fed to the command
+        :returns: list of (returncode, stdout, stderr) tuples in the order
+                  of the commands
+        """
+        request = {'commands': [{'args': [daemon.encode(arg)
+                                          for arg in args],
+                                 'stdin': daemon.encode(stdin)}
+                                for args, stdin in commands]}
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                sock.connect(self._get_socket_path())
+            except socket.error as exc:
+                raise DaemonUnavailable(str(exc))
+            stream = sock.makefile('r+b')
+            try:
+                stream.write(json.dumps(request) + '\n')
+                stream.flush()
+                line = stream.readline()
+            except socket.error as exc:
+                raise DaemonError(str(exc))
+            finally:
+                stream.close()
+        finally:
+            sock.close()
+        if not line:
+            raise DaemonError("Connection closed by the daemon")
+        return [(returncode, daemon.decode(out), daemon.decode(err))
+                for returncode, out, err in json.loads(line)['results']]
@@ -63,24 +63,17 @@ def _exit_error(execname, message, errorcode, log=True):
     sys.exit(errorcode)
 
 
-def main():
-    # Split arguments, require at least a command
-    execname = sys.argv.pop(0)
-    if len(sys.argv) < 2:
-        _exit_error(execname, "No command specified", RC_NOCOMMAND, log=False)
-
-    configfile = sys.argv.pop(0)
-    userargs = sys.argv[:]
-
+def _add_topdir(execname):
     # Add ../ to sys.path to allow running from branch
     possible_topdir = os.path.normpath(os.path.join(os.path.abspath(execname),
                                                     os.pardir, os.pardir))
     if os.path.exists(os.path.join(possible_topdir, "nova", "__init__.py")):
         sys.path.insert(0, possible_topdir)
 
+
+def _load_config(execname, configfile):
     from nova.openstack.common.rootwrap import wrapper
 
-    # Load configuration
     try:
         rawconfig = ConfigParser.RawConfigParser()
         rawconfig.read(configfile)
@@ -96,6 +89,23 @@ def main():
         wrapper.setup_syslog(execname,
                              config.syslog_log_facility,
                              config.syslog_log_level)
+    return config
+
+
+def main():
+    # Split arguments, require at least a command
+    execname = sys.argv.pop(0)
+    if len(sys.argv) < 2:
+        _exit_error(execname, "No command specified", RC_NOCOMMAND, log=False)
+
+    configfile = sys.argv.pop(0)
+    userargs = sys.argv[:]
+
+    _add_topdir(execname)
+    from nova.openstack.common.rootwrap import wrapper
+
+    # Load configuration
+    config = _load_config(execname, configfile)
 
     # Execute command if it matches any of the loaded filters
     filters = wrapper.load_filters(config.filters_path)
@@ -128,3 +138,20 @@ def main():
         msg = ("Unauthorized command: %s (no filter matched)"
                % ' '.join(userargs))
         _exit_error(execname, msg, RC_UNAUTHORIZED, log=config.use_syslog)
+
+
+def daemon():
+    """Entry point of nova-rootwrap-daemon."""
+    execname = sys.argv.pop(0)
+    if len(sys.argv) != 1:
+        _exit_error(execname, "No configuration file specified",
+                    RC_BADCONFIG, log=False)
+    configfile = sys.argv.pop(0)
+
+    _add_topdir(execname)
+    from nova.openstack.common.rootwrap import daemon as rootwrap_daemon
+    from nova.openstack.common.rootwrap import wrapper
+
+    config = _load_config(execname, configfile)
+    filters = wrapper.load_filters(config.filters_path)
+    rootwrap_daemon.daemon_start(config, filters)
@@ -0,0 +1,186 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long running root wrapper
+
+   nova-rootwrap-daemon loads its configuration and filters once, then runs
+   the commands it receives on a UNIX socket with the same filter matching
+   as nova-rootwrap.  This spares starting sudo and a Python interpreter
+   for every command.
+
+   The service using it starts it through sudo, which needs in sudoers:
+   nova ALL = (root) NOPASSWD: /usr/bin/nova-rootwrap-daemon
+                                   /etc/nova/rootwrap.conf
+
+   The daemon writes the path of its socket on stdout.  The socket is in a
+   directory only accessible by the user who ran sudo, and the daemon exits
+   when its stdin is closed, that is when the service exits.
+
+   Requests and responses are JSON objects, one per line.  A request is
+   {"commands": [{"args": [...], "stdin": "..."}, ...]}, the commands of a
+   request are run concurrently and the response is
+   {"results": [[returncode, stdout, stderr], ...]} in the same order.
+   Strings are sent decoded as latin-1 so that any bytes go through JSON.
+"""
+
+import json
+import logging
+import os
+import shutil
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+
+from nova.openstack.common.rootwrap import cmd
+from nova.openstack.common.rootwrap import wrapper
+
+
+def encode(value):
+    """Turn bytes into a string which JSON can carry unchanged."""
+    if value is None:
+        return None
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return value.decode('latin-1')
+
+
+def decode(value):
+    """Turn a string made by encode() back into bytes."""
+    if value is None:
+        return None
+    return value.encode('latin-1')
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            try:
+                commands = [([decode(arg) for arg in command['args']],
+                             decode(command.get('stdin')))
+                            for command in json.loads(line)['commands']]
+            except (ValueError, KeyError, TypeError, AttributeError):
+                logging.error("Malformed request: %r" % line)
+                return
+            results = self.server.run_commands(commands)
+            response = {'results': [[returncode, encode(out), encode(err)]
+                                    for returncode, out, err in results]}
+            self.wfile.write(json.dumps(response) + '\n')
+            self.wfile.flush()
+
+
+class RootwrapServer(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+    """Runs the commands matching the filters for each connection."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, config, filters):
+        SocketServer.UnixStreamServer.__init__(self, socket_path,
+                                               _RequestHandler)
+        self.config = config
+        self.filters = filters
+
+    def run_command(self, userargs, stdin=None):
+        """Run a command if it matches a filter.
+
+        Returns a (returncode, stdout, stderr) tuple, with the return codes
+        of nova-rootwrap if the command is not run.
+        """
+        exec_dirs = self.config.exec_dirs
+        try:
+            filtermatch = wrapper.match_filter(self.filters, userargs,
+                                               exec_dirs=exec_dirs)
+            command = filtermatch.get_command(userargs, exec_dirs=exec_dirs)
+        except wrapper.FilterMatchNotExecutable as exc:
+            msg = ("Executable not found: %s (filter match = %s)"
+                   % (exc.match.exec_path, exc.match.name))
+            return self._refuse(msg, cmd.RC_NOEXECFOUND)
+        except wrapper.NoFilterMatched:
+            msg = ("Unauthorized command: %s (no filter matched)"
+                   % ' '.join(userargs))
+            return self._refuse(msg, cmd.RC_UNAUTHORIZED)
+
+        if self.config.use_syslog:
+            logging.info("Executing %s (filter match = %s)" % (
+                command, filtermatch.name))
+        obj = subprocess.Popen(command,
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               close_fds=True,
+                               preexec_fn=cmd._subprocess_setup,
+                               env=filtermatch.get_environment(userargs))
+        out, err = obj.communicate(stdin)
+        return obj.returncode, out, err
+
+    def _refuse(self, msg, returncode):
+        if self.config.use_syslog:
+            logging.error(msg)
+        return returncode, '', msg + '\n'
+
+    def run_commands(self, commands):
+        """Run (userargs, stdin) pairs concurrently, return their results."""
+        if len(commands) == 1:
+            return [self.run_command(*commands[0])]
+
+        results = [None] * len(commands)
+
+        def run(i, userargs, stdin):
+            results[i] = self.run_command(userargs, stdin)
+
+        threads = [threading.Thread(target=run, args=(i,) + command)
+                   for i, command in enumerate(commands)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+
+def _wait_for_eof(stream, server):
+    while stream.read(4096):
+        pass
+    server.shutdown()
+
+
+def daemon_start(config, filters):
+    """Serve requests until stdin is closed."""
+    # The socket is only reachable by the user who started the daemon
+    uid = int(os.environ.get('SUDO_UID', os.getuid()))
+    gid = int(os.environ.get('SUDO_GID', os.getgid()))
+    temp_dir = tempfile.mkdtemp(prefix='rootwrap-')
+    try:
+        os.chown(temp_dir, uid, gid)
+        socket_path = os.path.join(temp_dir, 'rootwrap.sock')
+        server = RootwrapServer(socket_path, config, filters)
+        os.chown(socket_path, uid, gid)
+
+        watcher = threading.Thread(target=_wait_for_eof,
+                                   args=(sys.stdin, server))
+        watcher.daemon = True
+        watcher.start()
+
+        sys.stdout.write(socket_path + '\n')
+        sys.stdout.flush()
+        server.serve_forever()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
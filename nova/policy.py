@@ -18,6 +18,8 @@
 """Policy Engine For Nova."""
 
 import os.path
+import re
+import time
 
 from oslo.config import cfg
 
@@ -33,6 +35,10 @@ policy_opts = [
     cfg.StrOpt('policy_default_rule',
                default='default',
                help=_('Rule checked when requested rule is not found')),
+    cfg.IntOpt('policy_check_interval',
+               default=1,
+               help=_('Seconds between checks of the policy file for '
+                      'modifications')),
     ]
 
 CONF = cfg.CONF
@@ -40,27 +46,51 @@ CONF.register_opts(policy_opts)
 
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+_POLICY_CHECKED_AT = None
+
+# Rules compiled from the policy.Rules object currently in use, see
+# _get_compiled().  The generation is part of every memoized result key
+# so results computed under older rules are never reused.
+_COMPILED_RULES = None
+_COMPILED = {}
+_COMPILED_GENERATION = 0
+
+_TARGET_KEY_RE = re.compile(r'%\(([^)]+)\)')
+_MISSING = object()
 
 
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _POLICY_CHECKED_AT
+    global _COMPILED_RULES
+    global _COMPILED
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _POLICY_CHECKED_AT = None
+    _COMPILED_RULES = None
+    _COMPILED = {}
     policy.reset()
 
 
 def init():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _POLICY_CHECKED_AT
     if not _POLICY_PATH:
         _POLICY_PATH = CONF.policy_file
         if not os.path.exists(_POLICY_PATH):
             _POLICY_PATH = CONF.find_file(_POLICY_PATH)
         if not _POLICY_PATH:
             raise exception.ConfigNotFound(path=CONF.policy_file)
-    utils.read_cached_file(_POLICY_PATH, _POLICY_CACHE,
-                           reload_func=_set_rules)
+    # Only stat the policy file every policy_check_interval seconds
+    # instead of on every policy check.
+    now = time.time()
+    if (not _POLICY_CACHE or _POLICY_CHECKED_AT is None or
+            now - _POLICY_CHECKED_AT >= CONF.policy_check_interval):
+        _POLICY_CHECKED_AT = now
+        utils.read_cached_file(_POLICY_PATH, _POLICY_CACHE,
+                               reload_func=_set_rules)
 
 
 def _set_rules(data):
@@ -68,6 +98,159 @@ def _set_rules(data):
     policy.set_rules(policy.Rules.load_json(data, default_rule))
 
 
+class _InlinedRuleCheck(policy.BaseCheck):
+    """A 'rule:' reference replaced by the rule it refers to.
+
+    Like RuleCheck, it fails closed when the rule needs a key the target
+    or the credentials lack.
+    """
+
+    def __init__(self, rule):
+        self.rule = rule
+
+    def __str__(self):
+        return str(self.rule)
+
+    def __call__(self, target, creds):
+        try:
+            return self.rule(target, creds)
+        except KeyError:
+            return False
+
+
+def _inline_rules(check, rules, seen=frozenset()):
+    """Return a copy of a Check tree with 'rule:' references replaced by
+    the (inlined) rules they refer to, and nested and/or checks of the
+    same kind flattened.
+
+    References that are part of a cycle are left alone.  Inlined rules
+    are not flattened into the check referring to them, as a missing key
+    fails the whole rule.
+    """
+    if type(check) is policy.RuleCheck:
+        if check.match in seen:
+            return check
+        try:
+            rule = rules[check.match]
+        except KeyError:
+            # RuleCheck fails closed on unknown rules
+            return policy.FalseCheck()
+        return _InlinedRuleCheck(
+            _inline_rules(rule, rules, seen | frozenset([check.match])))
+    if type(check) is policy.NotCheck:
+        return policy.NotCheck(_inline_rules(check.rule, rules, seen))
+    if type(check) in (policy.AndCheck, policy.OrCheck):
+        flattened = []
+        for rule in check.rules:
+            rule = _inline_rules(rule, rules, seen)
+            if type(rule) is type(check):
+                flattened.extend(rule.rules)
+            else:
+                flattened.append(rule)
+        return type(check)(flattened)
+    return check
+
+
+def _check_keys(check):
+    """Return the credential and target keys the result of an inlined
+    Check tree depends on, or None if the result can't be memoized.
+    """
+    if type(check) in (policy.TrueCheck, policy.FalseCheck):
+        return set(), set()
+    if type(check) is policy.RoleCheck:
+        return set(['roles']), set()
+    if type(check) is IsAdminCheck:
+        return set(['is_admin']), set()
+    if type(check) is policy.GenericCheck:
+        return (set([check.kind]),
+                set(_TARGET_KEY_RE.findall(check.match)))
+    if type(check) in (policy.NotCheck, _InlinedRuleCheck):
+        return _check_keys(check.rule)
+    if type(check) in (policy.AndCheck, policy.OrCheck):
+        cred_keys = set()
+        target_keys = set()
+        for rule in check.rules:
+            keys = _check_keys(rule)
+            if keys is None:
+                return None
+            cred_keys |= keys[0]
+            target_keys |= keys[1]
+        return cred_keys, target_keys
+    # http: checks, unresolved rule: cycles and unknown check types
+    return None
+
+
+def _get_compiled(action):
+    """Return (check, cred_keys, target_keys, generation) for an action,
+    compiling it against the rules in use if needed.
+    """
+    global _COMPILED_RULES
+    global _COMPILED
+    global _COMPILED_GENERATION
+
+    rules = policy._rules
+    if rules is not _COMPILED_RULES:
+        _COMPILED_RULES = rules
+        _COMPILED = {}
+        _COMPILED_GENERATION += 1
+
+    compiled = _COMPILED.get(action)
+    if compiled is None:
+        check = policy.FalseCheck()
+        if rules:
+            try:
+                check = _inline_rules(rules[action], rules)
+            except KeyError:
+                # No such rule and no default rule; fail closed
+                pass
+        keys = _check_keys(check)
+        if keys is None:
+            compiled = (check, None, None)
+        else:
+            compiled = (check, sorted(keys[0]), sorted(keys[1]))
+        _COMPILED[action] = compiled
+    return compiled + (_COMPILED_GENERATION,)
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _call(check, target, credentials):
+    try:
+        return check(target, credentials)
+    except KeyError:
+        # Missing target or credentials key; fail closed like check()
+        return False
+
+
+def _check(action, target, credentials, results=None):
+    """Evaluate the compiled rule for an action.
+
+    If a results dict is given, results are memoized in it keyed by the
+    values of the credentials and target keys the rule looks at.
+    """
+    check, cred_keys, target_keys, generation = _get_compiled(action)
+    if results is None or cred_keys is None:
+        return _call(check, target, credentials)
+
+    try:
+        key = (generation, action,
+               tuple(_freeze(credentials.get(k, _MISSING))
+                     for k in cred_keys),
+               tuple(_freeze(target[k]) for k in target_keys))
+        result = results.get(key, _MISSING)
+    except Exception:
+        # Missing or unhashable target values; just run the check.
+        return _call(check, target, credentials)
+    if result is _MISSING:
+        result = _call(check, target, credentials)
+        results[key] = result
+    return result
+
+
 def enforce(context, action, target, do_raise=True):
     """Verifies that the action is valid on the target in this context.
 
@@ -94,12 +277,13 @@ def enforce(context, action, target, do_raise=True):
 
     credentials = context.to_dict()
 
-    # Add the exception arguments if asked to do a raise
-    extra = {}
-    if do_raise:
-        extra.update(exc=exception.PolicyNotAuthorized, action=action)
+    result = _check(action, target, credentials,
+                    getattr(context, 'policy_results', None))
+
+    if do_raise and result is False:
+        raise exception.PolicyNotAuthorized(action=action)
 
-    return policy.check(action, target, credentials, **extra)
+    return result
 
 
 def check_is_admin(context):
@@ -112,7 +296,7 @@ def check_is_admin(context):
     credentials = context.to_dict()
     target = credentials
 
-    return policy.check('context_is_admin', target, credentials)
+    return _check('context_is_admin', target, credentials)
 
 
 @policy.register('is_admin')
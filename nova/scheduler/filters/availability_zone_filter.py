@@ -13,14 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from oslo.config import cfg
-
-from nova import db
+from nova import availability_zones
 from nova.scheduler import filters
 
-CONF = cfg.CONF
-CONF.import_opt('default_availability_zone', 'nova.availability_zones')
-
 
 class AvailabilityZoneFilter(filters.BaseHostFilter):
     """Filters Hosts by availability zone.
@@ -40,11 +35,8 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
 
         if availability_zone:
             context = filter_properties['context'].elevated()
-            metadata = db.aggregate_metadata_get_by_host(
-                         context, host_state.host, key='availability_zone')
-            if 'availability_zone' in metadata:
-                return availability_zone in metadata['availability_zone']
-            else:
-                return availability_zone == CONF.default_availability_zone
+            azs = availability_zones.get_host_availability_zones(
+                         context, host_state.host)
+            return availability_zone in azs
 
         return True
@@ -397,7 +397,9 @@ class HostManager(object):
         """
 
         # Get resource usage across the available compute nodes:
-        compute_nodes = db.compute_node_get_all(context)
+        # NOTE: the nodes may lag behind on a replica, as they do anyway
+        # between their periodic updates; claims are checked on the nodes
+        compute_nodes = db.compute_node_get_all(context, use_slave=True)
         seen_nodes = set()
         for compute in compute_nodes:
             service = compute['service']
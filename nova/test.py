@@ -38,6 +38,8 @@ from oslo.config import cfg
 import stubout
 import testtools
 
+from nova.api.ec2 import id_mapping
+from nova import availability_zones
 from nova import context
 from nova import db
 from nova.db import migration
@@ -233,6 +235,11 @@ class TestCase(testtools.TestCase):
                                         sqlite_clean_db=CONF.sqlite_clean_db)
 
             self.useFixture(_DB_CACHE)
+            # NOTE: the aggregates version starts over with every fresh
+            # database, so the index built by another test may look current
+            availability_zones._reset_cache()
+            # NOTE: likewise for the cached EC2 id mappings
+            id_mapping.reset_cache()
 
         # NOTE(danms): Make sure to reset us back to non-remote objects
         # for each test to avoid interactions. Also, backup the object
@@ -1176,6 +1176,60 @@ class CloudTestCase(test.TestCase):
         db.instance_destroy(self.context, inst1['uuid'])
         db.service_destroy(self.context, comp1['id'])
 
+    def test_describe_instances_bulk_lookups(self):
+        # Make sure describe_instances doesn't do per instance lookups.
+        self._stub_instance_get_with_fixed_ips('get_all')
+
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        kernel_uuid = '76fa36fc-c930-4bf3-8c8a-ea2a2420deb6'
+        sys_meta = flavors.save_flavor_info(
+            {}, flavors.get_flavor(1))
+        insts = [db.instance_create(self.context,
+                                    {'reservation_id': 'a',
+                                     'image_ref': image_uuid,
+                                     'kernel_id': kernel_uuid,
+                                     'instance_type_id': 1,
+                                     'host': 'host%d' % i,
+                                     'vm_state': 'active',
+                                     'system_metadata': sys_meta})
+                 for i in xrange(2)]
+
+        def fail(*args, **kwargs):
+            self.fail('unexpected per instance lookup')
+
+        self.stubs.Set(db, 'block_device_mapping_get_all_by_instance', fail)
+        self.stubs.Set(db, 's3_image_get_by_uuid', fail)
+        self.stubs.Set(ec2utils, 'get_availability_zone_by_host', fail)
+
+        result = self.cloud.describe_instances(self.context)
+        result = result['reservationSet'][0]
+        self.assertEqual(len(result['instancesSet']), 2)
+        for instance in result['instancesSet']:
+            self.assertEqual('ami-00000001', instance['imageId'])
+            self.assertEqual('aki-00000002', instance['kernelId'])
+            self.assertEqual('nova', instance['placement']['availabilityZone'])
+            self.assertEqual('instance-store', instance['rootDeviceType'])
+
+        for inst in insts:
+            db.instance_destroy(self.context, inst['uuid'])
+
+    def test_describe_instances_volume_backed(self):
+        # Volume-backed instances have an empty image_ref.
+        sys_meta = flavors.save_flavor_info(
+            {}, flavors.get_flavor(1))
+        inst = db.instance_create(self.context, {'reservation_id': 'a',
+                                                 'image_ref': '',
+                                                 'instance_type_id': 1,
+                                                 'host': 'host1',
+                                                 'vm_state': 'active',
+                                                 'system_metadata': sys_meta})
+        result = self.cloud.describe_instances(self.context)
+        instance = result['reservationSet'][0]['instancesSet'][0]
+        self.assertEqual(ec2utils.glance_id_to_ec2_id(self.context, ''),
+                         instance['imageId'])
+        self.assertFalse('kernelId' in instance)
+        db.instance_destroy(self.context, inst['uuid'])
+
     def test_describe_instances_deleted(self):
         image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
         sys_meta = flavors.save_flavor_info(
@@ -2363,12 +2417,12 @@ class CloudTestCase(test.TestCase):
                 }
         self.stubs.Set(self.cloud.compute_api, 'get', fake_get)
 
-        def fake_get_instance_uuid_by_ec2_id(ctxt, int_id):
-            if int_id == 305419896:
-                return 'e5fe5518-0288-4fa3-b0c4-c79764101b85'
-            raise exception.InstanceNotFound(instance_id=int_id)
-        self.stubs.Set(db, 'get_instance_uuid_by_ec2_id',
-                        fake_get_instance_uuid_by_ec2_id)
+        def fake_ec2_id_mappings_get_by_ids(ctxt, kind, int_ids):
+            self.assertEqual('instance', kind)
+            return dict((int_id, 'e5fe5518-0288-4fa3-b0c4-c79764101b85')
+                        for int_id in int_ids if int_id == 305419896)
+        self.stubs.Set(db, 'ec2_id_mappings_get_by_ids',
+                        fake_ec2_id_mappings_get_by_ids)
 
         get_attribute = functools.partial(
             self.cloud.describe_instance_attribute,
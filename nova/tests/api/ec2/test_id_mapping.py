@@ -0,0 +1,125 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova.api.ec2 import ec2utils
+from nova.api.ec2 import id_mapping
+from nova import context
+from nova import db
+from nova import exception
+from nova.openstack.common import uuidutils
+from nova import test
+
+
+class LRUCacheTestCase(test.NoDBTestCase):
+    def test_get_set(self):
+        cache = id_mapping.LRUCache(2)
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual('x', cache.get('b', 'x'))
+
+    def test_least_recently_used_dropped(self):
+        cache = id_mapping.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+
+
+class IdMappingTestCase(test.TestCase):
+    def setUp(self):
+        super(IdMappingTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        id_mapping.reset_cache()
+        self.addCleanup(id_mapping.reset_cache)
+        self.mapping = id_mapping.get_mapping('volume')
+
+    def test_get_ids_creates_in_order(self):
+        uuids = [uuidutils.generate_uuid() for i in xrange(3)]
+        ids = self.mapping.get_ids(self.context, uuids)
+        self.assertEqual(sorted(ids.values()), [ids[uuid] for uuid in uuids])
+        self.assertEqual(ids, self.mapping.get_ids(self.context, uuids))
+
+    def test_get_ids_no_create(self):
+        uuid = uuidutils.generate_uuid()
+        self.assertEqual({}, self.mapping.get_ids(self.context, [uuid],
+                                                  create=False))
+        self.assertEqual({}, db.ec2_id_mappings_get_by_uuids(
+            self.context, 'volume', [uuid]))
+
+    def test_get_ids_uses_existing(self):
+        uuid = uuidutils.generate_uuid()
+        ref = db.ec2_volume_create(self.context, uuid)
+        self.assertEqual(ref['id'], self.mapping.get_id(self.context, uuid))
+
+    def test_lookups_cached(self):
+        uuid = uuidutils.generate_uuid()
+        id = self.mapping.get_id(self.context, uuid)
+
+        self.mox.StubOutWithMock(db, 'ec2_id_mappings_get_by_uuids')
+        self.mox.StubOutWithMock(db, 'ec2_id_mappings_get_by_ids')
+        self.mox.ReplayAll()
+
+        self.assertEqual(id, self.mapping.get_id(self.context, uuid))
+        self.assertEqual(uuid, self.mapping.get_uuid(self.context, id))
+
+    def test_get_uuids(self):
+        uuids = [uuidutils.generate_uuid() for i in xrange(2)]
+        ids = self.mapping.get_ids(self.context, uuids)
+        id_mapping.reset_cache()
+        mapping = id_mapping.get_mapping('volume')
+        result = mapping.get_uuids(self.context, ids.values() + [100500])
+        self.assertEqual(dict((v, k) for k, v in ids.items()), result)
+
+    def test_get_uuid_not_found(self):
+        self.assertRaises(exception.VolumeNotFound,
+                          self.mapping.get_uuid, self.context, 100500)
+        self.assertRaises(exception.ImageNotFound,
+                          id_mapping.get_mapping('image').get_uuid,
+                          self.context, 100500)
+
+    def test_get_uuid_from_string(self):
+        uuid = uuidutils.generate_uuid()
+        id = self.mapping.get_id(self.context, uuid)
+        self.assertEqual(uuid, self.mapping.get_uuid(self.context, str(id)))
+        self.assertRaises(exception.VolumeNotFound,
+                          self.mapping.get_uuid, self.context, 'foo')
+
+    def test_context_check_per_kind(self):
+        # NOTE: as with the s3_image_* APIs, image mappings do not require
+        #       a user or admin context
+        anonymous = context.RequestContext(None, None)
+        uuid = uuidutils.generate_uuid()
+        self.assertTrue(id_mapping.get_mapping('image').get_id(anonymous,
+                                                               uuid))
+        self.assertRaises(exception.NotAuthorized,
+                          self.mapping.get_id, anonymous, uuid)
+
+    def test_unknown_kind(self):
+        self.assertRaises(ValueError, id_mapping.get_mapping, 'foo')
+
+    def test_ec2utils_uses_mapping(self):
+        uuid = uuidutils.generate_uuid()
+        id = ec2utils.get_int_id_from_snapshot_uuid(self.context, uuid)
+        self.assertEqual(id, db.get_ec2_snapshot_id_by_uuid(self.context,
+                                                            uuid))
+        self.assertEqual(uuid, ec2utils.get_snapshot_uuid_from_int_id(
+            self.context, id))
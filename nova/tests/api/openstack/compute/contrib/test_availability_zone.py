@@ -37,32 +37,39 @@ def fake_service_get_all(context, disabled=None):
                 'host': host,
                 'disabled': disabled}
 
-    if disabled:
-        return [__fake_service("nova-compute", "zone-2",
-                               datetime.datetime(2012, 11, 14, 9, 53, 25, 0),
-                               datetime.datetime(2012, 12, 26, 14, 45, 25, 0),
-                               "fake_host-1", True),
-                __fake_service("nova-scheduler", "internal",
-                               datetime.datetime(2012, 11, 14, 9, 57, 3, 0),
-                               datetime.datetime(2012, 12, 26, 14, 45, 25, 0),
-                               "fake_host-1", True),
-                __fake_service("nova-network", "internal",
-                               datetime.datetime(2012, 11, 16, 7, 25, 46, 0),
-                               datetime.datetime(2012, 12, 26, 14, 45, 24, 0),
-                               "fake_host-2", True)]
+    disabled_services = [
+        __fake_service("nova-compute", "zone-2",
+                       datetime.datetime(2012, 11, 14, 9, 53, 25, 0),
+                       datetime.datetime(2012, 12, 26, 14, 45, 25, 0),
+                       "fake_host-1", True),
+        __fake_service("nova-scheduler", "internal",
+                       datetime.datetime(2012, 11, 14, 9, 57, 3, 0),
+                       datetime.datetime(2012, 12, 26, 14, 45, 25, 0),
+                       "fake_host-1", True),
+        __fake_service("nova-network", "internal",
+                       datetime.datetime(2012, 11, 16, 7, 25, 46, 0),
+                       datetime.datetime(2012, 12, 26, 14, 45, 24, 0),
+                       "fake_host-2", True)]
+    enabled_services = [
+        __fake_service("nova-compute", "zone-1",
+                       datetime.datetime(2012, 11, 14, 9, 53, 25, 0),
+                       datetime.datetime(2012, 12, 26, 14, 45, 25, 0),
+                       "fake_host-1", False),
+        __fake_service("nova-sched", "internal",
+                       datetime.datetime(2012, 11, 14, 9, 57, 3, 0),
+                       datetime.datetime(2012, 12, 26, 14, 45, 25, 0),
+                       "fake_host-1", False),
+        __fake_service("nova-network", "internal",
+                       datetime.datetime(2012, 11, 16, 7, 25, 46, 0),
+                       datetime.datetime(2012, 12, 26, 14, 45, 24, 0),
+                       "fake_host-2", False)]
+
+    if disabled is None:
+        return enabled_services + disabled_services
+    elif disabled:
+        return disabled_services
     else:
-        return [__fake_service("nova-compute", "zone-1",
-                               datetime.datetime(2012, 11, 14, 9, 53, 25, 0),
-                               datetime.datetime(2012, 12, 26, 14, 45, 25, 0),
-                               "fake_host-1", False),
-                __fake_service("nova-sched", "internal",
-                               datetime.datetime(2012, 11, 14, 9, 57, 3, 0),
-                               datetime.datetime(2012, 12, 26, 14, 45, 25, 0),
-                               "fake_host-1", False),
-                __fake_service("nova-network", "internal",
-                               datetime.datetime(2012, 11, 16, 7, 25, 46, 0),
-                               datetime.datetime(2012, 12, 26, 14, 45, 24, 0),
-                               "fake_host-2", False)]
+        return enabled_services
 
 
 def fake_service_is_up(self, service):
@@ -44,6 +44,12 @@ def fake_compute_get_instance_bdms(*args, **kwargs):
     return [{'volume_id': UUID1}, {'volume_id': UUID2}]
 
 
+def fake_compute_get_instances_bdms(self, context, instance_uuids,
+                                    legacy=True):
+    return dict((uuid, fake_compute_get_instance_bdms())
+                for uuid in instance_uuids)
+
+
 class ExtendedVolumesTest(test.TestCase):
     content_type = 'application/json'
     prefix = 'os-extended-volumes:'
@@ -55,6 +61,8 @@ class ExtendedVolumesTest(test.TestCase):
         self.stubs.Set(compute.api.API, 'get_all', fake_compute_get_all)
         self.stubs.Set(compute.api.API, 'get_instance_bdms',
                        fake_compute_get_instance_bdms)
+        self.stubs.Set(compute.api.API, 'get_instances_bdms',
+                       fake_compute_get_instances_bdms)
         self.flags(
             osapi_compute_extension=[
                 'nova.api.openstack.compute.contrib.select_extensions'],
@@ -45,6 +45,27 @@ def fake_compute_get_empty(*args, **kwargs):
     return inst
 
 
+def fake_compute_get_no_host(*args, **kwargs):
+    inst = fakes.stub_instance(1, uuid=UUID3, host=None,
+                               vm_state=vm_states.ACTIVE,
+                               availability_zone='fakeaz')
+    return inst
+
+
+def fake_compute_get_all_no_host(*args, **kwargs):
+    inst1 = fakes.stub_instance(1, uuid=UUID1, host=None,
+                                vm_state=vm_states.ACTIVE,
+                                availability_zone='fakeaz')
+    inst2 = fakes.stub_instance(2, uuid=UUID2, host="",
+                                vm_state=vm_states.ACTIVE,
+                                availability_zone='fakeaz')
+    db_list = [inst1, inst2]
+    fields = instance_obj.INSTANCE_DEFAULT_FIELDS
+    return instance_obj._make_instance_list(args[1],
+                                            instance_obj.InstanceList(),
+                                            db_list, fields)
+
+
 def fake_compute_get(*args, **kwargs):
     inst = fakes.stub_instance(1, uuid=UUID3, host="get-host",
                                vm_state=vm_states.ACTIVE)
@@ -71,6 +92,10 @@ def fake_get_no_host_availability_zone(context, host):
     return None
 
 
+def fake_get_hosts_availability_zones(context, hosts):
+    return dict((host, host) for host in hosts)
+
+
 class ExtendedServerAttributesTest(test.TestCase):
     content_type = 'application/json'
     prefix = '%s:' % extended_availability_zone.ExtendedAvailabilityZone.alias
@@ -83,6 +108,8 @@ class ExtendedServerAttributesTest(test.TestCase):
         self.stubs.Set(compute.api.API, 'get_all', fake_compute_get_all)
         self.stubs.Set(availability_zones, 'get_host_availability_zone',
                        fake_get_host_availability_zone)
+        self.stubs.Set(availability_zones, 'get_hosts_availability_zones',
+                       fake_get_hosts_availability_zones)
 
     def _make_request(self, url):
         req = webob.Request.blank(url)
@@ -139,6 +166,21 @@ class ExtendedServerAttributesTest(test.TestCase):
         for i, server in enumerate(self._get_servers(res.body)):
             self.assertServerAttributes(server, 'all-host')
 
+    def test_show_and_detail_agree_without_host(self):
+        self.stubs.Set(compute.api.API, 'get', fake_compute_get_no_host)
+        self.stubs.Set(compute.api.API, 'get_all',
+                       fake_compute_get_all_no_host)
+
+        res = self._make_request('/v3/servers/%s' % UUID3)
+        self.assertEqual(res.status_int, 200)
+        self.assertServerAttributes(self._get_server(res.body), 'None')
+
+        res = self._make_request('/v3/servers/detail')
+        self.assertEqual(res.status_int, 200)
+        servers = self._get_servers(res.body)
+        self.assertServerAttributes(servers[0], 'None')
+        self.assertServerAttributes(servers[1], 'fakeaz')
+
     def test_no_instance_passthrough_404(self):
 
         def fake_compute_get(*args, **kwargs):
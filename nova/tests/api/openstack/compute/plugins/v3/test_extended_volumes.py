@@ -52,6 +52,12 @@ def fake_compute_get_instance_bdms(*args, **kwargs):
     return [{'volume_id': UUID1}, {'volume_id': UUID2}]
 
 
+def fake_compute_get_instances_bdms(self, context, instance_uuids,
+                                    legacy=True):
+    return dict((uuid, fake_compute_get_instance_bdms())
+                for uuid in instance_uuids)
+
+
 def fake_attach_volume(self, context, instance, volume_id, device):
     pass
 
@@ -105,6 +111,8 @@ class ExtendedVolumesTest(test.TestCase):
         self.stubs.Set(compute.api.API, 'get_all', fake_compute_get_all)
         self.stubs.Set(compute.api.API, 'get_instance_bdms',
                        fake_compute_get_instance_bdms)
+        self.stubs.Set(compute.api.API, 'get_instances_bdms',
+                       fake_compute_get_instances_bdms)
         self.stubs.Set(volume.cinder.API, 'get', fake_volume_get)
         self.stubs.Set(compute.api.API, 'detach_volume', fake_detach_volume)
         self.stubs.Set(compute.api.API, 'attach_volume', fake_attach_volume)
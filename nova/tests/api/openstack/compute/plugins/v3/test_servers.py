@@ -700,7 +700,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             db_list = [fakes.stub_instance(100, uuid=server_uuid)]
             return instance_obj._make_instance_list(
                 context, instance_obj.InstanceList(), db_list, FIELDS)
@@ -718,7 +719,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('image' in search_opts)
             self.assertEqual(search_opts['image'], '12345')
@@ -737,7 +739,7 @@ class ServersControllerTest(test.TestCase):
     def test_tenant_id_filter_converts_to_project_id_for_admin(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, use_slave=False):
             self.assertNotEqual(filters, None)
             self.assertEqual(filters['project_id'], 'fake')
             self.assertFalse(filters.get('tenant_id'))
@@ -755,7 +757,7 @@ class ServersControllerTest(test.TestCase):
     def test_admin_restricted_tenant(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, use_slave=False):
             self.assertNotEqual(filters, None)
             self.assertEqual(filters['project_id'], 'fake')
             return [fakes.stub_instance(100)]
@@ -772,7 +774,7 @@ class ServersControllerTest(test.TestCase):
     def test_all_tenants_pass_policy(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, use_slave=False):
             self.assertNotEqual(filters, None)
             self.assertTrue('project_id' not in filters)
             return [fakes.stub_instance(100)]
@@ -797,7 +799,7 @@ class ServersControllerTest(test.TestCase):
     def test_all_tenants_fail_policy(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, use_slave=False):
             self.assertNotEqual(filters, None)
             return [fakes.stub_instance(100)]
 
@@ -821,7 +823,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('flavor' in search_opts)
             # flavor is an integer ID
@@ -849,7 +852,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('vm_state' in search_opts)
             self.assertEqual(search_opts['vm_state'], vm_states.ACTIVE)
@@ -883,7 +887,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertTrue('vm_state' in search_opts)
             self.assertEqual(search_opts['vm_state'], 'deleted')
 
@@ -905,7 +910,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('name' in search_opts)
             self.assertEqual(search_opts['name'], 'whee.*')
@@ -926,7 +932,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('changes-since' in search_opts)
             changes_since = datetime.datetime(2011, 1, 24, 17, 8, 1,
@@ -960,7 +967,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertNotEqual(search_opts, None)
             # Allowed by user
             self.assertTrue('name' in search_opts)
@@ -991,7 +999,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertNotEqual(search_opts, None)
             # Allowed by user
             self.assertTrue('name' in search_opts)
@@ -1021,7 +1030,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('ip' in search_opts)
             self.assertEqual(search_opts['ip'], '10\..*')
@@ -1045,7 +1055,8 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None, want_objects=False):
+                         limit=None, marker=None, want_objects=False,
+                         use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('ip6' in search_opts)
             self.assertEqual(search_opts['ip6'], 'ffff.*')
@@ -29,6 +29,7 @@ from nova.api.openstack.compute import views
 from nova.api.openstack import xmlutil
 import nova.context
 from nova.openstack.common import jsonutils
+from nova.openstack.common import memorycache
 from nova import test
 from nova.tests.api.openstack import fakes
 from nova.tests import matchers
@@ -602,6 +603,11 @@ class LimiterTest(BaseLimitTestSuite):
         results = list(self._check(10, "PUT", "/anything"))
         self.assertEqual(expected, results)
 
+    def test_limits_grouped_by_verb(self):
+        dispatch = self.limiter._get_dispatch(None)
+        self.assertEqual(set(['GET', 'POST', 'PUT']), set(dispatch.keys()))
+        self.assertEqual(2, len(dispatch['PUT']))
+
     def test_user_limit(self):
         # Test user-specific limits.
         self.assertEqual(self.limiter.levels['user3'], [])
@@ -638,6 +644,60 @@ class LimiterTest(BaseLimitTestSuite):
         self.assertEqual(expected, results)
 
 
+class SharedLimiterTest(BaseLimitTestSuite):
+    """
+    Tests for the `limits.SharedLimiter` class.
+    """
+
+    def setUp(self):
+        super(SharedLimiterTest, self).setUp()
+        self.time = 120.0
+        cache = memorycache.Client()
+        self.stubs.Set(memorycache, 'get_client', lambda servers: cache)
+        self.cache = cache
+        self.limiter1 = limits.SharedLimiter(TEST_LIMITS, sync_interval='10')
+        self.limiter2 = limits.SharedLimiter(TEST_LIMITS, sync_interval='10')
+
+    def _check(self, limiter, num, verb, url, username=None):
+        return [limiter.check_for_delay(verb, url, username)[0]
+                for x in xrange(num)]
+
+    def test_limit_per_window(self):
+        expected = [None] * 10 + [60.0]
+        self.assertEqual(expected, self._check(self.limiter1, 11,
+                                               "PUT", "/anything"))
+        self.time += 30.0
+        self.assertEqual([30.0], self._check(self.limiter1, 1,
+                                             "PUT", "/anything"))
+        self.time += 30.0
+        self.assertEqual([None], self._check(self.limiter1, 1,
+                                             "PUT", "/anything"))
+
+    def test_limit_shared_between_limiters(self):
+        self.assertEqual([None] * 6, self._check(self.limiter1, 6,
+                                                 "PUT", "/anything"))
+        # limiter2 does not see limiter1's requests until they are pushed
+        self.assertEqual([None] * 4, self._check(self.limiter2, 4,
+                                                 "PUT", "/anything"))
+        self.time += 10.0
+        self.assertEqual([None], self._check(self.limiter1, 1,
+                                             "PUT", "/anything"))
+        self.assertEqual([50.0], self._check(self.limiter2, 1,
+                                             "PUT", "/anything"))
+
+    def test_requests_batched(self):
+        self.mox.StubOutWithMock(self.cache, 'incr')
+        self.mox.ReplayAll()
+        self.assertEqual([None] * 5, self._check(self.limiter1, 5,
+                                                 "PUT", "/anything"))
+
+    def test_get_limits(self):
+        self._check(self.limiter1, 3, "PUT", "/anything")
+        put_limit = [limit for limit in self.limiter1.get_limits()
+                     if limit['verb'] == 'PUT' and limit['regex'] == ''][0]
+        self.assertEqual(7, put_limit['remaining'])
+
+
 class WsgiLimiterTest(BaseLimitTestSuite):
     """
     Tests for `limits.WsgiLimiter` class.
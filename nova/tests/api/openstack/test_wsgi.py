@@ -97,6 +97,23 @@ class RequestTest(test.TestCase):
                  'uuid1': instances[1],
                  'uuid2': instances[2]})
 
+    def test_get_batched_items(self):
+        request = wsgi.Request.blank('/foo')
+        calls = []
+
+        def loader(item_keys):
+            calls.append(sorted(item_keys))
+            return dict((item_key, item_key * 2) for item_key in item_keys
+                        if item_key != 'c')
+
+        self.assertEqual({'a': 'aa', 'b': 'bb'},
+                request.get_batched_items('key', ['a', 'b', 'a'], loader))
+        self.assertEqual({'b': 'bb', 'c': None},
+                request.get_batched_items('key', ['b', 'c'], loader))
+        self.assertEqual({'a': 'aa', 'c': None},
+                request.get_batched_items('key', ['a', 'c'], loader))
+        self.assertEqual([['a', 'b'], ['c']], calls)
+
 
 class ActionDispatcherTest(test.TestCase):
     def test_dispatch(self):
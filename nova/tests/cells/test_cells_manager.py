@@ -109,7 +109,8 @@ class CellsManagerClassTestCase(test.TestCase):
                                  'tell_parents_our_capacities')
 
         self.msg_runner.tell_parents_our_capabilities(self.ctxt)
-        self.msg_runner.tell_parents_our_capacities(self.ctxt)
+        self.msg_runner.tell_parents_our_capacities(self.ctxt,
+                                                    only_if_changed=True)
         self.mox.ReplayAll()
         self.cells_manager._update_our_parents(self.ctxt)
 
@@ -807,12 +807,39 @@ class CellsTargetedMethodsTestCase(test.TestCase):
         self.src_state_manager.get_our_capacities().AndReturn(capacs)
         self.tgt_state_manager.update_cell_capacities('child-cell2',
                                                       capacs)
-        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt)
+        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt,
+                                                        only_if_changed=True)
 
         self.mox.ReplayAll()
 
         self.src_msg_runner.tell_parents_our_capacities(self.ctxt)
 
+    def test_update_capacities_only_if_changed(self):
+        self._setup_attrs('child-cell2', 'child-cell2!api-cell')
+        self.mox.StubOutWithMock(self.src_state_manager,
+                                 'get_our_capacities')
+        self.mox.StubOutWithMock(self.tgt_state_manager,
+                                 'update_cell_capacities')
+        self.mox.StubOutWithMock(self.tgt_msg_runner,
+                                 'tell_parents_our_capacities')
+        self.src_state_manager.get_our_capacities().AndReturn('capacs1')
+        self.tgt_state_manager.update_cell_capacities('child-cell2',
+                                                      'capacs1')
+        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt,
+                                                        only_if_changed=True)
+        self.src_state_manager.get_our_capacities().AndReturn('capacs1')
+        self.src_state_manager.get_our_capacities().AndReturn('capacs2')
+        self.tgt_state_manager.update_cell_capacities('child-cell2',
+                                                      'capacs2')
+        self.tgt_msg_runner.tell_parents_our_capacities(self.ctxt,
+                                                        only_if_changed=True)
+
+        self.mox.ReplayAll()
+
+        for i in xrange(3):
+            self.src_msg_runner.tell_parents_our_capacities(
+                    self.ctxt, only_if_changed=True)
+
     def test_announce_capabilities(self):
         self._setup_attrs('api-cell', 'api-cell!child-cell1')
         # To make this easier to test, make us only have 1 child cell.
@@ -36,16 +36,17 @@ FAKE_ITYPES = [
 ]
 
 
-def _fake_compute_node_get_all(context):
-    def _node(host, total_mem, total_disk, free_mem, free_disk):
-        service = {'host': host, 'disabled': False}
-        return {'service': service,
-                'memory_mb': total_mem,
-                'local_gb': total_disk,
-                'free_ram_mb': free_mem,
-                'free_disk_gb': free_disk}
+def _make_node(host, total_mem, total_disk, free_mem, free_disk):
+    service = {'host': host, 'disabled': False}
+    return {'service': service,
+            'memory_mb': total_mem,
+            'local_gb': total_disk,
+            'free_ram_mb': free_mem,
+            'free_disk_gb': free_disk}
+
 
-    return [_node(*fake) for fake in FAKE_COMPUTES]
+def _fake_compute_node_get_all(context):
+    return [_make_node(*fake) for fake in FAKE_COMPUTES]
 
 
 def _fake_instance_type_all(context):
@@ -122,6 +123,33 @@ class TestCellsStateManager(test.TestCase):
         units = 2  # 2 on host 3
         self.assertEqual(units, cap['disk_free']['units_by_mb'][str(sz)])
 
+    def test_capacity_incremental_update(self):
+        state_manager = self._get_state_manager(0.0)
+        old_capacities = state_manager.get_my_state().capacities
+
+        # Nothing changed, so the capacities aren't replaced.
+        state_manager._update_our_capacity()
+        self.assertTrue(old_capacities is
+                        state_manager.get_my_state().capacities)
+
+        # host3 fills up and host4 goes away.
+        computes = [('host1', 1024, 100, 0, 0),
+                    ('host2', 1024, 100, -1, -1),
+                    ('host3', 1024, 100, 500, 50)]
+        self.stubs.Set(db, 'compute_node_get_all',
+                       lambda ctxt: [_make_node(*fake) for fake in computes])
+        state_manager._update_our_capacity()
+        cap = state_manager.get_my_state().capacities
+
+        self.assertEqual(499, cap['ram_free']['total_mb'])
+        self.assertEqual(49 * 1024, cap['disk_free']['total_mb'])
+        self.assertEqual(10, cap['ram_free']['units_by_mb']['50'])
+        self.assertEqual(2, cap['disk_free']['units_by_mb'][str(25 * 1024)])
+
+    def test_capacity_no_compute_hosts(self):
+        self.stubs.Set(db, 'compute_node_get_all', lambda ctxt: [])
+        self.assertEqual({}, self._capacity(0.0))
+
     def _get_state_manager(self, reserve_percent=0.0):
         self.flags(reserve_percent=reserve_percent, group='cells')
         return state.CellStateManager()
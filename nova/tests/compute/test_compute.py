@@ -4073,6 +4073,10 @@ class ComputeTestCase(BaseTestCase):
                                          'host': self.compute.host,
                                          'teardown': True},
                                 'version': '1.0'}, None)
+        self.mox.StubOutWithMock(self.compute.consoleauth_rpcapi,
+                                 'delete_tokens_for_instance')
+        self.compute.consoleauth_rpcapi.delete_tokens_for_instance(
+            c, inst_uuid)
 
         # start test
         self.mox.ReplayAll()
@@ -8255,6 +8259,20 @@ class ComputeAPITestCase(BaseTestCase):
         self.assertEqual(expected,
                          self.compute_api.get_instance_bdms({}, instance))
 
+    def test_get_instances_bdms(self):
+        bdms = [{'instance_uuid': 'uuid1', 'id': 1},
+                {'instance_uuid': 'uuid1', 'id': 2},
+                {'instance_uuid': 'uuid2', 'id': 3}]
+        self.mox.StubOutWithMock(self.compute_api.db,
+                'block_device_mapping_get_all_by_instance_uuids')
+        self.compute_api.db.block_device_mapping_get_all_by_instance_uuids(
+                {}, ['uuid1', 'uuid2', 'uuid3']).AndReturn(bdms)
+        self.mox.ReplayAll()
+
+        self.assertEqual({'uuid1': bdms[:2], 'uuid2': bdms[2:], 'uuid3': []},
+                         self.compute_api.get_instances_bdms(
+                             {}, ['uuid1', 'uuid2', 'uuid3'], legacy=False))
+
 
 def fake_rpc_method(context, topic, msg, do_cast=True):
     pass
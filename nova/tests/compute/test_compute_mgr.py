@@ -471,14 +471,15 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         instance.vm_state = vm_state
         instance.host = self.compute.host
         instance.task_state = task_state
-        self.mox.StubOutWithMock(instance, 'refresh')
+        self.mox.StubOutWithMock(instance_obj.Instance, 'get_by_uuid')
         self.mox.StubOutWithMock(instance, 'save')
+        instance_obj.Instance.get_by_uuid(self.context,
+                                          'fake-uuid').AndReturn(instance)
         return instance
 
     def test_sync_instance_power_state_match(self):
         instance = self._get_sync_instance(power_state.RUNNING,
                                            vm_states.ACTIVE)
-        instance.refresh()
         self.mox.ReplayAll()
         self.compute._sync_instance_power_state(self.context, instance,
                                                 power_state.RUNNING)
@@ -486,7 +487,6 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
     def test_sync_instance_power_state_running_stopped(self):
         instance = self._get_sync_instance(power_state.RUNNING,
                                            vm_states.ACTIVE)
-        instance.refresh()
         instance.save()
         self.mox.ReplayAll()
         self.compute._sync_instance_power_state(self.context, instance,
@@ -496,7 +496,6 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
     def _test_sync_to_stop(self, power_state, vm_state, driver_power_state,
                            stop=True):
         instance = self._get_sync_instance(power_state, vm_state)
-        instance.refresh()
         instance.save()
         self.mox.StubOutWithMock(self.compute.conductor_api, 'compute_stop')
         if stop:
@@ -514,6 +513,19 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self._test_sync_to_stop(power_state.SHUTDOWN, vm_states.STOPPED,
                                 power_state.RUNNING)
 
+    def test_sync_instance_power_state_stops_full_instance(self):
+        instance = self._get_sync_instance(power_state.RUNNING,
+                                           vm_states.ACTIVE)
+        projected = instance_obj.Instance()
+        projected.uuid = instance.uuid
+        projected.power_state = power_state.RUNNING
+        instance.save()
+        self.mox.StubOutWithMock(self.compute.conductor_api, 'compute_stop')
+        self.compute.conductor_api.compute_stop(self.context, instance)
+        self.mox.ReplayAll()
+        self.compute._sync_instance_power_state(self.context, projected,
+                                                power_state.SHUTDOWN)
+
     def test_sync_instance_power_state_to_no_stop(self):
         for ps in (power_state.PAUSED, power_state.NOSTATE):
             self._test_sync_to_stop(power_state.RUNNING, vm_states.ACTIVE, ps,
@@ -617,6 +617,22 @@ class _BaseTestCase(object):
         self.mox.ReplayAll()
         self.conductor.compute_reboot(self.context, 'instance', 'fake-type')
 
+    def test_block_device_mapping_bulk_update_or_create(self):
+        fake_bdms = [{'device_name': 'foo'}, {'device_name': 'foo2'}]
+        cells_rpcapi = self.conductor_manager.cells_rpcapi
+        self.mox.StubOutWithMock(db,
+                                 'block_device_mapping_bulk_update_or_create')
+        self.mox.StubOutWithMock(cells_rpcapi,
+                                 'bdm_update_or_create_at_top')
+        db.block_device_mapping_bulk_update_or_create(
+            self.context, fake_bdms).AndReturn(fake_bdms)
+        for fake_bdm in fake_bdms:
+            cells_rpcapi.bdm_update_or_create_at_top(self.context, fake_bdm,
+                                                     create=None)
+        self.mox.ReplayAll()
+        self.conductor.block_device_mapping_bulk_update_or_create(
+            self.context, fake_bdms)
+
 
 class ConductorTestCase(_BaseTestCase, test.TestCase):
     """Conductor Manager Tests."""
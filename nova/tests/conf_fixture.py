@@ -36,6 +36,8 @@ CONF.import_opt('instance_dns_manager', 'nova.network.floating_ips')
 CONF.import_opt('policy_file', 'nova.policy')
 CONF.import_opt('compute_driver', 'nova.virt.driver')
 CONF.import_opt('api_paste_config', 'nova.wsgi')
+CONF.import_opt('availability_zone_check_interval',
+                'nova.availability_zones')
 
 
 class ConfFixture(fixtures.Fixture):
@@ -49,6 +51,7 @@ class ConfFixture(fixtures.Fixture):
 
         self.conf.set_default('api_paste_config',
                               paths.state_path_def('etc/nova/api-paste.ini'))
+        self.conf.set_default('availability_zone_check_interval', 0)
         self.conf.set_default('host', 'fake-mini')
         self.conf.set_default('compute_driver', 'nova.virt.fake.FakeDriver')
         self.conf.set_default('fake_network', True)
@@ -52,8 +52,10 @@ class ConsoleauthTestCase(test.TestCase):
         timeutils.advance_time_seconds(1)
         self.assertFalse(self.manager.check_token(self.context, token))
 
-    def _stub_validate_console_port(self, result):
+    def _stub_validate_console_port(self, result, calls=None):
         def fake_validate_console_port(ctxt, instance, port, console_type):
+            if calls is not None:
+                calls.append(port)
             return result
 
         self.stubs.Set(self.manager.compute_rpcapi,
@@ -89,6 +91,44 @@ class ConsoleauthTestCase(test.TestCase):
         for token in tokens:
             self.assertFalse(self.manager.check_token(self.context, token))
 
+    def test_tokens_stored_per_instance(self):
+        self.manager.authorize_console(self.context, u'token', 'novnc',
+                                       '127.0.0.1', '8080', 'host',
+                                       self.instance['uuid'])
+        tokens = self.manager.mc.get(self.instance['uuid'].encode('UTF-8'))
+        self.assertEqual([u'token'], tokens.keys())
+
+    def test_legacy_token_list(self):
+        self.manager.mc.set(self.instance['uuid'].encode('UTF-8'),
+                            '["token"]')
+        self.assertEqual([u'token'], self.manager._get_tokens_for_instance(
+            self.instance['uuid']).keys())
+
+    def test_validation_cached(self):
+        calls = []
+        self._stub_validate_console_port(True, calls)
+
+        self.manager.authorize_console(self.context, u'token', 'novnc',
+                                       '127.0.0.1', '8080', 'host',
+                                       self.instance['uuid'])
+        self.assertTrue(self.manager.check_token(self.context, u'token'))
+        self.assertTrue(self.manager.check_token(self.context, u'token'))
+        self.assertEqual(['8080'], calls)
+
+        self.manager.delete_tokens_for_instance(self.context,
+                                                self.instance['uuid'])
+        self.assertFalse(self.manager.check_token(self.context, u'token'))
+
+    def test_failed_validation_not_cached(self):
+        self._stub_validate_console_port(False)
+        self.manager.authorize_console(self.context, u'token', 'novnc',
+                                       '127.0.0.1', '8080', 'host',
+                                       self.instance['uuid'])
+        self.assertFalse(self.manager.check_token(self.context, u'token'))
+
+        self._stub_validate_console_port(True)
+        self.assertTrue(self.manager.check_token(self.context, u'token'))
+
     def test_wrong_token_has_port(self):
         token = u'mytok'
 
@@ -120,7 +160,8 @@ class ControlauthMemcacheEncodingTestCase(test.TestCase):
         self.manager.mc.set(mox.IsA(str), mox.IgnoreArg(), mox.IgnoreArg()
                            ).AndReturn(True)
         self.manager.mc.get(mox.IsA(str)).AndReturn(None)
-        self.manager.mc.set(mox.IsA(str), mox.IgnoreArg()).AndReturn(True)
+        self.manager.mc.set(mox.IsA(str), mox.IgnoreArg(), mox.IgnoreArg()
+                           ).AndReturn(True)
 
         self.mox.ReplayAll()
 
@@ -155,9 +196,11 @@ class CellsConsoleauthTestCase(ConsoleauthTestCase):
         super(CellsConsoleauthTestCase, self).setUp()
         self.flags(enable=True, group='cells')
 
-    def _stub_validate_console_port(self, result):
+    def _stub_validate_console_port(self, result, calls=None):
         def fake_validate_console_port(ctxt, instance_uuid, console_port,
                                        console_type):
+            if calls is not None:
+                calls.append(console_port)
             return result
 
         self.stubs.Set(self.manager.cells_rpcapi,
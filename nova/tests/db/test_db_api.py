@@ -561,6 +561,35 @@ class AggregateDBApiTestCase(test.TestCase):
                           db.aggregate_host_delete,
                           ctxt, result['id'], _get_fake_aggr_hosts()[0])
 
+    def test_aggregate_version_bumped_on_changes(self):
+        ctxt = context.get_admin_context()
+        versions = [db.aggregate_version_get(ctxt)]
+
+        result = _create_aggregate(context=ctxt)
+        versions.append(db.aggregate_version_get(ctxt))
+        db.aggregate_host_add(ctxt, result['id'], 'foo.openstack.org')
+        versions.append(db.aggregate_version_get(ctxt))
+        db.aggregate_update(ctxt, result['id'],
+                            {'availability_zone': 'other_zone'})
+        versions.append(db.aggregate_version_get(ctxt))
+        db.aggregate_metadata_delete(ctxt, result['id'], 'availability_zone')
+        versions.append(db.aggregate_version_get(ctxt))
+        db.aggregate_host_delete(ctxt, result['id'], 'foo.openstack.org')
+        versions.append(db.aggregate_version_get(ctxt))
+        db.aggregate_delete(ctxt, result['id'])
+        versions.append(db.aggregate_version_get(ctxt))
+
+        self.assertEqual(sorted(set(versions)), versions)
+
+    def test_aggregate_version_not_bumped_on_failure(self):
+        ctxt = context.get_admin_context()
+        result = _create_aggregate(context=ctxt)
+        version = db.aggregate_version_get(ctxt)
+        self.assertRaises(exception.AggregateHostNotFound,
+                          db.aggregate_host_delete,
+                          ctxt, result['id'], _get_fake_aggr_hosts()[0])
+        self.assertEqual(version, db.aggregate_version_get(ctxt))
+
 
 class SqlAlchemyDbApiTestCase(DbTestCase):
     def test_instance_get_all_by_host(self):
@@ -582,6 +611,54 @@ class SqlAlchemyDbApiTestCase(DbTestCase):
         self.assertEqual(types.UnicodeType, type(result[0]))
 
 
+class SessionTestCase(test.TestCase):
+    def test_slave_session_without_slave_connection(self):
+        session = get_session(slave_session=True)
+        self.assertIs(get_engine(), session.bind)
+
+    def test_slave_session(self):
+        self.flags(sql_slave_connection='sqlite://')
+        self.stubs.Set(db_session, '_SLAVE_ENGINE', None)
+        self.stubs.Set(db_session, '_SLAVE_MAKER', None)
+        session = get_session(slave_session=True)
+        self.assertIsNot(get_engine(), session.bind)
+        self.assertIs(get_engine(slave_engine=True), session.bind)
+        self.assertIs(get_engine(), get_session().bind)
+
+    def test_query_stats(self):
+        self.flags(sql_query_stats=True)
+        db_session.reset_query_stats()
+        self.addCleanup(db_session.reset_query_stats)
+        engine = db_session.create_engine('sqlite://')
+
+        class FakeBackend(object):
+            def fake_api_call(self, queries):
+                for i in range(queries):
+                    engine.execute('select 1')
+
+            def fake_outer_api_call(self):
+                backend.fake_api_call(1)
+
+        backend = db_session.QueryStatsBackend(FakeBackend())
+        backend.fake_api_call(2)
+        backend.fake_api_call(3)
+        backend.fake_outer_api_call()
+        engine.execute('select 1')
+
+        stats = db_session.get_query_stats()
+        self.assertEqual(['fake_api_call', 'fake_outer_api_call'],
+                         sorted(stats))
+        self.assertEqual(2, stats['fake_api_call']['calls'])
+        self.assertEqual(5, stats['fake_api_call']['queries'])
+        self.assertEqual(1, stats['fake_outer_api_call']['calls'])
+        self.assertEqual(1, stats['fake_outer_api_call']['queries'])
+
+    def test_get_backend_with_query_stats(self):
+        self.flags(sql_query_stats=True)
+        backend = sqlalchemy_api.get_backend()
+        self.assertIsInstance(backend, db_session.QueryStatsBackend)
+
+
 class MigrationTestCase(test.TestCase):
 
     def setUp(self):
@@ -945,6 +1022,22 @@ class SecurityGroupRuleTestCase(test.TestCase, ModelsObjectComparatorMixin):
         for key, value in self._get_base_rule_values().items():
             self.assertEqual(value, security_group_rule[key])
 
+    def test_security_group_rule_bulk_create(self):
+        security_group = self._create_security_group({})
+        values = []
+        for port in (22, 80):
+            v = self._get_base_rule_values()
+            v.update({'parent_group_id': security_group['id'],
+                      'from_port': port, 'to_port': port})
+            values.append(v)
+        rules = db.security_group_rule_bulk_create(self.ctxt, values)
+        self.assertEqual([22, 80], [rule['from_port'] for rule in rules])
+        self.assertTrue(all(rule['id'] for rule in rules))
+        found_rules = db.security_group_rule_get_by_security_group(self.ctxt,
+                                                        security_group['id'])
+        self.assertEqual(sorted(rule['id'] for rule in rules),
+                         sorted(rule['id'] for rule in found_rules))
+
     def test_security_group_rule_get_by_security_group(self):
         security_group = self._create_security_group({})
         security_group_rule = self._create_security_group_rule(
@@ -1069,8 +1162,8 @@ class SecurityGroupTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
         session = get_session()
         self.mox.StubOutWithMock(sqlalchemy_api, 'get_session')
-        sqlalchemy_api.get_session().AndReturn(session)
-        sqlalchemy_api.get_session().AndReturn(session)
+        sqlalchemy_api.get_session(slave_session=False).AndReturn(session)
+        sqlalchemy_api.get_session(slave_session=False).AndReturn(session)
         self.mox.ReplayAll()
 
         security_group = db.security_group_get(self.ctxt, sid,
@@ -1492,6 +1585,28 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(result[0]['uuid'], instance['uuid'])
         self.assertEqual(result[0]['system_metadata'], [])
 
+    def test_instance_get_all_by_host_projected(self):
+        instance = self.create_instance_with_args(power_state=1,
+                                                  metadata={'foo': 'bar'})
+        result = db.instance_get_all_by_host(self.ctxt, 'h1',
+                                             columns_to_join=['metadata'],
+                                             columns=['power_state'])
+        self.assertEqual([{'id': instance['id'], 'uuid': instance['uuid'],
+                           'power_state': 1, 'system_metadata': [],
+                           'metadata': result[0]['metadata']}], result)
+        self.assertEqual('bar', result[0]['metadata'][0]['value'])
+
+    def test_instance_get_all_by_filters_projected(self):
+        inst1 = self.create_instance_with_args(display_name='inst1')
+        self.create_instance_with_args(display_name='inst2')
+        result = db.instance_get_all_by_filters(self.ctxt,
+                                                {'uuid': [inst1['uuid']]},
+                                                'created_at', 'desc',
+                                                columns=['display_name'])
+        self.assertEqual([{'id': inst1['id'], 'uuid': inst1['uuid'],
+                           'display_name': 'inst1', 'metadata': [],
+                           'system_metadata': []}], result)
+
     def test_instance_get_all_hung_in_rebooting(self):
         # Ensure no instances are returned.
         results = db.instance_get_all_hung_in_rebooting(self.ctxt, 10)
@@ -1734,6 +1849,17 @@ class InstanceMetadataTestCase(test.TestCase):
         metadata = db.instance_metadata_get(self.ctxt, instance['uuid'])
         self.assertEqual(metadata, {'new_key': 'new_value'})
 
+    def test_instance_metadata_update_many_keys(self):
+        instance = db.instance_create(self.ctxt, {'metadata': {'a': '1',
+                                                               'b': '2',
+                                                               'c': '3'}})
+        db.instance_metadata_update(self.ctxt, instance['uuid'],
+                                    {'a': '1', 'b': 'changed', 'd': '4',
+                                     'e': '5'}, True)
+        self.assertEqual({'a': '1', 'b': 'changed', 'd': '4', 'e': '5'},
+                         db.instance_metadata_get(self.ctxt,
+                                                  instance['uuid']))
+
 
 class ServiceTestCase(test.TestCase, ModelsObjectComparatorMixin):
     def setUp(self):
@@ -2962,6 +3088,59 @@ class FixedIPTestCase(BaseInstanceTypeTestCase):
         fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
         self.assertEqual(fixed_ip['instance_uuid'], instance_uuid)
 
+    def test_fixed_ip_associate_pool_sets_network(self):
+        instance_uuid = self._create_instance()
+        network = db.network_create_safe(self.ctxt, {})
+
+        address = self.create_fixed_ip()
+        db.fixed_ip_associate_pool(self.ctxt, network['id'], instance_uuid)
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        self.assertEqual(fixed_ip['instance_uuid'], instance_uuid)
+        self.assertEqual(fixed_ip['network_id'], network['id'])
+
+    def test_fixed_ip_associate_pool_skips_unavailable(self):
+        instance_uuid = self._create_instance()
+        network = db.network_create_safe(self.ctxt, {})
+
+        self.create_fixed_ip(address='192.168.0.1', network_id=network['id'],
+                             instance_uuid=self._create_instance())
+        self.create_fixed_ip(address='192.168.0.2', network_id=network['id'],
+                             reserved=True)
+        self.create_fixed_ip(address='192.168.0.3', network_id=network['id'],
+                             host='fake_host')
+        address = self.create_fixed_ip(address='192.168.0.4',
+                                       network_id=network['id'])
+        self.assertEqual(address,
+                         db.fixed_ip_associate_pool(self.ctxt, network['id'],
+                                                    instance_uuid))
+        self.assertRaises(exception.NoMoreFixedIps, db.fixed_ip_associate_pool,
+                          self.ctxt, network['id'], instance_uuid)
+
+    def test_fixed_ip_associate_pool_many(self):
+        network = db.network_create_safe(self.ctxt, {})
+        for i in range(3):
+            self.create_fixed_ip(address='192.168.0.%d' % i,
+                                 network_id=network['id'])
+        instance_uuids = [self._create_instance() for i in range(4)]
+
+        addresses = db.fixed_ip_associate_pool_many(self.ctxt, network['id'],
+                                                    instance_uuids[:2])
+        self.assertEqual(2, len(set(addresses)))
+        for address, instance_uuid in zip(addresses, instance_uuids):
+            fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+            self.assertEqual(instance_uuid, fixed_ip['instance_uuid'])
+
+        addresses += db.fixed_ip_associate_pool_many(self.ctxt,
+                                                     network['id'],
+                                                     instance_uuids[2:])
+        self.assertEqual(['192.168.0.0', '192.168.0.1', '192.168.0.2'],
+                         sorted(addresses))
+
+    def test_fixed_ip_associate_pool_many_invalid_uuid(self):
+        self.assertRaises(exception.InvalidUUID,
+                          db.fixed_ip_associate_pool_many,
+                          self.ctxt, None, ['123'])
+
     def test_fixed_ip_create_same_address(self):
         address = 'fixed_ip_address'
         params = {'address': address}
@@ -4081,6 +4260,44 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bdm_real = bdm_real[0]
         self.assertEqual(bdm_real['device_name'], 'device5')
 
+    def test_block_device_mapping_bulk_update_or_create(self):
+        uuid = self.instance['uuid']
+        self._create_bdm({'device_name': 'existing'})
+        values_list = [
+            {'instance_uuid': uuid, 'device_name': 'existing',
+             'source_type': 'volume', 'destination_type': 'camelot'},
+            {'instance_uuid': uuid, 'device_name': 'new1',
+             'source_type': 'volume', 'destination_type': 'volume',
+             'volume_id': 'fake-vol'},
+            {'instance_uuid': uuid, 'device_name': 'new2',
+             'source_type': 'blank', 'destination_type': 'local',
+             'guest_format': 'swap', 'volume_size': ''},
+        ]
+        result = db.block_device_mapping_bulk_update_or_create(
+            self.ctxt, values_list, legacy=False)
+        self.assertEqual(['existing', 'new1', 'new2'],
+                         sorted(bdm['device_name'] for bdm in result))
+
+        bdms = dict((bdm['device_name'], bdm) for bdm in
+                    db.block_device_mapping_get_all_by_instance(self.ctxt,
+                                                                uuid))
+        self.assertEqual(['existing', 'new1', 'new2'], sorted(bdms))
+        self.assertEqual('camelot', bdms['existing']['destination_type'])
+        self.assertEqual('fake-vol', bdms['new1']['volume_id'])
+        self.assertEqual('swap', bdms['new2']['guest_format'])
+        self.assertEqual(None, bdms['new2']['volume_size'])
+
+    def test_block_device_mapping_bulk_update_or_create_last_swap(self):
+        uuid = self.instance['uuid']
+        values_list = [{'instance_uuid': uuid, 'device_name': name,
+                        'source_type': 'blank', 'guest_format': 'swap'}
+                       for name in ('device1', 'device2', 'device3')]
+        db.block_device_mapping_bulk_update_or_create(self.ctxt, values_list,
+                                                      legacy=False)
+        bdm_real = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid)
+        self.assertEqual(['device3'],
+                         [bdm['device_name'] for bdm in bdm_real])
+
     def test_block_device_mapping_get_all_by_instance(self):
         uuid1 = self.instance['uuid']
         uuid2 = db.instance_create(self.ctxt, {})['uuid']
@@ -4102,6 +4319,32 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bmd = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid2)
         self.assertEqual(len(bmd), 2)
 
+    def test_block_device_mapping_get_all_by_instance_uuids(self):
+        uuid1 = self.instance['uuid']
+        uuid2 = db.instance_create(self.ctxt, {})['uuid']
+        uuid3 = db.instance_create(self.ctxt, {})['uuid']
+
+        bmds_values = [{'instance_uuid': uuid1,
+                        'device_name': 'first'},
+                       {'instance_uuid': uuid2,
+                        'device_name': 'second'},
+                       {'instance_uuid': uuid2,
+                        'device_name': 'third'},
+                       {'instance_uuid': uuid3,
+                        'device_name': 'fourth'}]
+
+        for bdm in bmds_values:
+            self._create_bdm(bdm)
+
+        bmd = db.block_device_mapping_get_all_by_instance_uuids(
+                self.ctxt, [uuid1, uuid2])
+        self.assertEqual(['first', 'second', 'third'],
+                         sorted(b['device_name'] for b in bmd))
+
+        self.assertEqual([],
+                db.block_device_mapping_get_all_by_instance_uuids(self.ctxt,
+                                                                  []))
+
     def test_block_device_mapping_destroy(self):
         bdm = self._create_bdm({})
         db.block_device_mapping_destroy(self.ctxt, bdm['id'])
@@ -5530,6 +5773,31 @@ class Ec2TestCase(test.TestCase):
                           db.get_instance_uuid_by_ec2_id,
                           self.ctxt, 100500)
 
+    def test_ec2_id_mappings_create(self):
+        result = db.ec2_id_mappings_create(self.ctxt, 'instance',
+                                           ['uuid1', 'uuid2'])
+        self.assertTrue(result['uuid1'] < result['uuid2'])
+        self.assertEqual(result['uuid2'],
+                         db.get_ec2_instance_id_by_uuid(self.ctxt, 'uuid2'))
+
+    def test_ec2_id_mappings_get_by_uuids(self):
+        vol = db.ec2_volume_create(self.ctxt, 'fake-uuid')
+        result = db.ec2_id_mappings_get_by_uuids(self.ctxt, 'volume',
+                                                 ['fake-uuid', 'missing'])
+        self.assertEqual({'fake-uuid': vol['id']}, result)
+
+    def test_ec2_id_mappings_get_by_ids(self):
+        snap = db.ec2_snapshot_create(self.ctxt, 'fake-uuid')
+        result = db.ec2_id_mappings_get_by_ids(self.ctxt, 'snapshot',
+                                               [snap['id'], 100500])
+        self.assertEqual({snap['id']: 'fake-uuid'}, result)
+
+    def test_ec2_id_mappings_get_empty(self):
+        self.assertEqual({}, db.ec2_id_mappings_get_by_uuids(self.ctxt,
+                                                             'image', []))
+        self.assertEqual({}, db.ec2_id_mappings_get_by_ids(self.ctxt,
+                                                           'image', []))
+
 
 class ArchiveTestCase(test.TestCase):
 
@@ -2141,6 +2141,21 @@ class TestNovaMigrations(BaseMigrationTestCase, CommonTestsMixIn):
                           cells.insert().execute,
                           {'name': 'cell_transport_123', 'deleted': 0})
 
+    def _check_201(self, engine, data):
+        aggregate_versions = db_utils.get_table(engine, 'aggregate_versions')
+        rows = aggregate_versions.select().execute().fetchall()
+        self.assertEqual(1, len(rows))
+        self.assertEqual(0, rows[0]['version'])
+        self.assertTrue(db_utils.check_shadow_table(engine,
+                                                    'aggregate_versions'))
+
+    def _post_downgrade_201(self, engine):
+        self.assertRaises(sqlalchemy.exc.NoSuchTableError,
+                          db_utils.get_table, engine, 'aggregate_versions')
+        self.assertRaises(sqlalchemy.exc.NoSuchTableError,
+                          db_utils.get_table, engine,
+                          'shadow_aggregate_versions')
+
 
 class TestBaremetalMigrations(BaseMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
@@ -2251,6 +2266,16 @@ class TestBaremetalMigrations(BaseMigrationTestCase, CommonTestsMixIn):
     def _post_downgrade_008(self, engine):
         db_utils.get_table(engine, 'bm_pxe_ips')
 
+    def _check_009(self, engine, data):
+        bm_nodes = db_utils.get_table(engine, 'bm_nodes')
+        columns = [c.name for c in bm_nodes.columns]
+        self.assertIn(u'deploy_progress', columns)
+
+    def _post_downgrade_009(self, engine):
+        bm_nodes = db_utils.get_table(engine, 'bm_nodes')
+        columns = [c.name for c in bm_nodes.columns]
+        self.assertNotIn(u'deploy_progress', columns)
+
 
 class ProjectTestCase(test.TestCase):
 
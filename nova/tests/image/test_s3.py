@@ -15,11 +15,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
 import binascii
 import eventlet
 import mox
 import os
-import tempfile
+import random
+import StringIO
+import tarfile
 
 import fixtures
 
@@ -30,6 +33,7 @@ from nova import exception
 from nova.image import s3
 from nova import test
 from nova.tests.image import fake
+from nova import utils
 
 
 ami_manifest_xml = """<?xml version="1.0" ?>
@@ -198,7 +202,6 @@ class TestS3ImageService(test.TestCase):
         self.assertEqual(block_device_mapping, expected_bdm)
 
     def _initialize_mocks(self):
-        handle, tempf = tempfile.mkstemp(dir='/tmp')
         ignore = mox.IgnoreArg()
         mockobj = self.mox.CreateMockAnything()
         self.stubs.Set(self.image_service, '_conn', mockobj)
@@ -209,15 +212,16 @@ class TestS3ImageService(test.TestCase):
         mockobj(ignore).AndReturn(mockobj)
         self.stubs.Set(mockobj, 'get_contents_as_string', mockobj)
         mockobj().AndReturn(file_manifest_xml)
-        self.stubs.Set(self.image_service, '_download_file', mockobj)
-        mockobj(ignore, ignore, ignore).AndReturn(tempf)
+        self.stubs.Set(self.image_service, '_fetch_parts', mockobj)
+        mockobj(ignore, ['foo'], ignore).AndReturn(['data'])
         self.stubs.Set(binascii, 'a2b_hex', mockobj)
         mockobj(ignore).AndReturn('foo')
         mockobj(ignore).AndReturn('foo')
         self.stubs.Set(self.image_service, '_decrypt_image', mockobj)
-        mockobj(ignore, ignore, ignore, ignore, ignore).AndReturn(mockobj)
+        mockobj(ignore, ['data'], 'foo', 'foo').AndReturn(mockobj)
         self.stubs.Set(self.image_service, '_untarzip_image', mockobj)
-        mockobj(ignore, ignore).AndReturn(tempf)
+        mockobj(ignore).AndReturn((StringIO.StringIO('image'), 5))
+        mockobj.close().AndReturn(None)
         self.mox.ReplayAll()
 
     def test_s3_create_image_locations(self):
@@ -260,10 +264,124 @@ class TestS3ImageService(test.TestCase):
         self.assertEqual(updated_image['properties']['image_state'],
                           'available')
 
+    def _register_bundle(self, image_data, part_size, failing_part=None,
+                         decryption_key=None):
+        """Register image_data as a bundle split in parts of part_size.
+
+        Returns the final state of the image and the data uploaded to the
+        image service.
+        """
+        key, iv = '0' * 32, '1' * 32
+        tar_data = StringIO.StringIO()
+        tar_file = tarfile.open(fileobj=tar_data, mode='w:gz')
+        info = tarfile.TarInfo('image')
+        info.size = len(image_data)
+        tar_file.addfile(info, StringIO.StringIO(image_data))
+        tar_file.close()
+        encrypted = utils.execute('openssl', 'enc', '-aes-128-cbc',
+                                  '-K', key, '-iv', iv,
+                                  process_input=tar_data.getvalue())[0]
+
+        contents = {}
+        for i in xrange(0, len(encrypted), part_size):
+            contents['part%d' % i] = encrypted[i:i + part_size]
+        part_names = sorted(contents, key=lambda name: int(name[4:]))
+        contents['manifest.xml'] = (
+            '<manifest><image>'
+            '<ec2_encrypted_key>%s</ec2_encrypted_key>'
+            '<ec2_encrypted_iv>%s</ec2_encrypted_iv><parts>%s</parts>'
+            '</image></manifest>' % (
+                binascii.b2a_hex('key'), binascii.b2a_hex('iv'),
+                ''.join('<part><filename>%s</filename></part>' % name
+                        for name in part_names)))
+
+        class FakeKey(object):
+            def __init__(self, name):
+                self.name = name
+
+            def get_contents_as_string(self):
+                if self.name == failing_part:
+                    raise IOError()
+                return contents[self.name]
+
+        class FakeConnection(object):
+            def get_bucket(self, bucket_name):
+                return self
+
+            def get_key(self, name):
+                return FakeKey(name)
+
+        def fake_decrypt_text(context, project_id, text):
+            if base64.b64decode(text) == 'key':
+                return decryption_key or key
+            return iv
+
+        uploaded = []
+        orig_update = self.image_service.service.update
+
+        def fake_update(context, image_id, metadata, data=None,
+                        purge_props=False):
+            if data is not None:
+                uploaded.append(''.join(iter(lambda: data.read(4096), '')))
+            return orig_update(context, image_id, metadata,
+                               purge_props=purge_props)
+
+        self.stubs.Set(self.image_service, '_conn',
+                       lambda context: FakeConnection())
+        self.stubs.Set(self.image_service.cert_rpcapi, 'decrypt_text',
+                       fake_decrypt_text)
+        self.stubs.Set(self.image_service.service, 'update', fake_update)
+        self.stubs.Set(eventlet, 'spawn_n', lambda f: f())
+
+        image = self.image_service._s3_create(
+            self.context,
+            {'properties': {'image_location': 'bucket/manifest.xml'}})
+        image_uuid = ec2utils.id_to_glance_id(self.context, image['id'])
+        image = self.image_service.service.show(self.context, image_uuid)
+        return image['properties']['image_state'], ''.join(uploaded)
+
+    def test_s3_create_streams_image(self):
+        self.flags(s3_part_concurrency=2)
+        image_data = os.urandom(256 * 1024)
+        state, uploaded = self._register_bundle(image_data, 10 * 1024)
+        self.assertEqual('available', state)
+        self.assertEqual(image_data, uploaded)
+
+    def test_s3_create_failed_download(self):
+        state, uploaded = self._register_bundle(os.urandom(256 * 1024),
+                                                10 * 1024,
+                                                failing_part='part40960')
+        self.assertEqual('failed_download', state)
+
+    def test_s3_create_failed_decrypt(self):
+        # NOTE: tar fails on the garbage while parts are still being fed to
+        #       openssl, which only finds the key wrong at the end
+        data = random.Random(0)
+        image_data = ''.join(chr(data.randint(0, 255))
+                             for i in xrange(1024 * 1024))
+        state, uploaded = self._register_bundle(image_data, 10 * 1024,
+                                                decryption_key='2' * 32)
+        self.assertEqual('failed_decrypt', state)
+
+    def test_fetch_parts_in_order(self):
+        self.flags(s3_part_concurrency=3)
+        fetched = []
+
+        def fake_fetch_part(bucket, filename):
+            fetched.append(filename)
+            # Let the parts fetched ahead complete out of order
+            eventlet.sleep(0.01 * (5 - filename))
+            return 'x' * filename
+
+        self.stubs.Set(self.image_service, '_fetch_part', fake_fetch_part)
+        progress = {'downloaded': 0}
+        parts = self.image_service._fetch_parts(None, range(1, 6), progress)
+        self.assertEqual(['x' * i for i in range(1, 6)], list(parts))
+        self.assertEqual(15, progress['downloaded'])
+        self.assertEqual(range(1, 6), fetched)
+
     def test_s3_malicious_tarballs(self):
-        self.assertRaises(exception.NovaException,
-            self.image_service._test_for_malicious_tarball,
-            "/unused", os.path.join(os.path.dirname(__file__), 'abs.tar.gz'))
-        self.assertRaises(exception.NovaException,
-            self.image_service._test_for_malicious_tarball,
-            "/unused", os.path.join(os.path.dirname(__file__), 'rel.tar.gz'))
+        for name in ('abs.tar.gz', 'rel.tar.gz'):
+            with open(os.path.join(os.path.dirname(__file__), name)) as f:
+                self.assertRaises(exception.NovaException,
+                                  self.image_service._untarzip_image, f)
@@ -0,0 +1,91 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+
+from nova import exception
+from nova.network import fixed_ip_batch
+from nova import test
+
+
+class FakeDB(object):
+    """Hands out addresses, yielding like a database call in a tpool."""
+
+    def __init__(self, free):
+        self.free = free
+        self.calls = []
+
+    def fixed_ip_associate_pool(self, context, network_id, instance_uuid):
+        self.calls.append([instance_uuid])
+        eventlet.sleep(0)
+        if not self.free:
+            raise exception.NoMoreFixedIps()
+        return self.free.pop(0)
+
+    def fixed_ip_associate_pool_many(self, context, network_id,
+                                     instance_uuids):
+        self.calls.append(instance_uuids)
+        eventlet.sleep(0)
+        addresses = self.free[:len(instance_uuids)]
+        del self.free[:len(instance_uuids)]
+        return addresses
+
+
+class FixedIpBatcherTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(FixedIpBatcherTestCase, self).setUp()
+        self.batcher = fixed_ip_batch.FixedIpBatcher()
+
+    def _associate_concurrently(self, db, instance_uuids):
+        def associate(instance_uuid):
+            try:
+                return self.batcher.associate(db, 'context', 'net',
+                                              instance_uuid)
+            except exception.NoMoreFixedIps:
+                return None
+
+        threads = [eventlet.spawn(associate, instance_uuid)
+                   for instance_uuid in instance_uuids]
+        return [thread.wait() for thread in threads]
+
+    def test_single_allocation(self):
+        db = FakeDB(['10.0.0.1'])
+        self.assertEqual('10.0.0.1',
+                         self.batcher.associate(db, 'context', 'net', 'a'))
+        self.assertEqual([['a']], db.calls)
+
+    def test_concurrent_allocations_batched(self):
+        db = FakeDB(['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+        addresses = self._associate_concurrently(db, ['a', 'b', 'c'])
+        self.assertEqual(['10.0.0.1', '10.0.0.2', '10.0.0.3'], addresses)
+        self.assertEqual([['a'], ['b', 'c']], db.calls)
+
+    def test_batch_short_of_addresses(self):
+        db = FakeDB(['10.0.0.1', '10.0.0.2'])
+        addresses = self._associate_concurrently(db, ['a', 'b', 'c'])
+        self.assertEqual(['10.0.0.1', '10.0.0.2', None], addresses)
+
+    def test_error_raised_in_every_request_of_the_batch(self):
+        db = FakeDB(['10.0.0.1'])
+        self.stubs.Set(db, 'fixed_ip_associate_pool_many',
+                       lambda *args: 1 / 0)
+        threads = [eventlet.spawn(self.batcher.associate, db, 'context',
+                                  'net', instance_uuid)
+                   for instance_uuid in ('a', 'b', 'c')]
+        self.assertEqual('10.0.0.1', threads[0].wait())
+        self.assertRaises(ZeroDivisionError, threads[1].wait)
+        self.assertRaises(ZeroDivisionError, threads[2].wait)
@@ -414,6 +414,80 @@ class _TestInstanceListObject(object):
             self.assertEqual(inst_list.objects[i].uuid, fakes[i]['uuid'])
         self.assertRemotes()
 
+    def _fake_projected_instances(self):
+        return [{'id': 1, 'uuid': 'uuid1', 'power_state': 1,
+                 'metadata': [], 'system_metadata': []},
+                {'id': 2, 'uuid': 'uuid2', 'power_state': 4,
+                 'metadata': [], 'system_metadata': []}]
+
+    def test_get_by_host_projected(self):
+        ctxt = context.get_admin_context()
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.instance_get_all_by_host(
+            ctxt, 'foo', columns_to_join=None,
+            columns=['id', 'power_state', 'uuid']).AndReturn(
+                self._fake_projected_instances())
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_by_host(
+            ctxt, 'foo', fields=['power_state'])
+        self.assertEqual(['uuid1', 'uuid2'], [inst.uuid for inst in inst_list])
+        self.assertEqual([1, 4], [inst.power_state for inst in inst_list])
+        self.assertFalse('host' in inst_list[0])
+        self.assertFalse('info_cache' in inst_list[0])
+        self.assertRemotes()
+
+    def test_projected_columns_loaded_in_bulk(self):
+        ctxt = context.get_admin_context()
+        full = [self.fake_instance(1, {'id': 1, 'uuid': 'uuid1',
+                                       'host': 'foo', 'vm_state': 'active'}),
+                self.fake_instance(2, {'id': 2, 'uuid': 'uuid2',
+                                       'host': 'foo', 'vm_state': 'active'})]
+        columns = sorted(set(instance._column_fields()) - set(['power_state']))
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        db.instance_get_all_by_host(
+            ctxt, 'foo', columns_to_join=None,
+            columns=['id', 'power_state', 'uuid']).AndReturn(
+                self._fake_projected_instances())
+        db.instance_get_all_by_filters(
+            ctxt, {'uuid': ['uuid1', 'uuid2']}, 'created_at', 'desc',
+            limit=None, marker=None, columns_to_join=None,
+            columns=columns).AndReturn(full)
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_by_host(
+            ctxt, 'foo', fields=['power_state'])
+        inst_list[1].vm_state = 'stopped'
+        # One query loads the missing columns of every instance
+        self.assertEqual('foo', inst_list[0].host)
+        self.assertEqual('foo', inst_list[1].host)
+        self.assertEqual('active', inst_list[0].vm_state)
+        self.assertEqual('stopped', inst_list[1].vm_state)
+        self.assertEqual(1, inst_list[0].power_state)
+        self.assertEqual(set(), inst_list[0].obj_what_changed())
+        self.assertEqual(set(['vm_state']), inst_list[1].obj_what_changed())
+
+    def test_projected_metadata_loaded_in_bulk(self):
+        ctxt = context.get_admin_context()
+        metadata = [{'id': 1, 'uuid': 'uuid1', 'system_metadata': [],
+                     'metadata': [{'key': 'foo', 'value': 'bar'}]},
+                    {'id': 2, 'uuid': 'uuid2', 'system_metadata': [],
+                     'metadata': []}]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        db.instance_get_all_by_host(
+            ctxt, 'foo', columns_to_join=None,
+            columns=['id', 'power_state', 'uuid']).AndReturn(
+                self._fake_projected_instances())
+        db.instance_get_all_by_filters(
+            ctxt, {'uuid': ['uuid1', 'uuid2']}, 'created_at', 'desc',
+            limit=None, marker=None, columns_to_join=['metadata'],
+            columns=['id', 'uuid']).AndReturn(metadata)
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_by_host(
+            ctxt, 'foo', fields=['power_state'])
+        self.assertEqual({'foo': 'bar'}, inst_list[0].metadata)
+        self.assertEqual({}, inst_list[1].metadata)
+
     def test_with_fault(self):
         ctxt = context.get_admin_context()
         fake_insts = [
@@ -428,8 +502,10 @@ class _TestInstanceListObject(object):
         db.instance_fault_get_by_instance_uuids(
             ctxt, [x['uuid'] for x in fake_insts]).AndReturn(fake_faults)
         self.mox.ReplayAll()
-        instances = instance.InstanceList.get_by_host(ctxt, 'host',
-                                                      expected_attrs=['fault'])
+        expected_attrs = ['fault']
+        instances = instance.InstanceList.get_by_host(
+            ctxt, 'host', expected_attrs=expected_attrs)
+        self.assertEqual(['fault'], expected_attrs)
         self.assertEqual(2, len(instances))
         self.assertEqual(fake_faults['fake-uuid'][0],
                          dict(instances[0].fault.iteritems()))
@@ -78,7 +78,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                 mox.IsA(exception.NoValidHost), mox.IgnoreArg())
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
-        db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        db.compute_node_get_all(mox.IgnoreArg(),
+                                use_slave=True).AndReturn([])
 
         self.mox.ReplayAll()
         sched.schedule_run_instance(
@@ -244,7 +245,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         filter_properties = {}
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
-        db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        db.compute_node_get_all(mox.IgnoreArg(),
+                                use_slave=True).AndReturn([])
         self.mox.ReplayAll()
 
         sched._schedule(self.context, request_spec,
@@ -263,7 +265,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         filter_properties = {}
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
-        db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        db.compute_node_get_all(mox.IgnoreArg(),
+                                use_slave=True).AndReturn([])
         self.mox.ReplayAll()
 
         sched._schedule(self.context, request_spec,
@@ -284,7 +287,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         filter_properties = dict(retry=retry)
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
-        db.compute_node_get_all(mox.IgnoreArg()).AndReturn([])
+        db.compute_node_get_all(mox.IgnoreArg(),
+                                use_slave=True).AndReturn([])
         self.mox.ReplayAll()
 
         sched._schedule(self.context, request_spec,
@@ -319,7 +319,8 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         self.mox.StubOutWithMock(host_manager.LOG, 'warn')
 
-        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.compute_node_get_all(context, use_slave=True).AndReturn(
+                fakes.COMPUTE_NODES)
         # Invalid service
         host_manager.LOG.warn("No service for compute ID 5")
 
@@ -376,7 +377,8 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         context = 'fake_context'
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
-        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.compute_node_get_all(context, use_slave=True).AndReturn(
+                fakes.COMPUTE_NODES)
         self.mox.ReplayAll()
 
         self.host_manager.get_all_host_states(context)
@@ -388,11 +390,13 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         # all nodes active for first call
-        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.compute_node_get_all(context, use_slave=True).AndReturn(
+                fakes.COMPUTE_NODES)
         # remove node4 for second call
         running_nodes = [n for n in fakes.COMPUTE_NODES
                          if n.get('hypervisor_hostname') != 'node4']
-        db.compute_node_get_all(context).AndReturn(running_nodes)
+        db.compute_node_get_all(context, use_slave=True).AndReturn(
+                running_nodes)
         self.mox.ReplayAll()
 
         self.host_manager.get_all_host_states(context)
@@ -405,9 +409,11 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         # all nodes active for first call
-        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.compute_node_get_all(context, use_slave=True).AndReturn(
+                fakes.COMPUTE_NODES)
         # remove all nodes for second call
-        db.compute_node_get_all(context).AndReturn([])
+        db.compute_node_get_all(context, use_slave=True).AndReturn(
+                [])
         self.mox.ReplayAll()
 
         self.host_manager.get_all_host_states(context)
@@ -19,6 +19,8 @@
 Tests for availability zones
 """
 
+import time
+
 from oslo.config import cfg
 
 from nova import availability_zones as az
@@ -211,3 +213,50 @@ class AvailabilityZoneTestCases(test.TestCase):
 
         self.assertEqual(self.availability_zone,
                 az.get_instance_availability_zone(self.context, fake_inst))
+
+    def test_get_hosts_availability_zones(self):
+        """Test availability zones of several hosts in one lookup."""
+        service = self._create_service_with_topic('compute', 'host1')
+        self._add_to_aggregate(service, self.agg)
+        self._create_service_with_topic('compute', 'host2')
+
+        self.assertEqual({'host1': self.availability_zone,
+                          'host2': self.default_az},
+                az.get_hosts_availability_zones(self.context,
+                                                ['host1', 'host2']))
+
+    def test_host_availability_zone_index(self):
+        """Test the index is only rebuilt when aggregates change."""
+        service = self._create_service_with_topic('compute', self.host)
+        self._add_to_aggregate(service, self.agg)
+        self.assertEqual(self.availability_zone,
+                az.get_host_availability_zone(self.context, self.host))
+
+        self.mox.StubOutWithMock(db, 'aggregate_host_get_by_metadata_key')
+        self.mox.ReplayAll()
+        self.assertEqual(set([self.availability_zone]),
+                az.get_host_availability_zones(self.context, self.host))
+        self.mox.VerifyAll()
+        self.mox.UnsetStubs()
+
+        self._update_az(self.agg, 'nova-test2')
+        self.assertEqual(set(['nova-test2']),
+                az.get_host_availability_zones(self.context, self.host))
+
+    def test_host_availability_zone_check_interval(self):
+        """Test aggregates are only checked every check interval."""
+        self.flags(availability_zone_check_interval=10)
+        service = self._create_service_with_topic('compute', self.host)
+        self._add_to_aggregate(service, self.agg)
+        now = time.time()
+        self.stubs.Set(time, 'time', lambda: now)
+        self.assertEqual(self.availability_zone,
+                az.get_host_availability_zone(self.context, self.host))
+
+        self._update_az(self.agg, 'nova-test2')
+        self.assertEqual(self.availability_zone,
+                az.get_host_availability_zone(self.context, self.host))
+
+        self.stubs.Set(time, 'time', lambda: now + 11)
+        self.assertEqual('nova-test2',
+                az.get_host_availability_zone(self.context, self.host))
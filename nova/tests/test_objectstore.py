@@ -23,6 +23,7 @@ Unittets for S3 objectstore clone.
 import boto
 import os
 import shutil
+import StringIO
 import tempfile
 
 from boto import exception as boto_exception
@@ -128,6 +129,55 @@ class S3APITestCase(test.TestCase):
 
         self._ensure_no_buckets(bucket.get_all_keys())
 
+    def test_get_key_range(self):
+        bucket = self.conn.create_bucket('testbucket')
+        bucket.new_key('somekey').set_contents_from_string('0123456789')
+
+        key = bucket.get_key('somekey')
+        self.assertEquals('234', key.get_contents_as_string(
+            headers={'Range': 'bytes=2-4'}))
+        self.assertEquals('789', key.get_contents_as_string(
+            headers={'Range': 'bytes=-3'}))
+        self.assertRaises(boto_exception.S3ResponseError,
+                          key.get_contents_as_string,
+                          headers={'Range': 'bytes=10-'})
+
+    def test_list_keys_with_prefix_and_marker(self):
+        bucket = self.conn.create_bucket('testbucket')
+        for key_name in ('a1', 'a2', 'a3', 'b1'):
+            bucket.new_key(key_name).set_contents_from_string(key_name)
+
+        keys = bucket.get_all_keys(prefix='a', marker='a1', max_keys=1)
+        self.assertEquals(['a2'], [key.name for key in keys])
+        self.assertTrue(keys.is_truncated)
+        keys = bucket.get_all_keys(prefix='a', marker='a2')
+        self.assertEquals(['a3'], [key.name for key in keys])
+        self.assertFalse(keys.is_truncated)
+
+    def test_list_keys_of_unindexed_bucket(self):
+        bucket = self.conn.create_bucket('testbucket')
+        bucket.new_key('somekey').set_contents_from_string('somekey')
+        shutil.rmtree(os.path.join(CONF.buckets_path,
+                                   s3server.INTERNAL_DIRECTORY, 'index'))
+        os.mkdir(os.path.join(CONF.buckets_path,
+                              s3server.INTERNAL_DIRECTORY, 'index'))
+
+        self.assertEquals(['somekey'],
+                          [key.name for key in bucket.get_all_keys()])
+        self._ensure_one_bucket(self.conn.get_all_buckets(), 'testbucket')
+
+    def test_multipart_upload(self):
+        bucket = self.conn.create_bucket('testbucket')
+        upload = bucket.initiate_multipart_upload('bigkey')
+        upload.upload_part_from_file(StringIO.StringIO('a' * 10), 1)
+        upload.upload_part_from_file(StringIO.StringIO('b' * 10), 2)
+        upload.complete_upload()
+
+        key = bucket.get_key('bigkey')
+        self.assertEquals('a' * 10 + 'b' * 10, key.get_contents_as_string())
+        self.assertEquals([], os.listdir(os.path.join(
+            CONF.buckets_path, s3server.INTERNAL_DIRECTORY, 'uploads')))
+
     def test_unknown_bucket(self):
         bucket_name = 'falalala'
         self.assertRaises(boto_exception.S3ResponseError,
@@ -138,3 +188,21 @@ class S3APITestCase(test.TestCase):
         """Tear down test server."""
         self.server.stop()
         super(S3APITestCase, self).tearDown()
+
+
+class RangeTestCase(test.NoDBTestCase):
+    def test_parse_range(self):
+        self.assertEquals((2, 4), s3server._parse_range('bytes=2-4', 10))
+        self.assertEquals((2, 9), s3server._parse_range('bytes=2-', 10))
+        self.assertEquals((2, 9), s3server._parse_range('bytes=2-20', 10))
+        self.assertEquals((7, 9), s3server._parse_range('bytes=-3', 10))
+        self.assertEquals((0, 9), s3server._parse_range('bytes=-20', 10))
+
+    def test_parse_range_ignored(self):
+        for header in (None, 'bytes=-', 'bytes=4-2', 'bytes=1-2,4-5',
+                       'items=1-2'):
+            self.assertEquals(None, s3server._parse_range(header, 10))
+
+    def test_parse_range_unsatisfiable(self):
+        self.assertRaises(ValueError, s3server._parse_range, 'bytes=10-', 10)
+        self.assertRaises(ValueError, s3server._parse_range, 'bytes=-0', 10)
@@ -58,6 +58,23 @@ class PolicyFileTestCase(test.TestCase):
             self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
                               self.context, action, self.target)
 
+    def test_policy_file_checks_are_throttled(self):
+        self.flags(policy_check_interval=60)
+        policy.init()
+        self.mox.StubOutWithMock(utils, 'read_cached_file')
+        self.mox.ReplayAll()
+        policy.init()
+        policy.enforce(self.context, 'compute:get', self.target)
+
+    def test_policy_file_checked_after_interval(self):
+        self.flags(policy_check_interval=0)
+        policy.init()
+        self.mox.StubOutWithMock(utils, 'read_cached_file')
+        utils.read_cached_file(policy._POLICY_PATH, policy._POLICY_CACHE,
+                               reload_func=policy._set_rules)
+        self.mox.ReplayAll()
+        policy.init()
+
 
 class PolicyTestCase(test.TestCase):
     def setUp(self):
@@ -147,6 +164,89 @@ class PolicyTestCase(test.TestCase):
         policy.enforce(admin_context, uppercase_action, self.target)
 
 
+class CompiledPolicyTestCase(test.TestCase):
+    def setUp(self):
+        super(CompiledPolicyTestCase, self).setUp()
+        rules = {
+            "admin": "role:admin",
+            "owner": "project_id:%(project_id)s",
+            "admin_or_owner": "rule:admin or rule:owner",
+            "example:nested": "rule:admin_or_owner or role:member",
+            "example:missing": "rule:nonexistent",
+            "example:loop": "rule:example:loop",
+            "example:http": "http://www.example.com",
+        }
+        self.policy.set_rules(rules)
+        self.context = context.RequestContext('fake', 'fake', roles=['foo'])
+
+    def test_rule_references_inlined(self):
+        check = policy._get_compiled('example:nested')[0]
+        self.assertTrue(isinstance(check, common_policy.OrCheck))
+        self.assertEqual(['(role:admin or project_id:%(project_id)s)',
+                          'role:member'],
+                         [str(rule) for rule in check.rules])
+
+    def test_missing_rule_reference_fails_closed(self):
+        check = policy._get_compiled('example:missing')[0]
+        self.assertTrue(isinstance(check, common_policy.FalseCheck))
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:missing', {})
+
+    def test_rule_cycle_not_inlined(self):
+        check, cred_keys, target_keys, gen = policy._get_compiled(
+            'example:loop')
+        self.assertTrue(isinstance(check.rule, common_policy.RuleCheck))
+        self.assertEqual(None, cred_keys)
+
+    def test_check_keys(self):
+        check, cred_keys, target_keys, gen = policy._get_compiled(
+            'example:nested')
+        self.assertEqual(['project_id', 'roles'], cred_keys)
+        self.assertEqual(['project_id'], target_keys)
+
+    def test_http_check_not_memoized(self):
+        self.assertEqual(None, policy._get_compiled('example:http')[1])
+
+    def test_results_memoized_per_target(self):
+        calls = []
+        orig_call = common_policy.GenericCheck.__call__
+
+        def fake_call(check, target, creds):
+            calls.append(target)
+            return orig_call(check, target, creds)
+
+        self.stubs.Set(common_policy.GenericCheck, '__call__', fake_call)
+        mine = {'project_id': 'fake', 'uuid': 'a'}
+        also_mine = {'project_id': 'fake', 'uuid': 'b'}
+        not_mine = {'project_id': 'other'}
+        policy.enforce(self.context, 'example:nested', mine)
+        policy.enforce(self.context, 'example:nested', also_mine)
+        self.assertEqual(1, len(calls))
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:nested', not_mine)
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:nested', not_mine)
+        self.assertEqual(2, len(calls))
+
+    def test_new_rules_invalidate_memoized_results(self):
+        policy.enforce(self.context, 'example:nested', {'project_id': 'fake'})
+        self.policy.set_rules({"example:nested": "!"})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:nested',
+                          {'project_id': 'fake'})
+
+    def test_missing_target_key_not_memoized(self):
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:nested', {})
+        self.assertEqual({}, self.context.policy_results)
+
+    def test_missing_target_key_fails_only_the_rule(self):
+        member = context.RequestContext('fake', 'fake', roles=['member'])
+        self.assertTrue(policy.enforce(member, 'example:nested', {}))
+        self.assertFalse(policy._check('example:nested', {},
+                                       {'roles': ['foo']}))
+
+
 class DefaultPolicyTestCase(test.TestCase):
 
     def setUp(self):
@@ -15,22 +15,29 @@
 #    under the License.
 
 import __builtin__
+import ConfigParser
 import datetime
 import functools
 import hashlib
 import importlib
 import os
 import os.path
+import shutil
 import StringIO
 import tempfile
 
+import eventlet
 import mox
 import netaddr
 from oslo.config import cfg
 
 import nova
 from nova import exception
+from nova.openstack.common import lockutils
 from nova.openstack.common import processutils
+from nova.openstack.common.rootwrap import client as rootwrap_client
+from nova.openstack.common.rootwrap import daemon as rootwrap_daemon
+from nova.openstack.common.rootwrap import wrapper as rootwrap_wrapper
 from nova.openstack.common import timeutils
 from nova import test
 from nova import utils
@@ -467,6 +474,226 @@ class GenericUtilsTestCase(test.TestCase):
                           "failure")
 
 
+class RootwrapDaemonTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(RootwrapDaemonTestCase, self).setUp()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        filters_dir = os.path.join(temp_dir, 'rootwrap.d')
+        os.mkdir(filters_dir)
+        with open(os.path.join(filters_dir, 'test.filters'), 'w') as f:
+            f.write('[Filters]\n'
+                    'cat: CommandFilter, cat, root\n'
+                    'false: CommandFilter, false, root\n')
+
+        rawconfig = ConfigParser.RawConfigParser()
+        rawconfig.set('DEFAULT', 'filters_path', filters_dir)
+        rawconfig.set('DEFAULT', 'exec_dirs', '/bin,/usr/bin')
+        config = rootwrap_wrapper.RootwrapConfig(rawconfig)
+        filters = rootwrap_wrapper.load_filters(config.filters_path)
+
+        socket_path = os.path.join(temp_dir, 'rootwrap.sock')
+        server = rootwrap_daemon.RootwrapServer(socket_path, config, filters)
+        eventlet.spawn_n(server.serve_forever)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        client = rootwrap_client.Client(['nova-rootwrap-daemon'])
+        self.stubs.Set(client, '_get_socket_path', lambda: socket_path)
+        self.stubs.Set(utils, '_ROOTWRAP_CLIENT', client)
+        self.stubs.Set(os, 'geteuid', lambda: 1000)
+        self.flags(use_rootwrap_daemon=True)
+
+        self.path = os.path.join(temp_dir, 'file')
+        with open(self.path, 'w') as f:
+            f.write('data')
+
+    def test_execute(self):
+        self.assertEqual(('data', ''),
+                         utils.execute('cat', self.path, run_as_root=True))
+
+    def test_execute_binary_input(self):
+        data = ''.join(chr(i) for i in xrange(256))
+        self.assertEqual((data, ''),
+                         utils.execute('cat', process_input=data,
+                                       run_as_root=True))
+
+    def test_execute_exit_code(self):
+        self.assertRaises(processutils.ProcessExecutionError,
+                          utils.execute, 'false', run_as_root=True)
+        utils.execute('false', run_as_root=True, check_exit_code=[1])
+
+    def test_execute_unauthorized(self):
+        exc = self.assertRaises(processutils.ProcessExecutionError,
+                                utils.execute, 'ls', run_as_root=True)
+        self.assertEqual(99, exc.exit_code)
+
+    def test_trycmd(self):
+        self.assertEqual(('data', ''),
+                         utils.trycmd('cat', self.path, run_as_root=True))
+        out, err = utils.trycmd('false', run_as_root=True)
+        self.assertEqual('', out)
+        self.assertNotEqual('', err)
+
+    def test_execute_root_batch(self):
+        self.assertEqual([('data', ''), ('data', '')],
+                         utils.execute_root_batch([['cat', self.path],
+                                                   ['cat', self.path]]))
+        self.assertRaises(processutils.ProcessExecutionError,
+                          utils.execute_root_batch,
+                          [['cat', self.path], ['false']])
+
+    def test_daemon_unavailable(self):
+        def fake_execute(commands):
+            raise rootwrap_client.DaemonUnavailable('test')
+
+        self.stubs.Set(utils._ROOTWRAP_CLIENT, 'execute', fake_execute)
+        self.mox.StubOutWithMock(processutils, 'execute')
+        processutils.execute('cat', self.path, run_as_root=True,
+                             root_helper=mox.StrContains('nova-rootwrap')
+                             ).AndReturn(('data', ''))
+        self.mox.ReplayAll()
+
+        self.assertEqual(('data', ''),
+                         utils.execute('cat', self.path, run_as_root=True))
+
+
+class SynchronizedTestCase(test.NoDBTestCase):
+    def _run(self, *funcs):
+        threads = [eventlet.spawn(func) for func in funcs]
+        for thread in threads:
+            thread.wait()
+
+    def test_readers_share_lock(self):
+        inside = []
+
+        @utils.synchronized('test-lock', shared=True)
+        def reader():
+            inside.append(True)
+            eventlet.sleep(0)
+            # the other reader got in while this one was holding the lock
+            self.assertEqual(2, len(inside))
+
+        self._run(reader, reader)
+
+    def test_writer_excludes_readers(self):
+        calls = []
+
+        @utils.synchronized('test-lock')
+        def writer():
+            calls.append('writer-in')
+            eventlet.sleep(0)
+            calls.append('writer-out')
+
+        @utils.synchronized('test-lock', shared=True)
+        def reader():
+            calls.append('reader')
+
+        self._run(writer, reader)
+        self.assertEqual(['writer-in', 'writer-out', 'reader'], calls)
+
+    def test_waiting_writer_blocks_new_readers(self):
+        calls = []
+
+        @utils.synchronized('test-lock', shared=True)
+        def reader(name):
+            calls.append(name)
+            eventlet.sleep(0)
+            eventlet.sleep(0)
+
+        @utils.synchronized('test-lock')
+        def writer():
+            calls.append('writer')
+
+        self._run(lambda: reader('reader1'), writer,
+                  lambda: reader('reader2'))
+        self.assertEqual(['reader1', 'writer', 'reader2'], calls)
+
+    def test_external_shared_lock(self):
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir)
+
+        @utils.synchronized('test-lock', external=True, lock_path=lock_dir,
+                            shared=True)
+        def reader():
+            return 'read'
+
+        self.assertEqual('read', reader())
+        self.assertTrue(os.path.exists(os.path.join(lock_dir,
+                                                    'nova-test-lock')))
+
+    def test_external_readers_share_file_lock(self):
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir)
+        calls = []
+
+        class FakeLock(object):
+            def __init__(self, name, shared=False):
+                self.shared = shared
+
+            def __enter__(self):
+                calls.append(('lock', self.shared))
+
+            def __exit__(self, exc_type, exc_val, exc_tb):
+                calls.append(('unlock', self.shared))
+
+        self.stubs.Set(lockutils, 'InterProcessLock', FakeLock)
+
+        @utils.synchronized('test-lock', external=True, lock_path=lock_dir,
+                            shared=True)
+        def reader(name):
+            calls.append(name)
+            eventlet.sleep(0)
+            eventlet.sleep(0)
+
+        @utils.synchronized('test-lock', external=True, lock_path=lock_dir)
+        def writer():
+            calls.append('writer')
+
+        self._run(lambda: reader('reader1'), lambda: reader('reader2'))
+        writer()
+        # NOTE: the file lock belongs to the process, the first reader out
+        # must not release it while the other one still holds it
+        self.assertEqual([('lock', True), 'reader1', 'reader2',
+                          ('unlock', True),
+                          ('lock', False), 'writer', ('unlock', False)],
+                         calls)
+
+    def test_striped_names(self):
+        name = lockutils.striped('images', 'image-1', 8)
+        self.assertEqual(name, lockutils.striped('images', u'image-1', 8))
+        self.assertTrue(name.startswith('images-stripe-'))
+        self.assertEqual(8, len(set(lockutils.striped('images', i, 8)
+                                    for i in range(100))))
+
+    def test_lock_stats(self):
+        self.flags(lock_stats=True)
+        lockutils.reset_lock_stats()
+        self.addCleanup(lockutils.reset_lock_stats)
+
+        @utils.synchronized('test-lock')
+        def f():
+            pass
+
+        f()
+        f()
+        stats = lockutils.get_lock_stats()['test-lock']
+        self.assertEqual(2, stats['wait']['count'])
+        self.assertEqual(2, stats['hold']['count'])
+        self.assertEqual(len(lockutils.STATS_BUCKETS) + 1,
+                         len(stats['hold']['buckets']))
+
+    def test_lock_stats_disabled(self):
+        lockutils.reset_lock_stats()
+
+        @utils.synchronized('test-lock')
+        def f():
+            pass
+
+        f()
+        self.assertEqual({}, lockutils.get_lock_stats())
+
+
 class MonkeyPatchTestCase(test.TestCase):
     """Unit test for utils.monkey_patch()."""
     def setUp(self):
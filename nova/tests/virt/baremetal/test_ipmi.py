@@ -19,10 +19,12 @@
 
 """Test class for baremetal IPMI power manager."""
 
+import functools
 import os
 import stat
 import tempfile
 
+import eventlet
 from oslo.config import cfg
 
 from nova import test
@@ -45,6 +47,7 @@ class BareMetalIPMITestCase(test.TestCase):
                 pm_user='fake-user',
                 pm_password='fake-password')
         self.ipmi = ipmi.IPMI(self.node)
+        self.stubs.Set(ipmi, 'POWER_CHECK_INTERVAL', 0.01)
 
     def test_construct(self):
         self.assertEqual(self.ipmi.node_id, 123)
@@ -189,6 +192,47 @@ class BareMetalIPMITestCase(test.TestCase):
         self.mox.VerifyAll()
         self.assertEqual(self.ipmi.state, baremetal_states.DELETED)
 
+    def test_power_check_backoff(self):
+        self.stubs.Set(ipmi, 'POWER_CHECK_INTERVAL', 1)
+        self.stubs.Set(ipmi, 'POWER_CHECK_MAX_INTERVAL', 4)
+        self.stubs.Set(self.ipmi, 'is_power_on', lambda: False)
+        self.stubs.Set(self.ipmi, '_exec_ipmitool', lambda command: None)
+        self.ipmi.retries = 0
+
+        change = ipmi._PowerChange(self.ipmi, True)
+        intervals = []
+        for i in range(4):
+            change.check()
+            intervals.append(change.interval)
+        self.assertEqual([2, 4, 4, 4], intervals)
+        self.assertFalse(change.done.ready())
+
+    def test_power_on_several_nodes(self):
+        nodes = [ipmi.IPMI(bm_db_utils.new_bm_node(
+                     id=i, pm_address='fake-address-%d' % i,
+                     pm_user='fake-user', pm_password='fake-password'))
+                 for i in range(3)]
+        powered = set()
+
+        def fake_exec_ipmitool(node, command):
+            if command == 'power on':
+                powered.add(node.node_id)
+                return ['', '']
+            if node.node_id in powered:
+                return ['Chassis Power is on\n', '']
+            return ['Chassis Power is off\n', '']
+
+        for node in nodes:
+            self.stubs.Set(node, '_exec_ipmitool',
+                           functools.partial(fake_exec_ipmitool, node))
+
+        threads = [eventlet.spawn(node._power_on) for node in nodes]
+        for thread in threads:
+            thread.wait()
+        for node in nodes:
+            self.assertEqual(baremetal_states.ACTIVE, node.state)
+        self.assertEqual(None, ipmi._SWEEPER._thread)
+
     def test_get_console_pid_path(self):
         self.flags(terminal_pid_dir='/tmp', group='baremetal')
         path = ipmi._get_console_pid_path(self.ipmi.node_id)
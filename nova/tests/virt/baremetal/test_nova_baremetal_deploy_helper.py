@@ -24,9 +24,11 @@ import mox
 
 from nova.cmd import baremetal_deploy_helper as bmdh
 from nova.openstack.common import log as logging
+from nova.openstack.common import processutils
 from nova import test
 from nova.tests.virt.baremetal.db import base as bm_db_base
 from nova.virt.baremetal import db as bm_db
+from nova.virt.baremetal import deploy_events
 
 bmdh.LOG = logging.getLogger('nova.virt.baremetal.deploy_helper')
 
@@ -81,7 +83,7 @@ class WorkerTestCase(bm_db_base.BMDBTestCase):
         """Check all queued requests are passed to deploy()."""
         history = []
 
-        def fake_deploy(**params):
+        def fake_deploy(progress=None, **params):
             history.append(params)
 
         self.stubs.Set(bmdh, 'deploy', fake_deploy)
@@ -105,7 +107,7 @@ class WorkerTestCase(bm_db_base.BMDBTestCase):
         """
         history = []
 
-        def fake_deploy(**params):
+        def fake_deploy(progress=None, **params):
             history.append(params)
             # always fail
             raise Exception('test')
@@ -158,7 +160,7 @@ class PhysicalWorkTestCase(test.TestCase):
         self.mox.StubOutWithMock(bmdh, 'logout_iscsi')
         self.mox.StubOutWithMock(bmdh, 'make_partitions')
         self.mox.StubOutWithMock(bmdh, 'is_block_device')
-        self.mox.StubOutWithMock(bmdh, 'dd')
+        self.mox.StubOutWithMock(bmdh, 'write_image')
         self.mox.StubOutWithMock(bmdh, 'mkswap')
         self.mox.StubOutWithMock(bmdh, 'block_uuid')
         self.mox.StubOutWithMock(bmdh, 'switch_pxe_config')
@@ -172,7 +174,7 @@ class PhysicalWorkTestCase(test.TestCase):
         bmdh.make_partitions(dev, root_mb, swap_mb)
         bmdh.is_block_device(root_part).AndReturn(True)
         bmdh.is_block_device(swap_part).AndReturn(True)
-        bmdh.dd(image_path, root_part)
+        bmdh.write_image(image_path, root_part, None)
         bmdh.mkswap(swap_part)
         bmdh.block_uuid(root_part).AndReturn(root_uuid)
         bmdh.logout_iscsi(address, port, iqn)
@@ -212,7 +214,7 @@ class PhysicalWorkTestCase(test.TestCase):
         bmdh.get_image_mb(image_path).AndReturn(1)  # < root_mb
         bmdh.discovery(address, port)
         bmdh.login_iscsi(address, port, iqn)
-        bmdh.work_on_disk(dev, root_mb, swap_mb, image_path).\
+        bmdh.work_on_disk(dev, root_mb, swap_mb, image_path, None).\
                 AndRaise(TestException)
         bmdh.logout_iscsi(address, port, iqn)
         self.mox.ReplayAll()
@@ -223,6 +225,66 @@ class PhysicalWorkTestCase(test.TestCase):
                          pxe_config_path, root_mb, swap_mb)
 
 
+class WriteImageTestCase(test.TestCase):
+    def setUp(self):
+        super(WriteImageTestCase, self).setUp()
+        self.stubs.Set(bmdh, 'WRITE_CHUNK_MB', 2)
+        (fd, self.image) = tempfile.mkstemp()
+        # data, 3 zero blocks, data, and a short block of zeros
+        os.write(fd, 'x' * bmdh.MB + '\0' * (3 * bmdh.MB) +
+                 '\0' * 10 + 'x' + '\0' * (bmdh.MB - 11) + '\0' * 10)
+        os.close(fd)
+        self.addCleanup(os.unlink, self.image)
+
+        self.history = []
+
+        def fake_dd(src, dst, *args):
+            self.history.append(('dd', src, dst) + args)
+
+        def fake_zero_out(dev, first_block, count):
+            self.history.append(('zero_out', dev, first_block, count))
+
+        self.stubs.Set(bmdh, 'dd', fake_dd)
+        self.stubs.Set(bmdh, 'zero_out', fake_zero_out)
+
+    def test_image_extents(self):
+        self.assertEqual([(True, 0, 1), (False, 1, 3), (True, 4, 1),
+                          (False, 5, 1)],
+                         bmdh.image_extents(self.image))
+
+    def test_write_image(self):
+        progress = []
+        bmdh.write_image(self.image, '/dev/fake', progress.append)
+        self.assertEqual(
+            sorted([('dd', self.image, '/dev/fake', 'skip=0', 'seek=0',
+                     'count=1', 'conv=notrunc'),
+                    ('zero_out', '/dev/fake', 1, 2),
+                    ('zero_out', '/dev/fake', 3, 1),
+                    ('dd', self.image, '/dev/fake', 'skip=4', 'seek=4',
+                     'count=1', 'conv=notrunc'),
+                    ('zero_out', '/dev/fake', 5, 1)]),
+            sorted(self.history))
+        self.assertEqual(100, progress[-1])
+
+    def test_write_image_without_zero_out(self):
+        def fake_zero_out(dev, first_block, count):
+            raise processutils.ProcessExecutionError()
+
+        self.stubs.Set(bmdh, 'zero_out', fake_zero_out)
+        self.flags(deploy_write_streams=1, group='baremetal')
+        bmdh.write_image(self.image, '/dev/fake')
+        self.assertEqual(['skip=%d' % block for block in (0, 1, 3, 4, 5)],
+                         [args[3] for args in self.history])
+
+    def test_write_image_fails(self):
+        def fake_dd(src, dst, *args):
+            raise processutils.ProcessExecutionError()
+
+        self.stubs.Set(bmdh, 'dd', fake_dd)
+        self.assertRaises(processutils.ProcessExecutionError,
+                          bmdh.write_image, self.image, '/dev/fake')
+
+
 class SwitchPxeConfigTestCase(test.TestCase):
     def setUp(self):
         super(SwitchPxeConfigTestCase, self).setUp()
@@ -248,6 +310,38 @@ class OtherFunctionTestCase(test.TestCase):
         actual = bmdh.get_dev('1.2.3.4', 5678, 'iqn.fake', 9)
         self.assertEqual(expected, actual)
 
+    def test_portal_semaphore(self):
+        self.stubs.Set(bmdh, '_PORTALS', {})
+        self.flags(deploy_workers_per_portal=1, group='baremetal')
+        semaphore = bmdh.portal_semaphore('1.2.3.4', '3260')
+        self.assertTrue(semaphore is bmdh.portal_semaphore('1.2.3.4', '3260'))
+        self.assertFalse(semaphore is bmdh.portal_semaphore('1.2.3.5',
+                                                             '3260'))
+        with semaphore:
+            self.assertFalse(semaphore.acquire(False))
+
+    def test_set_deploy_state(self):
+        self.mox.StubOutWithMock(bm_db, 'bm_node_update')
+        self.mox.StubOutWithMock(deploy_events.DeployEventAPI,
+                                 'deploy_state_changed')
+        bm_db.bm_node_update('context', 1, {'task_state': 'fake-state'})
+        deploy_events.DeployEventAPI.deploy_state_changed(
+                'context', 1, 'fake-state').AndRaise(Exception('test'))
+        self.mox.ReplayAll()
+
+        # a lost notification does not fail the deployment
+        bmdh.set_deploy_state('context', 1, {'task_state': 'fake-state'})
+
+    def test_progress_reporter(self):
+        self.mox.StubOutWithMock(bm_db, 'bm_node_update')
+        bm_db.bm_node_update('context', 1, {'deploy_progress': 10})
+        bm_db.bm_node_update('context', 1, {'deploy_progress': 25})
+        self.mox.ReplayAll()
+
+        report = bmdh.progress_reporter('context', 1)
+        for percent in (5, 10, 15, 25):
+            report(percent)
+
     def test_get_image_mb(self):
         mb = 1024 * 1024
         size = None
@@ -21,6 +21,7 @@
 
 import os
 
+import eventlet
 import mox
 
 from oslo.config import cfg
@@ -34,6 +35,7 @@ from nova.tests.virt.baremetal.db import base as bm_db_base
 from nova.tests.virt.baremetal.db import utils as bm_db_utils
 from nova.virt.baremetal import baremetal_states
 from nova.virt.baremetal import db
+from nova.virt.baremetal import deploy_events
 from nova.virt.baremetal import pxe
 from nova.virt.baremetal import utils as bm_utils
 from nova.virt.disk import api as disk_api
@@ -600,3 +602,25 @@ class PXEPublicMethodsTestCase(BareMetalPXETestCase):
         self.assertRaises(exception.InstanceDeployFailure,
                 self.driver.activate_node,
                 self.context, self.node, self.instance)
+
+    def test_activate_node_notified(self):
+        self._create_node()
+        self.instance['uuid'] = 'fake-uuid'
+        self.flags(pxe_deploy_poll_interval=60, group='baremetal')
+        waiter = deploy_events.DeployWaiter()
+        self.stubs.Set(deploy_events, '_WAITER', waiter)
+
+        db.bm_node_update(self.context, 1,
+                {'task_state': baremetal_states.DEPLOYING,
+                 'instance_uuid': 'fake-uuid'})
+        thread = eventlet.spawn(self.driver.activate_node,
+                                self.context, self.node, self.instance)
+        eventlet.sleep(0)
+        self.addCleanup(waiter._conn.close)
+
+        db.bm_node_update(self.context, 1,
+                {'task_state': baremetal_states.DEPLOYDONE})
+        deploy_events.DeployEventAPI().deploy_state_changed(
+                self.context, '1', baremetal_states.DEPLOYDONE)
+        with eventlet.Timeout(5):
+            thread.wait()
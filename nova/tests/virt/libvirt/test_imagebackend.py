@@ -68,6 +68,8 @@ class _ImageTestCase(object):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(False)
         os.path.exists(self.PATH).AndReturn(False)
         os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
+        # NOTE: checked again once the lock is held exclusively
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
@@ -101,6 +103,8 @@ class _ImageTestCase(object):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
         os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
+        # NOTE: checked again once the lock is held exclusively
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
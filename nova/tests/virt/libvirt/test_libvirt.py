@@ -5777,6 +5777,146 @@ class LibvirtVolumeUsageTestCase(test.TestCase):
         self.assertEqual(vol_usage, [])
 
 
+class FakeStatsDomain(object):
+    def __init__(self, id, name, state=power_state.RUNNING):
+        self.id = id
+        self._name = name
+        self.state = state
+        self.info_calls = 0
+        self.xml_calls = 0
+
+    def ID(self):
+        return self.id
+
+    def name(self):
+        return self._name
+
+    def UUIDString(self):
+        return 'uuid-' + self._name
+
+    def info(self):
+        self.info_calls += 1
+        return [self.state, 2048, 1024, 2, 10]
+
+    def suspend(self):
+        self.state = power_state.PAUSED
+
+    def XMLDesc(self, flags):
+        self.xml_calls += 1
+        return ("<domain type='kvm'><devices>"
+                "<disk type='file'><driver name='qemu' type='qcow2'/>"
+                "<source file='/test/%s/disk'/>"
+                "<target dev='vda' bus='virtio'/></disk>"
+                "<interface type='bridge'><target dev='tap0'/></interface>"
+                "</devices></domain>" % self._name)
+
+
+class FakeStatsConnection(object):
+    def __init__(self, doms):
+        self.doms = doms
+        self.lookups = 0
+
+    def numOfDomains(self):
+        return len(self.listDomainsID())
+
+    def listDomainsID(self):
+        return [dom.id for dom in self.doms if dom.id >= 0]
+
+    def listDefinedDomains(self):
+        return [dom.name() for dom in self.doms if dom.id < 0]
+
+    def lookupByID(self, id):
+        self.lookups += 1
+        return [dom for dom in self.doms if dom.id == id][0]
+
+    def lookupByName(self, name):
+        self.lookups += 1
+        return [dom for dom in self.doms if dom.name() == name][0]
+
+
+class LibvirtDomainRegistryTestCase(test.TestCase):
+    def setUp(self):
+        super(LibvirtDomainRegistryTestCase, self).setUp()
+        self.running = FakeStatsDomain(1, 'instance-1')
+        self.defined = FakeStatsDomain(-1, 'instance-2',
+                                       state=power_state.SHUTDOWN)
+        self.fake_conn = FakeStatsConnection([self.running, self.defined])
+        self.stubs.Set(libvirt_driver.LibvirtDriver, '_conn', self.fake_conn)
+        self.conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.conn._domains.enable()
+
+    def test_lookup_by_name_cached_until_event(self):
+        self.conn._lookup_by_name('instance-1')
+        self.conn._lookup_by_name('instance-1')
+        self.assertEqual(1, self.fake_conn.lookups)
+
+        libvirt_driver.LibvirtDriver._event_lifecycle_callback(
+            self.fake_conn, self.running, libvirt.VIR_DOMAIN_EVENT_STOPPED,
+            0, self.conn)
+        self.conn._lookup_by_name('instance-1')
+        self.assertEqual(2, self.fake_conn.lookups)
+
+    def test_lookup_by_name_not_cached_without_events(self):
+        self.conn._domains.enable(False)
+        self.conn._lookup_by_name('instance-1')
+        self.conn._lookup_by_name('instance-1')
+        self.assertEqual(2, self.fake_conn.lookups)
+
+    def test_periodic_calls_share_one_snapshot(self):
+        self.assertEqual(['instance-1', 'instance-2'],
+                         sorted(self.conn.list_instances()))
+        self.assertEqual(['uuid-instance-1', 'uuid-instance-2'],
+                         sorted(self.conn.list_instance_uuids()))
+        self.assertEqual(1, self.conn.get_num_instances())
+        self.assertEqual(2, self.conn.get_vcpu_used())
+        info = self.conn.get_info({'name': 'instance-1'})
+        self.assertEqual(power_state.RUNNING, info['state'])
+        self.assertEqual(1, info['id'])
+        self.assertEqual(power_state.SHUTDOWN,
+                         self.conn.get_info({'name': 'instance-2'})['state'])
+        self.assertEqual(1, self.running.info_calls)
+        self.assertEqual(1, self.defined.info_calls)
+
+    def test_get_info_not_found_in_snapshot(self):
+        self.conn.list_instances()
+        self.assertRaises(exception.InstanceNotFound,
+                          self.conn.get_info, {'name': 'instance-3'})
+
+    def test_description_parsed_once(self):
+        self.assertEqual(['vda'], self.conn.get_disks('instance-1'))
+        self.assertEqual(['vda'], self.conn.get_disks('instance-1'))
+        self.assertEqual(1, self.running.xml_calls)
+
+        libvirt_driver.LibvirtDriver._event_lifecycle_callback(
+            self.fake_conn, self.running, libvirt.VIR_DOMAIN_EVENT_DEFINED,
+            0, self.conn)
+        self.conn.get_disks('instance-1')
+        self.assertEqual(2, self.running.xml_calls)
+
+    def test_disk_virtual_size_not_cached_with_description(self):
+        sizes = [20 * 1024 * 1024 * 1024, 40 * 1024 * 1024 * 1024]
+
+        self.stubs.Set(libvirt_driver.disk, 'get_disk_size',
+                       lambda path: sizes.pop(0))
+        self.stubs.Set(libvirt_driver.libvirt_utils, 'get_disk_backing_file',
+                       lambda path: 'base')
+        self.stubs.Set(os.path, 'getsize', lambda path: 1024)
+        # NOTE: the disk is resized without the domain changing
+        for virt_size in (20 * 1024 * 1024 * 1024, 40 * 1024 * 1024 * 1024):
+            info = jsonutils.loads(
+                self.conn.get_instance_disk_info('instance-1'))
+            self.assertEqual('/test/instance-1/disk', info[0]['path'])
+            self.assertEqual(virt_size, info[0]['virt_disk_size'])
+        self.assertEqual(1, self.running.xml_calls)
+
+    def test_pause_invalidates_snapshot(self):
+        self.conn.list_instances()
+        self.conn.pause({'name': 'instance-1'})
+        self.assertEqual(power_state.PAUSED,
+                         self.conn.get_info({'name': 'instance-1'})['state'])
+        self.assertEqual(2, self.running.info_calls)
+
+
 class LibvirtNonblockingTestCase(test.TestCase):
     """Test libvirt_nonblocking option."""
 
@@ -0,0 +1,118 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+#    Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+from nova import test
+from nova.virt.libvirt import domains
+
+
+class DomainDescriptionTestCase(test.NoDBTestCase):
+    def test_parse_devices(self):
+        xml = ("<domain type='kvm'><devices>"
+               "<disk type='file' device='cdrom'>"
+               "<target dev='hdc' bus='ide'/></disk>"
+               "<disk type='file'><driver name='qemu' type='qcow2'/>"
+               "<source file='/path/disk'/>"
+               "<target dev='vda' bus='virtio'/></disk>"
+               "<disk type='block'><driver name='qemu' type='raw'/>"
+               "<source dev='/dev/sdb'/>"
+               "<target dev='vdb' bus='virtio'/></disk>"
+               "<interface type='bridge'><target dev='tap0'/></interface>"
+               "<interface type='bridge'/>"
+               "</devices></domain>")
+        description = domains.DomainDescription(xml)
+        self.assertEqual(
+            [domains.DiskDescription('file', None, None, None, 'hdc'),
+             domains.DiskDescription('file', 'qcow2', '/path/disk', None,
+                                     'vda'),
+             domains.DiskDescription('block', 'raw', None, '/dev/sdb',
+                                     'vdb')],
+            description.disks)
+        self.assertEqual(['tap0'], description.interfaces)
+
+
+class DomainRegistryTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(DomainRegistryTestCase, self).setUp()
+        self.registry = domains.DomainRegistry()
+        self.registry.enable()
+
+    def test_disabled_registry_caches_nothing(self):
+        registry = domains.DomainRegistry()
+        registry.add('uuid', 'name', 'dom', registry.generation)
+        registry.set_stats({}, registry.generation)
+        self.assertEqual(None, registry.get_by_name('name'))
+        self.assertEqual(None, registry.get_stats(10))
+
+    def test_add_and_get(self):
+        self.registry.add('uuid', 'name', 'dom', self.registry.generation)
+        self.assertEqual('dom', self.registry.get_by_name('name'))
+        self.assertEqual('dom', self.registry.get_by_uuid('uuid'))
+
+    def test_add_after_invalidation_ignored(self):
+        generation = self.registry.generation
+        self.registry.invalidate('other-uuid')
+        self.registry.add('uuid', 'name', 'dom', generation)
+        self.assertEqual(None, self.registry.get_by_name('name'))
+
+    def test_check_and_store_under_lock(self):
+        registry = self.registry
+        calls = []
+
+        class FakeLock(object):
+            def __enter__(self):
+                calls.append(registry.generation)
+
+            def __exit__(self, exc_type, exc_val, exc_tb):
+                pass
+
+        generation = registry.generation
+        registry._lock = FakeLock()
+        registry.add('uuid', 'name', 'dom', generation)
+        registry.add_description('uuid', 'name', 'desc', generation)
+        registry.set_stats({}, generation)
+        registry.invalidate('uuid')
+        self.assertEqual([generation] * 4, calls)
+
+    def test_invalidate_by_uuid_and_name(self):
+        self.registry.add('uuid1', 'name1', 'dom1', self.registry.generation)
+        self.registry.add('uuid2', 'name2', 'dom2', self.registry.generation)
+        self.registry.invalidate('uuid1')
+        self.assertEqual(None, self.registry.get_by_name('name1'))
+        self.assertEqual('dom2', self.registry.get_by_name('name2'))
+        self.registry.invalidate(name='name2')
+        self.assertEqual(None, self.registry.get_by_uuid('uuid2'))
+
+    def test_description_dropped_on_invalidation(self):
+        self.registry.add_description('uuid', 'name', 'desc',
+                                      self.registry.generation)
+        self.assertEqual('desc', self.registry.get_description('uuid'))
+        self.registry.invalidate(name='name')
+        self.assertEqual(None, self.registry.get_description('uuid'))
+
+    def test_stats_dropped_on_invalidation(self):
+        self.registry.set_stats({'name': 'stats'}, self.registry.generation)
+        self.assertEqual({'name': 'stats'}, self.registry.get_stats(10))
+        self.registry.invalidate('uuid')
+        self.assertEqual(None, self.registry.get_stats(10))
+
+    def test_stats_expire(self):
+        now = time.time()
+        self.stubs.Set(time, 'time', lambda: now)
+        self.registry.set_stats({}, self.registry.generation)
+        self.stubs.Set(time, 'time', lambda: now + 11)
+        self.assertEqual(None, self.registry.get_stats(10))
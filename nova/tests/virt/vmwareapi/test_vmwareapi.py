@@ -417,6 +417,32 @@ class VMwareAPIVMTestCase(test.TestCase):
         info = self.conn.get_info({'uuid': 'fake-uuid'})
         self._check_vm_info(info, power_state.RUNNING)
 
+    def test_get_info_reuses_listed_info(self):
+        self._create_vm()
+        self.conn.list_instances()
+        self.mox.StubOutWithMock(vm_util, 'get_vm_ref')
+        self.mox.ReplayAll()
+        info = self.conn.get_info({'uuid': 'fake-uuid'})
+        self._check_vm_info(info, power_state.RUNNING)
+
+    def test_get_info_listed_info_expires_on_task(self):
+        self._create_vm()
+        self.conn.list_instances()
+        self.conn.power_off(self.instance)
+        info = self.conn.get_info({'uuid': 'fake-uuid'})
+        self._check_vm_info(info, power_state.SHUTDOWN)
+
+    def test_get_info_listed_info_disabled(self):
+        self.flags(vmwareapi_vm_info_max_age=0)
+        self._create_vm()
+        self.conn.list_instances()
+        self.mox.StubOutWithMock(vm_util, 'get_vm_ref')
+        vm_util.get_vm_ref(mox.IgnoreArg(), mox.IgnoreArg()).AndRaise(
+                exception.InstanceNotFound(instance_id='fake-uuid'))
+        self.mox.ReplayAll()
+        self.assertRaises(exception.InstanceNotFound, self.conn.get_info,
+                          {'uuid': 'fake-uuid'})
+
     def test_destroy(self):
         self._create_vm()
         info = self.conn.get_info({'uuid': 'fake-uuid'})
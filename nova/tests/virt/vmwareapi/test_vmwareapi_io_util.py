@@ -0,0 +1,95 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import StringIO
+
+from eventlet import greenthread
+
+from nova import test
+from nova.virt.vmwareapi import io_util
+
+
+class ParallelRangeReaderTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ParallelRangeReaderTestCase, self).setUp()
+        self.data = ''.join(chr(i % 251) for i in xrange(10000))
+        self.opened = []
+        self.read_ahead = 0
+
+    def _open_range(self, offset, length):
+        self.opened.append((offset, length))
+        handle = StringIO.StringIO(self.data[offset:offset + length])
+        orig_read = handle.read
+
+        def read(size):
+            data = orig_read(size)
+            self.read_ahead += len(data)
+            return data
+        handle.read = read
+        return handle
+
+    def _read_all(self, reader):
+        chunks = []
+        while True:
+            data = reader.read(None)
+            if not data:
+                break
+            self.read_ahead -= len(data)
+            chunks.append(data)
+        return ''.join(chunks)
+
+    def test_read_in_order(self):
+        reader = io_util.ParallelRangeReader(self._open_range,
+                                             len(self.data), 1500, 100, 3, 2)
+        self.assertEqual(self.data, self._read_all(reader))
+        self.assertEqual(len(self.data), reader.transferred)
+        self.assertEqual(sorted(self.opened),
+                         [(offset, min(1500, 10000 - offset))
+                          for offset in xrange(0, 10000, 1500)])
+
+    def test_buffering_bounded(self):
+        reader = io_util.ParallelRangeReader(self._open_range,
+                                             len(self.data), 1000, 100, 3, 2)
+        greenthread.sleep(0)
+        self.read_ahead -= len(reader.read(None))
+        greenthread.sleep(0)
+        # 3 ranges in flight, each holding at most 2 queued chunks plus
+        # the one waiting to be queued
+        self.assertTrue(self.read_ahead <= 3 * 3 * 100)
+        reader.close()
+
+    def test_error_raised_to_reader(self):
+        def open_range(offset, length):
+            if offset:
+                raise IOError('boom')
+            return self._open_range(offset, length)
+
+        reader = io_util.ParallelRangeReader(open_range, len(self.data),
+                                             5000, 1000, 2, 10)
+        self.assertRaises(IOError, self._read_all, reader)
+
+    def test_short_range_raises(self):
+        reader = io_util.ParallelRangeReader(self._open_range,
+                                             len(self.data) + 10, 5000, 1000,
+                                             2, 10)
+        self.assertRaises(IOError, self._read_all, reader)
+
+    def test_empty_file(self):
+        reader = io_util.ParallelRangeReader(self._open_range, 0, 5000, 1000,
+                                             2, 10)
+        self.assertEqual('', reader.read(None))
+        self.assertEqual([], self.opened)
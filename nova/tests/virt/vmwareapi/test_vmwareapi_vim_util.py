@@ -0,0 +1,73 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova import test
+from nova.virt.vmwareapi import error_util
+from nova.virt.vmwareapi import fake
+from nova.virt.vmwareapi import vim_util
+
+
+class VMwareVIMUtilTestCase(test.TestCase):
+    def setUp(self):
+        super(VMwareVIMUtilTestCase, self).setUp()
+        fake.reset()
+        self.vim = fake.FakeVim()
+        self.vim._login()
+        for i in range(5):
+            fake._create_object('VirtualMachine', fake.VirtualMachine(
+                name='vm-%d' % i, ds=fake.Datastore()))
+
+    def tearDown(self):
+        super(VMwareVIMUtilTestCase, self).tearDown()
+        fake.reset()
+
+    def test_get_objects_paginated(self):
+        self.flags(vmwareapi_maximum_objects=2)
+        vms = vim_util.get_objects(self.vim, 'VirtualMachine',
+                                   ['name', 'runtime.powerState'])
+        self.assertEqual(sorted('vm-%d' % i for i in range(5)),
+                         sorted(vm.get('name') for vm in vms))
+        self.assertEqual('poweredOn', vms[0].get('runtime.powerState'))
+        self.assertEqual({}, self.vim._retrieve_results)
+
+    def test_get_objects_single_page(self):
+        vms = vim_util.get_objects(self.vim, 'VirtualMachine')
+        self.assertEqual(5, len(vms))
+
+    def test_get_objects_none(self):
+        fake._db_content['VirtualMachine'].clear()
+        self.assertEqual([], vim_util.get_objects(self.vim,
+                                                  'VirtualMachine'))
+
+    def test_get_properties_for_a_collection_of_objects(self):
+        self.flags(vmwareapi_maximum_objects=1)
+        vm_refs = [vm.obj for vm in fake._get_objects('VirtualMachine')[:3]]
+        vms = vim_util.get_properties_for_a_collection_of_objects(
+                self.vim, 'VirtualMachine', vm_refs, ['name'])
+        self.assertEqual(vm_refs, [vm.obj for vm in vms])
+
+    def test_retrievepropertiesex_fault_checker(self):
+        checker = error_util.FaultCheckers.retrievepropertiesex_fault_checker
+        result = fake.DataObject()
+        result.objects = fake._get_objects('VirtualMachine')
+        checker(result)
+        # NOTE: what a timed out idle session gets
+        for resp_obj in (None, []):
+            exc = self.assertRaises(error_util.VimFaultException,
+                                    checker, resp_obj)
+            self.assertEqual([error_util.FAULT_NOT_AUTHENTICATED],
+                             exc.fault_list)
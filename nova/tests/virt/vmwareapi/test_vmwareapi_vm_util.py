@@ -150,3 +150,87 @@ class VMwareVMUtilTestCase(test.TestCase):
         prop4 = vm_util.property_from_property_set('foo', results_bad)
         self.assertIsNotNone(prop4)
         self.assertEqual('bar1', prop4.val)
+
+
+class fake_vim_session(object):
+    def __init__(self):
+        self.vim = fake.FakeVim()
+        self.vim._login()
+        self.calls = []
+        self.vm_ref_index = vm_util.VMRefIndex(self)
+
+    def _call_method(self, module, method, *args, **kwargs):
+        self.calls.append(method)
+        return getattr(module, method)(self.vim, *args, **kwargs)
+
+
+class VMRefIndexTestCase(test.TestCase):
+    def setUp(self):
+        super(VMRefIndexTestCase, self).setUp()
+        fake.reset()
+        self.session = fake_vim_session()
+
+    def tearDown(self):
+        super(VMRefIndexTestCase, self).tearDown()
+        fake.reset()
+
+    def _create_vm(self, name, instance_uuid=None):
+        vm = fake.VirtualMachine(name=name, instanceUuid=instance_uuid,
+                                 ds=fake.Datastore())
+        fake._create_object('VirtualMachine', vm)
+        return vm.obj
+
+    def test_lookups(self):
+        vm_ref = self._create_vm('uuid-1', 'uuid-1')
+        old_vm_ref = self._create_vm('uuid-2')
+
+        instance = {'uuid': 'uuid-1', 'name': 'instance-1'}
+        self.assertEqual(vm_ref, vm_util.get_vm_ref(self.session, instance))
+        self.assertEqual(vm_ref,
+                         vm_util.get_vm_ref_from_name(self.session, 'uuid-1'))
+        self.assertEqual(old_vm_ref,
+                         vm_util.get_vm_ref_from_uuid(self.session, 'uuid-2'))
+        self.assertNotIn('get_objects', self.session.calls)
+
+    def test_changes_picked_up(self):
+        self.assertIsNone(vm_util.get_vm_ref_from_name(self.session, 'vm'))
+
+        vm_ref = self._create_vm('vm')
+        self.assertEqual(vm_ref,
+                         vm_util.get_vm_ref_from_name(self.session, 'vm'))
+
+        fake._db_content['VirtualMachine'][vm_ref].set('name', 'renamed')
+        self.assertIsNone(vm_util.get_vm_ref_from_name(self.session, 'vm'))
+        self.assertEqual(vm_ref,
+                         vm_util.get_vm_ref_from_name(self.session, 'renamed'))
+
+        del fake._db_content['VirtualMachine'][vm_ref]
+        self.assertIsNone(
+                vm_util.get_vm_ref_from_name(self.session, 'renamed'))
+        self.assertEqual(1, self.session.calls.count(
+                'create_property_collector'))
+
+    def test_search_by_instance_uuid_on_miss(self):
+        self.session.vm_ref_index.sync()
+        self.mox.StubOutWithMock(self.session.vm_ref_index, 'get_by_uuid')
+        self.session.vm_ref_index.get_by_uuid('uuid-1').AndReturn(None)
+        self.mox.ReplayAll()
+
+        vm_ref = self._create_vm('vm', 'uuid-1')
+        self.assertEqual(vm_ref,
+                         vm_util.get_vm_ref_from_uuid(self.session, 'uuid-1'))
+        self.assertIn('find_vms_by_instance_uuid', self.session.calls)
+
+    def test_restarts_after_collector_lost(self):
+        vm_ref = self._create_vm('vm')
+        self.assertTrue(self.session.vm_ref_index.sync())
+
+        self.session.vim._collectors.clear()
+        self.assertEqual(vm_ref,
+                         vm_util.get_vm_ref_from_name(self.session, 'vm'))
+        self.assertEqual(2, self.session.calls.count(
+                'create_property_collector'))
+
+    def test_instance_not_found(self):
+        self.assertRaises(exception.InstanceNotFound, vm_util.get_vm_ref,
+                          self.session, {'uuid': 'uuid-1', 'name': 'vm'})
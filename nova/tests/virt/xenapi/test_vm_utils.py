@@ -17,7 +17,9 @@
 
 import contextlib
 import copy
+import os
 import pkg_resources
+import StringIO
 import urlparse
 
 import fixtures
@@ -1043,3 +1045,141 @@ class GenerateEphemeralTestCase(test.TestCase):
         self.assertRaises(exception.NovaException, vm_utils.generate_ephemeral,
             self.session, self.instance, self.vm_ref,
             str(self.userdevice), self.name_label, 4030)
+
+
+class SparseCopyTestCase(test.NoDBTestCase):
+    def _write(self, path, size, chunks):
+        with open(path, 'w') as f:
+            f.truncate(size)
+            for offset, data in chunks:
+                f.seek(offset)
+                f.write(data)
+
+    def _check_copy(self, size, chunks, virtual_size=None):
+        if virtual_size is None:
+            virtual_size = size
+        with utils.tempdir() as tmpdir:
+            src_path = os.path.join(tmpdir, 'src')
+            dst_path = os.path.join(tmpdir, 'dst')
+            self._write(src_path, size, chunks)
+            self._write(dst_path, 0, [])
+            vm_utils._sparse_copy(src_path, dst_path, virtual_size)
+            with open(src_path) as src:
+                expected = src.read(virtual_size)
+            with open(dst_path) as dst:
+                self.assertEqual(expected, dst.read())
+
+    def test_copy_sparse_file(self):
+        self.flags(xenapi_sparse_copy_buffer_size=64 * 1024)
+        self._check_copy(1024 * 1024, [(0, 'a' * 10),
+                                       (4096 * 3 + 7, 'b' * 70000),
+                                       (1024 * 1024 - 5, 'c' * 5)])
+
+    def test_copy_partial(self):
+        self._check_copy(100000, [(10, 'a' * 99990)], virtual_size=50001)
+
+    def test_copy_without_seek_data(self):
+        self.stubs.Set(vm_utils, '_SEEK_DATA', -1)
+        self._check_copy(300000, [(8192, 'a' * 4096), (200000, 'b')])
+
+    def test_write_sparse_skips_empty_blocks(self):
+        data = 'a' * 10 + '\0' * 8182 + 'b' * 100
+        dst = StringIO.StringIO()
+        skipped = vm_utils._write_sparse(dst, 0, data, 4096, '\0' * 4096)
+        self.assertEqual(4096, skipped)
+        self.assertEqual(data, dst.getvalue())
+
+    def test_throttle_caps_rate(self):
+        sleeps = []
+        self.stubs.Set(vm_utils.greenthread, 'sleep', sleeps.append)
+        self.stubs.Set(vm_utils.time, 'time', lambda: 100.0)
+        throttle = vm_utils._CopyThrottle(1000, 10)
+        throttle(500)
+        self.assertEqual([0.5], sleeps)
+
+
+class FakeTopologySession(object):
+    XenAPI = fake.FakeXenAPI()
+
+    def __init__(self, records, events=None):
+        self.records = records
+        self.events = events
+        self.calls = []
+
+    def call_xenapi(self, method, *args):
+        self.calls.append(method)
+        if method == 'event.from':
+            if self.events is None:
+                raise fake.Failure(['MESSAGE_METHOD_UNKNOWN', 'event.from'])
+            if args[0] == ['pool']:
+                return {'token': '1', 'events': []}
+            events, self.events = self.events, []
+            return {'token': '2', 'events': events}
+        elif method == 'VDI.get_all_records_where':
+            return dict((ref, rec) for ref, rec in self.records.items()
+                        if rec['SR'] == 'sr')
+        elif method == 'VDI.get_record':
+            return self.records[args[0]]
+        raise AssertionError(method)
+
+
+def _vdi_rec(uuid, parent=None, sr='sr'):
+    return {'uuid': uuid, 'SR': sr, 'other_config': {},
+            'sm_config': {'vhd-parent': parent} if parent else {}}
+
+
+class SRTopologyTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(SRTopologyTestCase, self).setUp()
+        self.records = {'ref-base': _vdi_rec('base'),
+                        'ref-a': _vdi_rec('a', 'base'),
+                        'ref-b': _vdi_rec('b', 'base'),
+                        'ref-leaf': _vdi_rec('leaf', 'a'),
+                        'ref-other': _vdi_rec('other', sr='other-sr')}
+
+    def test_walk_chain_and_children(self):
+        session = FakeTopologySession(self.records)
+        topology = vm_utils.SRTopology(session, 'sr')
+
+        chain = vm_utils._walk_vdi_chain(session, 'leaf', topology)
+        self.assertEqual(['leaf', 'a', 'base'],
+                         [vdi_rec['uuid'] for vdi_rec in chain])
+        self.assertEqual(set(['a', 'b']), topology.get_children('base'))
+        self.assertEqual(set(['a', 'b']),
+                         vm_utils._child_vhds(session, 'sr', 'base', topology))
+        self.assertEqual(4, len(topology.get_all_records()))
+        self.assertEqual(1, session.calls.count('VDI.get_all_records_where'))
+
+    def test_refresh_applies_events(self):
+        session = FakeTopologySession(self.records, events=[])
+        topology = vm_utils.SRTopology(session, 'sr')
+
+        # 'a' coalesced into 'base'
+        session.events = [
+            {'class': 'VDI', 'operation': 'del', 'ref': 'ref-a'},
+            {'class': 'VDI', 'operation': 'mod', 'ref': 'ref-leaf',
+             'snapshot': _vdi_rec('leaf', 'base')}]
+        topology.refresh()
+
+        self.assertEqual(set(['b', 'leaf']), topology.get_children('base'))
+        self.assertEqual('base', topology.get_parent_uuid(
+            topology.get_record('ref-leaf')))
+        self.assertEqual(1, session.calls.count('VDI.get_all_records_where'))
+
+    def test_refresh_without_events_reloads(self):
+        session = FakeTopologySession(self.records)
+        topology = vm_utils.SRTopology(session, 'sr')
+        self.records['ref-c'] = _vdi_rec('c', 'base')
+        topology.refresh()
+
+        self.assertEqual(set(['a', 'b', 'c']), topology.get_children('base'))
+        self.assertEqual(2, session.calls.count('VDI.get_all_records_where'))
+
+    def test_wait_for_vhd_coalesce_other_child(self):
+        session = FakeTopologySession(self.records)
+        self.mox.StubOutWithMock(vm_utils, '_scan_sr')
+        self.mox.ReplayAll()
+
+        result = vm_utils._wait_for_vhd_coalesce(session, None, 'sr',
+                                                 'ref-leaf', 'base')
+        self.assertEqual(('a', 'base'), result)
@@ -47,6 +47,7 @@ from nova.openstack.common import importutils
 from nova.openstack.common import lockutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import processutils
+from nova.openstack.common.rootwrap import client as rootwrap_client
 from nova.openstack.common.rpc import common as rpc_common
 from nova.openstack.common import timeutils
 
@@ -75,6 +76,11 @@ utils_opts = [
                default="/etc/nova/rootwrap.conf",
                help='Path to the rootwrap configuration file to use for '
                     'running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run the commands needing root through a long running '
+                     'nova-rootwrap-daemon instead of starting sudo and '
+                     'nova-rootwrap for each of them'),
     cfg.StrOpt('tempdir',
                default=None,
                help='Explicitly specify the temporary working directory'),
@@ -155,15 +161,140 @@ def vpn_ping(address, port, timeout=0.05, session_id=None):
         return server_sess
 
 
+_ROOTWRAP_CLIENT = None
+
+
+def _get_rootwrap_client():
+    global _ROOTWRAP_CLIENT
+    if _ROOTWRAP_CLIENT is None:
+        _ROOTWRAP_CLIENT = rootwrap_client.Client(
+                ['sudo', 'nova-rootwrap-daemon', CONF.rootwrap_config])
+    return _ROOTWRAP_CLIENT
+
+
+def _use_rootwrap_daemon(kwargs):
+    return (CONF.use_rootwrap_daemon and kwargs.get('run_as_root') and
+            'root_helper' not in kwargs and not kwargs.get('shell') and
+            os.geteuid() != 0)
+
+
+def _check_daemon_result(cmd, result, check_exit_code):
+    returncode, stdout, stderr = result
+    ignore_exit_code = False
+    if isinstance(check_exit_code, bool):
+        ignore_exit_code = not check_exit_code
+        check_exit_code = [0]
+    elif isinstance(check_exit_code, int):
+        check_exit_code = [check_exit_code]
+    if returncode:
+        LOG.debug(_('Result was %s') % returncode)
+        if not ignore_exit_code and returncode not in check_exit_code:
+            raise processutils.ProcessExecutionError(exit_code=returncode,
+                                                     stdout=stdout,
+                                                     stderr=stderr,
+                                                     cmd=' '.join(cmd))
+    return stdout, stderr
+
+
+def _daemon_run(commands):
+    """Run (cmd, process_input) pairs through the rootwrap daemon."""
+    try:
+        return _get_rootwrap_client().execute(commands)
+    except rootwrap_client.DaemonError as exc:
+        raise processutils.ProcessExecutionError(
+                description=_('Lost the rootwrap daemon: %s') % exc,
+                cmd='; '.join(' '.join(cmd) for cmd, _input in commands))
+
+
+def _daemon_execute(*cmd, **kwargs):
+    """processutils.execute() through the rootwrap daemon."""
+    process_input = kwargs.pop('process_input', None)
+    check_exit_code = kwargs.pop('check_exit_code', [0])
+    delay_on_retry = kwargs.pop('delay_on_retry', True)
+    attempts = kwargs.pop('attempts', 1)
+    kwargs.pop('run_as_root')
+    kwargs.pop('shell', None)
+    if kwargs:
+        raise processutils.UnknownArgumentError(
+                _('Got unknown keyword args to utils.execute: %r') % kwargs)
+
+    cmd = map(str, cmd)
+    while True:
+        attempts -= 1
+        LOG.debug(_('Running cmd (rootwrap daemon): %s'), ' '.join(cmd))
+        try:
+            result = _daemon_run([(cmd, process_input)])[0]
+            return _check_daemon_result(cmd, result, check_exit_code)
+        except processutils.ProcessExecutionError:
+            if attempts <= 0:
+                raise
+            LOG.debug(_('%r failed. Retrying.'), cmd)
+            if delay_on_retry:
+                eventlet.sleep(random.randint(20, 200) / 100.0)
+
+
 def execute(*cmd, **kwargs):
-    """Convenience wrapper around oslo's execute() method."""
+    """Convenience wrapper around oslo's execute() method.
+
+    Commands run as root go through nova-rootwrap-daemon when
+    use_rootwrap_daemon is set, or sudo nova-rootwrap if it is not or the
+    daemon cannot be started.
+    """
+    if _use_rootwrap_daemon(kwargs):
+        try:
+            return _daemon_execute(*cmd, **kwargs)
+        except rootwrap_client.DaemonUnavailable as exc:
+            LOG.warn(_('Rootwrap daemon unavailable, using sudo: %s'), exc)
     if 'run_as_root' in kwargs and not 'root_helper' in kwargs:
         kwargs['root_helper'] = 'sudo nova-rootwrap %s' % CONF.rootwrap_config
     return processutils.execute(*cmd, **kwargs)
 
 
+def execute_root_batch(cmds, check_exit_code=[0]):
+    """Run independent commands as root and return their (out, err).
+
+    With the rootwrap daemon the commands are sent at once and run
+    concurrently, otherwise they are run one after the other.  All the
+    commands are run even if some fail; a ProcessExecutionError is raised
+    for the first one which failed.
+    """
+    cmds = [map(str, cmd) for cmd in cmds]
+    if _use_rootwrap_daemon({'run_as_root': True}):
+        try:
+            results = _daemon_run([(cmd, None) for cmd in cmds])
+        except rootwrap_client.DaemonUnavailable as exc:
+            LOG.warn(_('Rootwrap daemon unavailable, using sudo: %s'), exc)
+        else:
+            return [_check_daemon_result(cmd, result, check_exit_code)
+                    for cmd, result in zip(cmds, results)]
+
+    outputs = []
+    error = None
+    for cmd in cmds:
+        try:
+            outputs.append(execute(*cmd, run_as_root=True,
+                                   check_exit_code=check_exit_code))
+        except processutils.ProcessExecutionError as exc:
+            error = error or exc
+    if error:
+        raise error
+    return outputs
+
+
 def trycmd(*args, **kwargs):
     """Convenience wrapper around oslo's trycmd() method."""
+    if _use_rootwrap_daemon(kwargs):
+        # NOTE: processutils.trycmd() would not go through the daemon
+        discard_warnings = kwargs.pop('discard_warnings', False)
+        try:
+            out, err = execute(*args, **kwargs)
+            failed = False
+        except processutils.ProcessExecutionError as exn:
+            out, err = '', str(exn)
+            failed = True
+        if not failed and discard_warnings and err:
+            err = ''
+        return out, err
     if 'run_as_root' in kwargs and not 'root_helper' in kwargs:
         kwargs['root_helper'] = 'sudo nova-rootwrap %s' % CONF.rootwrap_config
     return processutils.trycmd(*args, **kwargs)
@@ -52,6 +52,7 @@ class BareMetalNode(BASE, models.NovaBase):
     deploy_key = Column(String(255), nullable=True)
     root_mb = Column(Integer)
     swap_mb = Column(Integer)
+    deploy_progress = Column(Integer, nullable=True)
 
 
 class BareMetalInterface(BASE, models.NovaBase):
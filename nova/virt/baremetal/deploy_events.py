@@ -0,0 +1,107 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Notifications of the deploy state changes of bare-metal nodes.
+
+nova-baremetal-deploy-helper casts the new task_state of the nodes it
+deploys to every bare-metal compute service, where the greenthreads waiting
+for the deployment of those nodes are woken up instead of polling the
+database.
+"""
+
+import collections
+import contextlib
+
+from eventlet import queue
+
+from nova.openstack.common import rpc
+from nova.openstack.common.rpc import dispatcher as rpc_dispatcher
+from nova.openstack.common.rpc import proxy as rpc_proxy
+
+TOPIC = 'baremetal_deploy'
+
+
+class DeployEventAPI(rpc_proxy.RpcProxy):
+    """Client side of the deploy state notifications.
+
+    API version history:
+
+        1.0 - Initial version.
+    """
+
+    BASE_RPC_API_VERSION = '1.0'
+
+    def __init__(self):
+        super(DeployEventAPI, self).__init__(
+                topic=TOPIC,
+                default_version=self.BASE_RPC_API_VERSION)
+
+    def deploy_state_changed(self, ctxt, node_id, task_state):
+        self.fanout_cast(ctxt, self.make_msg('deploy_state_changed',
+                                             node_id=node_id,
+                                             task_state=task_state))
+
+
+class DeployWaiter(object):
+    """Receives the notifications and hands them to the waiting threads."""
+
+    RPC_API_VERSION = '1.0'
+
+    def __init__(self):
+        self._queues = collections.defaultdict(list)
+        self._conn = None
+
+    def _start(self):
+        if self._conn is None:
+            self._conn = rpc.create_connection(new=True)
+            dispatcher = rpc_dispatcher.RpcDispatcher([self])
+            self._conn.create_consumer(TOPIC, dispatcher, fanout=True)
+            self._conn.consume_in_thread()
+
+    @contextlib.contextmanager
+    def watch(self, node_id):
+        """Yield a queue receiving the new task_states of a node.
+
+        Notifications sent before watch() is entered are not received.
+        """
+        self._start()
+        node_id = str(node_id)
+        states = queue.LightQueue()
+        self._queues[node_id].append(states)
+        try:
+            yield states
+        finally:
+            self._queues[node_id].remove(states)
+            if not self._queues[node_id]:
+                del self._queues[node_id]
+
+    def deploy_state_changed(self, context, node_id, task_state):
+        # NOTE: the deploy helper gets the node id as a string
+        for states in self._queues.get(str(node_id), []):
+            states.put(task_state)
+
+
+_WAITER = None
+
+
+def get_waiter():
+    """Return the DeployWaiter of this process."""
+    global _WAITER
+    if _WAITER is None:
+        _WAITER = DeployWaiter()
+    return _WAITER
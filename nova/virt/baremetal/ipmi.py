@@ -23,13 +23,18 @@ Baremetal IPMI power manager.
 
 import os
 import stat
+import sys
 import tempfile
+import time
 
+import eventlet
+from eventlet import event
+from eventlet import greenpool
+from eventlet import queue
 from oslo.config import cfg
 
 from nova import exception
 from nova.openstack.common import log as logging
-from nova.openstack.common import loopingcall
 from nova import paths
 from nova import utils
 from nova.virt.baremetal import baremetal_states
@@ -49,6 +54,10 @@ opts = [
     cfg.IntOpt('ipmi_power_retry',
                default=5,
                help='maximal number of retries for IPMI operations'),
+    cfg.IntOpt('ipmi_power_check_concurrency',
+               default=16,
+               help='maximal number of nodes whose power state is checked '
+                    'at the same time while waiting for power changes'),
     ]
 
 baremetal_group = cfg.OptGroup(name='baremetal',
@@ -60,6 +69,11 @@ CONF.register_opts(opts, baremetal_group)
 
 LOG = logging.getLogger(__name__)
 
+# The power state of a node is checked again after this many seconds,
+# doubling up to POWER_CHECK_MAX_INTERVAL for as long as it did not change.
+POWER_CHECK_INTERVAL = 0.5
+POWER_CHECK_MAX_INTERVAL = 4
+
 
 def _make_password_file(password):
     fd, path = tempfile.mkstemp()
@@ -87,6 +101,98 @@ def _get_console_pid(node_id):
     return None
 
 
+class _PowerChange(object):
+    """A node whose power is being turned on or off."""
+
+    def __init__(self, ipmi, power_on):
+        self.ipmi = ipmi
+        self.power_on = power_on
+        self.command = 'power on' if power_on else 'power off'
+        self.interval = POWER_CHECK_INTERVAL
+        self.next_check = 0
+        self.done = event.Event()
+
+    def check(self):
+        """Check the power state and ask again for the change if needed."""
+        ipmi = self.ipmi
+        try:
+            if ipmi.is_power_on() is self.power_on:
+                if self.power_on:
+                    ipmi.state = baremetal_states.ACTIVE
+                else:
+                    ipmi.state = baremetal_states.DELETED
+                self.done.send()
+                return
+            if ipmi.retries > CONF.baremetal.ipmi_power_retry:
+                ipmi.state = baremetal_states.ERROR
+                self.done.send()
+                return
+            try:
+                ipmi.retries += 1
+                ipmi._exec_ipmitool(self.command)
+            except Exception:
+                LOG.exception(_("IPMI %s failed"), self.command)
+        except Exception:
+            self.done.send_exception(*sys.exc_info())
+            return
+        self.next_check = time.time() + self.interval
+        self.interval = min(self.interval * 2, POWER_CHECK_MAX_INTERVAL)
+
+
+class PowerSweeper(object):
+    """Checks the nodes waiting for a power change in a single loop.
+
+    Instead of every node polling ipmitool on its own timer, one
+    greenthread checks all the nodes which are due at once, at most
+    ipmi_power_check_concurrency at the same time, and backs off
+    exponentially for each node whose power did not change yet.
+    """
+
+    def __init__(self):
+        self._changes = []
+        self._wakeup = queue.LightQueue()
+        self._thread = None
+
+    def wait(self, ipmi, power_on):
+        """Wait until the power of a node is on or off, or retries ran out.
+
+        ipmi.state is set to the resulting state.
+        """
+        change = _PowerChange(ipmi, power_on)
+        self._changes.append(change)
+        self._wakeup.put(None)
+        if self._thread is None:
+            self._thread = eventlet.spawn(self._run)
+        change.done.wait()
+
+    def _run(self):
+        pool = greenpool.GreenPool(CONF.baremetal.ipmi_power_check_concurrency)
+        try:
+            while True:
+                now = time.time()
+                for change in self._changes:
+                    if change.next_check <= now:
+                        pool.spawn_n(change.check)
+                pool.waitall()
+
+                self._changes = [change for change in self._changes
+                                 if not change.done.ready()]
+                if not self._changes:
+                    break
+                delay = (min(change.next_check for change in self._changes)
+                         - time.time())
+                try:
+                    # Woken up early when another node starts waiting
+                    self._wakeup.get(timeout=max(delay, 0))
+                except queue.Empty:
+                    pass
+        finally:
+            self._thread = None
+
+
+_SWEEPER = PowerSweeper()
+
+
 class IPMI(base.PowerManager):
     """IPMI Power Driver for Baremetal Nova Compute
 
@@ -140,47 +246,13 @@ class IPMI(base.PowerManager):
 
     def _power_on(self):
         """Turn the power to this node ON."""
-
-        def _wait_for_power_on():
-            """Called at an interval until the node's power is on."""
-
-            if self.is_power_on():
-                self.state = baremetal_states.ACTIVE
-                raise loopingcall.LoopingCallDone()
-            if self.retries > CONF.baremetal.ipmi_power_retry:
-                self.state = baremetal_states.ERROR
-                raise loopingcall.LoopingCallDone()
-            try:
-                self.retries += 1
-                self._exec_ipmitool("power on")
-            except Exception:
-                LOG.exception(_("IPMI power on failed"))
-
         self.retries = 0
-        timer = loopingcall.FixedIntervalLoopingCall(_wait_for_power_on)
-        timer.start(interval=0.5).wait()
+        _SWEEPER.wait(self, True)
 
     def _power_off(self):
         """Turn the power to this node OFF."""
-
-        def _wait_for_power_off():
-            """Called at an interval until the node's power is off."""
-
-            if self.is_power_on() is False:
-                self.state = baremetal_states.DELETED
-                raise loopingcall.LoopingCallDone()
-            if self.retries > CONF.baremetal.ipmi_power_retry:
-                self.state = baremetal_states.ERROR
-                raise loopingcall.LoopingCallDone()
-            try:
-                self.retries += 1
-                self._exec_ipmitool("power off")
-            except Exception:
-                LOG.exception(_("IPMI power off failed"))
-
         self.retries = 0
-        timer = loopingcall.FixedIntervalLoopingCall(_wait_for_power_off)
-        timer.start(interval=0.5).wait()
+        _SWEEPER.wait(self, False)
 
     def _set_pxe_for_next_boot(self):
         try:
@@ -191,9 +263,8 @@ class IPMI(base.PowerManager):
     def activate_node(self):
         """Turns the power to node ON.
 
-        Sets node next-boot to PXE and turns the power on,
-        waiting up to ipmi_power_retry/2 seconds for confirmation
-        that the power is on.
+        Sets node next-boot to PXE and turns the power on, asking up to
+        ipmi_power_retry times until the power is confirmed to be on.
 
         :returns: One of baremetal_states.py, representing the new state.
         """
@@ -208,8 +279,8 @@ class IPMI(base.PowerManager):
         """Cycles the power to a node.
 
         Turns the power off, sets next-boot to PXE, and turns the power on.
-        Each action waits up to ipmi_power_retry/2 seconds for confirmation
-        that the power state has changed.
+        Each action is asked up to ipmi_power_retry times until the power
+        state is confirmed to have changed.
 
         :returns: One of baremetal_states.py, representing the new state.
         """
@@ -221,8 +292,8 @@ class IPMI(base.PowerManager):
     def deactivate_node(self):
         """Turns the power to node OFF.
 
-        Turns the power off, and waits up to ipmi_power_retry/2 seconds
-        for confirmation that the power is off.
+        Turns the power off, asking up to ipmi_power_retry times until the
+        power is confirmed to be off.
 
         :returns: One of baremetal_states.py, representing the new state.
         """
@@ -23,6 +23,7 @@ Class for PXE bare-metal nodes.
 import datetime
 import os
 
+from eventlet import queue
 from oslo.config import cfg
 
 from nova.compute import flavors
@@ -30,11 +31,11 @@ from nova import exception
 from nova.openstack.common.db import exception as db_exc
 from nova.openstack.common import fileutils
 from nova.openstack.common import log as logging
-from nova.openstack.common import loopingcall
 from nova.openstack.common import timeutils
 from nova.virt.baremetal import baremetal_states
 from nova.virt.baremetal import base
 from nova.virt.baremetal import db
+from nova.virt.baremetal import deploy_events
 from nova.virt.baremetal import utils as bm_utils
 
 pxe_opts = [
@@ -54,6 +55,11 @@ pxe_opts = [
     cfg.IntOpt('pxe_deploy_timeout',
                 help='Timeout for PXE deployments. Default: 0 (unlimited)',
                 default=0),
+    cfg.IntOpt('pxe_deploy_poll_interval',
+                help='Seconds between checks of the deploy state of a node '
+                     'in the database, in case a notification from the '
+                     'deploy helper was lost',
+                default=60),
     cfg.BoolOpt('pxe_network_config',
                 help='If set, pass the network configuration details to the '
                 'initramfs via cmdline.',
@@ -445,51 +451,61 @@ class PXE(base.NodeDriver):
                 os.path.join(CONF.baremetal.tftp_root, instance['uuid']))
 
     def activate_node(self, context, node, instance):
-        """Wait for PXE deployment to complete."""
+        """Wait for PXE deployment to complete.
 
-        locals = {'error': '', 'started': False}
-
-        def _wait_for_deploy():
-            """Called at an interval until the deployment completes."""
-            try:
-                row = db.bm_node_get(context, node['id'])
+        The node is read from the database whenever the deploy helper
+        announces a new state for it, and every pxe_deploy_poll_interval
+        seconds in case an announcement was lost.
+        """
+        expiration = timeutils.utcnow() + datetime.timedelta(
+                            seconds=CONF.baremetal.pxe_deploy_timeout)
+        waiter = deploy_events.get_waiter()
+        started = False
+        error = None
+
+        with waiter.watch(node['id']) as states:
+            while True:
+                try:
+                    row = db.bm_node_get(context, node['id'])
+                except exception.NodeNotFound:
+                    error = _("Baremetal node deleted while waiting "
+                              "for deployment of instance %s")
+                    break
                 if instance['uuid'] != row.get('instance_uuid'):
-                    locals['error'] = _("Node associated with another instance"
-                                        " while waiting for deploy of %s")
-                    raise loopingcall.LoopingCallDone()
+                    error = _("Node associated with another instance"
+                              " while waiting for deploy of %s")
+                    break
 
                 status = row.get('task_state')
-                if (status == baremetal_states.DEPLOYING
-                        and locals['started'] == False):
+                if status == baremetal_states.DEPLOYING and not started:
                     LOG.info(_("PXE deploy started for instance %s")
                                 % instance['uuid'])
-                    locals['started'] = True
+                    started = True
                 elif status in (baremetal_states.DEPLOYDONE,
                                 baremetal_states.ACTIVE):
                     LOG.info(_("PXE deploy completed for instance %s")
                                 % instance['uuid'])
-                    raise loopingcall.LoopingCallDone()
+                    break
                 elif status == baremetal_states.DEPLOYFAIL:
-                    locals['error'] = _("PXE deploy failed for instance %s")
-            except exception.NodeNotFound:
-                locals['error'] = _("Baremetal node deleted while waiting "
-                                    "for deployment of instance %s")
-
-            if (CONF.baremetal.pxe_deploy_timeout and
-                    timeutils.utcnow() > expiration):
-                locals['error'] = _("Timeout reached while waiting for "
-                                     "PXE deploy of instance %s")
-            if locals['error']:
-                raise loopingcall.LoopingCallDone()
-
-        expiration = timeutils.utcnow() + datetime.timedelta(
-                            seconds=CONF.baremetal.pxe_deploy_timeout)
-        timer = loopingcall.FixedIntervalLoopingCall(_wait_for_deploy)
-        timer.start(interval=1).wait()
-
-        if locals['error']:
-            raise exception.InstanceDeployFailure(
-                    locals['error'] % instance['uuid'])
+                    error = _("PXE deploy failed for instance %s")
+                    break
+
+                timeout = CONF.baremetal.pxe_deploy_poll_interval
+                if CONF.baremetal.pxe_deploy_timeout:
+                    remaining = timeutils.delta_seconds(timeutils.utcnow(),
+                                                        expiration)
+                    if remaining <= 0:
+                        error = _("Timeout reached while waiting for "
+                                  "PXE deploy of instance %s")
+                        break
+                    timeout = min(timeout, remaining)
+                try:
+                    states.get(timeout=timeout)
+                except queue.Empty:
+                    pass
+
+        if error:
+            raise exception.InstanceDeployFailure(error % instance['uuid'])
 
     def deactivate_node(self, context, node, instance):
         pass
@@ -0,0 +1,174 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Registry of libvirt domain handles, parsed descriptions and stats.
+
+While the driver receives domain lifecycle events, a handle looked up by
+name stays valid until an event for that domain arrives, and the stats of
+all the domains can be collected once and shared by the periodic tasks
+instead of each of them querying every domain again.  The same goes for
+the devices parsed from a domain's XML description, which the driver also
+invalidates whenever it defines the domain or attaches or detaches devices.
+
+invalidate() is called from the native libvirt event thread, where green
+locks cannot be used, so the registry is guarded by a native lock.  It is
+only held for a few dict operations, never across a libvirt call.
+"""
+
+import collections
+import itertools
+import time
+
+from eventlet import patcher
+from lxml import etree
+
+native_threading = patcher.original("threading")
+
+
+DomainStats = collections.namedtuple('DomainStats',
+                                     ['id', 'name', 'uuid', 'state',
+                                      'max_mem', 'mem', 'num_cpu',
+                                      'cpu_time'])
+
+DiskDescription = collections.namedtuple('DiskDescription',
+                                         ['type', 'driver_type',
+                                          'source_file', 'source_dev',
+                                          'target_dev'])
+
+
+class DomainDescription(object):
+    """Devices of a domain, parsed once from its XML description."""
+
+    def __init__(self, xml):
+        doc = etree.fromstring(xml)
+
+        self.disks = []
+        for node in doc.findall('./devices/disk'):
+            driver = node.find('driver')
+            source = node.find('source')
+            target = node.find('target')
+            self.disks.append(DiskDescription(
+                type=node.get('type'),
+                driver_type=driver.get('type') if driver is not None else None,
+                source_file=source.get('file') if source is not None else None,
+                source_dev=source.get('dev') if source is not None else None,
+                target_dev=target.get('dev') if target is not None else None))
+
+        self.interfaces = [target.get('dev') for target in
+                           doc.findall('./devices/interface/target')
+                           if target.get('dev')]
+
+
+class DomainRegistry(object):
+    """Domain handles keyed by UUID and name, and a shared stats snapshot.
+
+    Every invalidation bumps the generation.  Handles and snapshots are only
+    stored if the generation did not change while they were being looked up,
+    so a lookup racing with an event never stores stale data.  The check and
+    the store are made under the lock invalidate() takes, so an event cannot
+    land in between.
+    """
+
+    def __init__(self):
+        self._lock = native_threading.Lock()
+        self.enabled = False
+        self.generation = 0
+        self._generations = itertools.count(1)
+        self._domains = {}
+        self._uuids = {}
+        self._descriptions = {}
+        self._stats = None
+
+    def enable(self, enabled=True):
+        """Start or stop caching, dropping everything cached so far."""
+        self.enabled = enabled
+        self.invalidate()
+
+    def get_by_uuid(self, uuid):
+        if not self.enabled:
+            return None
+        return self._domains.get(uuid)
+
+    def get_by_name(self, name):
+        if not self.enabled:
+            return None
+        uuid = self._uuids.get(name)
+        if uuid is None:
+            return None
+        return self._domains.get(uuid)
+
+    def add(self, uuid, name, domain, generation):
+        """Remember a handle looked up at the given generation."""
+        with self._lock:
+            if self.enabled and generation == self.generation:
+                self._uuids[name] = uuid
+                self._domains[uuid] = domain
+
+    def get_description(self, uuid):
+        if not self.enabled:
+            return None
+        return self._descriptions.get(uuid)
+
+    def add_description(self, uuid, name, description, generation):
+        """Remember a description fetched at the given generation."""
+        with self._lock:
+            if self.enabled and generation == self.generation:
+                self._uuids[name] = uuid
+                self._descriptions[uuid] = description
+
+    def get_stats(self, max_age):
+        """Return the stats snapshot, or None if it is missing or stale.
+
+        :param max_age: seconds after which a snapshot is not used even if
+                        no event invalidated it
+        """
+        snapshot = self._stats
+        if not self.enabled or snapshot is None:
+            return None
+        generation, taken_at, stats = snapshot
+        if (generation != self.generation or
+                time.time() - taken_at > max_age):
+            return None
+        return stats
+
+    def set_stats(self, stats, generation):
+        """Share a snapshot collected at the given generation."""
+        with self._lock:
+            if self.enabled and generation == self.generation:
+                self._stats = (generation, time.time(), stats)
+
+    def invalidate(self, uuid=None, name=None):
+        """Forget the handle and description of a domain.
+
+        The domain is given by UUID or by name; without either, all the
+        domains are forgotten.  The stats snapshot is always dropped.
+        """
+        with self._lock:
+            self.generation = next(self._generations)
+            self._stats = None
+            if name is not None:
+                uuid = self._uuids.pop(name, None)
+                if uuid is None:
+                    return
+            if uuid is not None:
+                self._domains.pop(uuid, None)
+                self._descriptions.pop(uuid, None)
+            else:
+                self._domains = {}
+                self._uuids = {}
+                self._descriptions = {}
@@ -88,6 +88,7 @@ from nova.virt import event as virtevent
 from nova.virt import firewall
 from nova.virt.libvirt import blockinfo
 from nova.virt.libvirt import config as vconfig
+from nova.virt.libvirt import domains
 from nova.virt.libvirt import firewall as libvirt_firewall
 from nova.virt.libvirt import imagebackend
 from nova.virt.libvirt import imagecache
@@ -216,6 +217,11 @@ libvirt_opts = [
                 default=None,
                 help='Which pcpus can be used by vcpus of instance '
                      'e.g: "4-12,^8,15"'),
+    cfg.IntOpt('libvirt_domain_stats_max_age',
+               default=10,
+               help='Number of seconds the stats collected from all the '
+                    'domains in one pass are shared between periodic tasks. '
+                    'Only used while libvirt lifecycle events are received'),
     ]
 
 CONF = cfg.CONF
@@ -316,6 +322,8 @@ class LibvirtDriver(driver.ComputeDriver):
         self._fc_wwpns = None
         self._wrapped_conn = None
         self._wrapped_conn_lock = threading.Lock()
+        self._domains = domains.DomainRegistry()
+        self._domain_events = False
         self._caps = None
         self._vcpu_total = 0
         self.read_only = read_only
@@ -451,6 +459,8 @@ class LibvirtDriver(driver.ComputeDriver):
         self = opaque
 
         uuid = dom.UUIDString()
+        self._domains.invalidate(uuid)
+
         transition = None
         if event == libvirt.VIR_DOMAIN_EVENT_STOPPED:
             transition = virtevent.EVENT_LIFECYCLE_STOPPED
@@ -554,6 +564,8 @@ class LibvirtDriver(driver.ComputeDriver):
         LOG.debug("Starting green dispatch thread")
         eventlet.spawn(self._dispatch_thread)
 
+        self._domains.enable(self._domain_events)
+
     def init_host(self, host):
         if not self.has_min_version(MIN_LIBVIRT_VERSION):
             major = MIN_LIBVIRT_VERSION[0]
@@ -583,6 +595,10 @@ class LibvirtDriver(driver.ComputeDriver):
             with self._wrapped_conn_lock:
                 self._wrapped_conn = wrapped_conn
 
+            # Handles from a previous connection must not be reused, and
+            # only lifecycle events keep the domain registry accurate.
+            self._domain_events = False
+            self._domains.enable(False)
             try:
                 LOG.debug("Registering for lifecycle events %s" % str(self))
                 wrapped_conn.domainEventRegisterAny(
@@ -590,9 +606,12 @@ class LibvirtDriver(driver.ComputeDriver):
                     libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
                     self._event_lifecycle_callback,
                     self)
+                self._domain_events = True
             except Exception:
                 LOG.warn(_("URI %s does not support events"),
                          self.uri())
+            self._domains.enable(self._domain_events and
+                                 self._event_queue is not None)
 
             if self.has_min_version(MIN_LIBVIRT_CLOSE_CALLBACK_VERSION):
                 try:
@@ -613,6 +632,8 @@ class LibvirtDriver(driver.ComputeDriver):
             if conn == self._wrapped_conn:
                 LOG.info(_("Connection to libvirt lost: %s") % reason)
                 self._wrapped_conn = None
+                self._domain_events = False
+                self._domains.enable(False)
 
     @staticmethod
     def _test_connection(conn):
@@ -680,6 +701,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
     def get_num_instances(self):
         """Efficient override of base instance_exists method."""
+        if self._domains.enabled:
+            return len([stats for stats in self._get_domain_stats().values()
+                        if stats.id >= 0])
         return self._conn.numOfDomains()
 
     def instance_exists(self, instance_name):
@@ -700,6 +724,10 @@ class LibvirtDriver(driver.ComputeDriver):
         return self._conn.listDomainsID()
 
     def list_instances(self):
+        if self._domains.enabled:
+            return [stats.name for stats in self._get_domain_stats().values()
+                    if stats.id != 0]
+
         names = []
         for domain_id in self.list_instance_ids():
             try:
@@ -718,6 +746,10 @@ class LibvirtDriver(driver.ComputeDriver):
         return names
 
     def list_instance_uuids(self):
+        if self._domains.enabled:
+            return [stats.uuid for stats in self._get_domain_stats().values()
+                    if stats.id != 0]
+
         uuids = set()
         for domain_id in self.list_instance_ids():
             try:
@@ -785,6 +817,8 @@ class LibvirtDriver(driver.ComputeDriver):
                                     'Code=%(errcode)s Error=%(e)s'),
                                   {'errcode': errcode, 'e': e},
                                   instance=instance)
+            finally:
+                self._domains.invalidate(name=instance['name'])
 
         def _wait_for_destroy(expected_domid):
             """Called at an interval until the VM is gone."""
@@ -860,6 +894,8 @@ class LibvirtDriver(driver.ComputeDriver):
                     LOG.error(_('Error from libvirt during undefine. '
                                 'Code=%(errcode)s Error=%(e)s') %
                               {'errcode': errcode, 'e': e}, instance=instance)
+            finally:
+                self._domains.invalidate(name=instance['name'])
 
     def _cleanup(self, instance, network_info, block_device_info,
                  destroy_disks):
@@ -1030,6 +1066,7 @@ class LibvirtDriver(driver.ComputeDriver):
             if state == power_state.RUNNING:
                 flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
             virt_dom.attachDeviceFlags(conf.to_xml(), flags)
+            self._domains.invalidate(name=instance_name)
         except Exception as ex:
             if isinstance(ex, libvirt.libvirtError):
                 errcode = ex.get_error_code()
@@ -1088,6 +1125,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 if state == power_state.RUNNING:
                     flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
                 virt_dom.detachDeviceFlags(xml, flags)
+                self._domains.invalidate(name=instance_name)
         except libvirt.libvirtError as ex:
             # NOTE(vish): This is called to cleanup volumes after live
             #             migration, so we should still disconnect even if
@@ -1118,6 +1156,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 if state == power_state.RUNNING:
                     flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
                 virt_dom.attachDeviceFlags(cfg.to_xml(), flags)
+                self._domains.invalidate(name=instance['name'])
             except libvirt.libvirtError:
                 LOG.error(_('attaching network adapter failed.'),
                          instance=instance)
@@ -1136,6 +1175,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 if state == power_state.RUNNING:
                     flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
                 virt_dom.detachDeviceFlags(cfg.to_xml(), flags)
+                self._domains.invalidate(name=instance['name'])
             except libvirt.libvirtError as ex:
                 error_code = ex.get_error_code()
                 if error_code == libvirt.VIR_ERR_NO_DOMAIN:
@@ -1235,6 +1275,7 @@ class LibvirtDriver(driver.ComputeDriver):
         if CONF.libvirt_type != 'lxc' and not live_snapshot:
             if state == power_state.RUNNING or state == power_state.PAUSED:
                 virt_dom.managedSave(0)
+                self._domains.invalidate(name=instance['name'])
 
         snapshot_backend = self.image_backend.snapshot(disk_path,
                 snapshot_name,
@@ -1260,6 +1301,7 @@ class LibvirtDriver(driver.ComputeDriver):
                     utils.execute('chmod', '777', tmpdir, run_as_root=True)
                     self._live_snapshot(virt_dom, disk_path, out_path,
                                         image_format)
+                    self._domains.invalidate(name=instance['name'])
                 else:
                     snapshot_backend.snapshot_extract(out_path, image_format)
             finally:
@@ -1379,6 +1421,7 @@ class LibvirtDriver(driver.ComputeDriver):
         #             is already shutdown.
         if state == power_state.RUNNING:
             dom.shutdown()
+            self._domains.invalidate(name=instance['name'])
         # NOTE(vish): This actually could take slighty longer than the
         #             FLAG defines depending on how long the get_info
         #             call takes to return.
@@ -1461,11 +1504,13 @@ class LibvirtDriver(driver.ComputeDriver):
         """Pause VM instance."""
         dom = self._lookup_by_name(instance['name'])
         dom.suspend()
+        self._domains.invalidate(name=instance['name'])
 
     def unpause(self, instance):
         """Unpause paused VM instance."""
         dom = self._lookup_by_name(instance['name'])
         dom.resume()
+        self._domains.invalidate(name=instance['name'])
 
     def power_off(self, instance):
         """Power off the specified instance."""
@@ -1483,6 +1528,7 @@ class LibvirtDriver(driver.ComputeDriver):
         """Suspend the specified instance."""
         dom = self._lookup_by_name(instance['name'])
         dom.managedSave(0)
+        self._domains.invalidate(name=instance['name'])
 
     def resume(self, instance, network_info, block_device_info=None):
         """resume the specified instance."""
@@ -2456,9 +2502,17 @@ class LibvirtDriver(driver.ComputeDriver):
         All libvirt error handling should be handled in this method and
         relevant nova exceptions should be raised in response.
 
+        Handles are kept in the domain registry until a lifecycle event
+        or a change made by this driver invalidates them.
+
         """
+        virt_dom = self._domains.get_by_name(instance_name)
+        if virt_dom is not None:
+            return virt_dom
+
+        generation = self._domains.generation
         try:
-            return self._conn.lookupByName(instance_name)
+            virt_dom = self._conn.lookupByName(instance_name)
         except libvirt.libvirtError as ex:
             error_code = ex.get_error_code()
             if error_code == libvirt.VIR_ERR_NO_DOMAIN:
@@ -2471,6 +2525,82 @@ class LibvirtDriver(driver.ComputeDriver):
                     'ex': ex})
             raise exception.NovaException(msg)
 
+        if self._domains.enabled:
+            self._domains.add(virt_dom.UUIDString(), instance_name, virt_dom,
+                              generation)
+        return virt_dom
+
+    def _get_domain_stats(self):
+        """Return a dict of domain name to DomainStats for all domains.
+
+        The stats are collected in one pass over the running and defined
+        domains.  While lifecycle events are received, the snapshot is
+        shared by the callers until an event or a change made by this driver
+        invalidates it, or it gets older than libvirt_domain_stats_max_age.
+
+        """
+        stats = self._domains.get_stats(CONF.libvirt_domain_stats_max_age)
+        if stats is not None:
+            return stats
+
+        generation = self._domains.generation
+        stats = {}
+        for domain_id in self.list_instance_ids():
+            try:
+                virt_dom = self._lookup_by_id(domain_id)
+                info = virt_dom.info()
+            except exception.InstanceNotFound:
+                # Ignore domains which went away while listing
+                continue
+            except libvirt.libvirtError as ex:
+                if ex.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
+                continue
+            name = virt_dom.name()
+            dom_uuid = virt_dom.UUIDString()
+            self._domains.add(dom_uuid, name, virt_dom, generation)
+            stats[name] = domains.DomainStats(domain_id, name, dom_uuid,
+                                              *info)
+            greenthread.sleep(0)
+
+        for name in self._conn.listDefinedDomains():
+            if name in stats:
+                continue
+            try:
+                virt_dom = self._lookup_by_name(name)
+                info = virt_dom.info()
+            except exception.InstanceNotFound:
+                continue
+            except libvirt.libvirtError as ex:
+                if ex.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
+                continue
+            stats[name] = domains.DomainStats(-1, name, virt_dom.UUIDString(),
+                                              *info)
+            greenthread.sleep(0)
+
+        self._domains.set_stats(stats, generation)
+        return stats
+
+    def _get_domain_description(self, virt_dom):
+        """Return the DomainDescription parsed from a domain's XML.
+
+        While lifecycle events are received, the description is parsed
+        once and reused until the domain changes.
+
+        """
+        if not self._domains.enabled:
+            return domains.DomainDescription(virt_dom.XMLDesc(0))
+
+        dom_uuid = virt_dom.UUIDString()
+        description = self._domains.get_description(dom_uuid)
+        if description is None:
+            generation = self._domains.generation
+            description = domains.DomainDescription(virt_dom.XMLDesc(0))
+            self._domains.add_description(dom_uuid, virt_dom.name(),
+                                          description, generation)
+        return description
+
     def get_info(self, instance):
         """Retrieve information from libvirt for a specific instance name.
 
@@ -2479,6 +2609,18 @@ class LibvirtDriver(driver.ComputeDriver):
         libvirt error is.
 
         """
+        stats = self._domains.get_stats(CONF.libvirt_domain_stats_max_age)
+        if stats is not None:
+            if instance['name'] not in stats:
+                raise exception.InstanceNotFound(instance_id=instance['name'])
+            dom_stats = stats[instance['name']]
+            return {'state': LIBVIRT_POWER_STATE[dom_stats.state],
+                    'max_mem': dom_stats.max_mem,
+                    'mem': dom_stats.mem,
+                    'num_cpu': dom_stats.num_cpu,
+                    'cpu_time': dom_stats.cpu_time,
+                    'id': dom_stats.id}
+
         virt_dom = self._lookup_by_name(instance['name'])
         (state, max_mem, mem, num_cpu, cpu_time) = virt_dom.info()
         return {'state': LIBVIRT_POWER_STATE[state],
@@ -2527,6 +2669,11 @@ class LibvirtDriver(driver.ComputeDriver):
                                 "defined domain with xml: %s") %
                               domain.XMLDesc(0))
 
+        if instance:
+            self._domains.invalidate(name=instance['name'])
+        else:
+            self._domains.invalidate()
+
         try:
             self._enable_hairpin(domain.XMLDesc(0))
         except Exception:
@@ -2583,19 +2730,16 @@ class LibvirtDriver(driver.ComputeDriver):
         for dom_id in self.list_instance_ids():
             try:
                 domain = self._lookup_by_id(dom_id)
-                doc = etree.fromstring(domain.XMLDesc(0))
+                description = self._get_domain_description(domain)
             except exception.InstanceNotFound:
                 LOG.info(_("libvirt can't find a domain with id: %s") % dom_id)
                 continue
             except Exception:
                 continue
-            ret = doc.findall('./devices/disk')
-            for node in ret:
-                if node.get('type') != 'block':
-                    continue
-                for child in node.getchildren():
-                    if child.tag == 'source':
-                        devices.append(child.get('dev'))
+            devices.extend(disk_desc.source_dev
+                           for disk_desc in description.disks
+                           if disk_desc.type == 'block' and
+                           disk_desc.source_dev)
         return devices
 
     def get_disks(self, instance_name):
@@ -2605,16 +2749,15 @@ class LibvirtDriver(driver.ComputeDriver):
         Returns a list of all block devices for this domain.
         """
         domain = self._lookup_by_name(instance_name)
-        xml = domain.XMLDesc(0)
 
         try:
-            doc = etree.fromstring(xml)
+            description = self._get_domain_description(domain)
         except Exception:
             return []
 
         return filter(bool,
-                      [target.get("dev")
-                       for target in doc.findall('devices/disk/target')])
+                      [disk_desc.target_dev
+                       for disk_desc in description.disks])
 
     def get_interfaces(self, xml):
         """
@@ -2765,6 +2908,11 @@ class LibvirtDriver(driver.ComputeDriver):
         if CONF.libvirt_type == 'lxc':
             return total + 1
 
+        if self._domains.enabled:
+            return sum(stats.num_cpu
+                       for stats in self._get_domain_stats().values()
+                       if stats.id >= 0)
+
         dom_ids = self.list_instance_ids()
         for dom_id in dom_ids:
             try:
@@ -2798,13 +2946,7 @@ class LibvirtDriver(driver.ComputeDriver):
         idx3 = m.index('Cached:')
         if CONF.libvirt_type == 'xen':
             used = 0
-            for domain_id in self.list_instance_ids():
-                try:
-                    dom_mem = int(self._lookup_by_id(domain_id).info()[2])
-                except exception.InstanceNotFound:
-                    LOG.info(_("libvirt can't find a domain with id: %s")
-                             % domain_id)
-                    continue
+            for domain_id, dom_mem in self._get_domain_memory():
                 # skip dom0
                 if domain_id != 0:
                     used += dom_mem
@@ -2822,6 +2964,23 @@ class LibvirtDriver(driver.ComputeDriver):
             # Convert it to MB
             return self.get_memory_mb_total() - avail / 1024
 
+    def _get_domain_memory(self):
+        """Yield the id and current memory of each running domain."""
+        if self._domains.enabled:
+            for stats in self._get_domain_stats().values():
+                if stats.id >= 0:
+                    yield stats.id, int(stats.mem)
+            return
+
+        for domain_id in self.list_instance_ids():
+            try:
+                dom_mem = int(self._lookup_by_id(domain_id).info()[2])
+            except exception.InstanceNotFound:
+                LOG.info(_("libvirt can't find a domain with id: %s")
+                         % domain_id)
+                continue
+            yield domain_id, dom_mem
+
     def get_hypervisor_type(self):
         """Get hypervisor type.
 
@@ -3351,6 +3510,7 @@ class LibvirtDriver(driver.ComputeDriver):
                              logical_sum,
                              None,
                              CONF.live_migration_bandwidth)
+            self._domains.invalidate(name=instance["name"])
 
         except Exception as e:
             with excutils.save_and_reraise_exception():
@@ -3541,6 +3701,7 @@ class LibvirtDriver(driver.ComputeDriver):
             # included in to_xml() result.
             dom = self._lookup_by_name(instance["name"])
             self._conn.defineXML(dom.XMLDesc(0))
+            self._domains.invalidate(name=instance["name"])
 
     def get_instance_disk_info(self, instance_name, xml=None,
                                block_device_info=None):
@@ -3564,7 +3725,7 @@ class LibvirtDriver(driver.ComputeDriver):
         if xml is None:
             try:
                 virt_dom = self._lookup_by_name(instance_name)
-                xml = virt_dom.XMLDesc(0)
+                description = self._get_domain_description(virt_dom)
             except libvirt.libvirtError as ex:
                 error_code = ex.get_error_code()
                 msg = (_('Error from libvirt while getting description of '
@@ -3575,6 +3736,8 @@ class LibvirtDriver(driver.ComputeDriver):
                         'ex': ex})
                 LOG.warn(msg)
                 raise exception.InstanceNotFound(instance_id=instance_name)
+        else:
+            description = domains.DomainDescription(xml)
 
         # NOTE (rmk): When block_device_info is provided, we will use it to
         #             filter out devices which are actually volumes.
@@ -3587,18 +3750,11 @@ class LibvirtDriver(driver.ComputeDriver):
             volume_devices.add(disk_dev)
 
         disk_info = []
-        doc = etree.fromstring(xml)
-        disk_nodes = doc.findall('.//devices/disk')
-        path_nodes = doc.findall('.//devices/disk/source')
-        driver_nodes = doc.findall('.//devices/disk/driver')
-        target_nodes = doc.findall('.//devices/disk/target')
-
-        for cnt, path_node in enumerate(path_nodes):
-            disk_type = disk_nodes[cnt].get('type')
-            path = path_node.get('file')
-            target = target_nodes[cnt].attrib['dev']
-
-            if disk_type != 'file':
+        for disk_desc in description.disks:
+            path = disk_desc.source_file
+            target = disk_desc.target_dev
+
+            if disk_desc.type != 'file':
                 LOG.debug(_('skipping %s since it looks like volume'), path)
                 continue
 
@@ -3616,7 +3772,7 @@ class LibvirtDriver(driver.ComputeDriver):
             # raise a localized error if image is unavailable
             dk_size = int(os.path.getsize(path))
 
-            disk_type = driver_nodes[cnt].get('type')
+            disk_type = disk_desc.driver_type
             if disk_type == "qcow2":
                 backing_file = libvirt_utils.get_disk_backing_file(path)
                 virt_size = disk.get_disk_size(path)
@@ -3892,21 +4048,17 @@ class LibvirtDriver(driver.ComputeDriver):
         self._cleanup_resize(instance, network_info)
 
     def get_diagnostics(self, instance):
-        def get_io_devices(xml_doc):
-            """get the list of io devices from the xml document."""
+        def get_io_devices(domain):
+            """get the list of io devices of the domain."""
             result = {"volumes": [], "ifaces": []}
             try:
-                doc = etree.fromstring(xml_doc)
+                description = self._get_domain_description(domain)
             except Exception:
                 return result
-            blocks = [('./devices/disk', 'volumes'),
-                ('./devices/interface', 'ifaces')]
-            for block, key in blocks:
-                section = doc.findall(block)
-                for node in section:
-                    for child in node.getchildren():
-                        if child.tag == 'target' and child.get('dev'):
-                            result[key].append(child.get('dev'))
+            result["volumes"] = [disk_desc.target_dev
+                                 for disk_desc in description.disks
+                                 if disk_desc.target_dev]
+            result["ifaces"] = description.interfaces
             return result
 
         domain = self._lookup_by_name(instance['name'])
@@ -3921,8 +4073,7 @@ class LibvirtDriver(driver.ComputeDriver):
         except libvirt.libvirtError:
             pass
         # get io status
-        xml = domain.XMLDesc(0)
-        dom_io = get_io_devices(xml)
+        dom_io = get_io_devices(domain)
         for disk in dom_io["volumes"]:
             try:
                 # blockStats might launch an exception if the method
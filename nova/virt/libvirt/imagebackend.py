@@ -139,14 +139,26 @@ class Image(object):
         :filename: Name of the file in the image directory
         :size: Size of created image in bytes (optional)
         """
+        @utils.synchronized(filename, external=True, lock_path=self.lock_path,
+                            shared=True)
+        def template_exists(target):
+            return os.path.exists(target)
+
         @utils.synchronized(filename, external=True, lock_path=self.lock_path)
-        def call_if_not_exists(target, *args, **kwargs):
+        def fetch_if_not_exists(target, *args, **kwargs):
             if not os.path.exists(target):
                 fetch_func(target=target, *args, **kwargs)
             elif CONF.libvirt_images_type == "lvm" and \
                     'ephemeral_size' in kwargs:
                 fetch_func(target=target, *args, **kwargs)
 
+        def call_if_not_exists(target, *args, **kwargs):
+            # NOTE: builds from a cached template only need to share the
+            # lock with each other, not to take turns
+            if (CONF.libvirt_images_type == "lvm" and
+                    'ephemeral_size' in kwargs) or not template_exists(target):
+                fetch_if_not_exists(target, *args, **kwargs)
+
         base_dir = os.path.join(CONF.instances_path, CONF.base_dir_name)
         if not os.path.exists(base_dir):
             fileutils.ensure_tree(base_dir)
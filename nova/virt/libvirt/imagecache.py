@@ -173,7 +173,8 @@ def read_stored_info(target, field=None, timestamped=False):
         lock_name = 'info-%s' % os.path.split(target)[-1]
         lock_path = os.path.join(CONF.instances_path, 'locks')
 
-        @utils.synchronized(lock_name, external=True, lock_path=lock_path)
+        @utils.synchronized(lock_name, external=True, lock_path=lock_path,
+                            shared=True)
         def read_file(info_file):
             LOG.debug(_('Reading image info file: %s'), info_file)
             with open(info_file, 'r') as f:
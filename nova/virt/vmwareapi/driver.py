@@ -459,7 +459,9 @@ class VMwareAPISession(object):
         self._scheme = scheme
         self._session_id = None
         self.vim = None
+        self.tasks_completed = 0
         self._create_session()
+        self.vm_ref_index = vm_util.VMRefIndex(self)
 
     def _get_vim_object(self):
         """Create the VIM Object instance."""
@@ -597,7 +599,11 @@ class VMwareAPISession(object):
                                                     instance_uuid,
                                                     task_ref, done)
         loop.start(CONF.vmwareapi_task_poll_interval)
-        ret_val = done.wait()
+        try:
+            ret_val = done.wait()
+        finally:
+            # Lets callers tell whether the state they fetched may be stale
+            self.tasks_completed += 1
         loop.stop()
         return ret_val
 
@@ -93,3 +93,31 @@ class FaultCheckers(object):
             raise VimFaultException(fault_list, Exception(_("Error(s) %s "
                     "occurred in the call to RetrieveProperties") %
                     exc_msg_list))
+
+    @staticmethod
+    def retrievepropertiesex_fault_checker(resp_obj):
+        """
+        Checks the RetrievePropertiesEx response for errors. As with
+        RetrieveProperties, certain faults are sent as property of the
+        missingSet of the objects, and an empty response is what a timed
+        out idle session gets.
+        """
+        fault_list = []
+        if not resp_obj:
+            # An empty response can also mean that no object matched, the
+            # caller tells both apart by trying again with a new session
+            fault_list = ["NotAuthenticated"]
+        else:
+            for obj_cont in getattr(resp_obj, "objects", None) or []:
+                if hasattr(obj_cont, "missingSet"):
+                    for missing_elem in obj_cont.missingSet:
+                        fault_type = missing_elem.fault.fault.__class__
+                        fault_list.append(fault_type.__name__)
+        if fault_list:
+            exc_msg_list = ', '.join(fault_list)
+            raise VimFaultException(fault_list, Exception(_("Error(s) %s "
+                    "occurred in the call to RetrievePropertiesEx") %
+                    exc_msg_list))
+
+    continueretrievepropertiesex_fault_checker = \
+        retrievepropertiesex_fault_checker
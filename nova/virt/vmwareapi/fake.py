@@ -22,6 +22,7 @@ A fake VMware VI API implementation.
 """
 
 import collections
+import itertools
 import pprint
 import uuid
 
@@ -37,6 +38,8 @@ _FAKE_FILE_SIZE = 1024
 
 _db_content = {}
 
+_vm_ids = itertools.count(10)
+
 LOG = logging.getLogger(__name__)
 
 
@@ -48,6 +51,8 @@ def log_db_contents(msg=None):
 
 def reset():
     """Resets the db contents."""
+    global _vm_ids
+    _vm_ids = itertools.count(10)
     for c in _CLASSES:
         # We fake the datastore by keeping the file references as a list of
         # names in the db
@@ -245,8 +250,10 @@ class VirtualMachine(ManagedObject):
     """Virtual Machine class."""
 
     def __init__(self, **kwargs):
-        super(VirtualMachine, self).__init__("VirtualMachine", value='vm-10')
+        super(VirtualMachine, self).__init__("VirtualMachine",
+                                             value='vm-%d' % _vm_ids.next())
         self.set("name", kwargs.get("name"))
+        self.set("config.instanceUuid", kwargs.get("instanceUuid"))
         self.set("runtime.connectionState",
                  kwargs.get("conn_state", "connected"))
         self.set("summary.config.guestId", kwargs.get("guest", "otherGuest"))
@@ -627,7 +634,10 @@ class FakeVim(object):
         service_content.fileManager = "FileManager"
         service_content.rootFolder = "RootFolder"
         service_content.sessionManager = "SessionManager"
+        service_content.searchIndex = "SearchIndex"
         self._service_content = service_content
+        self._collectors = {}
+        self._retrieve_results = {}
 
     def get_service_content(self):
         return self._service_content
@@ -679,6 +689,7 @@ class FakeVim(object):
         vm_dict = {"name": config_spec.name,
                   "ds": ds,
                   "powerstate": "poweredOff",
+                  "instanceUuid": getattr(config_spec, "instanceUuid", None),
                   "vmPathName": config_spec.files.vmPathName,
                   "numCpu": config_spec.numCPUs,
                   "mem": config_spec.memoryMB,
@@ -810,6 +821,118 @@ class FakeVim(object):
                 continue
         return lst_ret_objs
 
+    def _retrieve_page(self, objects, max_objects):
+        """Returns a page of objects and a token for the rest if any."""
+        if not objects:
+            return None
+        result = DataObject()
+        result.objects = objects[:max_objects]
+        if max_objects and len(objects) > max_objects:
+            result.token = str(uuid.uuid4())
+            self._retrieve_results[result.token] = (objects[max_objects:],
+                                                    max_objects)
+        return result
+
+    def _retrieve_properties_ex(self, method, *args, **kwargs):
+        """Retrieves the first page of properties based on the type."""
+        objects = self._retrieve_properties(method, *args, **kwargs)
+        return self._retrieve_page(objects, kwargs.get("options").maxObjects)
+
+    def _continue_retrieve_properties_ex(self, method, *args, **kwargs):
+        """Retrieves the next page of properties."""
+        token = kwargs.get("token")
+        if token not in self._retrieve_results:
+            raise error_util.VimFaultException(
+                    ["InvalidArgument"], _("Invalid token %s") % token)
+        objects, max_objects = self._retrieve_results.pop(token)
+        return self._retrieve_page(objects, max_objects)
+
+    def _create_property_collector(self, method, *args, **kwargs):
+        """Creates a property collector with no filter."""
+        collector = ManagedObjectReference("session[%s]%s" % (
+                        self._session, uuid.uuid4()), "PropertyCollector")
+        self._collectors[collector.value] = {'filters': [], 'version': 0,
+                                             'seen': {}}
+        return collector
+
+    def _destroy_property_collector(self, method, collector):
+        """Destroys a property collector."""
+        self._get_collector(collector)
+        del self._collectors[collector.value]
+
+    def _get_collector(self, collector):
+        if collector.value not in self._collectors:
+            raise error_util.VimFaultException(
+                    ["ManagedObjectNotFound"],
+                    _("Property collector %s does not exist")
+                    % collector.value)
+        return self._collectors[collector.value]
+
+    def _create_filter(self, method, collector, *args, **kwargs):
+        """Adds a filter on all the objects of a type to a collector."""
+        spec = kwargs.get("spec")
+        properties = spec.propSet[0].pathSet
+        if not isinstance(properties, list):
+            properties = properties.split()
+        self._get_collector(collector)['filters'].append(
+                (spec.propSet[0].type, properties))
+
+    def _wait_for_updates_ex(self, method, collector, *args, **kwargs):
+        """
+        Reports the objects which entered, were modified or left the
+        collector filters since the previous call. Never waits.
+        """
+        state = self._get_collector(collector)
+        seen = state['seen']
+        if not kwargs.get("version"):
+            seen.clear()
+        current = {}
+        for type, properties in state['filters']:
+            for mdo in _db_content[type].values():
+                current[mdo.obj] = dict((prop, mdo.get(prop))
+                                        for prop in properties)
+
+        object_updates = []
+        for obj, props in current.items():
+            changes = [(name, val) for name, val in props.items()
+                       if obj not in seen or seen[obj].get(name) != val]
+            if not changes:
+                continue
+            object_update = DataObject()
+            object_update.obj = obj
+            object_update.kind = "modify" if obj in seen else "enter"
+            object_update.changeSet = []
+            for name, val in changes:
+                change = DataObject()
+                change.name = name
+                change.op = "assign"
+                change.val = val
+                object_update.changeSet.append(change)
+            object_updates.append(object_update)
+        for obj in seen:
+            if obj not in current:
+                object_update = DataObject()
+                object_update.obj = obj
+                object_update.kind = "leave"
+                object_updates.append(object_update)
+        state['seen'] = current
+
+        if not object_updates:
+            return None
+        state['version'] += 1
+        filter_update = DataObject()
+        filter_update.objectSet = object_updates
+        update_set = DataObject()
+        update_set.version = str(state['version'])
+        update_set.truncated = False
+        update_set.filterSet = [filter_update]
+        return update_set
+
+    def _find_all_by_uuid(self, method, *args, **kwargs):
+        """Finds the VMs with the instance uuid specified."""
+        return [mdo.obj for mdo in _db_content["VirtualMachine"].values()
+                if mdo.get("config.instanceUuid") == kwargs.get("uuid")]
+
     def _add_port_group(self, method, *args, **kwargs):
         """Adds a port group to the host system."""
         _host_sk = _db_content["HostSystem"].keys()[0]
@@ -875,6 +998,28 @@ class FakeVim(object):
         elif attr_name == "RetrieveProperties":
             return lambda *args, **kwargs: self._retrieve_properties(
                                                 attr_name, *args, **kwargs)
+        elif attr_name == "RetrievePropertiesEx":
+            return lambda *args, **kwargs: self._retrieve_properties_ex(
+                                                attr_name, *args, **kwargs)
+        elif attr_name == "ContinueRetrievePropertiesEx":
+            return lambda *args, **kwargs: (
+                self._continue_retrieve_properties_ex(attr_name, *args,
+                                                      **kwargs))
+        elif attr_name == "CreatePropertyCollector":
+            return lambda *args, **kwargs: self._create_property_collector(
+                                                attr_name, *args, **kwargs)
+        elif attr_name == "DestroyPropertyCollector":
+            return lambda *args, **kwargs: self._destroy_property_collector(
+                                                attr_name, *args, **kwargs)
+        elif attr_name == "CreateFilter":
+            return lambda *args, **kwargs: self._create_filter(attr_name,
+                                                *args, **kwargs)
+        elif attr_name == "WaitForUpdatesEx":
+            return lambda *args, **kwargs: self._wait_for_updates_ex(
+                                                attr_name, *args, **kwargs)
+        elif attr_name == "FindAllByUuid":
+            return lambda *args, **kwargs: self._find_all_by_uuid(attr_name,
+                                                *args, **kwargs)
         elif attr_name == "AcquireCloneTicket":
             return lambda *args, **kwargs: self._just_return()
         elif attr_name == "AddPortGroup":
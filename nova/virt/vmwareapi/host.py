@@ -103,16 +103,14 @@ class HostState(object):
     def update_status(self):
         """Update the current state of the host.
         """
-        host_mor = self._session._call_method(vim_util, "get_objects",
-                                              "HostSystem")[0].obj
-        summary = self._session._call_method(vim_util,
-                                             "get_dynamic_property",
-                                             host_mor,
-                                             "HostSystem",
-                                             "summary")
-
+        hosts = self._session._call_method(vim_util, "get_objects",
+                                           "HostSystem", ["summary"])
+        if not hosts:
+            return
+        summary = vm_util.property_from_property_set("summary", hosts[:1])
         if summary is None:
             return
+        summary = summary.val
 
         try:
             ds = vm_util.get_datastore_ref_and_name(self._session)
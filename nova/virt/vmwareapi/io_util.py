@@ -30,7 +30,7 @@ from nova.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
-IO_THREAD_SLEEP_TIME = .01
+IO_THREAD_SLEEP_TIME = 0
 GLANCE_POLL_INTERVAL = 5
 
 
@@ -187,3 +187,96 @@ class IOThread(object):
 
     def wait(self):
         return self.done.wait()
+
+
+class ParallelRangeReader(object):
+    """Reads a file as consecutive ranges fetched over several connections
+    at once and returns the data in order.
+
+    open_range(offset, length) must return a file handle reading that range
+    of the file. At most `connections` ranges are in flight, each buffering
+    at most `max_chunks` chunks of `chunk_size` bytes, which bounds the
+    memory used however large the file is.
+    """
+
+    def __init__(self, open_range, size, range_size, chunk_size,
+                 connections, max_chunks):
+        self.open_range = open_range
+        self.transfer_size = size
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.transferred = 0
+        self._ranges = [(offset, min(range_size, size - offset))
+                        for offset in xrange(0, size, range_size)]
+        self._queues = {}
+        self._next_range = 0
+        self._current = 0
+        self._remaining = self._ranges[0][1] if self._ranges else 0
+        self._threads = [greenthread.spawn(self._fetch_ranges)
+                         for i in xrange(min(connections,
+                                             len(self._ranges)))]
+
+    def _get_queue(self, index):
+        if index not in self._queues:
+            self._queues[index] = queue.LightQueue(self.max_chunks)
+        return self._queues[index]
+
+    def _fetch_ranges(self):
+        while self._next_range < len(self._ranges):
+            index = self._next_range
+            self._next_range += 1
+            data_queue = self._get_queue(index)
+            offset, length = self._ranges[index]
+            end = offset + length
+            try:
+                handle = self.open_range(offset, length)
+                try:
+                    while length > 0:
+                        data = handle.read(min(self.chunk_size, length))
+                        if not data:
+                            raise IOError(_("Unexpected end of data at "
+                                            "offset %d") % (end - length))
+                        length -= len(data)
+                        # Blocks while the range is too far ahead of the
+                        # reader
+                        data_queue.put(data)
+                finally:
+                    handle.close()
+            except Exception as exc:
+                data_queue.put(exc)
+                return
+
+    def read(self, chunk_size=None):
+        """Read the next chunk of data, in file order.
+
+        The chunk size is ignored, chunks are as large as the range reads
+        returned.
+        """
+        if self._current >= len(self._ranges):
+            return ""
+        data = self._get_queue(self._current).get()
+        if isinstance(data, Exception):
+            self.close()
+            raise data
+        self.transferred += len(data)
+        self._remaining -= len(data)
+        if self._remaining <= 0:
+            del self._queues[self._current]
+            self._current += 1
+            if self._current < len(self._ranges):
+                self._remaining = self._ranges[self._current][1]
+        return data
+
+    def seek(self, offset, whence=0):
+        """Set the file's current position at the offset."""
+        pass
+
+    def tell(self):
+        """Get size of the file to be read."""
+        return self.transfer_size
+
+    def close(self):
+        """Stop fetching the ranges which are still in flight."""
+        for thread in self._threads:
+            thread.kill()
+        self._threads = []
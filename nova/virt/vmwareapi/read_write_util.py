@@ -151,15 +151,23 @@ class VMwareHTTPReadFile(VMwareHTTPFile):
     """VMware file read handler class."""
 
     def __init__(self, host, data_center_name, datastore_name, cookies,
-                 file_path, scheme="https"):
+                 file_path, scheme="https", offset=0, length=None,
+                 chunk_size=READ_CHUNKSIZE):
         base_url = "%s://%s/folder/%s" % (scheme, host,
                                           urllib.pathname2url(file_path))
         param_list = {"dcPath": data_center_name, "dsName": datastore_name}
         base_url = base_url + "?" + urllib.urlencode(param_list)
         headers = {'User-Agent': USER_AGENT,
                    'Cookie': self._build_vim_cookie_headers(cookies)}
+        if length is not None:
+            headers['Range'] = 'bytes=%d-%d' % (offset, offset + length - 1)
         request = urllib2.Request(base_url, None, headers)
         conn = urllib2.urlopen(request)
+        if length is not None and conn.getcode() != 206:
+            conn.close()
+            raise IOError(_("Range requests are not supported for %s")
+                          % file_path)
+        self.chunk_size = chunk_size
         VMwareHTTPFile.__init__(self, conn)
 
     def read(self, chunk_size):
@@ -167,7 +175,7 @@ class VMwareHTTPReadFile(VMwareHTTPFile):
         # We are ignoring the chunk size passed for we want the pipe to hold
         # data items of the chunk-size that Glance Client uses for read
         # while writing.
-        return self.file_handle.read(READ_CHUNKSIZE)
+        return self.file_handle.read(self.chunk_size)
 
     def get_size(self):
         """Get size of the file to be read."""
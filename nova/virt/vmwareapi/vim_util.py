@@ -19,6 +19,19 @@
 The VMware API utility module.
 """
 
+from oslo.config import cfg
+
+vmware_vim_util_opts = [
+    cfg.IntOpt('vmwareapi_maximum_objects',
+               default=100,
+               help='The maximum number of objects returned by vCenter in '
+                    'a single page of results. Larger results are fetched '
+                    'in several pages'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(vmware_vim_util_opts)
+
 
 def build_selection_spec(client_factory, name):
     """Builds the selection spec."""
@@ -172,8 +185,32 @@ def get_objects(vim, type, properties_to_collect=None, all=False):
     property_filter_spec = build_property_filter_spec(client_factory,
                                 [property_spec],
                                 [object_spec])
-    return vim.RetrieveProperties(vim.get_service_content().propertyCollector,
-                                specSet=[property_filter_spec])
+    return retrieve_properties_ex(vim,
+                                  vim.get_service_content().propertyCollector,
+                                  [property_filter_spec])
+
+
+def retrieve_properties_ex(vim, collector, spec_set, max_objects=None):
+    """
+    Retrieves the properties selected by the filter specs in pages of at
+    most max_objects objects, following the continuation token of each
+    page until the result is complete.
+    """
+    if max_objects is None:
+        max_objects = CONF.vmwareapi_maximum_objects
+    client_factory = vim.client.factory
+    retrieve_options = client_factory.create('ns0:RetrieveOptions')
+    retrieve_options.maxObjects = max_objects
+    result = vim.RetrievePropertiesEx(collector, specSet=spec_set,
+                                      options=retrieve_options)
+    objects = []
+    while result:
+        objects.extend(result.objects)
+        token = getattr(result, 'token', None)
+        if not token:
+            break
+        result = vim.ContinueRetrievePropertiesEx(collector, token=token)
+    return objects
 
 
 def get_prop_spec(client_factory, spec_type, properties):
@@ -217,5 +254,55 @@ def get_properties_for_a_collection_of_objects(vim, type,
         lst_obj_specs.append(get_obj_spec(client_factory, obj))
     prop_filter_spec = get_prop_filter_spec(client_factory,
                                             lst_obj_specs, [prop_spec])
-    return vim.RetrieveProperties(vim.get_service_content().propertyCollector,
-                                   specSet=[prop_filter_spec])
+    return retrieve_properties_ex(vim,
+                                  vim.get_service_content().propertyCollector,
+                                  [prop_filter_spec])
+
+
+def create_property_collector(vim):
+    """Creates a property collector owned by the session."""
+    return vim.CreatePropertyCollector(
+            vim.get_service_content().propertyCollector)
+
+
+def destroy_property_collector(vim, collector):
+    """Destroys a property collector created by the session."""
+    return vim.DestroyPropertyCollector(collector)
+
+
+def create_filter(vim, collector, type, properties_to_collect):
+    """
+    Creates a filter on the collector reporting the properties of all the
+    objects of the type specified.
+    """
+    client_factory = vim.client.factory
+    object_spec = build_object_spec(client_factory,
+                        vim.get_service_content().rootFolder,
+                        [build_recursive_traversal_spec(client_factory)])
+    property_spec = build_property_spec(client_factory, type=type,
+                                properties_to_collect=properties_to_collect)
+    property_filter_spec = build_property_filter_spec(client_factory,
+                                [property_spec],
+                                [object_spec])
+    return vim.CreateFilter(collector, spec=property_filter_spec,
+                            partialUpdates=False)
+
+
+def wait_for_updates_ex(vim, collector, version, max_wait_seconds=0):
+    """
+    Gets the changes reported by the filters of the collector since the
+    version specified. Returns None if there is none after waiting for
+    max_wait_seconds.
+    """
+    client_factory = vim.client.factory
+    wait_options = client_factory.create('ns0:WaitOptions')
+    wait_options.maxWaitSeconds = max_wait_seconds
+    return vim.WaitForUpdatesEx(collector, version=version,
+                                options=wait_options)
+
+
+def find_vms_by_instance_uuid(vim, instance_uuid):
+    """Gets the VirtualMachines with the instance uuid specified."""
+    return vim.FindAllByUuid(vim.get_service_content().searchIndex,
+                             uuid=instance_uuid, vmSearch=True,
+                             instanceUuid=True)
@@ -20,10 +20,14 @@ The VMware API VM utility module to build SOAP object specs.
 """
 
 import copy
+import threading
 
 from nova import exception
+from nova.openstack.common import log as logging
 from nova.virt.vmwareapi import vim_util
 
+LOG = logging.getLogger(__name__)
+
 
 def build_datastore_path(datastore_name, path):
     """Build the datastore compliant path."""
@@ -49,6 +53,7 @@ def get_vm_create_spec(client_factory, instance, data_store_name,
     """Builds the VM Create spec."""
     config_spec = client_factory.create('ns0:VirtualMachineConfigSpec')
     config_spec.name = instance['uuid']
+    config_spec.instanceUuid = instance['uuid']
     config_spec.guestId = os_type
 
     # Allow nested ESX instances to host 64 bit VMs.
@@ -498,8 +503,140 @@ def search_datastore_spec(client_factory, file_name):
     return search_spec
 
 
-def get_vm_ref_from_name(session, vm_name):
-    """Get reference to the VM with the name specified."""
+class VMRefIndex(object):
+    """
+    Index of the VirtualMachine managed object references by name and
+    instance uuid.
+
+    The index is filled and kept current by a property collector owned by
+    the session: each lookup first applies the changes the collector queued
+    since the previous one (WaitForUpdatesEx without waiting), so it costs
+    one small round trip rather than fetching the name of every VM.
+    """
+
+    PROPERTIES = ["name", "config.instanceUuid"]
+
+    def __init__(self, session):
+        self._session = session
+        self._lock = threading.Lock()
+        self._collector = None
+        self._version = None
+        self._vms = {}
+        self._by_name = {}
+        self._by_uuid = {}
+
+    def _start(self):
+        self._vms.clear()
+        self._by_name.clear()
+        self._by_uuid.clear()
+        self._collector = self._session._call_method(vim_util,
+                                "create_property_collector")
+        self._session._call_method(vim_util, "create_filter",
+                                   self._collector, "VirtualMachine",
+                                   self.PROPERTIES)
+        self._version = ""
+
+    def _stop(self):
+        collector = self._collector
+        self._collector = None
+        if collector is None:
+            return
+        try:
+            self._session._call_method(vim_util,
+                                       "destroy_property_collector",
+                                       collector)
+        except Exception as excep:
+            # The collector goes away with the session anyway
+            LOG.debug(excep)
+
+    def _remove(self, key):
+        vm = self._vms.pop(key, None)
+        if vm is None:
+            return
+        vm_ref, name, instance_uuid = vm
+        if self._by_name.get(name) is vm_ref:
+            del self._by_name[name]
+        if self._by_uuid.get(instance_uuid) is vm_ref:
+            del self._by_uuid[instance_uuid]
+
+    def _apply(self, object_update):
+        key = object_update.obj.value
+        vm_ref, name, instance_uuid = self._vms.get(key,
+                                                    (None, None, None))
+        self._remove(key)
+        if object_update.kind == "leave":
+            return
+
+        for change in getattr(object_update, "changeSet", None) or []:
+            val = None
+            if change.op != "remove":
+                val = getattr(change, "val", None)
+            if change.name == "name":
+                name = val
+            elif change.name == "config.instanceUuid":
+                instance_uuid = val
+
+        vm_ref = object_update.obj
+        self._vms[key] = (vm_ref, name, instance_uuid)
+        if name is not None:
+            self._by_name[name] = vm_ref
+        if instance_uuid is not None:
+            self._by_uuid[instance_uuid] = vm_ref
+
+    def _update(self):
+        if self._collector is None:
+            self._start()
+        while True:
+            update_set = self._session._call_method(vim_util,
+                                    "wait_for_updates_ex",
+                                    self._collector, self._version)
+            if not update_set:
+                return
+            self._version = update_set.version
+            for filter_update in update_set.filterSet:
+                for object_update in filter_update.objectSet:
+                    self._apply(object_update)
+            if not getattr(update_set, "truncated", False):
+                return
+
+    def sync(self):
+        """
+        Apply the changes reported since the last sync. Returns False if
+        the index could not be brought up to date and should not be used.
+        """
+        with self._lock:
+            # NOTE: a session re-created after a fault drops the collector,
+            # so start over once before giving up.
+            for attempt in range(2):
+                try:
+                    self._update()
+                    return True
+                except Exception as excep:
+                    LOG.warn(_("Unable to update the VM reference index: "
+                               "%s"), excep)
+                    self._stop()
+            return False
+
+    def get_by_name(self, vm_name):
+        return self._by_name.get(vm_name)
+
+    def get_by_uuid(self, instance_uuid):
+        # NOTE: VMs are named after the instance uuid, VMs created before
+        # config.instanceUuid was set are only found through their name.
+        vm_ref = self._by_uuid.get(instance_uuid)
+        if vm_ref is None:
+            vm_ref = self._by_name.get(instance_uuid)
+        return vm_ref
+
+
+def _get_vm_ref_index(session):
+    """Get the synced VM reference index of the session, if any."""
+    index = getattr(session, "vm_ref_index", None)
+    if index is not None and index.sync():
+        return index
+
+
+def _find_vm_ref_by_name(session, vm_name):
     vms = session._call_method(vim_util, "get_objects",
                 "VirtualMachine", ["name"])
     for vm in vms:
@@ -508,20 +645,43 @@ def get_vm_ref_from_name(session, vm_name):
     return None
 
 
+def _find_vm_ref_by_instance_uuid(session, instance_uuid):
+    vm_refs = session._call_method(vim_util, "find_vms_by_instance_uuid",
+                                   instance_uuid)
+    if vm_refs:
+        return vm_refs[0]
+
+
+def get_vm_ref_from_name(session, vm_name):
+    """Get reference to the VM with the name specified."""
+    index = _get_vm_ref_index(session)
+    if index is None:
+        return _find_vm_ref_by_name(session, vm_name)
+    return index.get_by_name(vm_name)
+
+
 def get_vm_ref_from_uuid(session, instance_uuid):
     """Get reference to the VM with the uuid specified."""
-    vms = session._call_method(vim_util, "get_objects",
-                "VirtualMachine", ["name"])
-    for vm in vms:
-        if vm.propSet[0].val == instance_uuid:
-            return vm.obj
+    index = _get_vm_ref_index(session)
+    if index is None:
+        return _find_vm_ref_by_name(session, instance_uuid)
+    vm_ref = index.get_by_uuid(instance_uuid)
+    if vm_ref is None:
+        vm_ref = _find_vm_ref_by_instance_uuid(session, instance_uuid)
+    return vm_ref
 
 
 def get_vm_ref(session, instance):
     """Get reference to the VM through uuid or vm name."""
-    vm_ref = get_vm_ref_from_uuid(session, instance['uuid'])
-    if not vm_ref:
+    index = _get_vm_ref_index(session)
+    if index is None:
+        vm_ref = _find_vm_ref_by_name(session, instance['uuid'])
+    else:
+        vm_ref = index.get_by_uuid(instance['uuid'])
+    if vm_ref is None:
         vm_ref = get_vm_ref_from_name(session, instance['name'])
+    if vm_ref is None and index is not None:
+        vm_ref = _find_vm_ref_by_instance_uuid(session, instance['uuid'])
     if vm_ref is None:
         raise exception.InstanceNotFound(instance_id=instance['uuid'])
     return vm_ref
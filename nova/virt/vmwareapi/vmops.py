@@ -51,12 +51,24 @@ vmware_vif_opts = [
                help='Name of Integration Bridge'),
     ]
 
+vmware_vm_info_opts = [
+    cfg.IntOpt('vmwareapi_vm_info_max_age',
+               default=10,
+               help='Number of seconds the power state, memory and CPU '
+                    'count of all the VMs, fetched together when the '
+                    'instances are listed, are reused to answer requests '
+                    'for the info of single instances. No task must have '
+                    'completed since they were fetched. Set to 0 to '
+                    'always fetch the info of each instance separately'),
+    ]
+
 vmware_group = cfg.OptGroup(name='vmware',
                             title='VMware Options')
 
 CONF = cfg.CONF
 CONF.register_group(vmware_group)
 CONF.register_opts(vmware_vif_opts, vmware_group)
+CONF.register_opts(vmware_vm_info_opts)
 CONF.import_opt('base_dir_name', 'nova.virt.libvirt.imagecache')
 CONF.import_opt('vnc_enabled', 'nova.vnc')
 
@@ -68,6 +80,12 @@ VMWARE_POWER_STATES = {
                     'suspended': power_state.SUSPENDED}
 VMWARE_PREFIX = 'vmware'
 
+VM_INFO_PROPERTIES = ["name",
+                      "runtime.connectionState",
+                      "runtime.powerState",
+                      "summary.config.numCpu",
+                      "summary.config.memorySizeMB"]
+
 
 RESIZE_TOTAL_STEPS = 4
 
@@ -86,22 +104,50 @@ class VMwareVMOps(object):
         self._default_root_device = 'vda'
         self._rescue_suffix = '-rescue'
         self._poll_rescue_last_ran = None
+        self._vms_info = None
+
+    def _get_vms_info(self):
+        """
+        Get the info properties of all the VMs, keyed by VM name, in a
+        single paginated retrieval.
+
+        The result is kept for get_info() of the instances listed in the
+        same periodic task, see _get_cached_vm_info().
+        """
+        vms = self._session._call_method(vim_util, "get_objects",
+                     "VirtualMachine", VM_INFO_PROPERTIES)
+        vms_info = {}
+        for vm in vms:
+            props = dict((prop.name, prop.val) for prop in vm.propSet)
+            vms_info[props.get("name")] = props
+        self._vms_info = (time.time(), self._session.tasks_completed,
+                          vms_info)
+        return vms_info
+
+    def _get_cached_vm_info(self, instance):
+        """
+        Get the info properties of the instance VM fetched by the last
+        _get_vms_info(), if they are recent and no task completed since.
+        """
+        if self._vms_info is None:
+            return
+        fetched_at, tasks_completed, vms_info = self._vms_info
+        if (tasks_completed != self._session.tasks_completed or
+                time.time() - fetched_at >= CONF.vmwareapi_vm_info_max_age):
+            self._vms_info = None
+            return
+        # Same lookup order as vm_util.get_vm_ref()
+        props = vms_info.get(instance['uuid'])
+        if props is None:
+            props = vms_info.get(instance['name'])
+        return props
 
     def list_instances(self):
         """Lists the VM instances that are registered with the ESX host."""
         LOG.debug(_("Getting list of instances"))
-        vms = self._session._call_method(vim_util, "get_objects",
-                     "VirtualMachine",
-                     ["name", "runtime.connectionState"])
         lst_vm_names = []
-        for vm in vms:
-            vm_name = None
-            conn_state = None
-            for prop in vm.propSet:
-                if prop.name == "name":
-                    vm_name = prop.val
-                elif prop.name == "runtime.connectionState":
-                    conn_state = prop.val
+        for vm_name, props in self._get_vms_info().iteritems():
+            conn_state = props.get("runtime.connectionState")
             # Ignoring the orphaned or inaccessible VMs
             if conn_state not in ["orphaned", "inaccessible"]:
                 lst_vm_names.append(vm_name)
@@ -1031,26 +1077,27 @@ class VMwareVMOps(object):
 
     def get_info(self, instance):
         """Return data about the VM instance."""
-        vm_ref = vm_util.get_vm_ref(self._session, instance)
+        props = self._get_cached_vm_info(instance)
+        if props is None:
+            vm_ref = vm_util.get_vm_ref(self._session, instance)
+            vm_props = self._session._call_method(vim_util,
+                        "get_object_properties", None, vm_ref,
+                        "VirtualMachine", VM_INFO_PROPERTIES)
+            props = {}
+            for elem in vm_props:
+                for prop in elem.propSet:
+                    props[prop.name] = prop.val
 
-        lst_properties = ["summary.config.numCpu",
-                    "summary.config.memorySizeMB",
-                    "runtime.powerState"]
-        vm_props = self._session._call_method(vim_util,
-                    "get_object_properties", None, vm_ref, "VirtualMachine",
-                    lst_properties)
         max_mem = None
         pwr_state = None
         num_cpu = None
-        for elem in vm_props:
-            for prop in elem.propSet:
-                if prop.name == "summary.config.numCpu":
-                    num_cpu = int(prop.val)
-                elif prop.name == "summary.config.memorySizeMB":
-                    # In MB, but we want in KB
-                    max_mem = int(prop.val) * 1024
-                elif prop.name == "runtime.powerState":
-                    pwr_state = VMWARE_POWER_STATES[prop.val]
+        if props.get("summary.config.numCpu") is not None:
+            num_cpu = int(props["summary.config.numCpu"])
+        if props.get("summary.config.memorySizeMB") is not None:
+            # In MB, but we want in KB
+            max_mem = int(props["summary.config.memorySizeMB"]) * 1024
+        if props.get("runtime.powerState") is not None:
+            pwr_state = VMWARE_POWER_STATES[props["runtime.powerState"]]
 
         return {'state': pwr_state,
                 'max_mem': max_mem,
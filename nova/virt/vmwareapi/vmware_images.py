@@ -19,15 +19,42 @@
 Utility functions for Image transfer.
 """
 
+import functools
+import time
+
+from oslo.config import cfg
+
 from nova import exception
 from nova.image import glance
 from nova.openstack.common import log as logging
 from nova.virt.vmwareapi import io_util
 from nova.virt.vmwareapi import read_write_util
 
-LOG = logging.getLogger(__name__)
+vmware_image_transfer_opts = [
+    cfg.IntOpt('vmwareapi_image_transfer_connections',
+               default=4,
+               help='Number of HTTP connections used to read an image from '
+                    'a datastore in parallel ranges when uploading it to '
+                    'Glance. Set to 1 to read it over a single connection'),
+    cfg.IntOpt('vmwareapi_image_transfer_range_size',
+               default=64 * 1024 * 1024,
+               help='Size in bytes of the ranges an image is split into '
+                    'when it is read over several connections'),
+    cfg.IntOpt('vmwareapi_image_transfer_chunk_size',
+               default=read_write_util.READ_CHUNKSIZE,
+               help='Size in bytes of the chunks image data is read from '
+                    'a datastore in'),
+    cfg.IntOpt('vmwareapi_image_transfer_buffers',
+               default=10,
+               help='Number of chunks buffered between the reader and the '
+                    'writer of an image transfer, and for each connection '
+                    'of a parallel read'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(vmware_image_transfer_opts)
 
-QUEUE_BUFFER_SIZE = 10
+LOG = logging.getLogger(__name__)
 
 
 def start_transfer(context, read_file_handle, data_size,
@@ -44,7 +71,8 @@ def start_transfer(context, read_file_handle, data_size,
 
     # The pipe that acts as an intermediate store of data for reader to write
     # to and writer to grab from.
-    thread_safe_pipe = io_util.ThreadSafePipe(QUEUE_BUFFER_SIZE, data_size)
+    thread_safe_pipe = io_util.ThreadSafePipe(
+            CONF.vmwareapi_image_transfer_buffers, data_size)
     # The read thread. In case of glance it is the instance of the
     # GlanceFileRead class. The glance client read returns an iterator
     # and this class wraps that iterator to provide datachunks in calls
@@ -63,12 +91,18 @@ def start_transfer(context, read_file_handle, data_size,
         write_thread = io_util.GlanceWriteThread(context, thread_safe_pipe,
                 image_service, image_id, image_meta)
     # Start the read and write threads.
+    started_at = time.time()
     read_event = read_thread.start()
     write_event = write_thread.start()
     try:
         # Wait on the read and write events to signal their end
         read_event.wait()
         write_event.wait()
+        elapsed = max(time.time() - started_at, 0.001)
+        LOG.info(_("Transferred %(size)d bytes in %(seconds).1f seconds "
+                   "(%(rate).2f MB/s)"),
+                 {'size': thread_safe_pipe.transferred, 'seconds': elapsed,
+                  'rate': thread_safe_pipe.transferred / elapsed / 1048576})
     except Exception as exc:
         # In case of any of the reads or writes raising an exception,
         # stop the threads so that we un-necessarily don't keep the other one
@@ -113,13 +147,20 @@ def upload_image(context, image, instance, **kwargs):
     """Upload the snapshotted vm disk file to Glance image server."""
     LOG.debug(_("Uploading image %s to the Glance image server") % image,
               instance=instance)
-    read_file_handle = read_write_util.VMwareHTTPReadFile(
-                                kwargs.get("host"),
-                                kwargs.get("data_center_name"),
-                                kwargs.get("datastore_name"),
-                                kwargs.get("cookies"),
-                                kwargs.get("file_path"))
-    file_size = read_file_handle.get_size()
+    open_file = functools.partial(read_write_util.VMwareHTTPReadFile,
+                                  kwargs.get("host"),
+                                  kwargs.get("data_center_name"),
+                                  kwargs.get("datastore_name"),
+                                  kwargs.get("cookies"),
+                                  kwargs.get("file_path"),
+                                  chunk_size=
+                                  CONF.vmwareapi_image_transfer_chunk_size)
+    read_file_handle = open_file()
+    file_size = int(read_file_handle.get_size())
+    if (CONF.vmwareapi_image_transfer_connections > 1 and
+            file_size > CONF.vmwareapi_image_transfer_range_size):
+        read_file_handle.close()
+        read_file_handle = _open_parallel_read(open_file, file_size)
     (image_service, image_id) = glance.get_remote_image_service(context, image)
     # The properties and other fields that we need to set for the image.
     image_metadata = {"disk_format": "vmdk",
@@ -141,6 +182,28 @@ def upload_image(context, image, instance, **kwargs):
               instance=instance)
 
 
+def _open_parallel_read(open_file, file_size):
+    """
+    Read the file as ranges over several connections, or over a single one
+    if the datastore does not support range requests.
+    """
+    def open_range(offset, length):
+        return open_file(offset=offset, length=length)
+
+    try:
+        # Check for range support before spreading the file over threads
+        open_range(0, 1).close()
+    except IOError as exc:
+        LOG.debug(_("Not reading the image in parallel ranges: %s") % exc)
+        return open_file()
+    return io_util.ParallelRangeReader(
+            open_range, file_size,
+            CONF.vmwareapi_image_transfer_range_size,
+            CONF.vmwareapi_image_transfer_chunk_size,
+            CONF.vmwareapi_image_transfer_connections,
+            CONF.vmwareapi_image_transfer_buffers)
+
+
 def get_vmdk_size_and_properties(context, image, instance):
     """
     Get size of the vmdk file that is to be downloaded for attach in spawn.
@@ -546,6 +546,16 @@ class SessionBase(object):
                            vdi_ref, key])
         db_ref['other_config'][key] = value
 
+    def VDI_get_all_records_where(self, _1, expr):
+        # Only the 'field "SR" = "<ref>"' expression is supported
+        sr_ref = expr.split('=', 1)[1].strip().strip('"')
+        return dict((vdi_ref, vdi_rec) for vdi_ref, vdi_rec
+                    in _db_content['VDI'].iteritems()
+                    if vdi_rec['SR'] == sr_ref)
+
+    def event_from(self, _1, classes, token, timeout):
+        raise Failure(['MESSAGE_METHOD_UNKNOWN', 'event.from'])
+
     def VDI_copy(self, _1, vdi_to_copy_ref, sr_ref):
         db_ref = _db_content['VDI'][vdi_to_copy_ref]
         name_label = db_ref['name_label']
@@ -22,9 +22,11 @@ their attributes like VDIs, VIFs, as well as their lookup functions.
 """
 
 import contextlib
+import errno
 import os
 import pkg_resources
 import re
+import stat
 import time
 import urllib
 import urlparse
@@ -88,6 +90,17 @@ xenapi_vm_utils_opts = [
                      'resize down (False will use standard dd). This speeds '
                      'up resizes down considerably since large runs of zeros '
                      'won\'t have to be rsynced'),
+    cfg.IntOpt('xenapi_sparse_copy_buffer_size',
+               default=1024 * 1024,
+               help='Size in bytes of the reads done by sparse_copy'),
+    cfg.IntOpt('xenapi_sparse_copy_max_rate',
+               default=0,
+               help='Maximum rate in bytes per second at which sparse_copy '
+                    'reads data (0 = unlimited)'),
+    cfg.FloatOpt('xenapi_sparse_copy_yield_interval',
+                 default=0.1,
+                 help='Seconds between yields to other greenthreads while '
+                      'doing a sparse_copy'),
     cfg.IntOpt('xenapi_num_vbd_unplug_retries',
                default=10,
                help='Maximum number of retries to unplug VBD'),
@@ -665,11 +678,14 @@ def snapshot_attached_here(session, instance, vm_ref, label, *args):
     if update_task_state is not None:
         update_task_state(task_state=task_states.IMAGE_PENDING_UPLOAD)
     try:
-        snapshot_rec = session.call_xenapi("VDI.get_record", snapshot_ref)
+        topology = SRTopology(session, sr_ref)
         _wait_for_vhd_coalesce(session, instance, sr_ref, vm_vdi_ref,
-                original_parent_uuid)
+                original_parent_uuid, topology)
+        _scan_sr(session, sr_ref)
+        topology.refresh()
+        snapshot_uuid = topology.get_record(snapshot_ref)['uuid']
         vdi_uuids = [vdi_rec['uuid'] for vdi_rec in
-                _walk_vdi_chain(session, snapshot_rec['uuid'])]
+                _walk_vdi_chain(session, snapshot_uuid, topology)]
         yield vdi_uuids
     finally:
         safe_destroy_vdis(session, [snapshot_ref])
@@ -700,7 +716,10 @@ def destroy_cached_images(session, sr_ref, all_cached=False, dry_run=False):
     The default behavior of this function is to destroy only 'unused' cached
     images. To destroy all cached images, use the `all_cached=True` kwarg.
     """
-    cached_images = _find_cached_images(session, sr_ref)
+    if not all_cached:
+        _scan_sr(session, sr_ref)
+    topology = SRTopology(session, sr_ref)
+    cached_images = _find_cached_images(session, sr_ref, topology)
     destroyed = set()
 
     def destroy_cached_vdi(vdi_uuid, vdi_ref):
@@ -710,7 +729,7 @@ def destroy_cached_images(session, sr_ref, all_cached=False, dry_run=False):
         destroyed.add(vdi_uuid)
 
     for vdi_ref in cached_images.values():
-        vdi_uuid = session.call_xenapi('VDI.get_uuid', vdi_ref)
+        vdi_uuid = topology.get_record(vdi_ref)['uuid']
 
         if all_cached:
             destroy_cached_vdi(vdi_uuid, vdi_ref)
@@ -721,13 +740,14 @@ def destroy_cached_images(session, sr_ref, all_cached=False, dry_run=False):
         # Chain length greater than two implies a VM must be holding a ref to
         # the base-copy (otherwise it would have coalesced), so consider this
         # cached image used.
-        chain = list(_walk_vdi_chain(session, vdi_uuid))
+        chain = list(_walk_vdi_chain(session, vdi_uuid, topology))
         if len(chain) > 2:
             continue
         elif len(chain) == 2:
             # Siblings imply cached image is used
             root_vdi_rec = chain[-1]
-            children = _child_vhds(session, sr_ref, root_vdi_rec['uuid'])
+            children = _child_vhds(session, sr_ref, root_vdi_rec['uuid'],
+                                   topology)
             if len(children) > 1:
                 continue
 
@@ -736,10 +756,12 @@ def destroy_cached_images(session, sr_ref, all_cached=False, dry_run=False):
     return destroyed
 
 
-def _find_cached_images(session, sr_ref):
+def _find_cached_images(session, sr_ref, topology=None):
     """Return a dict(uuid=vdi_ref) representing all cached images."""
+    if topology is None:
+        topology = SRTopology(session, sr_ref)
     cached_images = {}
-    for vdi_ref, vdi_rec in _get_all_vdis_in_sr(session, sr_ref):
+    for vdi_ref, vdi_rec in topology.get_all_records():
         try:
             image_id = vdi_rec['other_config']['image-id']
         except KeyError:
@@ -1785,6 +1807,109 @@ def get_instance_vdis_for_sr(session, vm_ref, sr_ref):
             continue
 
 
+class SRTopology(object):
+    """Index of the VDIs in an SR and of their VHD parent/child relations.
+
+    The index is built from a single VDI.get_all_records_where call and
+    refresh() applies the VDI changes since then using event.from, so
+    repeated lookups don't each fetch every VDI record in the SR.
+    """
+
+    def __init__(self, session, sr_ref):
+        self.session = session
+        self.sr_ref = sr_ref
+        self._token = None
+        self._load()
+
+    def _load(self):
+        self._records = {}
+        self._refs_by_uuid = {}
+        self._children = {}
+        # NOTE: take the event token first, so changes made while the
+        #       records are fetched are picked up by the next refresh().
+        try:
+            self._token = self.session.call_xenapi(
+                'event.from', ['pool'], '', 0.0)['token']
+        except self.session.XenAPI.Failure:
+            # No event.from, refresh() reloads everything
+            self._token = None
+        expr = 'field "SR" = "%s"' % self.sr_ref
+        records = self.session.call_xenapi('VDI.get_all_records_where', expr)
+        for vdi_ref, vdi_rec in records.iteritems():
+            self._add(vdi_ref, vdi_rec)
+
+    def _add(self, vdi_ref, vdi_rec):
+        self._remove(vdi_ref)
+        self._records[vdi_ref] = vdi_rec
+        self._refs_by_uuid[vdi_rec['uuid']] = vdi_ref
+        parent_uuid = vdi_rec['sm_config'].get('vhd-parent')
+        if parent_uuid:
+            self._children.setdefault(parent_uuid, set()).add(vdi_rec['uuid'])
+
+    def _remove(self, vdi_ref):
+        vdi_rec = self._records.pop(vdi_ref, None)
+        if vdi_rec is None:
+            return
+        self._refs_by_uuid.pop(vdi_rec['uuid'], None)
+        parent_uuid = vdi_rec['sm_config'].get('vhd-parent')
+        if parent_uuid:
+            self._children.get(parent_uuid, set()).discard(vdi_rec['uuid'])
+
+    def refresh(self):
+        """Pick up the VDI changes made since the last refresh."""
+        if self._token is None:
+            self._load()
+            return
+        try:
+            result = self.session.call_xenapi('event.from', ['VDI'],
+                                              self._token, 0.0)
+        except self.session.XenAPI.Failure:
+            self._load()
+            return
+
+        self._token = result['token']
+        for event in result['events']:
+            if event['class'].lower() != 'vdi':
+                continue
+            vdi_ref = event['ref']
+            vdi_rec = event.get('snapshot')
+            if (event['operation'] == 'del' or not vdi_rec or
+                    vdi_rec['SR'] != self.sr_ref):
+                self._remove(vdi_ref)
+            else:
+                self._add(vdi_ref, vdi_rec)
+
+    def get_all_records(self):
+        return self._records.items()
+
+    def get_record(self, vdi_ref):
+        """Return the record of a VDI, fetching it if it isn't indexed."""
+        vdi_rec = self._records.get(vdi_ref)
+        if vdi_rec is None:
+            vdi_rec = self.session.call_xenapi('VDI.get_record', vdi_ref)
+            if vdi_rec['SR'] == self.sr_ref:
+                self._add(vdi_ref, vdi_rec)
+        return vdi_rec
+
+    def get_record_by_uuid(self, vdi_uuid):
+        vdi_ref = self._refs_by_uuid.get(vdi_uuid)
+        if vdi_ref is None:
+            vdi_ref = self.session.call_xenapi('VDI.get_by_uuid', vdi_uuid)
+        return self.get_record(vdi_ref)
+
+    def get_parent_uuid(self, vdi_rec):
+        parent_uuid = vdi_rec['sm_config'].get('vhd-parent')
+        if parent_uuid:
+            LOG.debug(_('VHD %(vdi_uuid)s has parent %(parent_uuid)s'),
+                      {'vdi_uuid': vdi_rec['uuid'],
+                       'parent_uuid': parent_uuid})
+        return parent_uuid
+
+    def get_children(self, vdi_uuid):
+        """Return the uuids of the immediate children of a VHD."""
+        return set(self._children.get(vdi_uuid, ())) - set([vdi_uuid])
+
+
 def _get_vhd_parent_uuid(session, vdi_ref):
     vdi_rec = session.call_xenapi("VDI.get_record", vdi_ref)
 
@@ -1798,8 +1923,19 @@ def _get_vhd_parent_uuid(session, vdi_ref):
     return parent_uuid
 
 
-def _walk_vdi_chain(session, vdi_uuid):
-    """Yield vdi_recs for each element in a VDI chain."""
+def _walk_vdi_chain(session, vdi_uuid, topology=None):
+    """Yield vdi_recs for each element in a VDI chain.
+
+    If a SRTopology is given the chain is looked up in it, in which case the
+    caller is responsible for scanning the SR first.
+    """
+    if topology is not None:
+        while vdi_uuid:
+            vdi_rec = topology.get_record_by_uuid(vdi_uuid)
+            yield vdi_rec
+            vdi_uuid = topology.get_parent_uuid(vdi_rec)
+        return
+
     scan_default_sr(session)
     while True:
         vdi_ref = session.call_xenapi("VDI.get_by_uuid", vdi_uuid)
@@ -1813,11 +1949,14 @@ def _walk_vdi_chain(session, vdi_uuid):
         vdi_uuid = parent_uuid
 
 
-def _child_vhds(session, sr_ref, vdi_uuid):
+def _child_vhds(session, sr_ref, vdi_uuid, topology=None):
     """Return the immediate children of a given VHD.
 
     This is not recursive, only the immediate children are returned.
     """
+    if topology is not None:
+        return topology.get_children(vdi_uuid)
+
     children = set()
     for ref, rec in _get_all_vdis_in_sr(session, sr_ref):
         rec_uuid = rec['uuid']
@@ -1835,7 +1974,7 @@ def _child_vhds(session, sr_ref, vdi_uuid):
 
 
 def _wait_for_vhd_coalesce(session, instance, sr_ref, vdi_ref,
-                           original_parent_uuid):
+                           original_parent_uuid, topology=None):
     """Spin until the parent VHD is coalesced into its parent VHD
 
     Before coalesce:
@@ -1852,26 +1991,27 @@ def _wait_for_vhd_coalesce(session, instance, sr_ref, vdi_ref,
     if not original_parent_uuid:
         return
 
+    if topology is None:
+        topology = SRTopology(session, sr_ref)
+
+    def _get_parent_uuid(vdi_rec):
+        return topology.get_parent_uuid(vdi_rec)
+
     def _another_child_vhd():
         # Search for any other vdi which parents to original parent and is not
         # in the active vm/instance vdi chain.
-        vdi_uuid = session.call_xenapi('VDI.get_record', vdi_ref)['uuid']
-        parent_vdi_uuid = _get_vhd_parent_uuid(session, vdi_ref)
-        for _ref, rec in _get_all_vdis_in_sr(session, sr_ref):
-            if ((rec['uuid'] != vdi_uuid) and
-               (rec['uuid'] != parent_vdi_uuid) and
-               (rec['sm_config'].get('vhd-parent') == original_parent_uuid)):
-                # Found another vhd which too parents to original parent.
-                return True
-        # Found no other vdi with the same parent.
-        return False
+        vdi_rec = topology.get_record(vdi_ref)
+        parent_vdi_uuid = _get_parent_uuid(vdi_rec)
+        others = topology.get_children(original_parent_uuid) - set(
+            [vdi_rec['uuid'], parent_vdi_uuid])
+        # Found another vhd which too parents to original parent?
+        return bool(others)
 
     # Check if original parent has any other child. If so, coalesce will
     # not take place.
     if _another_child_vhd():
-        parent_uuid = _get_vhd_parent_uuid(session, vdi_ref)
-        parent_ref = session.call_xenapi("VDI.get_by_uuid", parent_uuid)
-        base_uuid = _get_vhd_parent_uuid(session, parent_ref)
+        parent_uuid = _get_parent_uuid(topology.get_record(vdi_ref))
+        base_uuid = _get_parent_uuid(topology.get_record_by_uuid(parent_uuid))
         return parent_uuid, base_uuid
 
     # NOTE(sirp): This rescan is necessary to ensure the VM's `sm_config`
@@ -1881,7 +2021,8 @@ def _wait_for_vhd_coalesce(session, instance, sr_ref, vdi_ref,
     max_attempts = CONF.xenapi_vhd_coalesce_max_attempts
     for i in xrange(max_attempts):
         _scan_sr(session, sr_ref)
-        parent_uuid = _get_vhd_parent_uuid(session, vdi_ref)
+        topology.refresh()
+        parent_uuid = _get_parent_uuid(topology.get_record(vdi_ref))
         if parent_uuid and (parent_uuid != original_parent_uuid):
             LOG.debug(_("Parent %(parent_uuid)s doesn't match original parent"
                         " %(original_parent_uuid)s, waiting for coalesce..."),
@@ -1889,8 +2030,8 @@ def _wait_for_vhd_coalesce(session, instance, sr_ref, vdi_ref,
                        'original_parent_uuid': original_parent_uuid},
                       instance=instance)
         else:
-            parent_ref = session.call_xenapi("VDI.get_by_uuid", parent_uuid)
-            base_uuid = _get_vhd_parent_uuid(session, parent_ref)
+            base_uuid = _get_parent_uuid(
+                topology.get_record_by_uuid(parent_uuid))
             return parent_uuid, base_uuid
 
         greenthread.sleep(CONF.xenapi_vhd_coalesce_poll_interval)
@@ -2165,13 +2306,93 @@ def _log_progress_if_required(left, last_log_time, virtual_size):
     return last_log_time
 
 
+# NOTE: os only has these from python 3.3, the values are the Linux ones.
+_SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+_SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+
+
+def _next_data_extent(fd, offset, end):
+    """Return (start, stop) of the next extent of data in fd at or after
+    offset, or None if there is no more data before end.
+
+    Raises OSError if the file doesn't support SEEK_DATA/SEEK_HOLE.
+    """
+    try:
+        start = os.lseek(fd, offset, _SEEK_DATA)
+    except OSError as e:
+        if e.errno == errno.ENXIO:
+            # No data after offset
+            return None
+        raise
+    if start >= end:
+        return None
+    stop = os.lseek(fd, start, _SEEK_HOLE)
+    return start, min(stop, end)
+
+
+class _CopyThrottle(object):
+    """Caps the rate of a copy and yields to other greenthreads every
+    yield_interval seconds.
+    """
+
+    def __init__(self, max_rate, yield_interval):
+        self.max_rate = max_rate
+        self.yield_interval = yield_interval
+        self.start = self.last_yield = time.time()
+        self.bytes = 0
+
+    def __call__(self, num_bytes):
+        self.bytes += num_bytes
+        now = time.time()
+        if self.max_rate:
+            ahead = float(self.bytes) / self.max_rate - (now - self.start)
+            if ahead > 0:
+                greenthread.sleep(ahead)
+                self.last_yield = time.time()
+                return
+        if now - self.last_yield >= self.yield_interval:
+            greenthread.sleep(0)
+            self.last_yield = now
+
+
+def _write_sparse(dst, offset, data, block_size, empty_block):
+    """Write data at offset, skipping blocks of zeros.
+
+    Returns the number of bytes skipped.
+    """
+    skipped = 0
+    run_start = None
+    for pos in xrange(0, len(data), block_size):
+        if data[pos:pos + block_size] == empty_block:
+            if run_start is not None:
+                dst.seek(offset + run_start)
+                dst.write(data[run_start:pos])
+                run_start = None
+            skipped += block_size
+        elif run_start is None:
+            run_start = pos
+    if run_start is not None:
+        dst.seek(offset + run_start)
+        dst.write(data[run_start:])
+    return skipped
+
+
 def _sparse_copy(src_path, dst_path, virtual_size, block_size=4096):
-    """Copy data, skipping long runs of zeros to create a sparse file."""
+    """Copy data, skipping long runs of zeros to create a sparse file.
+
+    Holes in the source are skipped without being read where the source
+    supports SEEK_DATA/SEEK_HOLE; data is read in large buffers and only
+    the blocks which aren't all zeros are written.
+    """
     start_time = last_log_time = timeutils.utcnow()
-    EMPTY_BLOCK = '\0' * block_size
-    bytes_read = 0
+    buffer_size = max(block_size, (CONF.xenapi_sparse_copy_buffer_size //
+                                   block_size * block_size))
+    empty_buffer = '\0' * buffer_size
+    empty_block = empty_buffer[:block_size]
+    throttle = _CopyThrottle(CONF.xenapi_sparse_copy_max_rate,
+                             CONF.xenapi_sparse_copy_yield_interval)
     skipped_bytes = 0
-    left = virtual_size
+    offset = 0
 
     LOG.debug(_("Starting sparse_copy src=%(src_path)s dst=%(dst_path)s "
                 "virtual_size=%(virtual_size)d block_size=%(block_size)d"),
@@ -2183,31 +2404,64 @@ def _sparse_copy(src_path, dst_path, virtual_size, block_size=4096):
     # ownership of the devices.
     with utils.temporary_chown(src_path):
         with utils.temporary_chown(dst_path):
-            with open(src_path, "r") as src:
+            src_fd = os.open(src_path, os.O_RDONLY)
+            try:
+                end = virtual_size
+                src_stat = os.fstat(src_fd)
+                if stat.S_ISREG(src_stat.st_mode):
+                    end = min(end, src_stat.st_size)
                 with open(dst_path, "w") as dst:
-                    data = src.read(min(block_size, left))
-                    while data:
-                        if data == EMPTY_BLOCK:
-                            dst.seek(block_size, os.SEEK_CUR)
-                            left -= block_size
-                            bytes_read += block_size
-                            skipped_bytes += block_size
-                        else:
-                            dst.write(data)
-                            data_len = len(data)
-                            left -= data_len
-                            bytes_read += data_len
-
-                        if left <= 0:
+                    seek_data = True
+                    eof = False
+                    while offset < end and not eof:
+                        extent = (offset, end)
+                        if seek_data:
+                            try:
+                                extent = _next_data_extent(src_fd, offset,
+                                                           end)
+                            except OSError:
+                                # e.g. block devices; read everything
+                                seek_data = False
+                        if extent is None:
+                            skipped_bytes += end - offset
+                            offset = end
                             break
 
-                        data = src.read(min(block_size, left))
-                        greenthread.sleep(0)
-                        last_log_time = _log_progress_if_required(
-                            left, last_log_time, virtual_size)
+                        start, stop = extent
+                        skipped_bytes += start - offset
+                        offset = start
+                        os.lseek(src_fd, offset, os.SEEK_SET)
+                        while offset < stop:
+                            data = os.read(src_fd,
+                                           min(buffer_size, stop - offset))
+                            if not data:
+                                # Source is shorter than virtual_size
+                                eof = True
+                                break
+                            data_len = len(data)
+                            if (not data_len % block_size and
+                                    data == empty_buffer[:data_len]):
+                                skipped_bytes += data_len
+                            else:
+                                skipped_bytes += _write_sparse(
+                                    dst, offset, data, block_size,
+                                    empty_block)
+                            offset += data_len
+                            throttle(data_len)
+                            last_log_time = _log_progress_if_required(
+                                virtual_size - offset, last_log_time,
+                                virtual_size)
+
+                    if os.path.isfile(dst_path):
+                        # Skipped blocks at the end don't extend a file
+                        dst.truncate(offset)
+            finally:
+                os.close(src_fd)
 
     duration = timeutils.delta_seconds(start_time, timeutils.utcnow())
-    compression_pct = float(skipped_bytes) / bytes_read * 100
+    compression_pct = 0
+    if offset:
+        compression_pct = float(skipped_bytes) / offset * 100
 
     LOG.debug(_("Finished sparse_copy in %(duration).2f secs, "
                 "%(compression_pct).2f%% reduction in size"),
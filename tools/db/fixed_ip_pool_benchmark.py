@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+fixed_ip_pool_benchmark.py
+
+Allocates fixed ips of a scratch network from concurrent threads, first
+with the previous SELECT ... FOR UPDATE of the first free row, then with
+db.fixed_ip_associate_pool and db.fixed_ip_associate_pool_many, and checks
+that no address was handed out twice.  Run it against a MySQL or
+PostgreSQL database synced with nova-manage db sync, given with
+--sql_connection or a config file; sqlite does not lock rows.  The scratch
+network and its fixed ips are deleted afterwards.
+
+Options:
+
+    --fixed_ips - Number of fixed ips of the scratch network
+    --allocations - Number of fixed ips allocated by each run
+    --workers - Number of threads allocating concurrently
+    --batch_size - Number of instances per fixed_ip_associate_pool_many call
+"""
+import os
+import Queue
+import sys
+import threading
+import time
+import uuid
+
+import netaddr
+from oslo.config import cfg
+
+# If ../nova/__init__.py exists, add ../ to Python search path, so that
+# it will override what happens to be installed in /usr/(local/)lib/python...
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova import config
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova import exception
+
+benchmark_opts = [
+    cfg.IntOpt('fixed_ips',
+               default=4096,
+               help='Number of fixed ips of the scratch network'),
+    cfg.IntOpt('allocations',
+               default=2000,
+               help='Number of fixed ips allocated by each run'),
+    cfg.IntOpt('workers',
+               default=32,
+               help='Number of threads allocating concurrently'),
+    cfg.IntOpt('batch_size',
+               default=8,
+               help='Number of instances per fixed_ip_associate_pool_many '
+                    'call'),
+]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(benchmark_opts)
+
+CIDR = '10.250.0.0/16'
+
+
+def associate_first_free(ctxt, network_id, instance_uuids):
+    """The previous allocation, locking the first free row."""
+    addresses = []
+    for instance_uuid in instance_uuids:
+        session = sqlalchemy_api.get_session()
+        with session.begin():
+            fixed_ip_ref = session.query(models.FixedIp).\
+                                   filter_by(deleted=0).\
+                                   filter_by(network_id=network_id).\
+                                   filter_by(reserved=False).\
+                                   filter_by(instance_uuid=None).\
+                                   filter_by(host=None).\
+                                   with_lockmode('update').\
+                                   first()
+            if not fixed_ip_ref:
+                raise exception.NoMoreFixedIps()
+            fixed_ip_ref.instance_uuid = instance_uuid
+        addresses.append(fixed_ip_ref.address)
+    return addresses
+
+
+def associate_pool(ctxt, network_id, instance_uuids):
+    return [db.fixed_ip_associate_pool(ctxt, network_id, instance_uuid)
+            for instance_uuid in instance_uuids]
+
+
+def associate_pool_many(ctxt, network_id, instance_uuids):
+    return db.fixed_ip_associate_pool_many(ctxt, network_id, instance_uuids)
+
+
+def create_network(ctxt):
+    network = db.network_create_safe(ctxt, {'label': 'benchmark',
+                                            'cidr': CIDR})
+    addresses = list(netaddr.IPNetwork(CIDR))[1:CONF.fixed_ips + 1]
+    db.fixed_ip_bulk_create(ctxt, [{'network_id': network['id'],
+                                    'address': str(address)}
+                                   for address in addresses])
+    return network
+
+
+def delete_network(network):
+    session = sqlalchemy_api.get_session()
+    with session.begin():
+        session.query(models.FixedIp).\
+                filter_by(network_id=network['id']).\
+                delete(synchronize_session=False)
+        session.query(models.Network).\
+                filter_by(id=network['id']).\
+                delete(synchronize_session=False)
+
+
+def run(ctxt, associate, batch_size):
+    """Allocate from concurrent threads, return the time and latencies."""
+    network = create_network(ctxt)
+    try:
+        batches = Queue.Queue()
+        for i in xrange(0, CONF.allocations, batch_size):
+            batches.put([str(uuid.uuid4()) for _i in
+                         xrange(min(batch_size, CONF.allocations - i))])
+        latencies = []
+        addresses = []
+        errors = []
+
+        def worker():
+            while True:
+                try:
+                    instance_uuids = batches.get_nowait()
+                except Queue.Empty:
+                    return
+                start = time.time()
+                try:
+                    addresses.extend(associate(ctxt, network['id'],
+                                               instance_uuids))
+                except Exception as exc:
+                    errors.append(exc)
+                latencies.append((time.time() - start) / len(instance_uuids))
+
+        threads = [threading.Thread(target=worker)
+                   for _i in xrange(CONF.workers)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+    finally:
+        delete_network(network)
+
+    if errors:
+        print "ERROR: %d allocations failed, first: %s" % (len(errors),
+                                                          errors[0])
+    if len(set(addresses)) != len(addresses):
+        print "ERROR: addresses allocated more than once"
+    return elapsed, sorted(latencies), len(addresses)
+
+
+def main():
+    config.parse_args(sys.argv)
+    ctxt = context.get_admin_context()
+
+    print "%d allocations from %d fixed ips, %d workers" % (
+        CONF.allocations, CONF.fixed_ips, CONF.workers)
+    for name, associate, batch_size in (
+            ('first free row', associate_first_free, 1),
+            ('associate_pool', associate_pool, 1),
+            ('associate_pool_many', associate_pool_many, CONF.batch_size)):
+        elapsed, latencies, allocated = run(ctxt, associate, batch_size)
+        print ("%-20s %6.2f secs  %7.1f ips/sec  p50 %6.1f ms  "
+               "p99 %6.1f ms" % (name, elapsed, allocated / elapsed,
+                                 latencies[len(latencies) / 2] * 1000,
+                                 latencies[len(latencies) * 99 / 100] * 1000))
+
+
+if __name__ == "__main__":
+    sys.exit(main())